@@ -2,22 +2,24 @@ from django.contrib import admin
 from django.shortcuts import redirect
 from django.db.models import Max
 from django import forms
-from .models import Client, Chauffeur, Vehicule, Destination, TypeService, Tarification, Tournee, Expedition, TrackingExpedition, Facture, Paiement, Notification
+from .models import Client, Chauffeur, Vehicule, Destination, TypeService, Tarification, Tournee, Expedition, TrackingExpedition, Facture, Paiement, Notification, ReservationRessource, EvenementTerrain, ArchiveHistorique, MesureTournee, EvenementSortant
+from .services.calendrier_service import CalendrierService
 
 
 
 class TourneeAdminForm(forms.ModelForm):
     """
     Formulaire personnalisé pour TOURNÉE
-    Affiche SEULEMENT les chauffeurs et véhicules DISPONIBLES
+    Affiche SEULEMENT les chauffeurs et véhicules opérationnels
+    (les conflits de dates sont vérifiés à l'enregistrement par le calendrier)
     """
     chauffeur = forms.ModelChoiceField(
-        queryset=Chauffeur.objects.filter(statut_disponibilite='DISPONIBLE'),
+        queryset=Chauffeur.objects.exclude(statut_disponibilite__in=CalendrierService.STATUTS_CHAUFFEUR_INDISPONIBLE),
         label="Chauffeur"
     )
     
     vehicule = forms.ModelChoiceField(
-        queryset=Vehicule.objects.filter(statut='DISPONIBLE'),
+        queryset=Vehicule.objects.exclude(statut__in=CalendrierService.STATUTS_VEHICULE_INDISPONIBLE),
         label="Véhicule"
     )
     
@@ -62,6 +64,7 @@ class PaiementAdminForm(forms.ModelForm):
 class ClientAdmin(admin.ModelAdmin):
     list_display = ['get_id', 'nom', 'prenom', 'solde']
     search_fields = ['nom', 'prenom', 'email']
+    readonly_fields = ['solde']  # Modifié uniquement via le grand livre (SoldeService)
     
     def get_id(self, obj):
         return f"CL-{obj.id:03d}"
@@ -133,6 +136,97 @@ class TourneeAdmin(admin.ModelAdmin):
 admin.site.register(Tournee, TourneeAdmin)
 
 
+class ReservationRessourceAdmin(admin.ModelAdmin):
+    """
+    Calendrier des ressources : les réservations TOURNEE sont gérées automatiquement,
+    les congés / maintenances planifiés se saisissent ici
+    """
+    list_display = ['debut', 'fin', 'chauffeur', 'vehicule', 'motif', 'tournee']
+    list_filter = ['motif']
+    date_hierarchy = 'debut'
+    raw_id_fields = ['tournee']
+
+admin.site.register(ReservationRessource, ReservationRessourceAdmin)
+
+
+class EvenementTerrainAdmin(admin.ModelAdmin):
+    """
+    Événements reçus de l'application chauffeur (lecture seule : table en ajout uniquement)
+    """
+    list_display = ['horodatage', 'type_evenement', 'tournee', 'expedition', 'latitude', 'longitude']
+    list_filter = ['type_evenement', 'jour']
+    search_fields = ['evenement_id']
+    raw_id_fields = ['tournee', 'expedition']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+admin.site.register(EvenementTerrain, EvenementTerrainAdmin)
+
+
+class ArchiveHistoriqueAdmin(admin.ModelAdmin):
+    """
+    Archives compressées (commande archiver_historique) : résumé seulement,
+    le contenu se consulte depuis la page de l'objet
+    """
+    list_display = ['type_objet', 'objet_id', 'dernier_statut', 'nb_lignes', 'date_derniere_ligne', 'date_archivage']
+    list_filter = ['type_objet']
+    search_fields = ['objet_id']
+    exclude = ['contenu']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('contenu')
+
+admin.site.register(ArchiveHistorique, ArchiveHistoriqueAdmin)
+
+
+class MesureTourneeAdmin(admin.ModelAdmin):
+    """
+    Séries d'efficacité des véhicules (calculées à la fin de chaque tournée)
+    """
+    list_display = ['date_fin', 'vehicule', 'tournee', 'km_parcouru', 'km_estime', 'carburant', 'carburant_mesure', 'consommation_glissante']
+    list_filter = ['carburant_mesure', 'vehicule']
+    raw_id_fields = ['tournee', 'vehicule']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+admin.site.register(MesureTournee, MesureTourneeAdmin)
+
+
+class EvenementSortantAdmin(admin.ModelAdmin):
+    """
+    Boîte d'envoi : effets de bord en attente, traités ou en échec
+    (rejouer les échecs : commande traiter_boite_envoi --rejouer-echecs)
+    """
+    list_display = ['id', 'type_evenement', 'statut', 'tentatives', 'disponible_le', 'date_creation', 'date_traitement']
+    list_filter = ['statut', 'type_evenement']
+    readonly_fields = ['derniere_erreur']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+admin.site.register(EvenementSortant, EvenementSortantAdmin)
+
+
 class HistoriqueInline(admin.TabularInline):
     model = TrackingExpedition
     extra = 0
@@ -228,7 +322,7 @@ class FactureAdmin(admin.ModelAdmin):
     list_display = ['numero_facture', 'client', 'montant_ttc', 'get_montant_restant', 'statut', 'date_creation', 'date_echeance']
     list_filter = ['statut', 'date_creation']
     search_fields = ['numero_facture', 'client__nom', 'client__prenom']
-    readonly_fields = ['numero_facture', 'montant_ht', 'montant_tva', 'montant_ttc', 'date_creation']
+    readonly_fields = ['numero_facture', 'montant_ht', 'montant_tva', 'montant_ttc', 'montant_paye_cumule', 'nb_expeditions', 'date_creation']
     inlines = [PaiementInline]
     
     def get_montant_restant(self, obj):
@@ -0,0 +1,128 @@
+"""
+backends/sqlite/base.py - Moteur SQLite de production (ENGINE 'app1.backends.sqlite')
+
+UTILISATION :
+Avec le moteur SQLite de Django, plusieurs agents qui écrivent en même temps
+obtiennent "database is locked" :
+- select_for_update() ne fait rien sous SQLite
+- BEGIN (différé) : la transaction lit d'abord, puis demande le verrou
+  d'écriture ; si un autre écrivain le tient, SQLite répond SQLITE_BUSY
+  immédiatement (sans attendre busy_timeout) pour éviter un interblocage
+- longues transactions des signaux (gerer_suppression_expedition...)
+
+Ce moteur (sous-classe du moteur Django, vendor 'sqlite' inchangé) ajoute :
+- PRAGMAs à chaque connexion (settings.SQLITE_PRAGMAS) : journal (WAL en
+  production via SQLITE_JOURNAL_MODE : lecteurs et écrivain ne se bloquent plus ;
+  persistant dans le fichier, donc pas sur la base versionnée), synchronous,
+  busy_timeout, cache, mmap
+- BEGIN IMMEDIATE pour chaque transaction.atomic() : le verrou d'écriture est
+  pris dès le début → un select_for_update() suivi d'un UPDATE ne perd plus de
+  mise à jour, et l'attente passe par busy_timeout au lieu d'échouer
+- Porte d'écriture par processus : un verrou Python par fichier, tenu du BEGIN
+  au COMMIT / ROLLBACK ; les threads d'un même processus attendent leur tour
+  (file d'attente sans sondage) au lieu de se disputer le verrou SQLite
+
+Toute transaction atomic() est traitée comme une écriture (comme le mode
+IMMEDIATE de Django 5.1) : garder les transactions courtes, lectures seules
+hors atomic(). Exception : transaction_lecture() (exports, sauvegardes), BEGIN
+différé sans porte, pour lire d'un bloc sans bloquer ni attendre les écrivains.
+
+EXEMPLES :
+- DATABASES['default']['ENGINE'] = 'app1.backends.sqlite'
+- SQLITE_PORTE_ECRITURE = False → seulement BEGIN IMMEDIATE + busy_timeout (plusieurs processus)
+- with transaction_lecture(): ... → lecture cohérente (instantané en WAL), aucune écriture dedans
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.backends.sqlite3 import base
+from django.db.utils import OperationalError
+
+
+@contextmanager
+def transaction_lecture(using=DEFAULT_DB_ALIAS):
+    """
+    transaction.atomic() réservée aux lectures : BEGIN différé, sans porte d'écriture
+    (sinon un export lancé pendant une transaction d'écriture du même processus attend la porte)
+    Sans effet particulier sur les autres moteurs ; imbriquée, c'est un savepoint ordinaire
+    """
+    connexion = connections[using]
+    precedent = getattr(connexion, 'lecture_seule', False)
+    connexion.lecture_seule = True
+    try:
+        with transaction.atomic(using=using):
+            yield
+    finally:
+        connexion.lecture_seule = precedent
+
+
+class PorteEcriture:
+    """
+    Verrou d'écriture par fichier de base, partagé par les connexions du processus
+    """
+
+    _portes = {}
+    _verrou = threading.Lock()
+
+    @classmethod
+    def pour(cls, nom):
+        with cls._verrou:
+            return cls._portes.setdefault(str(nom), threading.Lock())
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    _porte = None
+    lecture_seule = False
+
+    # ==================== CONNEXION ====================
+
+    def get_new_connection(self, conn_params):
+        connexion = super().get_new_connection(conn_params)
+        for nom, valeur in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            connexion.execute(f"PRAGMA {nom} = {valeur}")
+        return connexion
+
+    # ==================== TRANSACTIONS ====================
+
+    def _start_transaction_under_autocommit(self):
+        if self.lecture_seule:
+            self.cursor().execute('BEGIN')
+            return
+        if getattr(settings, 'SQLITE_PORTE_ECRITURE', True) and not self.is_in_memory_db():
+            porte = PorteEcriture.pour(self.settings_dict['NAME'])
+            if not porte.acquire(timeout=getattr(settings, 'SQLITE_PORTE_ATTENTE_SECONDES', 20)):
+                raise OperationalError("database is locked (porte d'écriture : attente dépassée)")
+            self._porte = porte
+        try:
+            debut = 'BEGIN IMMEDIATE' if getattr(settings, 'SQLITE_TRANSACTIONS_IMMEDIATES', True) else 'BEGIN'
+            self.cursor().execute(debut)
+        except BaseException:
+            self._liberer_porte()
+            raise
+
+    def _commit(self):
+        try:
+            super()._commit()
+        finally:
+            self._liberer_porte()
+
+    def _rollback(self):
+        try:
+            super()._rollback()
+        finally:
+            self._liberer_porte()
+
+    def _close(self):
+        try:
+            super()._close()
+        finally:
+            self._liberer_porte()
+
+    def _liberer_porte(self):
+        porte, self._porte = self._porte, None
+        if porte is not None:
+            porte.release()
@@ -405,4 +405,67 @@ FAVORIS_PAR_DEFAUT = [
     'consulter_tournees',
     'consulter_factures',
     'ajouter_incident'
-]
\ No newline at end of file
+]
+# ========== COORDONNÉES DES WILAYAS (chef-lieu) ==========
+# Géocodage hors ligne : utilisé quand une destination n'a pas de latitude/longitude
+# Clé = nom normalisé (minuscules, sans accents ni espaces/tirets/apostrophes)
+COORDONNEES_WILAYAS = {
+    'adrar': (27.874, -0.294),
+    'chlef': (36.165, 1.334),
+    'laghouat': (33.800, 2.865),
+    'oumelbouaghi': (35.875, 7.114),
+    'batna': (35.556, 6.174),
+    'bejaia': (36.751, 5.056),
+    'biskra': (34.850, 5.728),
+    'bechar': (31.617, -2.217),
+    'blida': (36.470, 2.828),
+    'bouira': (36.375, 3.902),
+    'tamanrasset': (22.785, 5.523),
+    'tebessa': (35.404, 8.124),
+    'tlemcen': (34.878, -1.315),
+    'tiaret': (35.371, 1.317),
+    'tiziouzou': (36.712, 4.046),
+    'alger': (36.754, 3.059),
+    'djelfa': (34.673, 3.263),
+    'jijel': (36.820, 5.766),
+    'setif': (36.191, 5.414),
+    'saida': (34.830, 0.152),
+    'skikda': (36.876, 6.909),
+    'sidibelabbes': (35.190, -0.631),
+    'annaba': (36.900, 7.766),
+    'guelma': (36.462, 7.426),
+    'constantine': (36.365, 6.615),
+    'medea': (36.264, 2.754),
+    'mostaganem': (35.931, 0.089),
+    'msila': (35.706, 4.542),
+    'mascara': (35.397, 0.140),
+    'ouargla': (31.949, 5.325),
+    'oran': (35.697, -0.633),
+    'elbayadh': (33.683, 1.020),
+    'illizi': (26.483, 8.467),
+    'bordjbouarreridj': (36.073, 4.761),
+    'boumerdes': (36.760, 3.477),
+    'eltarf': (36.767, 8.314),
+    'tindouf': (27.671, -8.147),
+    'tissemsilt': (35.607, 1.811),
+    'eloued': (33.368, 6.867),
+    'khenchela': (35.436, 7.143),
+    'soukahras': (36.286, 7.951),
+    'tipaza': (36.589, 2.447),
+    'mila': (36.450, 6.264),
+    'aindefla': (36.264, 1.968),
+    'naama': (33.267, -0.313),
+    'aintemouchent': (35.297, -1.140),
+    'ghardaia': (32.490, 3.673),
+    'relizane': (35.737, 0.556),
+    'timimoun': (29.263, 0.241),
+    'bordjbadjimokhtar': (21.328, 0.948),
+    'ouleddjellal': (34.417, 5.067),
+    'beniabbes': (30.131, -2.166),
+    'insalah': (27.197, 2.466),
+    'inguezzam': (19.567, 5.767),
+    'touggourt': (33.104, 6.058),
+    'djanet': (24.554, 9.485),
+    'elmghair': (33.950, 5.917),
+    'elmeniaa': (30.583, 2.883),
+}
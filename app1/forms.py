@@ -4,14 +4,42 @@ from datetime import date
 from .models import Client, Chauffeur, Vehicule, TypeService, Destination, Tarification, Tournee, Expedition, TrackingExpedition, Facture, Paiement, Incident, Reclamation, AgentUtilisateur
 
 class ClientForm(forms.ModelForm):
+    """
+    Modification d'un client : le solde n'en fait PAS partie
+    (il ne change que par le grand livre, voir CorrectionSoldeForm)
+    """
     class Meta:
         model = Client
-        fields = '__all__'  
+        exclude = ['solde']
         widgets = {
             'date_naissance': forms.DateInput(attrs={'type': 'date'}),
             'remarques': forms.Textarea(attrs={'rows': 3}),
         }    
 
+class ClientCreationForm(ClientForm):
+    """Création d'un client : solde initial → mouvement d'ouverture (voir Client.save)"""
+    class Meta(ClientForm.Meta):
+        exclude = []
+
+class CorrectionSoldeForm(forms.Form):
+    """
+    Correction manuelle du solde : variation signée appliquée par SoldeService
+    (jamais une valeur cible, qui écraserait les mouvements concurrents)
+    """
+    correction_solde = forms.DecimalField(
+        label="Correction du solde (DA)",
+        max_digits=12,
+        decimal_places=2,
+        required=False,
+        help_text="Ajouté au solde : positif = dette, négatif = crédit. Laisser vide si aucune correction"
+    )
+    
+    motif_correction = forms.CharField(
+        label="Motif de la correction",
+        max_length=200,
+        required=False
+    )
+
 class ChauffeurForm(forms.ModelForm):
     class Meta:
         model = Chauffeur
@@ -104,7 +132,7 @@ class DestinationForm(forms.ModelForm):
         model = Destination
         fields = [
             'ville', 'wilaya', 'pays', 'zone_geographique', 'zone_logistique',
-            'distance_estimee', 'tarif_base', 'delai_livraison_estime',
+            'distance_estimee', 'latitude', 'longitude', 'tarif_base', 'delai_livraison_estime',
             'code_postal', 'remarques'
         ]
         widgets = {
@@ -177,15 +205,11 @@ class TourneeForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         
-        # Filtrer chauffeurs DISPONIBLES uniquement
-        self.fields['chauffeur'].queryset = Chauffeur.objects.filter(
-            statut_disponibilite='DISPONIBLE'
-        )
-        
-        # Filtrer véhicules DISPONIBLES uniquement
-        self.fields['vehicule'].queryset = Vehicule.objects.filter(
-            statut='DISPONIBLE'
-        )
+        # Chauffeurs / véhicules opérationnels (ni congé, ni maintenance...)
+        # Les conflits de dates sont vérifiés dans clean() avec le calendrier
+        from .services.calendrier_service import CalendrierService
+        self.fields['chauffeur'].queryset = CalendrierService.chauffeurs_operationnels()
+        self.fields['vehicule'].queryset = CalendrierService.vehicules_operationnels()
         
         # Labels personnalisés
         self.fields['chauffeur'].label = "Chauffeur *"
@@ -229,8 +253,33 @@ class TourneeForm(forms.ModelForm):
                     'date_retour_prevue': "La date de retour doit être après la date de départ"
                 })
         
+        # Chauffeur et véhicule libres sur [départ, retour) ?
+        chauffeur = cleaned_data.get('chauffeur')
+        vehicule = cleaned_data.get('vehicule')
+        if date_depart and chauffeur and vehicule:
+            from .services.calendrier_service import CalendrierService
+            fin = date_retour_prevue or date_depart + CalendrierService.duree_par_defaut()
+            erreurs = CalendrierService.conflits(
+                chauffeur, vehicule, date_depart, fin, exclure_tournee=self.instance.pk
+            )
+            if erreurs:
+                raise forms.ValidationError(erreurs)
+        
         return cleaned_data
 
+class FinTourneeForm(forms.Form):
+    """
+    Relevés de fin de tournée (litres facultatifs)
+    Mêmes bornes que Tournee.carburant_reel : NaN, infini ou trop de chiffres → erreur de saisie
+    """
+    carburant_reel = forms.DecimalField(
+        label="Litres relevés",
+        max_digits=6,
+        decimal_places=2,
+        min_value=0,
+        required=False,
+    )
+
 class ExpeditionForm(forms.ModelForm):
     """
     Formulaire de création d'expédition
@@ -499,7 +548,7 @@ class IncidentForm(forms.ModelForm):
         # Filtrer les expéditions (seulement celles en cours ou en attente)
         self.fields['expedition'].queryset = Expedition.objects.exclude(
             statut__in=['ANNULE']
-        ).order_by('-date_creation')
+        ).select_related('client', 'destination').order_by('-date_creation')
         
         # Help texts
         self.fields['cout_estime'].help_text = "Coût estimé des dommages en DA"
@@ -626,12 +675,14 @@ class ReclamationForm(forms.ModelForm):
         self.fields['service_concerne'].label = "Service concerné"
         
         # Filtrer les expéditions
-        self.fields['expeditions'].queryset = Expedition.objects.all().order_by('-date_creation')
+        self.fields['expeditions'].queryset = Expedition.objects.select_related(
+            'client', 'destination'
+        ).order_by('-date_creation')
         
         # Filtrer les factures (sauf annulées)
         self.fields['facture'].queryset = Facture.objects.exclude(
             statut='ANNULEE'
-        ).order_by('-date_creation')
+        ).select_related('client').order_by('-date_creation')
         
         # Help texts
         self.fields['expeditions'].help_text = "Sélectionner les expéditions concernées (si applicable)"
@@ -691,7 +742,9 @@ class ReclamationModificationForm(forms.ModelForm):
         self.fields['agent_responsable'].label = "Agent responsable"
         
         # Filtrer les expéditions
-        self.fields['expeditions'].queryset = Expedition.objects.all().order_by('-date_creation')
+        self.fields['expeditions'].queryset = Expedition.objects.select_related(
+            'client', 'destination'
+        ).order_by('-date_creation')
 
 class ReclamationReponseForm(forms.Form):
     """
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from app1.services.archive_service import ArchiveService
+
+
+class Command(BaseCommand):
+    help = (
+        "Compresse l'historique (suivis, événements terrain, historiques d'incidents et de "
+        "réclamations) des dossiers clôturés depuis plus de N mois dans ArchiveHistorique "
+        "et le retire des tables courantes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mois', type=int, help='Ancienneté minimale en mois (défaut : ARCHIVE_HISTORIQUE_MOIS)')
+        parser.add_argument('--lot', type=int, default=500, help='Objets archivés par transaction (défaut : 500)')
+        parser.add_argument('--simulation', action='store_true', help='Calcule sans rien écrire')
+
+    def handle(self, *args, **options):
+        stats = ArchiveService.archiver(mois=options['mois'], lot=options['lot'], simulation=options['simulation'])
+
+        for type_objet, resultat in stats.items():
+            taux = resultat['octets_compresses'] / resultat['octets_bruts'] if resultat['octets_bruts'] else 0
+            self.stdout.write(
+                f"🗄️ {type_objet:12} {resultat['objets']:6} objets, {resultat['lignes']:8} lignes archivées "
+                f"({resultat['octets_bruts'] / 1024:.0f} Ko → {resultat['octets_compresses'] / 1024:.0f} Ko, {taux:.0%})"
+            )
+
+        if options['simulation']:
+            self.stdout.write(self.style.WARNING("Simulation : aucune modification enregistrée"))
+        else:
+            self.stdout.write(self.style.SUCCESS("✓ Archivage terminé"))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from app1.models import MesureTournee, Tournee
+from app1.services.flotte_service import FlotteService
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruit les séries d'efficacité des véhicules (MesureTournee) à partir des "
+        "tournées finalisées, dans l'ordre chronologique, puis affiche les anomalies. "
+        "En fonctionnement normal, chaque tournée finalisée ajoute son point (signal)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vider', action='store_true', help='Supprimer les séries existantes avant de reconstruire')
+        parser.add_argument('--jours', type=int, default=90, help='Période du rapport affiché (défaut : 90)')
+
+    def handle(self, *args, **options):
+        if options['vider']:
+            supprimees, _ = MesureTournee.objects.all().delete()
+            self.stdout.write(f"🗑️ {supprimees} mesures supprimées")
+
+        # Ordre chronologique : les moyennes glissantes d'un point utilisent les points précédents
+        identifiants = Tournee.objects.filter(
+            statut='TERMINEE', kilometrage_parcouru__isnull=False
+        ).order_by(
+            F('date_retour_reelle').asc(nulls_first=False), 'date_depart', 'id'
+        ).values_list('id', flat=True)
+
+        nb_mesures = sum(1 for tournee_id in identifiants if FlotteService.enregistrer_tournee(tournee_id))
+        self.stdout.write(f"📈 {nb_mesures} tournées enregistrées dans les séries")
+
+        rapport = FlotteService.rapport(options['jours'])
+        for anomalie in rapport['anomalies']:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ {anomalie['date_fin']:%d/%m/%Y} {anomalie['immatriculation']} tournée #{anomalie['tournee_id']} : "
+                f"{anomalie['libelle']} — {anomalie['detail']}"
+            ))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {len(rapport['vehicules'])} véhicules, {len(rapport['anomalies'])} anomalie(s) sur {options['jours']} jours"
+        ))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from app1.models import Destination
+from app1.services.distance_service import DistanceService
+
+
+class Command(BaseCommand):
+    help = 'Géocode les destinations sans coordonnées puis recalcule toute la matrice des distances'
+
+    def handle(self, *args, **options):
+        geocodees = 0
+        for destination in Destination.objects.filter(latitude__isnull=True):
+            if DistanceService.geocoder(destination):
+                Destination.objects.filter(pk=destination.pk).update(
+                    latitude=destination.latitude,
+                    longitude=destination.longitude
+                )
+                geocodees += 1
+
+        if geocodees:
+            self.stdout.write(f"  {geocodees} destination(s) géocodée(s) (chef-lieu de wilaya)")
+
+        debut = time.time()
+        nb = DistanceService.reconstruire()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Matrice {nb}×{nb} calculée en {time.time() - debut:.3f} s → {DistanceService.dossier()}"
+        ))
@@ -0,0 +1,117 @@
+import http.client
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from app1.models import Expedition
+from app1.services.suivi_public_service import SuiviPublicService
+
+
+class Command(BaseCommand):
+    help = (
+        "Test de charge du suivi public (GET /api/suivi/<numéro>/?jeton=...). "
+        "Sans --url, les requêtes passent par le client de test Django dans ce processus ; "
+        "avec --url, elles sont envoyées à un serveur lancé (ex: runserver). "
+        "Pour mesurer le débit brut, lancer le serveur avec SUIVI_PUBLIC_LIMITE_PAR_MINUTE=0."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requetes', type=int, default=5000, help='Nombre de requêtes (défaut : 5000)')
+        parser.add_argument('--expeditions', type=int, default=50, help='Expéditions consultées (défaut : 50)')
+        parser.add_argument('--invalides', type=float, default=0.05, help='Part de codes erronés (défaut : 0.05)')
+        parser.add_argument('--url', help='Ex: http://localhost:8000')
+        parser.add_argument('--clients', type=int, default=8, help='Connexions simultanées avec --url (défaut : 8)')
+        parser.add_argument('--avec-limite', action='store_true', help='Mode local : appliquer la limitation de débit')
+        parser.add_argument('--graine', type=int, default=42, help='Graine aléatoire (défaut : 42)')
+
+    def handle(self, *args, **options):
+        hasard = random.Random(options['graine'])
+
+        identifiants = list(Expedition.objects.order_by('-id').values_list('id', flat=True)[:options['expeditions']])
+        if not identifiants:
+            raise CommandError("Aucune expédition en base")
+
+        chemins = []
+        for _ in range(options['requetes']):
+            expedition_id = hasard.choice(identifiants)
+            jeton = SuiviPublicService.jeton(expedition_id)
+            if hasard.random() < options['invalides']:
+                jeton = jeton[::-1]
+            chemins.append(f"/api/suivi/EXP-{expedition_id:06d}/?jeton={jeton}")
+
+        self.stdout.write(f"🔎 {len(chemins)} consultations sur {len(identifiants)} expéditions")
+
+        debut = time.perf_counter()
+        if options['url']:
+            resultats = self.envoyer(chemins, options)
+        else:
+            resultats = self.local(chemins, identifiants, options)
+        duree = time.perf_counter() - debut
+
+        self.afficher(resultats, duree)
+
+    # ==================== ENVOI ====================
+
+    def local(self, chemins, identifiants, options):
+        # Départ à froid : les premiers accès remplissent le cache
+        SuiviPublicService.invalider(identifiants)
+        client = Client(HTTP_HOST='localhost')
+        limite = {} if options['avec_limite'] else {'SUIVI_PUBLIC_LIMITE_PAR_MINUTE': 0}
+
+        resultats = []
+        with override_settings(**limite):
+            for chemin in chemins:
+                debut = time.perf_counter()
+                reponse = client.get(chemin)
+                resultats.append((reponse.status_code, time.perf_counter() - debut))
+        return resultats
+
+    def envoyer(self, chemins, options):
+        cible = urlsplit(options['url'])
+        connexions = threading.local()
+
+        def connexion():
+            if getattr(connexions, 'courante', None) is None:
+                connexions.courante = http.client.HTTPConnection(cible.hostname, cible.port or 80, timeout=30)
+            return connexions.courante
+
+        def consulter(chemin):
+            debut = time.perf_counter()
+            for _ in range(2):
+                try:
+                    conn = connexion()
+                    conn.request('GET', chemin)
+                    reponse = conn.getresponse()
+                    reponse.read()
+                    if reponse.getheader('Connection', '').lower() == 'close':
+                        conn.close()
+                        connexions.courante = None
+                    return reponse.status, time.perf_counter() - debut
+                except (http.client.HTTPException, OSError):
+                    # Connexion fermée par le serveur : nouvelle tentative
+                    connexions.courante = None
+            return 0, time.perf_counter() - debut
+
+        with ThreadPoolExecutor(max_workers=options['clients']) as pool:
+            return list(pool.map(consulter, chemins))
+
+    # ==================== AFFICHAGE ====================
+
+    def afficher(self, resultats, duree):
+        statuts = {}
+        for statut, _ in resultats:
+            statuts[statut] = statuts.get(statut, 0) + 1
+        durees = sorted(d for _, d in resultats)
+
+        for statut, nombre in sorted(statuts.items()):
+            self.stdout.write(f"HTTP {statut or 'erreur'} : {nombre}")
+        self.stdout.write(f"Latence médiane : {statistics.median(durees) * 1000:.2f} ms")
+        self.stdout.write(f"Latence p99     : {durees[int(0.99 * (len(durees) - 1))] * 1000:.2f} ms")
+        self.stdout.write(self.style.SUCCESS(f"✓ {len(resultats) / duree:.0f} requêtes/s ({duree:.2f} s)"))
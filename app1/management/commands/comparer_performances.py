@@ -0,0 +1,64 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app1.services.banc_service import BancService
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare deux résultats de mesurer_performances (référence puis candidat) et signale "
+        "les régressions : débit en baisse au-delà du seuil ou requêtes SQL supplémentaires "
+        "par opération. Code de sortie 1 en cas de régression."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('reference', help='JSON de référence (ex: benchmarks/avant.json)')
+        parser.add_argument('candidat', help='JSON à comparer (ex: benchmarks/apres.json)')
+        parser.add_argument('--seuil', type=float, default=0.15, help='Baisse de débit tolérée (défaut : 0.15 = 15 %%)')
+        parser.add_argument('--seuil-requetes', type=float, default=0.5,
+                            help='Requêtes SQL supplémentaires tolérées par opération (défaut : 0.5)')
+
+    def handle(self, *args, **options):
+        reference, candidat = (self.charger(options[cle]) for cle in ('reference', 'candidat'))
+
+        for libelle, donnees in (('Référence', reference), ('Candidat ', candidat)):
+            env = donnees.get('environnement', {})
+            self.stdout.write(f"{libelle} : {env.get('date')} commit {env.get('commit') or '?'} — "
+                              f"Python {env.get('python')}, SQLite {env.get('sqlite')}, {env.get('machine')}")
+        if reference.get('environnement', {}).get('machine') != candidat.get('environnement', {}).get('machine'):
+            self.stdout.write(self.style.WARNING("⚠️ Machines différentes : les débits ne sont pas directement comparables"))
+
+        lignes = BancService.comparer(reference, candidat, options['seuil'], options['seuil_requetes'])
+
+        self.stdout.write(f"\n{'Scénario':<32} {'Taille':>8} {'Réf. ops/s':>11} {'ops/s':>9} {'Écart':>8} {'Δ req/op':>9}  Verdict")
+        for ligne in lignes:
+            ancien, nouveau = ligne['reference'], ligne['candidat']
+            variation = f"{ligne['variation']:+.0%}" if ligne['variation'] is not None else '-'
+            delta = f"{ligne['delta_requetes']:+.1f}" if ligne['delta_requetes'] is not None else '-'
+            texte = (
+                f"{ligne['scenario']:<32} {ligne['taille']:>8} "
+                f"{(ancien or {}).get('ops_par_s', '-'):>11} {(nouveau or {}).get('ops_par_s', '-'):>9} "
+                f"{variation:>8} {delta:>9}  {ligne['verdict']}"
+            )
+            if ligne['verdict'] == 'REGRESSION':
+                self.stdout.write(self.style.ERROR(texte))
+            elif ligne['verdict'] == 'AMELIORATION':
+                self.stdout.write(self.style.SUCCESS(texte))
+            elif ligne['verdict'] in ('ABSENT', 'NOUVEAU'):
+                self.stdout.write(self.style.WARNING(texte))
+            else:
+                self.stdout.write(texte)
+
+        regressions = [ligne for ligne in lignes if ligne['verdict'] == 'REGRESSION']
+        if regressions:
+            raise CommandError(f"{len(regressions)} régression(s) sur {len(lignes)} mesures")
+
+        self.stdout.write(self.style.SUCCESS(f"\n✓ Aucune régression sur {len(lignes)} mesures"))
+
+    def charger(self, chemin):
+        try:
+            return json.loads(Path(chemin).read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Lecture impossible de {chemin} : {e}")
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app1.services.instantane_service import InstantaneService
+
+
+class Command(BaseCommand):
+    help = (
+        "Instantané de db.sqlite3 par l'API de sauvegarde en ligne de SQLite (l'application "
+        "continue d'écrire pendant la copie). Seuls les blocs modifiés depuis les instantanés "
+        "précédents sont stockés. Applique ensuite la politique de rétention INSTANTANES_GARDER_*."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--etiquette', default='', help='Libellé de l\'instantané (ex: avant-migration)')
+        parser.add_argument('--sans-retention', action='store_true', help='Ne supprimer aucun instantané')
+        parser.add_argument('--lister', action='store_true', help='Lister les instantanés sans en créer')
+
+    def handle(self, *args, **options):
+        if options['lister']:
+            self.lister()
+            return
+
+        manifeste = InstantaneService.creer(etiquette=options['etiquette'])
+        if manifeste is None:
+            raise CommandError("La base principale n'est pas SQLite")
+
+        self.stdout.write(
+            f"📸 {manifeste['id']} : {manifeste['taille'] / 1e6:.1f} Mo, {len(manifeste['blocs'])} blocs dont "
+            f"{manifeste['nouveaux_blocs']} nouveaux ({manifeste['octets_ecrits'] / 1e6:.1f} Mo écrits) "
+            f"en {manifeste['duree']} s"
+        )
+        if not options['sans_retention']:
+            retention = InstantaneService.appliquer_retention()
+            self.stdout.write(
+                f"🧹 {retention['instantanes_supprimes']} instantané(s) et {retention['blocs_supprimes']} bloc(s) "
+                f"supprimés ({retention['octets_liberes'] / 1e6:.1f} Mo libérés)"
+            )
+        self.stdout.write(self.style.SUCCESS(f"✓ Instantané {manifeste['id']} créé"))
+
+    def lister(self):
+        manifestes = InstantaneService.lister()
+        for manifeste in manifestes:
+            self.stdout.write(
+                f"  {manifeste['id']}  {manifeste['taille'] / 1e6:>9.1f} Mo  "
+                f"{manifeste['nouveaux_blocs']:>5}/{len(manifeste['blocs']):<5} blocs nouveaux  {manifeste['etiquette']}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"✓ {len(manifestes)} instantané(s) dans {InstantaneService.repertoire()}"))
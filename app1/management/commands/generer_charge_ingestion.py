@@ -0,0 +1,147 @@
+import json
+import math
+import random
+import statistics
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from app1.models import Expedition
+from app1.services.ingestion_service import IngestionService, SaturationIngestion
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère des événements terrain (GPS, scans, preuves de livraison) pour les tournées "
+        "existantes et mesure le débit d'ingestion. Sans --url, les lots sont ingérés dans ce "
+        "processus puis annulés (sauf --conserver) ; avec --url, ils sont envoyés en NDJSON "
+        "à un serveur lancé (runserver, gunicorn...)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--evenements', type=int, default=20000, help='Nombre d\'événements (défaut : 20000)')
+        parser.add_argument('--lot', type=int, default=1000, help='Événements par lot (défaut : 1000)')
+        parser.add_argument('--doublons', type=float, default=0.02, help='Part de lots renvoyés deux fois (défaut : 0.02)')
+        parser.add_argument('--url', help='Ex: http://localhost:8000/api/evenements/')
+        parser.add_argument('--jeton', default='', help='Jeton INGESTION_JETON du serveur')
+        parser.add_argument('--clients', type=int, default=4, help='Envois simultanés avec --url (défaut : 4)')
+        parser.add_argument('--conserver', action='store_true', help='Conserver les événements (mode local)')
+        parser.add_argument('--graine', type=int, default=42, help='Graine aléatoire (défaut : 42)')
+
+    def handle(self, *args, **options):
+        hasard = random.Random(options['graine'])
+
+        arrets = list(
+            Expedition.objects.filter(tournee__isnull=False)
+            .values_list('tournee_id', 'id', 'destination__latitude', 'destination__longitude')
+        )
+        if not arrets:
+            raise CommandError("Aucune expédition affectée à une tournée")
+
+        lots = self.generer_lots(arrets, options, hasard)
+        nb_evenements = sum(len(lot) for lot in lots)
+        self.stdout.write(f"📡 {nb_evenements} événements en {len(lots)} lots")
+
+        debut = time.perf_counter()
+        if options['url']:
+            resultats = self.envoyer(lots, options)
+        else:
+            with transaction.atomic():
+                resultats = [self.ingerer_local(lot) for lot in lots]
+                transaction.set_rollback(not options['conserver'])
+        duree = time.perf_counter() - debut
+
+        self.afficher(resultats, nb_evenements, duree)
+
+    # ==================== GÉNÉRATION ====================
+
+    def generer_lots(self, arrets, options, hasard):
+        """Pings GPS autour des destinations + un scan et une preuve (ou un échec) par arrêt"""
+        depart = timezone.now().replace(microsecond=0)
+        evenements = []
+
+        while len(evenements) < options['evenements']:
+            tournee_id, expedition_id, latitude, longitude = hasard.choice(arrets)
+            latitude = latitude if latitude is not None else 36.75
+            longitude = longitude if longitude is not None else 3.06
+            horodatage = depart + timedelta(seconds=len(evenements))
+            commun = {'tournee': tournee_id, 'horodatage': horodatage.isoformat()}
+
+            tirage = hasard.random()
+            if tirage < 0.9:
+                evenement = {
+                    'type': 'GPS',
+                    'lat': round(latitude + hasard.uniform(-0.05, 0.05), 6),
+                    'lon': round(longitude + hasard.uniform(-0.05, 0.05), 6),
+                }
+            elif tirage < 0.96:
+                evenement = {'type': 'SCAN', 'expedition': expedition_id, 'lat': latitude, 'lon': longitude}
+            elif tirage < 0.99:
+                evenement = {'type': 'LIVRAISON', 'expedition': expedition_id, 'donnees': {'signataire': 'Destinataire'}}
+            else:
+                evenement = {'type': 'ECHEC', 'expedition': expedition_id, 'donnees': {'motif': 'Absent'}}
+
+            evenements.append(json.dumps({'id': uuid.UUID(int=hasard.getrandbits(128)).hex, **commun, **evenement}))
+
+        taille = max(1, options['lot'])
+        lots = [evenements[i:i + taille] for i in range(0, len(evenements), taille)]
+
+        # Lots renvoyés (coupure réseau simulée) : doivent être ignorés à la 2e réception
+        renvois = [lot for lot in lots if hasard.random() < options['doublons']]
+        return lots + renvois
+
+    # ==================== ENVOI ====================
+
+    def ingerer_local(self, lot):
+        debut = time.perf_counter()
+        try:
+            resultat = IngestionService.ingerer(lot)
+        except SaturationIngestion:
+            return {'statut': 503, 'duree': time.perf_counter() - debut}
+        return {'statut': 200, 'duree': time.perf_counter() - debut, **resultat}
+
+    def envoyer(self, lots, options):
+        entetes = {'Content-Type': 'application/x-ndjson'}
+        if options['jeton']:
+            entetes['Authorization'] = f"Bearer {options['jeton']}"
+
+        def poster(lot):
+            corps = ('\n'.join(lot) + '\n').encode()
+            debut = time.perf_counter()
+            # Contre-pression : 503 → attendre Retry-After puis renvoyer le même lot
+            for _ in range(10):
+                requete = urllib.request.Request(options['url'], data=corps, headers=entetes, method='POST')
+                try:
+                    with urllib.request.urlopen(requete, timeout=60) as reponse:
+                        return {'statut': reponse.status, 'duree': time.perf_counter() - debut, **json.load(reponse)}
+                except urllib.error.HTTPError as e:
+                    if e.code != 503:
+                        return {'statut': e.code, 'duree': time.perf_counter() - debut}
+                    time.sleep(float(e.headers.get('Retry-After', 1)))
+            return {'statut': 503, 'duree': time.perf_counter() - debut}
+
+        with ThreadPoolExecutor(max_workers=options['clients']) as pool:
+            return list(pool.map(poster, lots))
+
+    # ==================== AFFICHAGE ====================
+
+    def afficher(self, resultats, nb_evenements, duree):
+        acceptes = [r for r in resultats if r['statut'] == 200]
+        durees = sorted(r['duree'] for r in resultats)
+
+        self.stdout.write(f"Lots acceptés           : {len(acceptes)} / {len(resultats)}")
+        self.stdout.write(f"Lots refusés (statut)   : {len(resultats) - len(acceptes)}")
+        self.stdout.write(f"Événements insérés      : {sum(r['inseres'] for r in acceptes)}")
+        self.stdout.write(f"Doublons ignorés        : {sum(r['doublons'] for r in acceptes)}")
+        self.stdout.write(f"Jalons de suivi créés   : {sum(r['jalons'] for r in acceptes)}")
+        self.stdout.write(f"Erreurs de validation   : {sum(len(r['erreurs']) for r in acceptes)}")
+        self.stdout.write(f"Durée par lot (médiane) : {statistics.median(durees) * 1000:.0f} ms")
+        self.stdout.write(f"Durée par lot (p95)     : {durees[math.ceil(0.95 * len(durees)) - 1] * 1000:.0f} ms")
+        self.stdout.write(self.style.SUCCESS(f"✓ {nb_evenements / duree:.0f} événements/s ({duree:.2f} s)"))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from app1.services.donnees_service import DonneesService
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère un jeu de données synthétique cohérent (clients, tournées, expéditions, suivis, "
+        "factures, paiements, grand livre, incidents) dans la base configurée, pour les tests de "
+        "charge. Tirages NumPy reproductibles (--graine), signaux suspendus, insertions par lots. "
+        "Les données s'ajoutent à l'existant : à lancer sur une base de test, jamais en production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expeditions', type=int, default=100000, help="Nombre d'expéditions à ajouter (défaut : 100000)")
+        parser.add_argument('--jours', type=int, default=365, help='Historique couvert en jours (défaut : 365)')
+        parser.add_argument('--graine', type=int, default=42, help='Graine aléatoire (défaut : 42)')
+        parser.add_argument('--taille-lot', type=int, default=DonneesService.TAILLE_LOT,
+                            help=f'Expéditions par transaction (défaut : {DonneesService.TAILLE_LOT})')
+
+    def handle(self, *args, **options):
+        if options['expeditions'] <= 0:
+            raise CommandError("--expeditions doit être positif")
+
+        self.stdout.write(f"🗄️ Base : {connection.settings_dict['NAME']} ({connection.vendor})")
+        debut = time.perf_counter()
+
+        def progression(ecrites):
+            ecoule = time.perf_counter() - debut
+            self.stdout.write(f"  … {ecrites}/{options['expeditions']} expéditions ({ecoule:.1f} s)", ending='\r')
+            self.stdout.flush()
+
+        compteurs = DonneesService.generer(
+            options['expeditions'], jours=options['jours'], graine=options['graine'],
+            progression=progression, taille_lot=options['taille_lot'],
+        )
+        duree = time.perf_counter() - debut
+        lignes = sum(compteurs.values())
+
+        self.stdout.write('')
+        for table, nombre in compteurs.items():
+            self.stdout.write(f"  {table:<24} {nombre:>10}")
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {lignes} lignes générées en {duree:.1f} s ({lignes / duree:.0f} lignes/s)"
+        ))
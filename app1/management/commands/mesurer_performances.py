@@ -0,0 +1,124 @@
+import contextlib
+import json
+import os
+import random
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from app1.models import AgentUtilisateur, Expedition
+from app1.services.banc_service import BancService
+from app1.services.donnees_service import DonneesService
+
+
+class Command(BaseCommand):
+    help = (
+        "Banc d'essai des chemins critiques : création d'expédition, paiement, démarrage / "
+        "finalisation de tournée, résolution d'incident, vues liste_* et exports PDF, "
+        "pour chaque taille de jeu de données (nombre d'expéditions). Les mesures sont faites "
+        "sur une base dédiée (--base, conservée d'une exécution à l'autre), jamais sur db.sqlite3. "
+        "Résultat JSON à comparer avec comparer_performances."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tailles', type=int, nargs='+', default=[10000, 100000],
+                            help="Tailles du jeu de données en expéditions (défaut : 10000 100000 ; ajouter 1000000 pour le palier 1M)")
+        parser.add_argument('--scenarios', nargs='+', help='Ne mesurer que ces scénarios (ex: expedition_creation liste_clients)')
+        parser.add_argument('--categories', nargs='+', choices=['ecriture', 'liste', 'pdf'], help='Ne mesurer que ces catégories')
+        parser.add_argument('--operations', type=int, default=30, help='Opérations par scénario (défaut : 30)')
+        parser.add_argument('--duree-max', type=float, default=10.0, help='Secondes maximum par scénario (défaut : 10)')
+        parser.add_argument('--base', default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'banc.sqlite3'),
+                            help='Base SQLite du banc (défaut : benchmarks/banc.sqlite3)')
+        parser.add_argument('--reinitialiser', action='store_true', help='Recréer la base du banc (jeu de données régénéré)')
+        parser.add_argument('--sortie', help='Fichier JSON du résultat (défaut : benchmarks/AAAAMMJJ-HHMMSS.json)')
+        parser.add_argument('--graine', type=int, default=42, help='Graine aléatoire (défaut : 42)')
+
+    def handle(self, *args, **options):
+        base = Path(options['base']).resolve()
+        base.parent.mkdir(parents=True, exist_ok=True)
+        if options['reinitialiser'] and base.exists():
+            base.unlink()
+
+        # Base dédiée : mêmes mécanismes que la base de test de Django (migrations comprises)
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = str(base)
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=True)
+        self.stdout.write(f"🗄️ Base du banc : {base}")
+
+        reglages = {
+            'REPLICA_ANALYTIQUE_ACTIVE': False,
+            'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+            'MATRICE_DISTANCES_DIR': str(base.parent / 'matrices'),
+            'REQUETES_BUDGET_ACTIF': False,
+            'REQUETES_BUDGET_STRICT': False,
+        }
+        with override_settings(**reglages):
+            resultats = self.executer(options)
+
+        sortie = Path(options['sortie'] or base.parent / f"{timezone.localtime():%Y%m%d-%H%M%S}.json")
+        sortie.write_text(json.dumps({
+            'environnement': BancService.environnement(),
+            'parametres': {cle: options[cle] for cle in ('tailles', 'operations', 'duree_max', 'graine')},
+            'resultats': resultats,
+        }, indent=2, ensure_ascii=False), encoding='utf-8')
+
+        self.stdout.write(self.style.SUCCESS(f"✓ {len(resultats)} mesures écrites dans {sortie}"))
+
+    def executer(self, options):
+        agent, _ = AgentUtilisateur.objects.get_or_create(
+            username='banc', defaults={'is_responsable': True, 'first_name': 'Banc', 'last_name': "d'essai"}
+        )
+        resultats = []
+
+        for taille in sorted(options['tailles']):
+            self.completer(taille, options['graine'])
+
+            hasard = random.Random(options['graine'])
+            for scenario in BancService.scenarios(agent, hasard, nb_elements=options['operations']):
+                if options['scenarios'] and scenario.nom not in options['scenarios']:
+                    continue
+                if options['categories'] and scenario.categorie not in options['categories']:
+                    continue
+
+                try:
+                    # Messages print() des services (emails...) : écrits, mais pas à l'écran
+                    with open(os.devnull, 'w') as muet, contextlib.redirect_stdout(muet):
+                        resultat = BancService.mesurer(scenario, taille, options['operations'], options['duree_max'])
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"  ❌ {scenario.nom} : {type(e).__name__} : {e}"))
+                    continue
+
+                if resultat is None:
+                    self.stdout.write(self.style.WARNING(f"  ⚠️ {scenario.nom} : aucune donnée à traiter, ignoré"))
+                    continue
+
+                resultats.append(resultat)
+                self.stdout.write(
+                    f"  {scenario.nom:<32} {resultat['ops_par_s']:>9} ops/s  "
+                    f"p50 {resultat['latence_p50_ms']:>9} ms  p95 {resultat['latence_p95_ms']:>9} ms  "
+                    f"{resultat['requetes_par_op']:>7} requêtes/op"
+                )
+
+        return resultats
+
+    def completer(self, taille, graine):
+        """Ajoute les expéditions manquantes pour atteindre `taille`"""
+        existantes = Expedition.objects.count()
+        self.stdout.write(f"\n📦 Palier {taille} expéditions ({existantes} en base)")
+        if existantes >= taille:
+            return
+
+        debut = time.perf_counter()
+
+        def progression(ecrites):
+            self.stdout.write(f"  … {existantes + ecrites}/{taille}", ending='\r')
+            self.stdout.flush()
+
+        compteurs = DonneesService.generer(taille - existantes, graine=graine, progression=progression)
+        duree = time.perf_counter() - debut
+        lignes = sum(compteurs.values())
+        self.stdout.write(f"  ✚ {lignes} lignes générées en {duree:.1f} s ({lignes / duree:.0f} lignes/s)")
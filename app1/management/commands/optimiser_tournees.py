@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from app1.models import Tournee
+from app1.services.optimisation_service import OptimisationTourneeService
+
+
+class Command(BaseCommand):
+    help = "Calcule l'ordre de livraison optimisé (une tournée ou toutes les tournées PREVUE)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tournee',
+            type=int,
+            help='ID de la tournée à optimiser (défaut : toutes les tournées PREVUE)'
+        )
+        parser.add_argument(
+            '--processus',
+            type=int,
+            default=None,
+            help='Nombre de processus pour le mode lot (défaut : nombre de CPU)'
+        )
+
+    def handle(self, *args, **options):
+        debut = time.time()
+
+        if options['tournee']:
+            try:
+                tournee = Tournee.objects.get(id=options['tournee'])
+            except Tournee.DoesNotExist:
+                raise CommandError(f"Tournée #{options['tournee']} introuvable")
+            resultats = [OptimisationTourneeService.optimiser_tournee(tournee)]
+        else:
+            resultats = OptimisationTourneeService.optimiser_tournees_prevues(processus=options['processus'])
+
+        for resultat in resultats:
+            self.stdout.write(
+                f"  → Tournée #{resultat['tournee_id']} : {resultat['nb_arrets']} arrêt(s), "
+                f"{resultat['kilometrage_estime']} km estimés"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {len(resultats)} tournée(s) optimisée(s) en {time.time() - debut:.2f} s"
+        ))
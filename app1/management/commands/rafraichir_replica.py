@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from app1.services.replica_service import ReplicaService
+
+
+class Command(BaseCommand):
+    help = 'Copie la base principale vers la réplica analytique (API backup SQLite)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages',
+            type=int,
+            default=1024,
+            help='Nombre de pages copiées par étape (défaut : 1024)'
+        )
+
+    def handle(self, *args, **options):
+        retard_avant = ReplicaService.retard()
+        resultat = ReplicaService.rafraichir(pages_par_etape=options['pages'])
+
+        if resultat is None:
+            self.stdout.write(self.style.WARNING("Réplica non configurée (SQLite uniquement)"))
+            return
+
+        if retard_avant is None:
+            self.stdout.write("  Première copie de la réplica")
+        else:
+            self.stdout.write(f"  Retard avant copie : {retard_avant} s")
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Réplica rafraîchie en {resultat['duree']} s"))
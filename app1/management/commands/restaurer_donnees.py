@@ -0,0 +1,56 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.base import DeserializationError
+from django.db import DatabaseError, connection
+
+from app1.services.sauvegarde_service import SauvegardeService
+
+
+class Command(BaseCommand):
+    help = (
+        "Restaure une sauvegarde (sauvegarder_donnees) ou un fichier dumpdata (JSON, même précédé "
+        "de lignes parasites, ou NDJSON ; compressé ou non) par lots, signaux suspendus, en une "
+        "seule transaction. Les objets de même clé primaire sont remplacés. À lancer sur une base "
+        "migrée ; rien n'est écrit si une contrainte échoue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help='Fichier à restaurer (ex: backup_data.json, sauvegardes/….jsonl.gz)')
+        parser.add_argument('--taille-lot', type=int, default=SauvegardeService.TAILLE_LOT,
+                            help=f'Objets insérés par requête (défaut : {SauvegardeService.TAILLE_LOT})')
+        parser.add_argument('--exclure', nargs='*', default=None,
+                            help=f"Applications ou modèles ignorés (défaut : {' '.join(SauvegardeService.EXCLUS)})")
+        parser.add_argument('--ignorer-champs-absents', action='store_true',
+                            help='Ignorer les champs et modèles inconnus de la base (comme loaddata -i)')
+
+    def handle(self, *args, **options):
+        fichier = Path(options['fichier'])
+        if not fichier.is_file():
+            raise CommandError(f"Fichier introuvable : {fichier}")
+
+        self.stdout.write(f"📥 {fichier} → {connection.settings_dict['NAME']} ({connection.vendor})")
+        debut = time.perf_counter()
+
+        def progression(modele, nombre):
+            self.stdout.write(f"  … {modele._meta.label_lower:<32} {nombre:>10}", ending='\r')
+            self.stdout.flush()
+
+        try:
+            compteurs = SauvegardeService.restaurer(
+                fichier, taille_lot=options['taille_lot'],
+                ignorer_champs_absents=options['ignorer_champs_absents'], exclus=options['exclure'],
+                progression=progression,
+            )
+        except (DatabaseError, DeserializationError, ValueError) as e:
+            raise CommandError(f"Restauration annulée : {type(e).__name__} : {e}")
+        duree = time.perf_counter() - debut
+        objets = sum(compteurs.values())
+
+        self.stdout.write('')
+        for modele, nombre in compteurs.items():
+            self.stdout.write(f"  {modele:<32} {nombre:>10}")
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {objets} objets restaurés en {duree:.1f} s ({objets / max(duree, 1e-9):.0f} objets/s)"
+        ))
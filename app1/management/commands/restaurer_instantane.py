@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app1.services.instantane_service import InstantaneIntrouvable, InstantaneService
+
+
+class Command(BaseCommand):
+    help = (
+        "Restaure un instantané dans un fichier (--vers) ou, avec --confirmer, à la place de la "
+        "base principale : copie en ligne par l'API backup de SQLite, après un instantané de "
+        "sécurité de l'état actuel. Les blocs sont vérifiés avant toute écriture."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('identifiant', help="Instantané à restaurer (ex: 20250115-080000-000, ou 'dernier')")
+        parser.add_argument('--vers', help='Fichier SQLite à écrire au lieu de la base principale')
+        parser.add_argument('--confirmer', action='store_true', help='Autorise le remplacement de la base principale')
+
+    def handle(self, *args, **options):
+        if not options['vers'] and not options['confirmer']:
+            raise CommandError("Remplacement de la base principale : ajouter --confirmer (ou --vers FICHIER)")
+
+        try:
+            resultat = InstantaneService.restaurer(options['identifiant'], cible=options['vers'])
+        except (InstantaneIntrouvable, ValueError) as e:
+            raise CommandError(str(e))
+
+        if resultat['securite']:
+            self.stdout.write(f"📸 État précédent conservé dans l'instantané {resultat['securite']}")
+        self.stdout.write(self.style.SUCCESS(f"✓ Instantané {resultat['id']} restauré dans {resultat['cible']}"))
@@ -0,0 +1,54 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app1.services.sauvegarde_service import SauvegardeService
+
+
+class Command(BaseCommand):
+    help = (
+        "Sauvegarde la base au format NDJSON de dumpdata (un objet par ligne, relisible par "
+        "loaddata et restaurer_donnees), une table par worker, en mémoire constante. "
+        "Compression selon l'extension : .gz, .bz2, .xz. Sur SQLite, les tables sont lues dans "
+        "des transactions distinctes : base au repos, ou --workers 1 pour un instantané unique."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('etiquettes', nargs='*', help='Applications ou modèles (ex: app1 auth.user ; défaut : tout)')
+        parser.add_argument('--sortie', help='Fichier produit (défaut : sauvegardes/sauvegarde-AAAAMMJJ-HHMMSS.jsonl.gz)')
+        parser.add_argument('--exclure', nargs='*', default=None,
+                            help=f"Applications ou modèles ignorés (défaut : {' '.join(SauvegardeService.EXCLUS)})")
+        parser.add_argument('--workers', type=int, default=4, help='Tables exportées en parallèle (défaut : 4)')
+        parser.add_argument('--taille-lot', type=int, default=SauvegardeService.TAILLE_LOT,
+                            help=f'Objets lus par requête (défaut : {SauvegardeService.TAILLE_LOT})')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers doit être positif")
+        sortie = Path(options['sortie'] or Path(settings.BASE_DIR) / 'sauvegardes'
+                      / f"sauvegarde-{timezone.localtime():%Y%m%d-%H%M%S}.jsonl.gz")
+
+        try:
+            modeles = SauvegardeService.modeles(options['etiquettes'], options['exclure'])
+        except LookupError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"💾 {len(modeles)} tables → {sortie}")
+
+        debut = time.perf_counter()
+
+        def progression(modele, nombre):
+            self.stdout.write(f"  {modele._meta.label_lower:<32} {nombre:>10}")
+
+        compteurs = SauvegardeService.sauvegarder(
+            sortie, etiquettes=[modele._meta.label for modele in modeles], exclus=[],
+            workers=options['workers'], taille_lot=options['taille_lot'], progression=progression,
+        )
+        duree = time.perf_counter() - debut
+        objets = sum(compteurs.values())
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {objets} objets sauvegardés en {duree:.1f} s ({sortie.stat().st_size / 1e6:.1f} Mo)"
+        ))
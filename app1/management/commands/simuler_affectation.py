@@ -0,0 +1,168 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from app1.models import Destination, Tournee, TypeService
+from app1.services.affectation_service import AffectationService
+from app1.services.calendrier_service import CalendrierService
+from app1.services.distance_service import DistanceService
+
+
+class Command(BaseCommand):
+    help = (
+        "Simule l'affectation de demandes fictives avec l'ancienne règle (premier libre) "
+        "puis avec AffectationService et compare l'utilisation de la flotte. "
+        "Tout est annulé en fin de simulation (aucune donnée conservée)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--demandes', type=int, default=60, help='Nombre de demandes simulées (défaut : 60)')
+        parser.add_argument('--jours', type=int, default=14, help='Horizon en jours (défaut : 14)')
+        parser.add_argument('--express', type=float, default=0.3, help='Part de demandes EXPRESS (défaut : 0.3)')
+        parser.add_argument('--graine', type=int, default=42, help='Graine aléatoire (défaut : 42)')
+
+    def handle(self, *args, **options):
+        destinations = list(Destination.objects.exclude(zone_geographique='INTERNATIONALE'))
+        services = {service.type_service: service for service in TypeService.objects.all()}
+
+        if not destinations or not {'STANDARD', 'EXPRESS'} <= set(services):
+            raise CommandError("Il faut des destinations nationales et les services STANDARD et EXPRESS")
+
+        demandes = self.generer_demandes(options, destinations, services)
+        self.stdout.write(f"📦 {len(demandes)} demandes sur {options['jours']} jours")
+
+        resultats = {}
+        for politique in ('premier_libre', 'affectation'):
+            debut = time.perf_counter()
+            with transaction.atomic():
+                resultats[politique] = self.simuler(politique, demandes)
+                transaction.set_rollback(True)
+            resultats[politique]['duree'] = time.perf_counter() - debut
+
+        self.afficher(resultats)
+
+    # ==================== DEMANDES ====================
+
+    def generer_demandes(self, options, destinations, services):
+        hasard = random.Random(options['graine'])
+        origine = (timezone.now() + timedelta(days=1)).replace(hour=8, minute=0, second=0, microsecond=0)
+
+        demandes = []
+        for _ in range(options['demandes']):
+            express = hasard.random() < options['express']
+            poids = hasard.uniform(0.5, 30) if express else hasard.uniform(5, 400)
+            destination = hasard.choice(destinations)
+            jours_route = DistanceService.jours_route(destination) or 1
+            depart = origine + timedelta(days=hasard.randrange(options['jours']), hours=hasard.randrange(8))
+
+            demandes.append(SimpleNamespace(
+                type_service=services['EXPRESS' if express else 'STANDARD'],
+                poids=Decimal(str(round(poids, 2))),
+                volume=Decimal('0.10'),
+                destination=destination,
+                debut=depart,
+                fin=depart + timedelta(days=2 * jours_route),
+                km=round(2 * (DistanceService.distance(None, destination.id) or 100)),
+            ))
+
+        demandes.sort(key=lambda demande: demande.debut)
+        return demandes
+
+    # ==================== SIMULATION ====================
+
+    def simuler(self, politique, demandes):
+        """Affecte chaque demande (tournée partagée existante si STANDARD, sinon nouvelle tournée)"""
+        charges = {}   # tournee_id → [capacité, charge, type_vehicule, privée, zone, jour]
+        refus = surcharges = 0
+
+        for demande in demandes:
+            express = demande.type_service.type_service == 'EXPRESS'
+
+            # STANDARD : tournée partagée de la même zone, même jour, avec de la place
+            if not express:
+                partagee = next((
+                    tournee_id for tournee_id, (capacite, charge, _, privee, zone, jour) in charges.items()
+                    if not privee and zone == demande.destination.zone_logistique
+                    and jour == demande.debut.date() and charge + demande.poids <= capacite
+                ), None)
+                if partagee:
+                    charges[partagee][1] += demande.poids
+                    continue
+
+            champs = {
+                'zone_cible': demande.destination.zone_logistique,
+                'est_privee': express,
+                'statut': 'PREVUE',
+            }
+
+            if politique == 'premier_libre':
+                chauffeur = CalendrierService.chauffeurs_libres(demande.debut, demande.fin).first()
+                vehicule = CalendrierService.vehicules_libres(demande.debut, demande.fin).first()
+                tournee = None
+                if chauffeur and vehicule:
+                    tournee = Tournee.objects.create(
+                        chauffeur=chauffeur, vehicule=vehicule,
+                        date_depart=demande.debut, date_retour_prevue=demande.fin, **champs
+                    )
+            else:
+                tournee = AffectationService.creer_tournee(demande.debut, demande.fin, demande, **champs)
+
+            if tournee is None:
+                refus += 1
+                continue
+
+            Tournee.objects.filter(pk=tournee.pk).update(kilometrage_estime=demande.km)
+            capacite = tournee.vehicule.capacite_poids
+            if demande.poids > capacite:
+                surcharges += 1
+
+            charges[tournee.pk] = [
+                capacite, demande.poids, tournee.vehicule.type_vehicule, express,
+                demande.destination.zone_logistique, demande.debut.date(),
+            ]
+
+        km_par_chauffeur = {}
+        for chauffeur_id, km in Tournee.objects.filter(pk__in=charges).values_list('chauffeur_id', 'kilometrage_estime'):
+            km_par_chauffeur[chauffeur_id] = km_par_chauffeur.get(chauffeur_id, 0) + (km or 0)
+
+        remplissages = [float(min(charge / capacite, 1)) for capacite, charge, *_ in charges.values() if capacite]
+
+        return {
+            'tournees': len(charges),
+            'refus': refus,
+            'surcharges': surcharges,
+            'remplissage': statistics.mean(remplissages) if remplissages else 0,
+            'express_camion': sum(1 for _, _, type_vehicule, privee, *_ in charges.values() if privee and type_vehicule == 'CAMION'),
+            'chauffeurs': len(km_par_chauffeur),
+            'ecart_km': statistics.pstdev(km_par_chauffeur.values()) if len(km_par_chauffeur) > 1 else 0,
+        }
+
+    # ==================== AFFICHAGE ====================
+
+    def afficher(self, resultats):
+        lignes = [
+            ('Tournées créées', 'tournees', '{:d}'),
+            ('Demandes refusées (aucune ressource)', 'refus', '{:d}'),
+            ('Colis plus lourds que le véhicule', 'surcharges', '{:d}'),
+            ('Remplissage moyen des véhicules', 'remplissage', '{:.1%}'),
+            ('Tournées EXPRESS sur un CAMION', 'express_camion', '{:d}'),
+            ('Chauffeurs sollicités', 'chauffeurs', '{:d}'),
+            ('Écart-type km par chauffeur', 'ecart_km', '{:.0f}'),
+            ('Durée de la simulation (s)', 'duree', '{:.2f}'),
+        ]
+
+        self.stdout.write(f"\n{'':40} {'Premier libre':>15} {'Affectation':>15}")
+        for libelle, cle, format_valeur in lignes:
+            self.stdout.write(
+                f"{libelle:40} {format_valeur.format(resultats['premier_libre'][cle]):>15} "
+                f"{format_valeur.format(resultats['affectation'][cle]):>15}"
+            )
+
+        self.stdout.write(self.style.SUCCESS("\n✓ Simulation terminée (aucune donnée conservée)"))
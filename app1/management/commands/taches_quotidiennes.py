@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from app1.models import Tournee
+from app1.services.metriques_service import MetriquesService
 from app1.utils import VehiculeService
 
 
@@ -33,6 +34,7 @@ class Command(BaseCommand):
         self.stdout.write("=" * 70)
     
     
+    @MetriquesService.chronometrer('taches_quotidiennes.execution_matin')
     def execution_matin(self):
         """Exécution du MATIN à 8h"""
         
@@ -46,6 +48,7 @@ class Command(BaseCommand):
         self.gerer_retours_maintenance()
     
     
+    @MetriquesService.chronometrer('taches_quotidiennes.execution_soir')
     def execution_soir(self):
         """Exécution du SOIR à 17h30"""
         
@@ -53,6 +56,7 @@ class Command(BaseCommand):
         self.gerer_maintenance_veille()
     
     
+    @MetriquesService.chronometrer('taches_quotidiennes.mettre_a_jour_tournees')
     def mettre_a_jour_tournees(self):
             """Met à jour les statuts des tournées PREVUE → EN_COURS"""
             self.stdout.write("\n--- 1. Mise à jour des tournées ---")
@@ -83,6 +87,7 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.WARNING("  Aucune tournée à mettre à jour"))
 
     
+    @MetriquesService.chronometrer('taches_quotidiennes.mettre_a_jour_factures')
     def mettre_a_jour_factures(self):
         """Met à jour les statuts des factures (vérifier échéances)"""
         self.stdout.write("\n--- 2. Mise à jour des factures ---")
@@ -109,12 +114,23 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS("  Aucune facture en retard"))
     
     
+    @MetriquesService.chronometrer('taches_quotidiennes.gerer_maintenance_veille')
     def gerer_maintenance_veille(self):
-        """Gère les maintenances du LENDEMAIN (J-1 à 17h30)"""
-        self.stdout.write("\n--- Gestion maintenances de DEMAIN (J-1) ---")
+        """Planifie les maintenances des prochains jours (17h30)"""
+        self.stdout.write("\n--- Planification des maintenances (horizon) ---")
         
         stats = VehiculeService.gerer_maintenance_veille_soir()
         
+        if stats['revisions_reservees'] > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"  ✓ {stats['revisions_reservees']} jour(s) de révision réservé(s) au calendrier"
+                )
+            )
+        
+        if stats['revisions_retirees'] > 0:
+            self.stdout.write(f"  → {stats['revisions_retirees']} réservation(s) de révision obsolète(s) retirée(s)")
+        
         if stats['notifications_vehicule_en_tournee'] > 0:
             self.stdout.write(
                 self.style.WARNING(
@@ -130,9 +146,10 @@ class Command(BaseCommand):
             )
         
         if sum(stats.values()) == 0:
-            self.stdout.write(self.style.WARNING("  Aucune maintenance prévue demain"))
+            self.stdout.write(self.style.WARNING("  Aucune maintenance prévue sur l'horizon"))
     
     
+    @MetriquesService.chronometrer('taches_quotidiennes.gerer_retours_maintenance')
     def gerer_retours_maintenance(self):
         """Gère les retours de maintenance (J+1, J+2, ... à 8h)"""
         self.stdout.write("\n--- 3. Vérification retours de maintenance ---")
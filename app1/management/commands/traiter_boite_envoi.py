@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Count
+
+from app1.models import EvenementSortant
+from app1.services.boite_envoi_service import BoiteEnvoiService
+
+
+class Command(BaseCommand):
+    help = (
+        "Traite les événements en attente de la boîte d'envoi (emails, notifications, séries "
+        "de la flotte) par lots. --boucle : worker dédié (autre processus que le serveur web, "
+        "BOITE_ENVOI_ACTIVE = False côté serveur). Affiche ensuite l'état de la file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--boucle', action='store_true', help='Traiter en continu (Ctrl+C pour arrêter)')
+        parser.add_argument('--taille-lot', type=int, help='Événements par lot (défaut : BOITE_ENVOI_TAILLE_LOT)')
+        parser.add_argument('--rejouer-echecs', action='store_true', help='Remettre les événements ECHEC en attente avant traitement')
+        parser.add_argument('--purger', action='store_true', help='Supprimer les événements traités depuis BOITE_ENVOI_CONSERVATION_JOURS')
+
+    def handle(self, *args, **options):
+        if options['rejouer_echecs']:
+            self.stdout.write(f"🔁 {BoiteEnvoiService.rejouer()} événement(s) en échec remis en attente")
+
+        if options['purger']:
+            self.stdout.write(f"🗑️ {BoiteEnvoiService.purger()} événement(s) traité(s) supprimé(s)")
+
+        if options['boucle']:
+            self.boucle(options['taille_lot'])
+            return
+
+        debut = time.perf_counter()
+        totaux = BoiteEnvoiService.vider(options['taille_lot'])
+        duree = time.perf_counter() - debut
+        self.afficher_file()
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {totaux['traites']} événement(s) traité(s), {totaux['echecs']} erreur(s) en {duree:.2f} s"
+        ))
+
+    def boucle(self, taille_lot):
+        intervalle = getattr(settings, 'BOITE_ENVOI_INTERVALLE_SECONDES', 30)
+        self.stdout.write(f"📬 Worker de la boîte d'envoi (passage toutes les {intervalle} s si file vide)")
+        try:
+            while True:
+                totaux = BoiteEnvoiService.vider(taille_lot)
+                if totaux['lot']:
+                    self.stdout.write(f"  {totaux['traites']} traité(s), {totaux['echecs']} erreur(s)")
+                close_old_connections()
+                time.sleep(0 if totaux['traites'] else intervalle)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS("✓ Worker arrêté"))
+
+    def afficher_file(self):
+        compteurs = dict(EvenementSortant.objects.values_list('statut').annotate(nb=Count('id')).order_by())
+        for statut, libelle in EvenementSortant.STATUTS:
+            self.stdout.write(f"  {libelle:<12} {compteurs.get(statut, 0):>8}")
+        for evenement in EvenementSortant.objects.filter(statut='ECHEC').order_by('-id')[:5]:
+            self.stdout.write(self.style.WARNING(f"  ⚠️ {evenement} : {evenement.derniere_erreur}"))
@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from app1.models import Facture, Paiement
+from app1.utils import FacturationService
+
+
+class Command(BaseCommand):
+    help = 'Vérifie les cumuls des factures (montant_paye_cumule, nb_expeditions, montants) contre la base'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--corriger',
+            action='store_true',
+            help='Recalcule complètement les factures en écart'
+        )
+
+    def handle(self, *args, **options):
+        centime = Decimal('0.01')
+
+        paiements_valides = Paiement.objects.filter(
+            facture=OuterRef('pk'),
+            statut='VALIDE'
+        ).order_by().values('facture').annotate(total=Sum('montant_paye')).values('total')
+
+        # Un seul passage : agrégats réels calculés à côté des cumuls maintenus
+        factures = Facture.objects.exclude(statut='ANNULEE').annotate(
+            nb_reel=Count('expeditions'),
+            ht_reel=Coalesce(Sum('expeditions__montant_total'), Decimal('0.00')),
+            paye_reel=Coalesce(Subquery(paiements_valides), Decimal('0.00')),
+        )
+
+        ecarts = []
+        for facture in factures:
+            problemes = []
+            if facture.nb_expeditions != facture.nb_reel:
+                problemes.append(f"nb_expeditions {facture.nb_expeditions} ≠ {facture.nb_reel}")
+            if facture.montant_ht.quantize(centime) != Decimal(facture.ht_reel).quantize(centime):
+                problemes.append(f"montant_ht {facture.montant_ht} ≠ {facture.ht_reel}")
+            if facture.montant_paye_cumule.quantize(centime) != Decimal(facture.paye_reel).quantize(centime):
+                problemes.append(f"montant_paye_cumule {facture.montant_paye_cumule} ≠ {facture.paye_reel}")
+
+            if problemes:
+                ecarts.append(facture)
+                self.stdout.write(self.style.ERROR(f"  ✗ {facture.numero_facture} : {', '.join(problemes)}"))
+
+        if ecarts and options['corriger']:
+            for facture in ecarts:
+                FacturationService.calculer_montants_facture(facture)
+                FacturationService.mettre_a_jour_statut_facture(facture)
+            self.stdout.write(self.style.SUCCESS(f"✓ {len(ecarts)} facture(s) recalculée(s)"))
+            return
+
+        if ecarts:
+            raise CommandError(f"{len(ecarts)} facture(s) en écart (relancer avec --corriger)")
+
+        self.stdout.write(self.style.SUCCESS("✓ Cumuls des factures cohérents"))
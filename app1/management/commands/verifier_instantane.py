@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app1.services.instantane_service import InstantaneIntrouvable, InstantaneService
+
+
+class Command(BaseCommand):
+    help = (
+        "Vérifie des instantanés : présence et empreinte SHA-256 de chaque bloc, empreinte du "
+        "fichier reconstitué et, avec --integrite, PRAGMA integrity_check sur la copie. "
+        "Code de sortie 1 si un instantané est inutilisable."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('identifiants', nargs='*', help="Instantanés à vérifier ('dernier' accepté ; défaut : tous)")
+        parser.add_argument('--integrite', action='store_true', help='Contrôle SQLite complet de chaque copie (plus long)')
+
+    def handle(self, *args, **options):
+        identifiants = options['identifiants'] or [manifeste['id'] for manifeste in InstantaneService.lister()]
+
+        invalides = 0
+        for identifiant in identifiants:
+            try:
+                resultat = InstantaneService.verifier(identifiant, integrite=options['integrite'])
+            except InstantaneIntrouvable as e:
+                raise CommandError(str(e))
+            if resultat['ok']:
+                self.stdout.write(f"  ✅ {resultat['id']}")
+            else:
+                invalides += 1
+                self.stdout.write(self.style.ERROR(f"  ❌ {resultat['id']}"))
+                for erreur in resultat['erreurs']:
+                    self.stdout.write(f"     {erreur}")
+
+        if invalides:
+            raise CommandError(f"{invalides} instantané(s) inutilisable(s) sur {len(identifiants)}")
+        self.stdout.write(self.style.SUCCESS(f"✓ {len(identifiants)} instantané(s) vérifié(s)"))
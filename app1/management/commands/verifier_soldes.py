@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from app1.models import Client
+from app1.services.solde_service import SoldeService
+
+
+class Command(BaseCommand):
+    help = 'Vérifie que Client.solde correspond à la somme du grand livre (MouvementSolde)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Nombre de vérifications en parallèle (défaut : 4)'
+        )
+        parser.add_argument(
+            '--taille-lot',
+            type=int,
+            default=500,
+            help='Nombre de clients vérifiés par lot (défaut : 500)'
+        )
+
+    def handle(self, *args, **options):
+        taille = options['taille_lot']
+        ids = list(Client.objects.order_by('id').values_list('id', flat=True))
+        lots = [ids[i:i + taille] for i in range(0, len(ids), taille)]
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executeur:
+            resultats = list(executeur.map(self.verifier_lot, lots))
+
+        ecarts = [ecart for lot in resultats for ecart in lot]
+
+        for client_id, solde, attendu in ecarts:
+            self.stdout.write(self.style.ERROR(
+                f"  ✗ CL-{client_id:03d} : solde {solde} DA ≠ grand livre {attendu} DA (écart {solde - attendu:+} DA)"
+            ))
+
+        if ecarts:
+            raise CommandError(f"{len(ecarts)} client(s) sur {len(ids)} en écart avec le grand livre")
+
+        self.stdout.write(self.style.SUCCESS(f"✓ {len(ids)} client(s) vérifié(s), aucun écart"))
+
+    @staticmethod
+    def verifier_lot(client_ids):
+        """Exécuté dans un thread : chaque thread a sa propre connexion, fermée à la fin"""
+        try:
+            return SoldeService.verifier_clients(client_ids)
+        finally:
+            connections.close_all()
@@ -0,0 +1,144 @@
+"""
+middleware.py - Middlewares de l'application
+"""
+
+import time
+
+from django.conf import settings
+
+from .routers import derniere_ecriture, marquer_ecriture, reinitialiser_ecriture, retablir_ecriture
+
+
+class EpinglagePrimaireMiddleware:
+    """
+    "Lecture de ses propres écritures" avec la réplica analytique
+
+    - Début de requête : récupère l'heure de la dernière écriture (cookie)
+    - Requête POST réussie (ou écriture détectée par signal) : mémorise l'heure
+    - Fin de requête : renvoie le cookie pour que les pages suivantes
+      (ex: redirection après création) restent sur la base principale
+      tant que la réplica n'a pas recopié cette écriture
+    """
+
+    NOM_COOKIE = 'derniere_ecriture'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            horodatage = float(request.COOKIES.get(self.NOM_COOKIE, ''))
+        except ValueError:
+            horodatage = None
+
+        jeton = reinitialiser_ecriture(horodatage)
+
+        response = self.get_response(request)
+
+        if request.method == 'POST' and response.status_code < 400:
+            marquer_ecriture()
+
+        ecriture = derniere_ecriture()
+        if ecriture is not None and ecriture != horodatage:
+            response.set_cookie(
+                self.NOM_COOKIE,
+                str(ecriture),
+                max_age=getattr(settings, 'REPLICA_RETARD_MAX', 600),
+                httponly=True,
+                samesite='Lax',
+            )
+
+        retablir_ecriture(jeton)
+        return response
+
+
+class BudgetRequetesMiddleware:
+    """
+    Nombre de requêtes SQL, temps SQL et N+1 de chaque vue
+    (voir services/requetes_service.py, budgets dans app1/urls.py)
+
+    - En-tête Server-Timing : temps SQL de la requête
+    - Budget dépassé ou N+1 : journal + /api/diagnostic/requetes/
+      (exception en mode strict : REQUETES_BUDGET_STRICT)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from .services.requetes_service import RequetesService
+
+        if not getattr(settings, 'REQUETES_BUDGET_ACTIF', True):
+            return self.get_response(request)
+
+        with RequetesService.mesurer() as mesure:
+            response = self.get_response(request)
+
+        response['Server-Timing'] = f'sql;dur={mesure.duree * 1000:.1f};desc="{mesure.nb} requetes"'
+
+        correspondance = request.resolver_match
+        if correspondance is not None and correspondance.url_name:
+            problemes = RequetesService.controler(correspondance.url_name, mesure)
+            if problemes:
+                RequetesService.signaler(correspondance.url_name, request.path, mesure, problemes)
+
+        return response
+
+
+class MetriquesMiddleware:
+    """
+    Durée et statut de chaque requête HTTP, par vue (voir services/metriques_service.py)
+    Exposés sur /metrics
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from .services.metriques_service import MetriquesService
+
+        if not MetriquesService.actif():
+            return self.get_response(request)
+
+        debut = time.perf_counter()
+        response = self.get_response(request)
+        duree = time.perf_counter() - debut
+
+        correspondance = request.resolver_match
+        vue = correspondance.url_name if correspondance is not None and correspondance.url_name else 'inconnue'
+        MetriquesService.histogramme(
+            'transportpro_http_duree_secondes', "Durée des requêtes HTTP par vue", ('vue', 'methode')
+        ).observer(duree, vue=vue, methode=request.method)
+        MetriquesService.compteur(
+            'transportpro_http_reponses_total', "Réponses HTTP par vue et statut", ('vue', 'statut')
+        ).inc(vue=vue, statut=response.status_code)
+
+        return response
+
+
+class ProfilageMiddleware:
+    """
+    Profil par échantillonnage des requêtes lentes (voir services/profilage_service.py)
+
+    Actif uniquement avec PROFILAGE_ACTIF : chaque requête est échantillonnée,
+    le profil n'est écrit que au-delà de PROFILAGE_SEUIL_MS
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from .services.profilage_service import ProfilageService
+
+        if not ProfilageService.actif():
+            return self.get_response(request)
+
+        session = ProfilageService.debut(f"{request.method} {request.path}")
+        try:
+            response = self.get_response(request)
+        finally:
+            correspondance = request.resolver_match
+            if correspondance is not None and correspondance.url_name:
+                session.nom = f"vue.{correspondance.url_name}"
+            ProfilageService.fin(session, seuil_ms=getattr(settings, 'PROFILAGE_SEUIL_MS', 1000))
+        return response
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.27 on 2026-10-18 23:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0006_reclamation_signale_par'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SketchTopK',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(help_text='Ex: clients_volume:2025 ou clients_volume:*', max_length=100, unique=True)),
+                ('donnees', models.JSONField(default=dict)),
+                ('date_mise_a_jour', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Sketch Top-K',
+                'verbose_name_plural': 'Sketches Top-K',
+            },
+        ),
+    ]
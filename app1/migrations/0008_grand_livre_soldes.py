@@ -0,0 +1,65 @@
+# Generated by Django 4.2.27 on 2026-10-18 23:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def creer_mouvements_ouverture(apps, schema_editor):
+    """Solde actuel de chaque client → mouvement d'ouverture du grand livre"""
+    Client = apps.get_model('app1', 'Client')
+    MouvementSolde = apps.get_model('app1', 'MouvementSolde')
+
+    MouvementSolde.objects.bulk_create([
+        MouvementSolde(
+            client_id=client_id,
+            montant=solde,
+            type_mouvement='OUVERTURE',
+            description="Reprise du solde existant",
+        )
+        for client_id, solde in Client.objects.exclude(solde=0).values_list('id', 'solde')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0007_sketchtopk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotSolde',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_snapshot', models.DateTimeField()),
+                ('solde', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('dernier_mouvement_id', models.BigIntegerField(help_text='Dernier MouvementSolde inclus dans ce snapshot')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots_solde', to='app1.client')),
+            ],
+            options={
+                'verbose_name': 'Snapshot de solde',
+                'verbose_name_plural': 'Snapshots de solde',
+                'indexes': [models.Index(fields=['client', 'date_snapshot'], name='app1_snapsh_client__4cdac5_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MouvementSolde',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('montant', models.DecimalField(decimal_places=2, help_text='Positif = dette, négatif = crédit', max_digits=12)),
+                ('type_mouvement', models.CharField(choices=[('OUVERTURE', 'Solde initial'), ('FACTURATION', 'Facturation expédition'), ('PAIEMENT', 'Paiement'), ('ANNULATION_PAIEMENT', 'Annulation paiement'), ('ANNULATION_EXPEDITION', 'Annulation expédition'), ('ANNULATION_FACTURE', 'Annulation facture'), ('REMBOURSEMENT', 'Remboursement client'), ('REMBOURSEMENT_INCIDENT', 'Remboursement incident'), ('COMPENSATION_RECLAMATION', 'Compensation réclamation'), ('AJUSTEMENT', 'Ajustement manuel')], max_length=30)),
+                ('reference', models.CharField(blank=True, help_text='Numéro de facture, incident, réclamation...', max_length=50)),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('date_mouvement', models.DateTimeField(default=django.utils.timezone.now)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mouvements_solde', to='app1.client')),
+            ],
+            options={
+                'verbose_name': 'Mouvement de solde',
+                'verbose_name_plural': 'Mouvements de solde',
+                'ordering': ['date_mouvement', 'id'],
+                'indexes': [models.Index(fields=['client', 'date_mouvement'], name='app1_mouvem_client__8af483_idx')],
+            },
+        ),
+        migrations.RunPython(creer_mouvements_ouverture, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.27 on 2026-10-18 23:40
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def initialiser_cumuls(apps, schema_editor):
+    """Calcule une fois les cumuls des factures existantes"""
+    Facture = apps.get_model('app1', 'Facture')
+    Paiement = apps.get_model('app1', 'Paiement')
+
+    payes = dict(
+        Paiement.objects.filter(statut='VALIDE').values('facture_id')
+        .annotate(total=Sum('montant_paye')).values_list('facture_id', 'total')
+    )
+    nb = dict(Facture.objects.annotate(n=Count('expeditions')).values_list('id', 'n'))
+
+    factures = list(Facture.objects.all())
+    for facture in factures:
+        facture.nb_expeditions = nb.get(facture.id, 0)
+        facture.montant_paye_cumule = payes.get(facture.id) or 0
+    Facture.objects.bulk_update(factures, ['nb_expeditions', 'montant_paye_cumule'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0008_grand_livre_soldes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facture',
+            name='montant_paye_cumule',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Somme des paiements VALIDES (maintenue par delta)', max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='facture',
+            name='nb_expeditions',
+            field=models.PositiveIntegerField(default=0, help_text="Nombre d'expéditions (maintenu par delta)"),
+        ),
+        migrations.RunPython(initialiser_cumuls, migrations.RunPython.noop),
+    ]
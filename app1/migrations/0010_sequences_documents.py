@@ -0,0 +1,89 @@
+# Generated by Django 4.2.27 on 2026-10-18 23:42
+
+import re
+
+from django.db import migrations, models
+
+
+def initialiser_sequences(apps, schema_editor):
+    """
+    - Numérote les paiements existants (P-<facture>-NN dans l'ordre de création)
+    - Démarre chaque séquence après le plus grand numéro déjà attribué
+    """
+    Facture = apps.get_model('app1', 'Facture')
+    Paiement = apps.get_model('app1', 'Paiement')
+    Incident = apps.get_model('app1', 'Incident')
+    Reclamation = apps.get_model('app1', 'Reclamation')
+    SequenceDocument = apps.get_model('app1', 'SequenceDocument')
+
+    sequences = {}
+
+    def retenir(cle, numero):
+        sequences[cle] = max(sequences.get(cle, 0), numero)
+
+    paiements = list(Paiement.objects.select_related('facture').order_by('facture_id', 'id'))
+    for paiement in paiements:
+        cle = ('PAIEMENT', paiement.facture.numero_facture, '')
+        numero = sequences.get(cle, 0) + 1
+        paiement.numero_paiement = f"P-{paiement.facture.numero_facture}-{numero:02d}"
+        retenir(cle, numero)
+    Paiement.objects.bulk_update(paiements, ['numero_paiement'])
+
+    for client_id, numero_facture in Facture.objects.values_list('client_id', 'numero_facture'):
+        trouve = re.match(r'^F-(\d{8})-CL-\d+-(\d+)$', numero_facture or '')
+        if trouve:
+            retenir(('FACTURE', f"CL-{client_id}", trouve.group(1)), int(trouve.group(2)))
+
+    for type_document, modele, champ, prefixe in (
+        ('INCIDENT', Incident, 'numero_incident', 'INC'),
+        ('RECLAMATION', Reclamation, 'numero_reclamation', 'REC'),
+    ):
+        for numero_document in modele.objects.values_list(champ, flat=True):
+            trouve = re.match(rf'^{prefixe}-(\d{{8}})-(\d+)$', numero_document or '')
+            if trouve:
+                retenir((type_document, '', trouve.group(1)), int(trouve.group(2)))
+
+    SequenceDocument.objects.bulk_create([
+        SequenceDocument(type_document=type_document, portee=portee, periode=periode, valeur=valeur)
+        for (type_document, portee, periode), valeur in sequences.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0009_facture_cumuls'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenceDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_document', models.CharField(max_length=20)),
+                ('portee', models.CharField(blank=True, default='', max_length=50)),
+                ('periode', models.CharField(blank=True, default='', help_text='AAAAMMJJ ou vide', max_length=8)),
+                ('valeur', models.PositiveBigIntegerField(default=0, help_text='Dernier numéro attribué')),
+            ],
+            options={
+                'verbose_name': 'Séquence de numérotation',
+                'verbose_name_plural': 'Séquences de numérotation',
+            },
+        ),
+        migrations.AddField(
+            model_name='paiement',
+            name='numero_paiement',
+            field=models.CharField(blank=True, default='', max_length=60),
+            preserve_default=False,
+        ),
+        migrations.AddConstraint(
+            model_name='sequencedocument',
+            constraint=models.UniqueConstraint(fields=('type_document', 'portee', 'periode'), name='sequence_document_unique'),
+        ),
+        migrations.RunPython(initialiser_sequences, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='paiement',
+            name='numero_paiement',
+            field=models.CharField(blank=True, max_length=60, unique=True),
+        ),
+    ]
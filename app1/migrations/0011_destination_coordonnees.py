@@ -0,0 +1,40 @@
+# Generated by Django 4.2.27 on 2026-10-18 23:44
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def geocoder_destinations(apps, schema_editor):
+    """Destinations existantes → coordonnées du chef-lieu de leur wilaya"""
+    from app1.constants import COORDONNEES_WILAYAS
+
+    Destination = apps.get_model('app1', 'Destination')
+
+    for destination in Destination.objects.exclude(zone_geographique='INTERNATIONALE'):
+        nom = unicodedata.normalize('NFKD', destination.wilaya or '').encode('ascii', 'ignore').decode()
+        coordonnees = COORDONNEES_WILAYAS.get(''.join(c for c in nom.lower() if c.isalnum()))
+        if coordonnees:
+            destination.latitude, destination.longitude = coordonnees
+            destination.save(update_fields=['latitude', 'longitude'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0010_sequences_documents'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='destination',
+            name='latitude',
+            field=models.FloatField(blank=True, help_text='Vide = chef-lieu de la wilaya', null=True),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='longitude',
+            field=models.FloatField(blank=True, help_text='Vide = chef-lieu de la wilaya', null=True),
+        ),
+        migrations.RunPython(geocoder_destinations, migrations.RunPython.noop),
+    ]
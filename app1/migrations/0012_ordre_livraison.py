@@ -0,0 +1,23 @@
+# Generated by Django 4.2.27 on 2026-10-18 23:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0011_destination_coordonnees'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expedition',
+            name='ordre_livraison',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Rang de passage dans la tournée (optimisé)', null=True),
+        ),
+        migrations.AddField(
+            model_name='tournee',
+            name='kilometrage_estime',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Km du circuit optimisé (dépôt → arrêts → dépôt)', null=True),
+        ),
+    ]
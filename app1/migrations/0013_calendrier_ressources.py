@@ -0,0 +1,86 @@
+# Generated by Django 4.2.27 on 2026-10-18 23:51
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def reserver_tournees_existantes(apps, schema_editor):
+    """
+    Tournées existantes → réservations chauffeur + véhicule
+    Les ressources restées EN_TOURNEE à cause d'une tournée seulement PREVUE
+    repassent DISPONIBLE (seule une tournée EN_COURS met ses ressources EN_TOURNEE)
+    """
+    Tournee = apps.get_model('app1', 'Tournee')
+    Chauffeur = apps.get_model('app1', 'Chauffeur')
+    Vehicule = apps.get_model('app1', 'Vehicule')
+    ReservationRessource = apps.get_model('app1', 'ReservationRessource')
+
+    duree = timedelta(hours=getattr(settings, 'DUREE_TOURNEE_DEFAUT_HEURES', 24))
+    reservations = []
+
+    for tournee in Tournee.objects.all():
+        debut = tournee.date_depart
+        if tournee.statut == 'TERMINEE':
+            fin = tournee.date_retour_reelle or tournee.date_modification or timezone.now()
+        else:
+            fin = tournee.date_retour_prevue or debut + duree
+        if fin <= debut:
+            fin = debut + timedelta(minutes=1)
+
+        reservations.append(ReservationRessource(chauffeur_id=tournee.chauffeur_id, tournee_id=tournee.id,
+                                                 motif='TOURNEE', debut=debut, fin=fin))
+        reservations.append(ReservationRessource(vehicule_id=tournee.vehicule_id, tournee_id=tournee.id,
+                                                 motif='TOURNEE', debut=debut, fin=fin))
+
+    ReservationRessource.objects.bulk_create(reservations, batch_size=500)
+
+    en_cours = Tournee.objects.filter(statut='EN_COURS')
+    Chauffeur.objects.filter(statut_disponibilite='EN_TOURNEE').exclude(
+        id__in=en_cours.values('chauffeur_id')
+    ).update(statut_disponibilite='DISPONIBLE')
+    Vehicule.objects.filter(statut='EN_TOURNEE').exclude(
+        id__in=en_cours.values('vehicule_id')
+    ).update(statut='DISPONIBLE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0012_ordre_livraison'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationRessource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('motif', models.CharField(choices=[('TOURNEE', 'Tournée'), ('CONGE', 'Congé'), ('MALADIE', 'Maladie'), ('MAINTENANCE', 'Maintenance'), ('AUTRE', 'Autre')], default='TOURNEE', max_length=20)),
+                ('debut', models.DateTimeField()),
+                ('fin', models.DateTimeField(help_text='Exclue : la ressource est libre à partir de cette date')),
+                ('remarques', models.TextField(blank=True, null=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('chauffeur', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='app1.chauffeur')),
+                ('tournee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='app1.tournee')),
+                ('vehicule', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='app1.vehicule')),
+            ],
+            options={
+                'verbose_name': 'Réservation de ressource',
+                'verbose_name_plural': 'Réservations de ressources',
+                'ordering': ['debut'],
+                'indexes': [models.Index(fields=['chauffeur', 'debut', 'fin'], name='app1_reserv_chauffe_d0cf67_idx'), models.Index(fields=['vehicule', 'debut', 'fin'], name='app1_reserv_vehicul_307371_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reservationressource',
+            constraint=models.CheckConstraint(check=models.Q(('fin__gt', models.F('debut'))), name='reservation_intervalle_valide'),
+        ),
+        migrations.AddConstraint(
+            model_name='reservationressource',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('chauffeur__isnull', False), ('vehicule__isnull', True)), models.Q(('chauffeur__isnull', True), ('vehicule__isnull', False)), _connector='OR'), name='reservation_une_ressource'),
+        ),
+        migrations.RunPython(reserver_tournees_existantes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.27 on 2026-10-19 00:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0013_calendrier_ressources'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvenementTerrain',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('evenement_id', models.CharField(help_text="Identifiant généré par l'application (idempotence)", max_length=64, unique=True)),
+                ('jour', models.DateField(help_text="Clé de partition (date de l'événement)")),
+                ('horodatage', models.DateTimeField(help_text="Heure de l'événement sur le terminal")),
+                ('type_evenement', models.CharField(choices=[('GPS', 'Position GPS'), ('SCAN', "Scan à l'arrêt"), ('LIVRAISON', 'Preuve de livraison'), ('ECHEC', 'Échec de livraison')], max_length=20)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('donnees', models.JSONField(blank=True, default=dict, help_text="Signataire, photo, motif d'échec...")),
+                ('date_reception', models.DateTimeField(auto_now_add=True)),
+                ('expedition', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='evenements', to='app1.expedition')),
+                ('tournee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='evenements', to='app1.tournee')),
+            ],
+            options={
+                'verbose_name': 'Événement terrain',
+                'verbose_name_plural': 'Événements terrain',
+                'ordering': ['horodatage', 'id'],
+                'indexes': [models.Index(fields=['jour'], name='app1_evenem_jour_75d8ff_idx'), models.Index(fields=['tournee', 'horodatage'], name='app1_evenem_tournee_3d01a0_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.27 on 2026-10-19 00:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0014_evenements_terrain'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveHistorique',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_objet', models.CharField(choices=[('EXPEDITION', 'Expédition'), ('INCIDENT', 'Incident'), ('RECLAMATION', 'Réclamation')], max_length=20)),
+                ('objet_id', models.PositiveBigIntegerField()),
+                ('dernier_statut', models.CharField(blank=True, default='', max_length=30)),
+                ('date_premiere_ligne', models.DateTimeField(blank=True, null=True)),
+                ('date_derniere_ligne', models.DateTimeField(blank=True, null=True)),
+                ('nb_lignes', models.PositiveIntegerField(default=0)),
+                ('taille_brute', models.PositiveIntegerField(default=0, help_text='Octets avant compression')),
+                ('contenu', models.BinaryField(help_text='Lignes JSON compressées')),
+                ('date_archivage', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': "Archive d'historique",
+                'verbose_name_plural': "Archives d'historique",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='archivehistorique',
+            constraint=models.UniqueConstraint(fields=('type_objet', 'objet_id'), name='archive_historique_unique'),
+        ),
+    ]
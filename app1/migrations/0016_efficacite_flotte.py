@@ -0,0 +1,92 @@
+# Generated by Django 4.2.27 on 2026-10-19 00:12
+
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Sum
+import django.db.models.deletion
+
+
+def remplir_mesures(apps, schema_editor):
+    """
+    Une mesure par tournée déjà terminée (même calcul que FlotteService.enregistrer_tournee),
+    dans l'ordre chronologique : les moyennes glissantes suivent les tournées précédentes
+    """
+    Tournee = apps.get_model('app1', 'Tournee')
+    MesureTournee = apps.get_model('app1', 'MesureTournee')
+
+    fenetre = getattr(settings, 'FLOTTE_FENETRE', 20)
+    series = defaultdict(lambda: deque(maxlen=fenetre))
+    mesures = []
+
+    tournees = Tournee.objects.filter(
+        statut='TERMINEE', kilometrage_parcouru__isnull=False, consommation_carburant__isnull=False,
+        kilometrage_depart__isnull=False, kilometrage_arrivee__isnull=False,
+    ).select_related('vehicule').annotate(poids_total=Sum('expeditions__poids')).order_by(
+        F('date_retour_reelle').asc(nulls_first=False), 'date_depart', 'id'
+    )
+    for tournee in tournees.iterator():
+        capacite = float(tournee.vehicule.capacite_poids or 0)
+        taux_chargement = float(tournee.poids_total or 0) / capacite if capacite else 0.0
+        serie = series[tournee.vehicule_id]
+        serie.append((tournee.kilometrage_parcouru, float(tournee.consommation_carburant), taux_chargement))
+
+        km = sum(point[0] for point in serie)
+        mesures.append(MesureTournee(
+            tournee_id=tournee.pk,
+            vehicule_id=tournee.vehicule_id,
+            date_fin=tournee.date_retour_reelle or tournee.date_depart,
+            kilometrage_depart=tournee.kilometrage_depart,
+            kilometrage_arrivee=tournee.kilometrage_arrivee,
+            km_parcouru=tournee.kilometrage_parcouru,
+            km_estime=tournee.kilometrage_estime,
+            carburant=tournee.consommation_carburant,
+            carburant_mesure=False,
+            taux_chargement=taux_chargement,
+            km_glissant=km / len(serie),
+            consommation_glissante=100 * sum(point[1] for point in serie) / km if km else 0.0,
+            chargement_glissant=sum(point[2] for point in serie) / len(serie),
+        ))
+    MesureTournee.objects.bulk_create(mesures, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0015_archives_historique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tournee',
+            name='carburant_reel',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Litres relevés en fin de tournée (vide = estimation par la consommation moyenne)', max_digits=6, null=True),
+        ),
+        migrations.CreateModel(
+            name='MesureTournee',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_fin', models.DateTimeField()),
+                ('kilometrage_depart', models.PositiveIntegerField()),
+                ('kilometrage_arrivee', models.PositiveIntegerField()),
+                ('km_parcouru', models.PositiveIntegerField()),
+                ('km_estime', models.PositiveIntegerField(blank=True, help_text='Circuit optimisé (Tournee.kilometrage_estime)', null=True)),
+                ('carburant', models.DecimalField(decimal_places=2, help_text='Litres', max_digits=7)),
+                ('carburant_mesure', models.BooleanField(default=False, help_text='Litres relevés (sinon estimés)')),
+                ('taux_chargement', models.FloatField(help_text='Poids transporté / capacité du véhicule')),
+                ('km_glissant', models.FloatField(help_text='Km moyen par tournée sur la fenêtre glissante')),
+                ('consommation_glissante', models.FloatField(help_text='L/100km sur la fenêtre glissante')),
+                ('chargement_glissant', models.FloatField(help_text='Taux de chargement moyen sur la fenêtre glissante')),
+                ('date_calcul', models.DateTimeField(auto_now=True)),
+                ('tournee', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='mesure', to='app1.tournee')),
+                ('vehicule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mesures', to='app1.vehicule')),
+            ],
+            options={
+                'verbose_name': 'Mesure de tournée',
+                'verbose_name_plural': 'Mesures de tournée',
+                'indexes': [models.Index(fields=['vehicule', 'date_fin'], name='app1_mesure_vehicul_a1c7df_idx'), models.Index(fields=['date_fin'], name='app1_mesure_date_fi_5e6481_idx')],
+            },
+        ),
+        migrations.RunPython(remplir_mesures, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.27 on 2026-10-19 02:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0016_efficacite_flotte'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('statut', 'NON_LUE')), fields=['-date_creation'], name='notification_non_lue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('statut__in', ['NON_LUE', 'LUE'])), fields=['vehicule', 'type_notification'], name='notification_ouverte_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tournee',
+            index=models.Index(condition=models.Q(('est_privee', False), ('statut', 'PREVUE')), fields=['zone_cible', 'date_depart'], name='tournee_partagee_prevue_idx'),
+        ),
+    ]
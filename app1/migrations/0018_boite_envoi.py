@@ -0,0 +1,35 @@
+# Generated by Django 4.2.27 on 2026-10-19 02:14
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0017_index_partiels'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvenementSortant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_evenement', models.CharField(max_length=50)),
+                ('donnees', models.JSONField(blank=True, default=dict, help_text="Arguments du gestionnaire (identifiants, pas d'objets)")),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('TRAITE', 'Traité'), ('ECHEC', 'Échec')], default='EN_ATTENTE', max_length=20)),
+                ('tentatives', models.PositiveSmallIntegerField(default=0)),
+                ('disponible_le', models.DateTimeField(default=django.utils.timezone.now, help_text='Prochaine tentative (reculée pendant le traitement et après une erreur)')),
+                ('verrou', models.CharField(blank=True, default='', help_text="Lot du worker en train de traiter l'événement", max_length=32)),
+                ('derniere_erreur', models.TextField(blank=True, default='')),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_traitement', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Événement sortant',
+                'verbose_name_plural': 'Événements sortants',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('statut', 'EN_ATTENTE')), fields=['disponible_le', 'id'], name='evenement_a_traiter_idx'), models.Index(condition=models.Q(('statut', 'TRAITE')), fields=['date_traitement'], name='evenement_traite_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-19 02:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0018_boite_envoi'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evenementterrain',
+            name='lot',
+            field=models.UUIDField(blank=True, editable=False, help_text="Lot d'ingestion qui a inséré l'événement", null=True),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from phonenumber_field.modelfields import PhoneNumberField
 from decimal import Decimal
 from datetime import date, timedelta 
@@ -9,6 +9,8 @@ from django.conf import settings
 import secrets
 import string
 
+from .services.metriques_service import MetriquesService
+
 # SECTION 1 : TABLES DE BASE
 class Client(models.Model):
 
@@ -29,6 +31,30 @@ class Client(models.Model):
     def __str__(self):
         return f"CL-{self.id:03d} {self.prenom} {self.nom}"
 
+    def save(self, *args, **kwargs):
+        """
+        Le solde n'est JAMAIS réécrit par save() sur un client existant :
+        il ne change que via SoldeService (UPDATE solde = solde + x + MouvementSolde)
+        """
+        from .services.solde_service import SoldeService
+
+        if self._state.adding:
+            # Solde initial saisi à la création → mouvement d'ouverture dans le grand livre
+            solde_initial = Decimal(str(self.solde or 0))
+            self.solde = Decimal('0.00')
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                if solde_initial:
+                    SoldeService.appliquer(self, solde_initial, 'OUVERTURE', description="Solde initial")
+            return
+
+        if kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                champ.name for champ in self._meta.concrete_fields
+                if not champ.primary_key and champ.name != 'solde'
+            ]
+        super().save(*args, **kwargs)
+
 class Chauffeur(models.Model):
 
     nom = models.CharField(max_length=50)
@@ -94,6 +120,8 @@ class Destination(models.Model):
     zone_geographique = models.CharField(max_length=20, choices=[('LOCALE', 'Locale (même wilaya)'),('NATIONALE', 'Nationale'),('INTERNATIONALE', 'Internationale'),])
     zone_logistique = models.CharField(max_length=10, choices=[('CENTRE', 'Centre (Alger, Blida...)'),('EST', 'Est (Constantine, Annaba, Sétif...)'),('OUEST', 'Ouest (Oran, Tlemcen, Sidi Bel Abbès...)'),('SUD', 'Sud (Tamanrasset, Adrar, Bechar...)'),], default='CENTRE')
     distance_estimee = models.IntegerField(help_text="Distance en km depuis le dépôt principal")
+    latitude = models.FloatField(blank=True, null=True, help_text="Vide = chef-lieu de la wilaya")
+    longitude = models.FloatField(blank=True, null=True, help_text="Vide = chef-lieu de la wilaya")
     tarif_base = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Tarif de base en DA")
     delai_livraison_estime = models.IntegerField(default=1, help_text="Délai estimé en jours")
     code_postal = models.CharField(max_length=10, blank=True, null=True)
@@ -104,6 +132,13 @@ class Destination(models.Model):
     def __str__(self):
         return f"{self.ville} - {self.wilaya} - {self.pays}"
 
+    def save(self, *args, **kwargs):
+        from .services.distance_service import DistanceService
+
+        # Coordonnées non saisies → chef-lieu de la wilaya (matrice des distances)
+        DistanceService.geocoder(self)
+        super().save(*args, **kwargs)
+
 class TypeService(models.Model):
 
     type_service = models.CharField(max_length=20, choices=[('STANDARD', 'Standard'),('EXPRESS', 'Express'),('INTERNATIONAL', 'International'), ], unique=True)
@@ -142,7 +177,13 @@ class Tarification(models.Model):
     def calculer_delai(self):
 
         if self.type_service.type_service == 'EXPRESS':
-            # EXPRESS : délai selon distance
+            # EXPRESS : délai selon le temps de route (matrice des distances)
+            from .services.distance_service import DistanceService
+            jours = DistanceService.jours_route(self.destination)
+            if jours is not None:
+                return jours
+            
+            # Destination hors matrice : délai selon distance
             if self.destination.distance_estimee < 500:
                 return 1  # 1 jour
             else:
@@ -163,7 +204,9 @@ class Tournee(models.Model):
     kilometrage_depart = models.PositiveIntegerField(blank=True, null=True, editable=False)
     kilometrage_arrivee = models.PositiveIntegerField(blank=True, null=True)
     kilometrage_parcouru = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    kilometrage_estime = models.PositiveIntegerField(blank=True, null=True, editable=False, help_text="Km du circuit optimisé (dépôt → arrêts → dépôt)")
     consommation_carburant = models.DecimalField(max_digits=6, decimal_places=2, blank=True, null=True, editable=False)
+    carburant_reel = models.DecimalField(max_digits=6, decimal_places=2, blank=True, null=True, help_text="Litres relevés en fin de tournée (vide = estimation par la consommation moyenne)")
     statut = models.CharField(max_length=20, choices=[('PREVUE', 'Prévue'), ('EN_COURS', 'En cours'), ('TERMINEE', 'Terminée')], default='PREVUE')
     est_privee = models.BooleanField(default=False, help_text="Tournée privée EXPRESS")
     remarques = models.TextField(blank=True, null=True)
@@ -171,6 +214,16 @@ class Tournee(models.Model):
     date_modification = models.DateTimeField(auto_now=True)
     cree_par = models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.SET_NULL,null=True,blank=True,related_name='tournees_crees',verbose_name="Créé par")
     modifie_par = models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.SET_NULL,null=True,blank=True,related_name='tournees_modifies',verbose_name="Modifié par")
+
+    class Meta:
+        indexes = [
+            # Index partiel : seules les tournées partagées à venir sont candidates à l'affectation
+            models.Index(
+                fields=['zone_cible', 'date_depart'],
+                condition=models.Q(statut='PREVUE', est_privee=False),
+                name='tournee_partagee_prevue_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"Tournée #{self.id} - {self.chauffeur} - {self.statut}"
@@ -189,10 +242,15 @@ class Tournee(models.Model):
         
         return f"TR-{self.zone_cible}-{date_str}-{nom_chauffeur}"
     
+    @MetriquesService.chronometrer('Tournee.save')
     def save(self, *args, **kwargs):
         from .utils import TourneeService
-        TourneeService.traiter_tournee(self)
-        super().save(*args, **kwargs)
+        from .services.calendrier_service import CalendrierService
+        with transaction.atomic():
+            TourneeService.traiter_tournee(self)
+            super().save(*args, **kwargs)
+            # Réservation chauffeur + véhicule sur [départ, retour) (lève ValidationError si conflit)
+            CalendrierService.reserver_tournee(self)
 
 class Expedition(models.Model):
 
@@ -212,6 +270,7 @@ class Expedition(models.Model):
     statut = models.CharField(max_length=20, choices=[('EN_ATTENTE', 'En attente'),('EN_TRANSIT', 'En transit'),('LIVRE', 'Livré'),('ECHEC', 'Échec'),('REENVOYE', 'Réexpédié'),], default='EN_ATTENTE')
     date_creation = models.DateTimeField(auto_now_add=True)
     date_livraison_reelle = models.DateField(blank=True, null=True)
+    ordre_livraison = models.PositiveIntegerField(blank=True, null=True, editable=False, help_text="Rang de passage dans la tournée (optimisé)")
     remarques = models.TextField(blank=True, null=True)
     cree_par = models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.SET_NULL,null=True,blank=True,related_name='expeditions_crees',verbose_name="Créé par")
     modifie_par = models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.SET_NULL,null=True,blank=True,related_name='expeditions_modifies',verbose_name="Modifié par")
@@ -221,7 +280,20 @@ class Expedition(models.Model):
     
     def get_numero_expedition(self):
         return f"EXP-{self.id:06d}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valeurs lues en base : le signal Top-K corrige les classements si elles changent
+        instance._topk_origine = instance.valeurs_topk()
+        return instance
+
+    def valeurs_topk(self):
+        """(client, destination, montant, date de création) comptés par les sketches Top-K"""
+        return (self.__dict__.get('client_id'), self.__dict__.get('destination_id'),
+                self.__dict__.get('montant_total'), self.__dict__.get('date_creation'))
     
+    @MetriquesService.chronometrer('Expedition.save')
     def save(self, *args, **kwargs):
         from .utils import ExpeditionService, TrackingService, FacturationService
         
@@ -284,37 +356,49 @@ class Facture(models.Model):
     montant_tva = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     montant_ttc = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     taux_tva = models.DecimalField(max_digits=5, decimal_places=2, default=19.00)
+    montant_paye_cumule = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Somme des paiements VALIDES (maintenue par delta)")
+    nb_expeditions = models.PositiveIntegerField(default=0, help_text="Nombre d'expéditions (maintenu par delta)")
     date_creation = models.DateTimeField(auto_now_add=True)
     date_echeance = models.DateField()
     statut = models.CharField(max_length=20, choices=[('IMPAYEE', 'Impayée'),('PARTIELLEMENT_PAYEE', 'Partiellement payée'),('PAYEE', 'Payée'),('EN_RETARD', 'En retard'),('ANNULEE', 'Annulée'),], default='IMPAYEE')
     remarques = models.TextField(blank=True, null=True)
     cree_par = models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.SET_NULL,null=True,blank=True,related_name='factures_creees',verbose_name="Créé par (agent)")
     
+    # Champs maintenus par FacturationService (UPDATE ... = champ + delta)
+    # → jamais réécrits par un save() complet sur une facture existante
+    CHAMPS_CUMULES = ['montant_ht', 'montant_tva', 'montant_ttc', 'montant_paye_cumule', 'nb_expeditions']
+    
     class Meta:
         ordering = ['-date_creation']
     
     def __str__(self):
         return f"{self.numero_facture} - {self.client}"
     
+    @MetriquesService.chronometrer('Facture.save')
     def save(self, *args, **kwargs):
-        if not self.numero_facture:
-            super().save(*args, **kwargs)
-            
-            # Compter les factures du client ce jour-là
-            nb = Facture.objects.filter(
-                client=self.client,
-                date_creation__date=self.date_creation.date()
-            ).count()
-            
-            self.numero_facture = f"F-{self.date_creation.strftime('%Y%m%d')}-CL-{self.client.id:03d}-{nb:03d}"
-            kwargs['force_insert'] = False
+        from .services.sequence_service import SequenceService
         
-        super().save(*args, **kwargs)
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                champ.name for champ in self._meta.concrete_fields
+                if not champ.primary_key and champ.name not in self.CHAMPS_CUMULES
+            ]
+        
+        # Numéro + insertion dans la même transaction : un échec libère le numéro
+        with transaction.atomic():
+            if not self.numero_facture:
+                # Numéro attribué AVANT l'insertion (séquence par client et par jour)
+                jour = timezone.now().strftime('%Y%m%d')
+                nb = SequenceService.suivant('FACTURE', portee=f"CL-{self.client_id}", periode=jour)
+                self.numero_facture = f"F-{jour}-CL-{self.client_id:03d}-{nb:03d}"
+            
+            super().save(*args, **kwargs)
     
 class Paiement(models.Model):
     
     facture = models.ForeignKey('Facture', on_delete=models.CASCADE, related_name='paiements')
     client = models.ForeignKey('Client', on_delete=models.CASCADE, related_name='paiements')
+    numero_paiement = models.CharField(max_length=60, unique=True, blank=True)
     montant_paye = models.DecimalField(max_digits=10, decimal_places=2)
     date_paiement = models.DateTimeField(auto_now_add=True)
     mode_paiement = models.CharField(max_length=20, choices=[('ESPECES', 'Espèces'),('CARTE', 'Carte bancaire'),('VIREMENT', 'Virement'),('CHEQUE', 'Chèque'),])
@@ -329,12 +413,16 @@ class Paiement(models.Model):
     def __str__(self):
         return f"Paiement {self.montant_paye} DA - {self.facture.numero_facture}"
     
+    @transaction.atomic
     def save(self, *args, **kwargs):
-        """Validation et mise à jour automatique"""
+        """Validation et mise à jour automatique (numéro, insertion, solde et cumuls : une transaction)"""
         from .utils import FacturationService
         from django.core.exceptions import ValidationError
 
         is_new = self.pk is None
+        ancien_statut = None
+        if not is_new:
+            ancien_statut = Paiement.objects.filter(pk=self.pk).values_list('statut', flat=True).first()
 
         # ========== VALIDATION CRITIQUE ==========
         if self.facture.client != self.client:
@@ -345,6 +433,9 @@ class Paiement(models.Model):
 
         # Validations pour nouveaux paiements uniquement
         if is_new:
+            # Cumuls à jour (une lecture par clé primaire, pas d'agrégat)
+            self.facture.refresh_from_db(fields=['statut'] + Facture.CHAMPS_CUMULES)
+
             if self.facture.statut == 'ANNULEE':
                 raise ValidationError("Impossible de payer une facture annulée")
 
@@ -364,17 +455,39 @@ class Paiement(models.Model):
             if self.montant_paye <= 0:
                 raise ValidationError("Le montant doit être supérieur à 0")
 
-            # Génération numéro paiement
-            super().save(*args, **kwargs)  # obtenir PK
-            nb = Paiement.objects.filter(facture=self.facture).count()
-            self.numero_paiement = f"P-{self.facture.numero_facture}-{nb:02d}"
+            # Génération numéro paiement (séquence par facture, avant l'insertion)
+            if not self.numero_paiement:
+                from .services.sequence_service import SequenceService
+                nb = SequenceService.suivant('PAIEMENT', portee=self.facture.numero_facture)
+                self.numero_paiement = f"P-{self.facture.numero_facture}-{nb:02d}"
 
         super().save(*args, **kwargs)
 
-        # Mise à jour solde client
+        # Mise à jour solde client + cumul payé de la facture
         if is_new and self.statut == 'VALIDE':
-            self.client.solde -= self.montant_paye
-            self.client.save()
+            from .services.solde_service import SoldeService
+            SoldeService.appliquer(
+                self.client, -self.montant_paye, 'PAIEMENT',
+                reference=self.facture.numero_facture,
+                description=f"Paiement {self.get_mode_paiement_display()}"
+            )
+            FacturationService.appliquer_delta_facture(self.facture, montant_paye=self.montant_paye)
+
+            FacturationService.mettre_a_jour_statut_facture(self.facture)
+
+        # Paiement annulé (ou revalidé) → corriger le solde client et le cumul payé
+        elif not is_new and ancien_statut != self.statut and 'VALIDE' in (ancien_statut, self.statut):
+            from .services.solde_service import SoldeService
+            revalide = self.statut == 'VALIDE'
+            # Même écriture que la suppression (annulation) ou la création (revalidation)
+            SoldeService.appliquer(
+                self.client, -self.montant_paye if revalide else self.montant_paye,
+                'PAIEMENT' if revalide else 'ANNULATION_PAIEMENT',
+                reference=self.facture.numero_facture,
+                description="Paiement revalidé" if revalide else "Paiement annulé"
+            )
+            delta = self.montant_paye if revalide else -self.montant_paye
+            FacturationService.appliquer_delta_facture(self.facture, montant_paye=delta)
 
             FacturationService.mettre_a_jour_statut_facture(self.facture)
 
@@ -402,6 +515,15 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-date_creation']
+        indexes = [
+            # Index partiels : le tableau de bord lit les non lues, les services les ouvertes par véhicule
+            models.Index(fields=['-date_creation'], condition=models.Q(statut='NON_LUE'), name='notification_non_lue_idx'),
+            models.Index(
+                fields=['vehicule', 'type_notification'],
+                condition=models.Q(statut__in=['NON_LUE', 'LUE']),
+                name='notification_ouverte_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.get_type_notification_display()} - {self.titre}"
@@ -478,13 +600,15 @@ class Incident(models.Model):
         
         is_new = self.pk is None
         
-        # Générer le numéro d'incident
-        if not self.numero_incident:
+        # Générer le numéro d'incident (séquence par jour, avant l'insertion, même transaction)
+        with transaction.atomic():
+            if not self.numero_incident:
+                from .services.sequence_service import SequenceService
+                jour = timezone.now().strftime('%Y%m%d')
+                nb = SequenceService.suivant('INCIDENT', periode=jour)
+                self.numero_incident = f"INC-{jour}-{nb:05d}"
+            
             super().save(*args, **kwargs)
-            self.numero_incident = f"INC-{self.date_creation.strftime('%Y%m%d')}-{self.id:05d}"
-            kwargs['force_insert'] = False
-        
-        super().save(*args, **kwargs)
         
 
     def clean(self):
@@ -577,25 +701,37 @@ class Reclamation(models.Model):
     
     def __str__(self):
         return f"{self.numero_reclamation} - {self.client} - {self.get_nature_display()}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._topk_origine = instance.valeurs_topk()
+        return instance
+
+    def valeurs_topk(self):
+        """(client, nature) comptés par les sketches Top-K"""
+        return (self.__dict__.get('client_id'), self.__dict__.get('nature'))
     
     def save(self, *args, **kwargs):
         from .utils import ReclamationService
         
         is_new = self.pk is None
         
-        # Générer le numéro de réclamation
-        if not self.numero_reclamation:
+        # Générer le numéro de réclamation (séquence par jour, avant l'insertion)
+        with transaction.atomic():
+            if not self.numero_reclamation:
+                from .services.sequence_service import SequenceService
+                jour = timezone.now().strftime('%Y%m%d')
+                nb = SequenceService.suivant('RECLAMATION', periode=jour)
+                self.numero_reclamation = f"REC-{jour}-{nb:05d}"
+            
             super().save(*args, **kwargs)
-            self.numero_reclamation = f"REC-{self.date_creation.strftime('%Y%m%d')}-{self.id:05d}"
-            kwargs['force_insert'] = False
-        
-        super().save(*args, **kwargs)
-        
-        # Traitement post-sauvegarde
-        if is_new:
-            ReclamationService.traiter_nouvelle_reclamation(self)
-        else:
-            ReclamationService.calculer_delai_traitement(self)
+            
+            # Traitement post-sauvegarde (même transaction : l'événement de la boîte d'envoi aussi)
+            if is_new:
+                ReclamationService.traiter_nouvelle_reclamation(self)
+            else:
+                ReclamationService.calculer_delai_traitement(self)
     
     def clean(self):
         from django.core.exceptions import ValidationError
@@ -683,4 +819,325 @@ class AgentUtilisateur(AbstractUser):
                    any(c in "!@#$%^&*" for c in mot_de_passe)):
             mot_de_passe = ''.join(secrets.choice(caracteres) for _ in range(longueur))
         
-        return mot_de_passe
\ No newline at end of file
+        return mot_de_passe
+# ========== SECTION 5 : STATISTIQUES ==========
+
+class SketchTopK(models.Model):
+    """
+    Sauvegarde périodique d'un sketch Space-Saving (classements approximatifs)
+    Voir services/topk_service.py
+    """
+    nom = models.CharField(max_length=100, unique=True, help_text="Ex: clients_volume:2025 ou clients_volume:*")
+    donnees = models.JSONField(default=dict)
+    date_mise_a_jour = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Sketch Top-K"
+        verbose_name_plural = "Sketches Top-K"
+
+    def __str__(self):
+        return f"{self.nom} ({self.date_mise_a_jour.strftime('%d/%m/%Y %H:%M')})"
+
+# ========== SECTION 6 : GRAND LIVRE DES SOLDES ==========
+
+class MouvementSolde(models.Model):
+    """
+    Ligne du grand livre client (ajout uniquement, jamais modifiée ni supprimée)
+    Client.solde = somme des mouvements du client
+    Voir services/solde_service.py
+    """
+    TYPES_MOUVEMENT = [
+        ('OUVERTURE', 'Solde initial'),
+        ('FACTURATION', 'Facturation expédition'),
+        ('PAIEMENT', 'Paiement'),
+        ('ANNULATION_PAIEMENT', 'Annulation paiement'),
+        ('ANNULATION_EXPEDITION', 'Annulation expédition'),
+        ('ANNULATION_FACTURE', 'Annulation facture'),
+        ('REMBOURSEMENT', 'Remboursement client'),
+        ('REMBOURSEMENT_INCIDENT', 'Remboursement incident'),
+        ('COMPENSATION_RECLAMATION', 'Compensation réclamation'),
+        ('AJUSTEMENT', 'Ajustement manuel'),
+    ]
+
+    client = models.ForeignKey('Client', on_delete=models.CASCADE, related_name='mouvements_solde')
+    montant = models.DecimalField(max_digits=12, decimal_places=2, help_text="Positif = dette, négatif = crédit")
+    type_mouvement = models.CharField(max_length=30, choices=TYPES_MOUVEMENT)
+    reference = models.CharField(max_length=50, blank=True, help_text="Numéro de facture, incident, réclamation...")
+    description = models.CharField(max_length=255, blank=True)
+    date_mouvement = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['date_mouvement', 'id']
+        indexes = [models.Index(fields=['client', 'date_mouvement'])]
+        verbose_name = "Mouvement de solde"
+        verbose_name_plural = "Mouvements de solde"
+
+    def __str__(self):
+        return f"{self.client} {self.montant:+.2f} DA ({self.get_type_mouvement_display()})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Un mouvement de solde ne peut pas être modifié")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Un mouvement de solde ne peut pas être supprimé")
+
+class SnapshotSolde(models.Model):
+    """
+    Solde d'un client figé à une date (issu du grand livre)
+    Solde à une date X = dernier snapshot <= X + mouvements postérieurs
+    """
+    client = models.ForeignKey('Client', on_delete=models.CASCADE, related_name='snapshots_solde')
+    date_snapshot = models.DateTimeField()
+    solde = models.DecimalField(max_digits=12, decimal_places=2)
+    dernier_mouvement_id = models.BigIntegerField(help_text="Dernier MouvementSolde inclus dans ce snapshot")
+
+    class Meta:
+        indexes = [models.Index(fields=['client', 'date_snapshot'])]
+        verbose_name = "Snapshot de solde"
+        verbose_name_plural = "Snapshots de solde"
+
+    def __str__(self):
+        return f"{self.client} : {self.solde} DA au {self.date_snapshot.strftime('%d/%m/%Y %H:%M')}"
+
+# ========== SECTION 7 : NUMÉROTATION DES DOCUMENTS ==========
+
+class SequenceDocument(models.Model):
+    """
+    Compteur de numérotation par (type de document, portée, période)
+    Exemple : ('FACTURE', 'CL-3', '20250115') → dernière facture du client 3 ce jour-là
+    Voir services/sequence_service.py
+    """
+    type_document = models.CharField(max_length=20)
+    portee = models.CharField(max_length=50, blank=True, default='')
+    periode = models.CharField(max_length=8, blank=True, default='', help_text="AAAAMMJJ ou vide")
+    valeur = models.PositiveBigIntegerField(default=0, help_text="Dernier numéro attribué")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['type_document', 'portee', 'periode'], name='sequence_document_unique')
+        ]
+        verbose_name = "Séquence de numérotation"
+        verbose_name_plural = "Séquences de numérotation"
+
+    def __str__(self):
+        return f"{self.type_document} {self.portee} {self.periode} → {self.valeur}"
+
+# ========== SECTION 8 : CALENDRIER DES RESSOURCES ==========
+
+class ReservationRessource(models.Model):
+    """
+    Occupation d'un chauffeur OU d'un véhicule sur l'intervalle [debut, fin)
+    Créée automatiquement pour chaque tournée (motif TOURNEE) ou saisie
+    à l'avance pour un congé / une maintenance planifiée
+    Voir services/calendrier_service.py
+    """
+    MOTIFS = [
+        ('TOURNEE', 'Tournée'),
+        ('CONGE', 'Congé'),
+        ('MALADIE', 'Maladie'),
+        ('MAINTENANCE', 'Maintenance'),
+        ('AUTRE', 'Autre'),
+    ]
+
+    chauffeur = models.ForeignKey('Chauffeur', on_delete=models.CASCADE, null=True, blank=True, related_name='reservations')
+    vehicule = models.ForeignKey('Vehicule', on_delete=models.CASCADE, null=True, blank=True, related_name='reservations')
+    tournee = models.ForeignKey('Tournee', on_delete=models.CASCADE, null=True, blank=True, related_name='reservations')
+    motif = models.CharField(max_length=20, choices=MOTIFS, default='TOURNEE')
+    debut = models.DateTimeField()
+    fin = models.DateTimeField(help_text="Exclue : la ressource est libre à partir de cette date")
+    remarques = models.TextField(blank=True, null=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Index (ressource, début, fin) : recherche de chevauchement = égalité + plage sur début
+        indexes = [
+            models.Index(fields=['chauffeur', 'debut', 'fin']),
+            models.Index(fields=['vehicule', 'debut', 'fin']),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(fin__gt=models.F('debut')), name='reservation_intervalle_valide'),
+            models.CheckConstraint(
+                check=(
+                    models.Q(chauffeur__isnull=False, vehicule__isnull=True) |
+                    models.Q(chauffeur__isnull=True, vehicule__isnull=False)
+                ),
+                name='reservation_une_ressource',
+            ),
+        ]
+        ordering = ['debut']
+        verbose_name = "Réservation de ressource"
+        verbose_name_plural = "Réservations de ressources"
+
+    def __str__(self):
+        ressource = self.chauffeur if self.chauffeur_id else self.vehicule
+        return f"{ressource} : {self.libelle()} ({self.debut.strftime('%d/%m/%Y %H:%M')} → {self.fin.strftime('%d/%m/%Y %H:%M')})"
+
+    def libelle(self):
+        if self.tournee_id:
+            return f"Tournée #{self.tournee_id}"
+        return self.get_motif_display()
+
+    def est_ouverte(self):
+        """Tournée EN_COURS : la ressource reste occupée jusqu'à la clôture"""
+        return self.tournee_id is not None and self.tournee.statut == 'EN_COURS'
+
+# ========== SECTION 9 : ÉVÉNEMENTS TERRAIN (APPLICATION CHAUFFEUR) ==========
+
+class EvenementTerrain(models.Model):
+    """
+    Événement envoyé par l'application chauffeur (ajout uniquement)
+    Positions GPS, scans à l'arrêt, preuves de livraison, échecs
+    Partitionné par jour (colonne `jour`) : l'archivage et la purge
+    travaillent partition par partition
+    Voir services/ingestion_service.py
+    """
+    TYPES_EVENEMENT = [
+        ('GPS', 'Position GPS'),
+        ('SCAN', "Scan à l'arrêt"),
+        ('LIVRAISON', 'Preuve de livraison'),
+        ('ECHEC', 'Échec de livraison'),
+    ]
+
+    evenement_id = models.CharField(max_length=64, unique=True, help_text="Identifiant généré par l'application (idempotence)")
+    jour = models.DateField(help_text="Clé de partition (date de l'événement)")
+    horodatage = models.DateTimeField(help_text="Heure de l'événement sur le terminal")
+    type_evenement = models.CharField(max_length=20, choices=TYPES_EVENEMENT)
+    tournee = models.ForeignKey('Tournee', on_delete=models.CASCADE, related_name='evenements')
+    expedition = models.ForeignKey('Expedition', on_delete=models.CASCADE, null=True, blank=True, related_name='evenements')
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    donnees = models.JSONField(default=dict, blank=True, help_text="Signataire, photo, motif d'échec...")
+    date_reception = models.DateTimeField(auto_now_add=True)
+    lot = models.UUIDField(null=True, blank=True, editable=False, help_text="Lot d'ingestion qui a inséré l'événement")
+
+    class Meta:
+        ordering = ['horodatage', 'id']
+        indexes = [
+            models.Index(fields=['jour']),
+            models.Index(fields=['tournee', 'horodatage']),
+        ]
+        verbose_name = "Événement terrain"
+        verbose_name_plural = "Événements terrain"
+
+    def __str__(self):
+        return f"Tournée #{self.tournee_id} - {self.get_type_evenement_display()} ({self.horodatage.strftime('%d/%m/%Y %H:%M:%S')})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Un événement terrain ne peut pas être modifié")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Un événement terrain ne peut pas être supprimé")
+
+# ========== SECTION 10 : ARCHIVES DE L'HISTORIQUE ==========
+
+class ArchiveHistorique(models.Model):
+    """
+    Historique compressé d'un objet clôturé depuis longtemps
+    (suivis + événements terrain d'une expédition, historique d'un incident
+    ou d'une réclamation). Une ligne par objet : résumé lisible + contenu
+    JSONL compressé, décompressé seulement à la demande
+    Voir services/archive_service.py
+    """
+    TYPES_OBJET = [
+        ('EXPEDITION', 'Expédition'),
+        ('INCIDENT', 'Incident'),
+        ('RECLAMATION', 'Réclamation'),
+    ]
+
+    type_objet = models.CharField(max_length=20, choices=TYPES_OBJET)
+    objet_id = models.PositiveBigIntegerField()
+    dernier_statut = models.CharField(max_length=30, blank=True, default='')
+    date_premiere_ligne = models.DateTimeField(null=True, blank=True)
+    date_derniere_ligne = models.DateTimeField(null=True, blank=True)
+    nb_lignes = models.PositiveIntegerField(default=0)
+    taille_brute = models.PositiveIntegerField(default=0, help_text="Octets avant compression")
+    contenu = models.BinaryField(help_text="Lignes JSON compressées")
+    date_archivage = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['type_objet', 'objet_id'], name='archive_historique_unique')
+        ]
+        verbose_name = "Archive d'historique"
+        verbose_name_plural = "Archives d'historique"
+
+    def __str__(self):
+        return f"{self.get_type_objet_display()} #{self.objet_id} : {self.nb_lignes} lignes archivées"
+
+# ========== SECTION 11 : EFFICACITÉ DE LA FLOTTE ==========
+
+class MesureTournee(models.Model):
+    """
+    Un point de la série d'efficacité d'un véhicule (une tournée terminée)
+    Les moyennes glissantes sont calculées à l'enregistrement à partir des
+    points précédents du véhicule (pas de recalcul de toute la série)
+    Voir services/flotte_service.py
+    """
+    tournee = models.OneToOneField('Tournee', on_delete=models.CASCADE, related_name='mesure')
+    vehicule = models.ForeignKey('Vehicule', on_delete=models.CASCADE, related_name='mesures')
+    date_fin = models.DateTimeField()
+    kilometrage_depart = models.PositiveIntegerField()
+    kilometrage_arrivee = models.PositiveIntegerField()
+    km_parcouru = models.PositiveIntegerField()
+    km_estime = models.PositiveIntegerField(null=True, blank=True, help_text="Circuit optimisé (Tournee.kilometrage_estime)")
+    carburant = models.DecimalField(max_digits=7, decimal_places=2, help_text="Litres")
+    carburant_mesure = models.BooleanField(default=False, help_text="Litres relevés (sinon estimés)")
+    taux_chargement = models.FloatField(help_text="Poids transporté / capacité du véhicule")
+    km_glissant = models.FloatField(help_text="Km moyen par tournée sur la fenêtre glissante")
+    consommation_glissante = models.FloatField(help_text="L/100km sur la fenêtre glissante")
+    chargement_glissant = models.FloatField(help_text="Taux de chargement moyen sur la fenêtre glissante")
+    date_calcul = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['vehicule', 'date_fin']),
+            models.Index(fields=['date_fin']),
+        ]
+        verbose_name = "Mesure de tournée"
+        verbose_name_plural = "Mesures de tournée"
+
+    def __str__(self):
+        return f"{self.vehicule} : {self.km_parcouru} km, {self.carburant} L ({self.date_fin.strftime('%d/%m/%Y')})"
+
+
+# ========== SECTION 12 : BOÎTE D'ENVOI (EFFETS DE BORD APRÈS COMMIT) ==========
+
+class EvenementSortant(models.Model):
+    """
+    Effet de bord à exécuter après le commit (email, notification, série de la flotte)
+    Écrit dans la même transaction que la modification qui le produit : annulé
+    avec elle, jamais perdu si elle est validée. Traité par lots, avec reprises
+    Voir services/boite_envoi_service.py
+    """
+    STATUTS = [
+        ('EN_ATTENTE', 'En attente'),
+        ('TRAITE', 'Traité'),
+        ('ECHEC', 'Échec'),
+    ]
+
+    type_evenement = models.CharField(max_length=50)
+    donnees = models.JSONField(default=dict, blank=True, help_text="Arguments du gestionnaire (identifiants, pas d'objets)")
+    statut = models.CharField(max_length=20, choices=STATUTS, default='EN_ATTENTE')
+    tentatives = models.PositiveSmallIntegerField(default=0)
+    disponible_le = models.DateTimeField(default=timezone.now, help_text="Prochaine tentative (reculée pendant le traitement et après une erreur)")
+    verrou = models.CharField(max_length=32, blank=True, default='', help_text="Lot du worker en train de traiter l'événement")
+    derniere_erreur = models.TextField(blank=True, default='')
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_traitement = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # Index partiels : le worker ne lit que les événements en attente, la purge que les traités
+            models.Index(fields=['disponible_le', 'id'], condition=models.Q(statut='EN_ATTENTE'), name='evenement_a_traiter_idx'),
+            models.Index(fields=['date_traitement'], condition=models.Q(statut='TRAITE'), name='evenement_traite_idx'),
+        ]
+        verbose_name = "Événement sortant"
+        verbose_name_plural = "Événements sortants"
+
+    def __str__(self):
+        return f"{self.type_evenement} #{self.pk} ({self.get_statut_display()}, {self.tentatives} tentative(s))"
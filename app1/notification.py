@@ -11,10 +11,30 @@ from django.core.mail import send_mail, EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
-from threading import Thread
+from contextlib import contextmanager
+from threading import Thread, local
+
+from .services.metriques_service import MetriquesService
+
+_envoi = local()
+
+
+@contextmanager
+def envoi_synchrone():
+    """
+    Dans ce bloc, les emails partent dans le thread courant et les erreurs SMTP
+    remontent à l'appelant (worker de la boîte d'envoi : l'événement est réessayé)
+    """
+    precedent = getattr(_envoi, 'synchrone', False)
+    _envoi.synchrone = True
+    try:
+        yield
+    finally:
+        _envoi.synchrone = precedent
 
 
 # ========== SERVICE EMAIL DE BASE ==========
+@MetriquesService.instrumenter
 class EmailService:
     """
     Service centralisé pour l'envoi d'emails
@@ -29,26 +49,41 @@ class EmailService:
         - L'envoi d'email peut prendre 1-2 secondes
         - On ne veut pas que l'agent attende
         - L'email part en "background"
+        
+        Dans envoi_synchrone() : envoi immédiat, l'erreur est relancée
         """
+        emails = MetriquesService.compteur('transportpro_emails_total', "Emails envoyés par résultat", ('resultat',))
+        synchrone = getattr(_envoi, 'synchrone', False)
+        
         def send():
             try:
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=recipient_list,
-                    html_message=html_message,
-                    fail_silently=False,
-                )
+                with MetriquesService.chronometre('EmailService.envoi_smtp'):
+                    send_mail(
+                        subject=subject,
+                        message=message,
+                        from_email=settings.DEFAULT_FROM_EMAIL,
+                        recipient_list=recipient_list,
+                        html_message=html_message,
+                        fail_silently=False,
+                    )
+                emails.inc(resultat='ok')
                 print(f"✅ Email envoyé : {subject}")
             except Exception as e:
+                emails.inc(resultat='erreur')
                 print(f"❌ Erreur envoi email : {e}")
+                if synchrone:
+                    raise
+        
+        if synchrone:
+            send()
+            return
         
         # Lancer l'envoi dans un thread séparé
         Thread(target=send).start()
 
 
 # ========== SERVICE ALERTES INCIDENTS ==========
+@MetriquesService.instrumenter
 class AlerteEmailService:
     """
     Service spécialisé pour les emails d'alertes (incidents et réclamations)
@@ -329,6 +364,7 @@ L'équipe Service Client
 
 
 # ========== SERVICE EMAILS EXPÉDITIONS ==========
+@MetriquesService.instrumenter
 class ExpeditionEmailService:
     """
     Service d'emails pour les expéditions
@@ -379,6 +415,8 @@ class ExpeditionEmailService:
         """
         Notifie le destinataire que son colis est en route
         """
+        from .services.suivi_public_service import SuiviPublicService
+        
         if not expedition.email_destinataire:
             print(f"⚠️ Destinataire {expedition.nom_destinataire} n'a pas d'email")
             return
@@ -394,6 +432,7 @@ class ExpeditionEmailService:
     - N° Expédition : {expedition.get_numero_expedition()}
     - Destination : {expedition.adresse_destinataire}
     - Date de livraison prévue : {expedition.date_livraison_prevue.strftime('%d/%m/%Y') if expedition.date_livraison_prevue else 'À confirmer'}
+    - Code de suivi : {SuiviPublicService.jeton(expedition.id)} (page « Suivre mon colis » : /suivi/)
 
     """
         
@@ -0,0 +1,102 @@
+"""
+routers.py - Routage des requêtes entre la base principale et la réplica analytique
+
+CONVENTION :
+- Toutes les écritures et lectures "métier" → base 'default'
+- Les lectures lourdes (statistiques, exports PDF) → Model.objects.using(base_analytique())
+
+base_analytique() renvoie 'analytics' SAUF si :
+- la réplica est désactivée ou n'a jamais été rafraîchie
+- la réplica est trop en retard (REPLICA_RETARD_MAX)
+- la requête en cours (ou la session via cookie) a écrit APRÈS la dernière copie
+  → "lecture de ses propres écritures" garantie
+"""
+
+import contextvars
+import time
+
+from django.conf import settings
+
+ALIAS_PRINCIPAL = 'default'
+ALIAS_ANALYTIQUE = 'analytics'
+
+# Horodatage (epoch) de la dernière écriture connue pour le contexte courant
+_derniere_ecriture = contextvars.ContextVar('derniere_ecriture', default=None)
+
+
+class AnalyticsRouter:
+    """
+    Router Django :
+    - Lecture : base de l'instance liée (relations) ou base principale
+    - Écriture : TOUJOURS la base principale (même pour un objet lu sur la réplica)
+    - Migrations : base principale uniquement (la réplica est une copie binaire)
+    """
+
+    alias_connus = {ALIAS_PRINCIPAL, ALIAS_ANALYTIQUE}
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return ALIAS_PRINCIPAL
+
+    def db_for_write(self, model, **hints):
+        return ALIAS_PRINCIPAL
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._state.db in self.alias_connus and obj2._state.db in self.alias_connus:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == ALIAS_PRINCIPAL
+
+
+def marquer_ecriture(horodatage=None):
+    """Mémorise qu'une écriture vient d'avoir lieu dans le contexte courant"""
+    _derniere_ecriture.set(horodatage or time.time())
+
+
+def derniere_ecriture():
+    return _derniere_ecriture.get()
+
+
+def reinitialiser_ecriture(horodatage=None):
+    """Appelé en début de requête par le middleware (valeur issue du cookie)"""
+    return _derniere_ecriture.set(horodatage)
+
+
+def retablir_ecriture(jeton):
+    """Appelé en fin de requête par le middleware"""
+    _derniere_ecriture.reset(jeton)
+
+
+def base_analytique():
+    """
+    Retourne l'alias à utiliser pour une lecture lourde
+
+    Exemple :
+        Expedition.objects.using(base_analytique()).filter(...)
+    """
+    from .services.replica_service import ReplicaService
+
+    if not getattr(settings, 'REPLICA_ANALYTIQUE_ACTIVE', False):
+        return ALIAS_PRINCIPAL
+
+    if ALIAS_ANALYTIQUE not in settings.DATABASES:
+        return ALIAS_PRINCIPAL
+
+    horodatage_copie = ReplicaService.horodatage_copie()
+    if horodatage_copie is None:
+        return ALIAS_PRINCIPAL
+
+    # Réplica trop en retard
+    if time.time() - horodatage_copie > getattr(settings, 'REPLICA_RETARD_MAX', 600):
+        return ALIAS_PRINCIPAL
+
+    # Écriture récente pas encore copiée → rester sur la base principale
+    ecriture = derniere_ecriture()
+    if ecriture is not None and ecriture >= horodatage_copie:
+        return ALIAS_PRINCIPAL
+
+    return ALIAS_ANALYTIQUE
@@ -1,16 +1,70 @@
 from apscheduler.schedulers.background import BackgroundScheduler # type: ignore
 from django.core.management import call_command
+from django.conf import settings
+from django.db import DatabaseError
 
+from .services.profilage_service import ProfilageService
+
+@ProfilageService.profiler('tache.taches_matin')
 def executer_taches_matin():
     """Exécute les tâches du matin à 8h"""
     print("Exécution tâches du MATIN (8h)")
     call_command('taches_quotidiennes', '--mode=matin')
 
+@ProfilageService.profiler('tache.taches_soir')
 def executer_taches_soir():
     """Exécute les tâches du soir à 17h30"""
     print("Exécution tâches du SOIR (17h30)")
     call_command('taches_quotidiennes', '--mode=soir')
 
+@ProfilageService.profiler('tache.sauvegarde_sketches_topk')
+def sauvegarder_sketches_topk():
+    """Persiste les classements Top-K modifiés (toutes les 10 minutes)"""
+    from .services.topk_service import TopKService
+    TopKService.sauvegarder()
+
+@ProfilageService.profiler('tache.reconstruction_sketches_topk')
+def reconstruire_sketches_topk():
+    """Recalcule exactement les classements Top-K (chaque nuit : corrige les retraits)"""
+    from .services.topk_service import TopKService
+    TopKService.reconstruire()
+
+@ProfilageService.profiler('tache.rafraichir_replica')
+def rafraichir_replica_analytique():
+    """Copie la base principale vers la réplica analytique"""
+    from .services.replica_service import ReplicaService
+    ReplicaService.rafraichir()
+
+@ProfilageService.profiler('tache.snapshots_soldes')
+def creer_snapshots_soldes():
+    """Fige les soldes clients issus du grand livre (chaque nuit)"""
+    from .services.solde_service import SoldeService
+    SoldeService.creer_snapshots()
+
+@ProfilageService.profiler('tache.optimisation_tournees')
+def optimiser_tournees_prevues():
+    """Calcule l'ordre de livraison des tournées PREVUE (chaque matin avant les départs)"""
+    from .services.optimisation_service import OptimisationTourneeService
+    OptimisationTourneeService.optimiser_tournees_prevues()
+
+@ProfilageService.profiler('tache.archivage_historique')
+def archiver_historique():
+    """Compresse l'historique des dossiers clôturés depuis longtemps (chaque dimanche)"""
+    from .services.archive_service import ArchiveService
+    ArchiveService.archiver()
+
+@ProfilageService.profiler('tache.instantane_base')
+def creer_instantane_base():
+    """Instantané de db.sqlite3 puis rétention (toutes les INSTANTANES_INTERVALLE_MINUTES)"""
+    from .services.instantane_service import InstantaneService
+    InstantaneService.planifie()
+
+@ProfilageService.profiler('tache.purge_boite_envoi')
+def purger_boite_envoi():
+    """Supprime les événements traités de la boîte d'envoi (chaque nuit)"""
+    from .services.boite_envoi_service import BoiteEnvoiService
+    BoiteEnvoiService.purger()
+
 def demarrer_scheduler():
     """Démarre le scheduler avec 2 exécutions par jour"""
     scheduler = BackgroundScheduler()
@@ -31,9 +85,96 @@ def demarrer_scheduler():
         id='taches_soir'
     )
     
+    scheduler.add_job(
+        sauvegarder_sketches_topk,
+        'interval',
+        minutes=10,
+        id='sauvegarde_sketches_topk'
+    )
+    
+    scheduler.add_job(
+        reconstruire_sketches_topk,
+        'cron',
+        hour=1,
+        minute=30,
+        id='reconstruction_sketches_topk'
+    )
+    
+    scheduler.add_job(
+        creer_snapshots_soldes,
+        'cron',
+        hour=2,
+        minute=0,
+        id='snapshots_soldes'
+    )
+    
+    scheduler.add_job(
+        optimiser_tournees_prevues,
+        'cron',
+        hour=7,
+        minute=0,
+        id='optimisation_tournees'
+    )
+    
+    scheduler.add_job(
+        archiver_historique,
+        'cron',
+        day_of_week='sun',
+        hour=3,
+        minute=0,
+        id='archivage_historique'
+    )
+    
+    if getattr(settings, 'BOITE_ENVOI_ACTIVE', False):
+        # Le worker est lancé par le serveur web (BoiteEnvoiService.demarrer_serveur)
+        scheduler.add_job(
+            purger_boite_envoi,
+            'cron',
+            hour=3,
+            minute=30,
+            id='purge_boite_envoi'
+        )
+    
     # ✅ AJOUTER CES 2 LIGNES ICI :
     print("🚀 Exécution initiale des tâches du matin...")
-    executer_taches_matin()
+    try:
+        executer_taches_matin()
+    except DatabaseError as e:
+        # Base pas encore migrée (ex: pendant "migrate") → les tâches tourneront à 8h
+        print(f"⚠️ Exécution initiale ignorée : {e}")
     
     scheduler.start()
-    print("Scheduler démarré : 8h (matin) et 17h30 (soir)")
\ No newline at end of file
+    print("Scheduler démarré : 8h (matin) et 17h30 (soir)")
+
+_scheduler_serveur = None
+
+def demarrer_scheduler_serveur():
+    """
+    Tâches qui copient la base entière : lancées par le serveur web seulement
+    (tp1/wsgi.py, tp1/asgi.py), jamais par les commandes manage.py
+    """
+    global _scheduler_serveur
+    if _scheduler_serveur is not None:
+        return
+    
+    scheduler = BackgroundScheduler()
+    
+    if settings.REPLICA_ANALYTIQUE_ACTIVE:
+        scheduler.add_job(
+            rafraichir_replica_analytique,
+            'interval',
+            minutes=settings.REPLICA_INTERVALLE_MINUTES,
+            id='rafraichir_replica'
+        )
+    
+    if getattr(settings, 'INSTANTANES_ACTIFS', False):
+        scheduler.add_job(
+            creer_instantane_base,
+            'interval',
+            minutes=settings.INSTANTANES_INTERVALLE_MINUTES,
+            id='instantane_base'
+        )
+    
+    if scheduler.get_jobs():
+        scheduler.start()
+    _scheduler_serveur = scheduler
@@ -0,0 +1,209 @@
+"""
+affectation_service.py - Choix du chauffeur et du véhicule d'une nouvelle tournée
+
+UTILISATION :
+Au lieu du premier chauffeur / véhicule libre, les candidats libres sur la fenêtre
+de la tournée (CalendrierService) sont notés en UNE requête chacun :
+
+VÉHICULE (score le plus bas = meilleur) :
+- Adéquation de capacité : capacité trop grande = place perdue, trop petite = refus
+  (EXPRESS → vise le poids du colis, STANDARD → vise AFFECTATION_CHARGE_STANDARD_KG)
+- Type de véhicule adapté au service (un colis EXPRESS de 2 kg ne prend pas le CAMION)
+- Révision : exclu si la révision tombe pendant la tournée, pénalisé si elle est
+  en retard ou suit la tournée de près
+- À égalité : le moins kilométré (usure répartie)
+
+CHAUFFEUR :
+- Charge récente = km (réels ou estimés) des tournées depuis AFFECTATION_FENETRE_JOURS,
+  convertis en heures de conduite + temps fixe par tournée → le moins chargé d'abord
+
+RÉSERVATION OPTIMISTE :
+Aucun verrou pendant la notation. Le meilleur couple est réservé ; si un autre agent
+l'a pris entre-temps (conflit détecté à l'insertion par le calendrier), on passe
+au candidat suivant. Sous PostgreSQL, un candidat en cours de réservation par une
+autre transaction est sauté sans attente (SELECT ... FOR UPDATE SKIP LOCKED).
+
+EXEMPLES :
+- AffectationService.vehicules_candidats(debut, fin, poids=Decimal('2'), type_service='EXPRESS')
+- AffectationService.creer_tournee(debut, fin, expedition, zone_cible='CENTRE', statut='PREVUE')
+- Commande simuler_affectation → compare l'utilisation de la flotte avant / après
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .calendrier_service import CalendrierService
+
+
+class AffectationService:
+    """
+    Service de choix des ressources d'une tournée :
+    - Notation des véhicules (capacité, type, révision)
+    - Notation des chauffeurs (charge récente)
+    - Création de la tournée avec réservation optimiste
+    """
+
+    # Pénalité par type de véhicule selon le service (0 = type idéal)
+    PENALITES_TYPE = {
+        'EXPRESS': {'MOTO': 0.0, 'FOURGON': 0.1, 'CAMIONNETTE': 0.3, 'CAMION': 1.0},
+        'STANDARD': {'CAMION': 0.0, 'CAMIONNETTE': 0.1, 'FOURGON': 0.3, 'MOTO': 1.0},
+    }
+
+    NB_CANDIDATS = 5
+
+    # ==================== VÉHICULES ====================
+
+    @staticmethod
+    def charge_cible(poids, type_service):
+        """Charge visée pour dimensionner le véhicule (kg)"""
+        if type_service == 'EXPRESS':
+            return float(poids)
+        return max(float(poids), float(getattr(settings, 'AFFECTATION_CHARGE_STANDARD_KG', 500)))
+
+    @staticmethod
+    def vehicules_candidats(debut, fin, poids, volume=0, type_service='STANDARD', exclure_tournee=None):
+        """
+        Véhicules libres sur [debut, fin) pouvant porter le colis, du meilleur au moins bon
+
+        Returns:
+            QuerySet annoté : score_capacite, penalite_type, penalite_revision, score
+        """
+        cible = AffectationService.charge_cible(poids, type_service)
+        capacite = Cast('capacite_poids', FloatField())
+        marge_revision = getattr(settings, 'AFFECTATION_MARGE_REVISION_JOURS', 7)
+
+        penalites = AffectationService.PENALITES_TYPE.get(type_service, AffectationService.PENALITES_TYPE['STANDARD'])
+
+        return CalendrierService.vehicules_libres(debut, fin, exclure_tournee).filter(
+            capacite_poids__gte=poids,
+            capacite_volume__gte=volume or 0,
+        ).exclude(
+            # Révision prévue pendant la tournée
+            date_prochaine_revision__range=(debut.date(), fin.date())
+        ).annotate(
+            # Place perdue (capacité > cible) ou manque (capacité < cible, pénalisé double)
+            score_capacite=Case(
+                When(capacite_poids__gte=cible, then=(capacite - Value(cible)) / capacite),
+                default=Value(2.0) * (Value(cible) - capacite) / Value(cible),
+                output_field=FloatField(),
+            ),
+            penalite_type=Case(
+                *[When(type_vehicule=type_vehicule, then=Value(penalite)) for type_vehicule, penalite in penalites.items()],
+                default=Value(0.5),
+                output_field=FloatField(),
+            ),
+            penalite_revision=Case(
+                When(date_prochaine_revision__lt=debut.date(), then=Value(1.0)),  # Révision en retard
+                When(date_prochaine_revision__lte=fin.date() + timedelta(days=marge_revision), then=Value(0.5)),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+        ).annotate(
+            score=F('score_capacite') + F('penalite_type') + F('penalite_revision')
+        ).order_by('score', 'kilometrage', 'id')
+
+    # ==================== CHAUFFEURS ====================
+
+    @staticmethod
+    def chauffeurs_candidats(debut, fin, exclure_tournee=None):
+        """
+        Chauffeurs libres sur [debut, fin), du moins chargé au plus chargé
+
+        Returns:
+            QuerySet annoté : km_recents, nb_tournees_recentes, charge_heures
+        """
+        from app1.models import Tournee
+
+        depuis = timezone.now() - timedelta(days=getattr(settings, 'AFFECTATION_FENETRE_JOURS', 30))
+        vitesse = float(getattr(settings, 'VITESSE_MOYENNE_KMH', 60))
+        heures_par_tournee = float(getattr(settings, 'AFFECTATION_HEURES_PAR_TOURNEE', 1))
+
+        recentes = Tournee.objects.filter(
+            chauffeur_id=OuterRef('pk'),
+            date_depart__gte=depuis,
+        ).values('chauffeur_id')
+
+        return CalendrierService.chauffeurs_libres(debut, fin, exclure_tournee).annotate(
+            km_recents=Coalesce(
+                Subquery(
+                    recentes.annotate(
+                        total=Sum(Coalesce('kilometrage_parcouru', 'kilometrage_estime', Value(0)))
+                    ).values('total')[:1],
+                    output_field=IntegerField(),
+                ),
+                Value(0),
+            ),
+            nb_tournees_recentes=Coalesce(
+                Subquery(recentes.annotate(total=Count('id')).values('total')[:1], output_field=IntegerField()),
+                Value(0),
+            ),
+        ).annotate(
+            # Heures de conduite équivalentes
+            charge_heures=ExpressionWrapper(
+                Cast('km_recents', FloatField()) / Value(vitesse) +
+                Cast('nb_tournees_recentes', FloatField()) * Value(heures_par_tournee),
+                output_field=FloatField(),
+            )
+        ).order_by('charge_heures', 'id')
+
+    # ==================== CRÉATION ====================
+
+    @staticmethod
+    def creer_tournee(debut, fin, expedition, **champs):
+        """
+        Crée une tournée sur [debut, fin) avec le meilleur couple chauffeur / véhicule
+
+        Réservation optimiste : si le candidat vient d'être réservé par quelqu'un
+        d'autre, Tournee.save lève ValidationError (conflit calendrier) et on
+        essaie le suivant ; s'il est verrouillé (PostgreSQL), on le saute.
+
+        Returns:
+            Tournee ou None si aucun couple n'est disponible
+        """
+        from app1.models import Tournee
+
+        type_service = expedition.type_service.type_service
+        nb = AffectationService.NB_CANDIDATS
+
+        chauffeurs = list(AffectationService.chauffeurs_candidats(debut, fin)[:nb])
+        vehicules = list(AffectationService.vehicules_candidats(
+            debut, fin, expedition.poids, expedition.volume, type_service
+        )[:nb])
+
+        i_chauffeur = i_vehicule = 0
+        while i_chauffeur < len(chauffeurs) and i_vehicule < len(vehicules):
+            chauffeur, vehicule = chauffeurs[i_chauffeur], vehicules[i_vehicule]
+            try:
+                with transaction.atomic():
+                    chauffeur_libre, vehicule_libre = CalendrierService.verrouiller(
+                        chauffeur.pk, vehicule.pk, sauter_verrouilles=True
+                    )
+                    # Verrouillé par une autre affectation en cours → candidat suivant, sans attendre
+                    if chauffeur_libre is None:
+                        i_chauffeur += 1
+                        continue
+                    if vehicule_libre is None:
+                        i_vehicule += 1
+                        continue
+                    return Tournee.objects.create(
+                        chauffeur=chauffeur,
+                        vehicule=vehicule,
+                        date_depart=debut,
+                        date_retour_prevue=fin,
+                        **champs
+                    )
+            except ValidationError:
+                # Qui a été pris entre-temps ?
+                if CalendrierService.conflits(chauffeur, None, debut, fin):
+                    i_chauffeur += 1
+                else:
+                    i_vehicule += 1
+
+        return None
+
@@ -3,6 +3,8 @@ from django.db.models.functions import TruncMonth, TruncYear
 from datetime import datetime, timedelta
 from decimal import Decimal
 from app1.models import Expedition, Tournee, Client, Destination, Chauffeur, Incident
+from app1.services.topk_service import TopKService
+from app1.routers import base_analytique
 
 
 class AnalyticsService:
@@ -20,11 +22,13 @@ class AnalyticsService:
             'taux_evolution': 15.5  # Pourcentage d'évolution
         }
         """
+        db = base_analytique()
+        
         if not annee_fin:
             annee_fin = annee_debut
         
         # Données mensuelles
-        expeditions_mois = Expedition.objects.filter(
+        expeditions_mois = Expedition.objects.using(db).filter(
             date_creation__year__gte=annee_debut,
             date_creation__year__lte=annee_fin
         ).annotate(
@@ -35,7 +39,7 @@ class AnalyticsService:
         ).order_by('mois')
         
         # Données annuelles
-        expeditions_annee = Expedition.objects.filter(
+        expeditions_annee = Expedition.objects.using(db).filter(
             date_creation__year__gte=annee_debut,
             date_creation__year__lte=annee_fin
         ).annotate(
@@ -64,10 +68,12 @@ class AnalyticsService:
         """
         Calcule l'évolution du chiffre d'affaires
         """
+        db = base_analytique()
+        
         if not annee_fin:
             annee_fin = annee_debut
         
-        ca_mois = Expedition.objects.filter(
+        ca_mois = Expedition.objects.using(db).filter(
             date_creation__year__gte=annee_debut,
             date_creation__year__lte=annee_fin
         ).annotate(
@@ -77,7 +83,7 @@ class AnalyticsService:
             ca_ttc=Sum('montant_total') * Decimal('1.19')  # Avec TVA 19%
         ).order_by('mois')
         
-        ca_annee = Expedition.objects.filter(
+        ca_annee = Expedition.objects.using(db).filter(
             date_creation__year__gte=annee_debut,
             date_creation__year__lte=annee_fin
         ).annotate(
@@ -102,11 +108,22 @@ class AnalyticsService:
         }
     
     @staticmethod
-    def top_clients(limite=10, annee=None):
+    def top_clients(limite=10, annee=None, exact=False):
         """
         Retourne les meilleurs clients (par volume ou valeur)
+        
+        Par défaut : lecture des sketches Top-K en O(K) (voir topk_service.py)
+        exact=True : double GROUP BY sur toutes les expéditions (audit)
         """
-        expeditions = Expedition.objects.all()
+        db = base_analytique()
+        
+        if not exact:
+            return {
+                'par_volume': AnalyticsService._top_clients_sketch('clients_volume', limite, annee),
+                'par_valeur': AnalyticsService._top_clients_sketch('clients_valeur', limite, annee)
+            }
+        
+        expeditions = Expedition.objects.using(db).all()
         
         if annee:
             expeditions = expeditions.filter(date_creation__year=annee)
@@ -137,11 +154,62 @@ class AnalyticsService:
         }
     
     @staticmethod
-    def destinations_populaires(limite=10, annee=None):
+    def _top_clients_sketch(nom_sketch, limite, annee):
+        """
+        Construit le classement clients depuis un sketch (mêmes clés que le mode exact)
+        Les valeurs sont des estimations : borne supérieure de la valeur réelle
+        """
+        db = base_analytique()
+        
+        classement = TopKService.top(nom_sketch, limite, annee)
+        clients = Client.objects.using(db).in_bulk([cle for cle, _, _ in classement])
+        
+        resultat = []
+        for client_id, _, _ in classement:
+            client = clients.get(client_id)
+            if not client:
+                continue
+            resultat.append({
+                'client__id': client.id,
+                'client__prenom': client.prenom,
+                'client__nom': client.nom,
+                'client__telephone': client.telephone,
+                'nb_expeditions': int(TopKService.estimer('clients_volume', client_id, annee)),
+                'ca_total': Decimal(str(round(TopKService.estimer('clients_valeur', client_id, annee), 2))),
+            })
+        
+        return resultat
+    
+    @staticmethod
+    def destinations_populaires(limite=10, annee=None, exact=False):
         """
         Retourne les destinations les plus sollicitées
+        
+        Par défaut : lecture du sketch Top-K en O(K)
+        exact=True : GROUP BY sur toutes les expéditions (audit)
         """
-        expeditions = Expedition.objects.all()
+        db = base_analytique()
+        
+        if not exact:
+            classement = TopKService.top('destinations_volume', limite, annee)
+            destinations = Destination.objects.using(db).in_bulk([cle for cle, _, _ in classement])
+            
+            resultat = []
+            for destination_id, nb, _ in classement:
+                destination = destinations.get(destination_id)
+                if not destination:
+                    continue
+                resultat.append({
+                    'destination__ville': destination.ville,
+                    'destination__wilaya': destination.wilaya,
+                    'destination__zone_logistique': destination.zone_logistique,
+                    'nb_expeditions': int(nb),
+                    'ca_total': Decimal(str(round(TopKService.estimer('destinations_valeur', destination_id, annee), 2))),
+                })
+            
+            return resultat
+        
+        expeditions = Expedition.objects.using(db).all()
         
         if annee:
             expeditions = expeditions.filter(date_creation__year=annee)
@@ -162,10 +230,12 @@ class AnalyticsService:
         """
         Calcule l'évolution du nombre de tournées
         """
+        db = base_analytique()
+        
         if not annee_fin:
             annee_fin = annee_debut
         
-        tournees_mois = Tournee.objects.filter(
+        tournees_mois = Tournee.objects.using(db).filter(
             date_depart__year__gte=annee_debut,
             date_depart__year__lte=annee_fin
         ).annotate(
@@ -174,7 +244,7 @@ class AnalyticsService:
             nombre=Count('id')
         ).order_by('mois')
         
-        tournees_annee = Tournee.objects.filter(
+        tournees_annee = Tournee.objects.using(db).filter(
             date_depart__year__gte=annee_debut,
             date_depart__year__lte=annee_fin
         ).annotate(
@@ -208,7 +278,9 @@ class AnalyticsService:
             'taux_reussite': 94.4
         }
         """
-        expeditions = Expedition.objects.all()
+        db = base_analytique()
+        
+        expeditions = Expedition.objects.using(db).all()
         
         if annee:
             expeditions = expeditions.filter(date_creation__year=annee)
@@ -234,7 +306,9 @@ class AnalyticsService:
         """
         Retourne les meilleurs chauffeurs par performance
         """
-        tournees = Tournee.objects.filter(statut='TERMINEE')
+        db = base_analytique()
+        
+        tournees = Tournee.objects.using(db).filter(statut='TERMINEE')
         
         if annee:
             tournees = tournees.filter(date_depart__year=annee)
@@ -267,7 +341,9 @@ class AnalyticsService:
         """
         Retourne les zones avec le plus d'incidents
         """
-        incidents = Incident.objects.filter(expedition__isnull=False)
+        db = base_analytique()
+        
+        incidents = Incident.objects.using(db).filter(expedition__isnull=False)
         
         if annee:
             incidents = incidents.filter(date_heure_incident__year=annee)
@@ -288,7 +364,9 @@ class AnalyticsService:
         """
         Identifie les périodes de forte activité (par mois)
         """
-        activite_mois = Expedition.objects.filter(
+        db = base_analytique()
+        
+        activite_mois = Expedition.objects.using(db).filter(
             date_creation__year=annee
         ).annotate(
             mois=TruncMonth('date_creation')
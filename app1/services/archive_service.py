@@ -0,0 +1,254 @@
+"""
+archive_service.py - Archivage compressé des historiques anciens
+
+UTILISATION :
+TrackingExpedition, EvenementTerrain, HistoriqueIncident et HistoriqueReclamation
+grossissent sans fin alors qu'on ne consulte presque jamais l'historique d'un
+dossier clôturé depuis des mois. La commande archiver_historique déplace ces
+lignes dans ArchiveHistorique :
+- UNE ligne par objet (expédition, incident, réclamation)
+- Résumé lisible : dernier statut, première / dernière date, nombre de lignes
+- Contenu : lignes JSON compressées (lzma), décompressées seulement quand
+  un agent clique sur "Afficher l'historique archivé"
+
+Les tables "chaudes" ne contiennent plus que les dossiers actifs ou récents.
+
+OBJETS ARCHIVABLES (dernière ligne d'historique plus vieille que ARCHIVE_HISTORIQUE_MOIS) :
+- Expédition LIVRE ou ECHEC, sans incident ni réclamation encore ouverts
+- Incident RESOLU ou CLOS
+- Réclamation RESOLUE, CLOSE ou ANNULEE
+
+Un objet réactivé après archivage (nouvelle ligne d'historique) sera de
+nouveau archivé plus tard : ses nouvelles lignes sont fusionnées avec l'archive.
+
+EXEMPLES :
+- ArchiveService.archiver(mois=12) → commande archiver_historique
+- ArchiveService.resume('EXPEDITION', expedition.id) → bandeau de detail_expedition
+- ArchiveService.historique('EXPEDITION', expedition.id) → lignes archivées (à la demande)
+"""
+
+import json
+import lzma
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .suivi_public_service import SuiviPublicService
+
+
+class ArchiveService:
+    """
+    Service d'archivage de l'historique :
+    - Sélection des objets clôturés depuis longtemps
+    - Compression par lots (une archive par objet, fusion si elle existe)
+    - Relecture à la demande
+    """
+
+    TYPES_OBJET = ('EXPEDITION', 'INCIDENT', 'RECLAMATION')
+
+    # ==================== SOURCES ====================
+
+    @staticmethod
+    def sources(type_objet):
+        """
+        Tables d'historique d'un type d'objet :
+        [(modèle, champ de l'objet, champ date, champ statut)]
+        La première source donne le résumé (dates, dernier statut)
+        """
+        from app1.models import EvenementTerrain, HistoriqueIncident, HistoriqueReclamation, TrackingExpedition
+
+        return {
+            'EXPEDITION': [
+                (TrackingExpedition, 'expedition_id', 'date_heure', 'statut_etape'),
+                (EvenementTerrain, 'expedition_id', 'horodatage', None),
+            ],
+            'INCIDENT': [(HistoriqueIncident, 'incident_id', 'date_action', 'nouveau_statut')],
+            'RECLAMATION': [(HistoriqueReclamation, 'reclamation_id', 'date_action', 'nouveau_statut')],
+        }[type_objet]
+
+    @staticmethod
+    def objets_archivables(type_objet, limite):
+        """Identifiants des objets clôturés dont la dernière ligne d'historique est antérieure à `limite`"""
+        from app1.models import Expedition, Incident, Reclamation
+
+        if type_objet == 'EXPEDITION':
+            objets = Expedition.objects.filter(
+                statut__in=['LIVRE', 'ECHEC']
+            ).annotate(
+                derniere_ligne=Max('suivis__date_heure')
+            ).exclude(
+                Exists(Incident.objects.filter(expedition_id=OuterRef('pk'), statut__in=['SIGNALE', 'EN_COURS']))
+            ).exclude(
+                Exists(Reclamation.objects.filter(
+                    expeditions=OuterRef('pk'), statut__in=['OUVERTE', 'EN_COURS', 'EN_ATTENTE_CLIENT']
+                ))
+            )
+        elif type_objet == 'INCIDENT':
+            objets = Incident.objects.filter(
+                statut__in=['RESOLU', 'CLOS']
+            ).annotate(derniere_ligne=Max('historique__date_action'))
+        else:
+            objets = Reclamation.objects.filter(
+                statut__in=['RESOLUE', 'CLOSE', 'ANNULEE']
+            ).annotate(derniere_ligne=Max('historique__date_action'))
+
+        return objets.filter(derniere_ligne__lt=limite).order_by('pk').values_list('pk', flat=True)
+
+    # ==================== COMPRESSION ====================
+
+    @staticmethod
+    def compresser(lignes):
+        """Liste de dicts → (octets compressés, taille brute)"""
+        brut = '\n'.join(json.dumps(ligne, cls=DjangoJSONEncoder, ensure_ascii=False) for ligne in lignes).encode()
+        return lzma.compress(brut), len(brut)
+
+    @staticmethod
+    def decompresser(contenu):
+        """Octets compressés → liste de dicts"""
+        brut = lzma.decompress(bytes(contenu)).decode()
+        return [json.loads(ligne) for ligne in brut.splitlines() if ligne]
+
+    # ==================== ARCHIVAGE ====================
+
+    @staticmethod
+    def archiver(mois=None, lot=500, simulation=False):
+        """
+        Archive tous les objets archivables, `lot` objets par transaction
+
+        Returns:
+            dict: {type_objet: {'objets', 'lignes', 'octets_bruts', 'octets_compresses'}}
+        """
+        mois = mois or getattr(settings, 'ARCHIVE_HISTORIQUE_MOIS', 12)
+        limite = timezone.now() - timedelta(days=30 * mois)
+
+        stats = {}
+        for type_objet in ArchiveService.TYPES_OBJET:
+            stats[type_objet] = {'objets': 0, 'lignes': 0, 'octets_bruts': 0, 'octets_compresses': 0}
+            identifiants = list(ArchiveService.objets_archivables(type_objet, limite))
+
+            for i in range(0, len(identifiants), lot):
+                paquet = identifiants[i:i + lot]
+                with transaction.atomic():
+                    resultat = ArchiveService._archiver_paquet(type_objet, paquet)
+                    if simulation:
+                        transaction.set_rollback(True)
+                    elif type_objet == 'EXPEDITION':
+                        # Les étapes quittent TrackingExpedition : l'état du suivi public en cache est périmé
+                        transaction.on_commit(lambda paquet=paquet: SuiviPublicService.invalider(paquet))
+                for cle, valeur in resultat.items():
+                    stats[type_objet][cle] += valeur
+
+        return stats
+
+    @staticmethod
+    def _archiver_paquet(type_objet, identifiants):
+        """Compresse l'historique de `identifiants` puis le retire des tables chaudes"""
+        from app1.models import ArchiveHistorique
+
+        # 1. Lignes chaudes de toutes les sources, groupées par objet
+        lignes_par_objet = {objet_id: [] for objet_id in identifiants}
+        for modele, champ_objet, champ_date, _ in ArchiveService.sources(type_objet):
+            for ligne in modele.objects.filter(**{f'{champ_objet}__in': identifiants}).order_by(champ_date, 'pk').values():
+                lignes_par_objet[ligne[champ_objet]].append({'modele': modele.__name__, **ligne})
+
+        # 2. Archives existantes (objet réactivé puis reclôturé) : fusion
+        existantes = {
+            archive.objet_id: archive
+            for archive in ArchiveHistorique.objects.filter(type_objet=type_objet, objet_id__in=identifiants)
+        }
+
+        nouvelles = []
+        modifiees = []
+        stats = {'objets': 0, 'lignes': 0, 'octets_bruts': 0, 'octets_compresses': 0}
+
+        for objet_id, lignes in lignes_par_objet.items():
+            if not lignes:
+                continue
+
+            archive = existantes.get(objet_id)
+            anciennes = ArchiveService.decompresser(archive.contenu) if archive else []
+            toutes = anciennes + lignes
+
+            archive = archive or ArchiveHistorique(type_objet=type_objet, objet_id=objet_id)
+            ArchiveService._resumer(archive, type_objet, toutes)
+            archive.contenu, archive.taille_brute = ArchiveService.compresser(toutes)
+            (modifiees if archive.pk else nouvelles).append(archive)
+
+            stats['objets'] += 1
+            stats['lignes'] += len(lignes)
+            stats['octets_bruts'] += archive.taille_brute
+            stats['octets_compresses'] += len(archive.contenu)
+
+        ArchiveHistorique.objects.bulk_create(nouvelles)
+        ArchiveHistorique.objects.bulk_update(
+            modifiees, ['dernier_statut', 'date_premiere_ligne', 'date_derniere_ligne', 'nb_lignes', 'taille_brute', 'contenu']
+        )
+
+        # 3. Tables chaudes allégées
+        for modele, champ_objet, _, _ in ArchiveService.sources(type_objet):
+            modele.objects.filter(**{f'{champ_objet}__in': identifiants}).delete()
+
+        return stats
+
+    @staticmethod
+    def _resumer(archive, type_objet, lignes):
+        """Résumé (dates, dernier statut, nombre de lignes) à partir de la source principale"""
+        modele, _, champ_date, champ_statut = ArchiveService.sources(type_objet)[0]
+        principales = [ligne for ligne in lignes if ligne['modele'] == modele.__name__]
+        dates = sorted(str(ligne[champ_date]) for ligne in principales)
+        statuts = [ligne[champ_statut] for ligne in sorted(principales, key=lambda l: str(l[champ_date])) if ligne[champ_statut]]
+
+        archive.nb_lignes = len(lignes)
+        archive.date_premiere_ligne = parse_datetime(dates[0]) if dates else None
+        archive.date_derniere_ligne = parse_datetime(dates[-1]) if dates else None
+        archive.dernier_statut = statuts[-1] if statuts else ''
+
+    # ==================== RELECTURE ====================
+
+    @staticmethod
+    def resume(type_objet, objet_id, using=None):
+        """Résumé de l'archive d'un objet (sans charger le contenu) ou None"""
+        from app1.models import ArchiveHistorique
+
+        return ArchiveHistorique.objects.using(using).defer('contenu').filter(type_objet=type_objet, objet_id=objet_id).first()
+
+    @staticmethod
+    def historique(type_objet, objet_id, modele=None, using=None):
+        """
+        Lignes archivées d'un objet, en instances NON enregistrées du modèle d'origine
+        (les templates les affichent comme les lignes chaudes), de la plus récente à la plus ancienne
+
+        Args:
+            modele: classe à relire (défaut : source principale, ex: TrackingExpedition)
+            using: base à lire, la même que celle des lignes chaudes affichées avec
+                   (sinon une ligne archivée entre-temps apparaît deux fois ou pas du tout)
+        """
+        from app1.models import ArchiveHistorique
+
+        archive = ArchiveHistorique.objects.using(using).filter(type_objet=type_objet, objet_id=objet_id).first()
+        if archive is None:
+            return []
+
+        source, _, champ_date, _ = next(
+            s for s in ArchiveService.sources(type_objet) if modele is None or s[0] is modele
+        )
+
+        instances = []
+        for ligne in ArchiveService.decompresser(archive.contenu):
+            if ligne.pop('modele') != source.__name__:
+                continue
+            for champ in source._meta.concrete_fields:
+                valeur = ligne.get(champ.attname)
+                if isinstance(valeur, str) and champ.get_internal_type() == 'DateTimeField':
+                    ligne[champ.attname] = parse_datetime(valeur)
+                elif isinstance(valeur, str) and champ.get_internal_type() == 'DateField':
+                    ligne[champ.attname] = parse_date(valeur)
+            instances.append(source(**ligne))
+
+        instances.sort(key=lambda instance: getattr(instance, champ_date), reverse=True)
+        return instances
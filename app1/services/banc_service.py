@@ -0,0 +1,296 @@
+"""
+banc_service.py - Banc d'essai des chemins critiques (débit, requêtes SQL par opération)
+
+UTILISATION :
+La commande mesurer_performances crée (ou réutilise) une base dédiée, la
+remplit avec DonneesService jusqu'à chaque taille demandée (10k, 100k, 1M
+expéditions...) puis mesure chaque scénario :
+- Écritures : création d'expédition (Expedition.save : tarif, affectation,
+  facture, suivis), paiement, démarrage / finalisation de tournée,
+  résolution d'incident
+- Lectures : chaque vue liste_* de l'application
+- Exports PDF : listes et fiches
+
+Chaque écriture s'exécute dans une transaction ANNULÉE après la mesure
+(callbacks on_commit compris) : le jeu de données est identique d'une
+opération, d'une taille et d'une exécution à l'autre.
+
+Résultat : un fichier JSON (ops/s, latences, requêtes SQL par opération,
+environnement). La commande comparer_performances compare deux fichiers et
+signale les régressions (code de sortie non nul : utilisable en CI).
+
+EXEMPLES :
+- BancService.mesurer('liste_clients', 10000, operation, elements) → résultat du scénario
+- BancService.comparer(reference, candidat, seuil=0.15) → lignes avec verdict
+"""
+
+import math
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.db import transaction
+from django.test import Client, TestCase
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from .requetes_service import RequetesService
+
+
+class Scenario:
+    """Une opération mesurée + les éléments sur lesquels la répéter"""
+
+    def __init__(self, nom, categorie, operation, elements, ecriture=False):
+        self.nom = nom
+        self.categorie = categorie
+        self.operation = operation
+        self.elements = elements      # Parcourus en boucle (une opération par élément)
+        self.ecriture = ecriture
+
+
+class BancService:
+    """
+    Service du banc d'essai :
+    - Définition des scénarios
+    - Mesure (latences, requêtes SQL)
+    - Comparaison de deux exécutions
+    """
+
+    # ==================== SCÉNARIOS ====================
+
+    @staticmethod
+    def scenarios(agent, hasard, nb_elements=50):
+        """Tous les scénarios, sur les données actuellement en base"""
+        from app1.models import Client as ClientModele, Destination, Expedition, Facture, Incident, Tournee, TypeService
+        from app1.urls import urlpatterns
+        from app1.utils import FacturationService
+
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(agent)
+
+        def verifier(reponse):
+            if reponse.status_code >= 400:
+                raise AssertionError(f"HTTP {reponse.status_code}")
+            return reponse
+
+        def echantillon(queryset):
+            """`nb_elements` identifiants tirés au hasard (reproductible) parmi le queryset"""
+            identifiants = list(queryset.order_by('id').values_list('id', flat=True)[:nb_elements * 20])
+            return hasard.sample(identifiants, min(nb_elements, len(identifiants)))
+
+        scenarios = []
+
+        # ---------- Écritures ----------
+        clients = echantillon(ClientModele.objects.all())
+        destinations = list(Destination.objects.exclude(zone_geographique='INTERNATIONALE').values_list('id', flat=True))
+        types_service = {t.type_service: t for t in TypeService.objects.filter(type_service__in=['STANDARD', 'EXPRESS'])}
+
+        def creer_expedition(element):
+            client_id, destination_id, type_service = element
+            Expedition(
+                client_id=client_id, destination_id=destination_id, type_service=types_service[type_service],
+                nom_destinataire="Banc Essai", telephone_destinataire='+213555000000',
+                email_destinataire='banc@exemple.dz', adresse_destinataire="1 rue du Banc",
+                poids=Decimal('12.50'), volume=Decimal('0.40'),
+            ).save()
+
+        if clients and destinations and len(types_service) == 2:
+            scenarios.append(Scenario('expedition_creation', 'ecriture', creer_expedition, [
+                (hasard.choice(clients), hasard.choice(destinations), 'EXPRESS' if hasard.random() < 0.2 else 'STANDARD')
+                for _ in range(nb_elements)
+            ], ecriture=True))
+
+        def enregistrer_paiement(facture_id):
+            facture = Facture.objects.select_related('client').get(pk=facture_id)
+            restant = FacturationService.calculer_montant_restant(facture)
+            FacturationService.enregistrer_paiement(facture, (restant / 2).quantize(Decimal('0.01')), 'ESPECES')
+
+        scenarios.append(Scenario('paiement_enregistrement', 'ecriture', enregistrer_paiement,
+                                  echantillon(Facture.objects.filter(statut='IMPAYEE', montant_ttc__gt=1)), ecriture=True))
+
+        def demarrer_tournee(tournee_id):
+            # Comme taches_quotidiennes (matin) : PREVUE → EN_COURS
+            tournee = Tournee.objects.select_related('chauffeur', 'vehicule').get(pk=tournee_id)
+            tournee.statut = 'EN_COURS'
+            tournee.save()
+
+        scenarios.append(Scenario('tournee_demarrage', 'ecriture', demarrer_tournee,
+                                  echantillon(Tournee.objects.filter(statut='PREVUE', expeditions__isnull=False).distinct()),
+                                  ecriture=True))
+
+        def finaliser_tournee(tournee_id):
+            # Retour de la tournée puis saisie du kilométrage (vue terminer_tournee)
+            tournee = Tournee.objects.select_related('chauffeur', 'vehicule').get(pk=tournee_id)
+            tournee.statut = 'TERMINEE'
+            tournee.date_retour_reelle = timezone.now()
+            tournee.save()
+            verifier(client.post(reverse('terminer_tournee', args=[tournee_id]), {
+                'kilometrage_arrivee': (tournee.kilometrage_depart or 0) + 320,
+            }))
+
+        scenarios.append(Scenario('tournee_finalisation', 'ecriture', finaliser_tournee,
+                                  echantillon(Tournee.objects.filter(statut='EN_COURS')), ecriture=True))
+
+        def resoudre_incident(element):
+            incident_id, statut_expedition = element
+            verifier(client.post(reverse('resoudre_incident', args=[incident_id]), {
+                'solution': "Résolution (banc d'essai)",
+                'cause': "Banc d'essai",
+                'nouveau_statut_exp': statut_expedition,
+            }))
+
+        from app1.utils import IncidentService
+        incidents = echantillon(Incident.objects.filter(statut__in=['SIGNALE', 'EN_COURS'], expedition__isnull=False))
+        types_incident = dict(Incident.objects.filter(pk__in=incidents).values_list('id', 'type_incident'))
+        scenarios.append(Scenario('incident_resolution', 'ecriture', resoudre_incident, [
+            (incident_id, 'REENVOYE' if types_incident[incident_id] in IncidentService.TYPES_REEXPEDITION else 'CONTINUE')
+            for incident_id in incidents
+        ], ecriture=True))
+
+        # ---------- Listes (toutes les vues liste_* sans paramètre) ----------
+        for motif in urlpatterns:
+            if isinstance(motif, URLPattern) and (motif.name or '').startswith('liste_') and not motif.pattern.converters:
+                url = reverse(motif.name)
+                scenarios.append(Scenario(motif.name, 'liste', lambda url: verifier(client.get(url)), [url]))
+
+        # ---------- Exports PDF ----------
+        for nom in ('exporter_expeditions_pdf', 'exporter_factures_pdf', 'exporter_tournees_pdf'):
+            scenarios.append(Scenario(nom, 'pdf', lambda url: verifier(client.get(url)), [reverse(nom)]))
+
+        for nom, modele in (('exporter_expedition_detail_pdf', Expedition), ('exporter_facture_detail_pdf', Facture)):
+            scenarios.append(Scenario(nom, 'pdf', lambda url: verifier(client.get(url)),
+                                      [reverse(nom, args=[pk]) for pk in echantillon(modele.objects.all())]))
+
+        return scenarios
+
+    # ==================== MESURE ====================
+
+    @staticmethod
+    def executer(scenario, element):
+        """
+        Une opération : (durée en secondes, nombre de requêtes SQL)
+        Écriture : transaction annulée après la mesure (callbacks on_commit exécutés avant)
+        """
+        with RequetesService.mesurer() as mesure:
+            if scenario.ecriture:
+                with transaction.atomic():
+                    debut = time.perf_counter()
+                    with TestCase.captureOnCommitCallbacks(execute=True):
+                        scenario.operation(element)
+                    duree = time.perf_counter() - debut
+                    transaction.set_rollback(True)
+            else:
+                debut = time.perf_counter()
+                scenario.operation(element)
+                duree = time.perf_counter() - debut
+        # Requêtes de l'annulation (SAVEPOINT / ROLLBACK) exclues
+        requetes = sum(1 for _, sql, _ in mesure.requetes if not sql.lstrip().upper().startswith(('SAVEPOINT', 'ROLLBACK', 'RELEASE')))
+        return duree, requetes
+
+    @staticmethod
+    def mesurer(scenario, taille, operations=30, duree_max=10.0, echauffement=1):
+        """
+        Répète l'opération jusqu'à `operations` fois (au moins une fois, au plus `duree_max` secondes)
+
+        Returns:
+            dict | None: résultat du scénario (None si aucun élément à traiter)
+        """
+        if not scenario.elements:
+            return None
+
+        for i in range(echauffement):
+            BancService.executer(scenario, scenario.elements[i % len(scenario.elements)])
+
+        durees = []
+        requetes = []
+        debut = time.perf_counter()
+        for i in range(operations):
+            duree, nb = BancService.executer(scenario, scenario.elements[i % len(scenario.elements)])
+            durees.append(duree)
+            requetes.append(nb)
+            if time.perf_counter() - debut >= duree_max:
+                break
+
+        durees.sort()
+        return {
+            'scenario': scenario.nom,
+            'categorie': scenario.categorie,
+            'taille': taille,
+            'operations': len(durees),
+            'ops_par_s': round(len(durees) / sum(durees), 2) if sum(durees) else None,
+            'latence_p50_ms': round(statistics.median(durees) * 1000, 2),
+            'latence_p95_ms': round(durees[math.ceil(0.95 * len(durees)) - 1] * 1000, 2),
+            'latence_max_ms': round(durees[-1] * 1000, 2),
+            'requetes_par_op': round(sum(requetes) / len(requetes), 1),
+            'requetes_max': max(requetes),
+        }
+
+    @staticmethod
+    def environnement():
+        """Contexte de la mesure (à comparer avant de conclure à une régression)"""
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=5,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+
+        return {
+            'date': timezone.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': sys.version.split()[0],
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'moteur': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+            'machine': platform.platform(),
+            'processeur': platform.processor() or platform.machine(),
+        }
+
+    # ==================== COMPARAISON ====================
+
+    @staticmethod
+    def comparer(reference, candidat, seuil=0.15, seuil_requetes=0.5):
+        """
+        Compare deux exécutions scénario par scénario (même taille)
+
+        Régression si :
+        - débit (ops/s) en baisse de plus de `seuil` (0.15 = 15 %)
+        - ou plus de `seuil_requetes` requête(s) SQL supplémentaire(s) par opération
+
+        Returns:
+            list: [{'scenario', 'taille', 'reference', 'candidat', 'variation', 'delta_requetes', 'verdict'}]
+        """
+        anciens = {(r['scenario'], r['taille']): r for r in reference['resultats']}
+        nouveaux = {(r['scenario'], r['taille']): r for r in candidat['resultats']}
+
+        lignes = []
+        for cle in sorted(anciens.keys() | nouveaux.keys(), key=lambda c: (c[1], c[0])):
+            ancien, nouveau = anciens.get(cle), nouveaux.get(cle)
+            ligne = {'scenario': cle[0], 'taille': cle[1], 'reference': ancien, 'candidat': nouveau,
+                     'variation': None, 'delta_requetes': None}
+
+            if ancien is None:
+                ligne['verdict'] = 'NOUVEAU'
+            elif nouveau is None:
+                ligne['verdict'] = 'ABSENT'
+            else:
+                if ancien['ops_par_s'] and nouveau['ops_par_s']:
+                    ligne['variation'] = round(nouveau['ops_par_s'] / ancien['ops_par_s'] - 1, 3)
+                ligne['delta_requetes'] = round(nouveau['requetes_par_op'] - ancien['requetes_par_op'], 1)
+
+                if ligne['delta_requetes'] > seuil_requetes or (ligne['variation'] is not None and ligne['variation'] < -seuil):
+                    ligne['verdict'] = 'REGRESSION'
+                elif ligne['variation'] is not None and ligne['variation'] > seuil:
+                    ligne['verdict'] = 'AMELIORATION'
+                else:
+                    ligne['verdict'] = 'STABLE'
+            lignes.append(ligne)
+
+        return lignes
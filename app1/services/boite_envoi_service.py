@@ -0,0 +1,378 @@
+"""
+boite_envoi_service.py - Boîte d'envoi transactionnelle des effets de bord
+
+UTILISATION :
+Les emails, notifications et séries de la flotte partaient DANS save() et les
+signaux, parfois avant le commit : la mise en forme (requêtes sur les
+expéditions, le client...) allongeait la transaction d'écriture, et l'email
+partait même si la transaction était ensuite annulée.
+
+Le code métier PUBLIE désormais un événement :
+- publier() insère une ligne EvenementSortant dans la transaction en cours
+  → annulée avec elle, jamais perdue si elle est validée
+- après le commit, le worker du processus est réveillé (transaction.on_commit) ;
+  un passage toutes les BOITE_ENVOI_INTERVALLE_SECONDES rattrape les reprises
+  et les événements publiés par d'autres processus
+
+TRAITEMENT (traiter) :
+- Réservation d'un lot : UPDATE disponible_le = maintenant + bail, verrou = jeton
+  → deux workers (threads ou processus) ne prennent jamais le même événement ;
+  un worker arrêté en plein lot libère ses événements à la fin du bail
+- Un gestionnaire par type d'événement. Il ouvre lui-même ses transactions :
+  un envoi SMTP ne doit pas tenir le verrou d'écriture
+- Succès → TRAITE (un seul UPDATE pour le lot)
+- Erreur → reprise après BOITE_ENVOI_DELAI_SECONDES × 2^(tentatives - 1),
+  ECHEC après BOITE_ENVOI_TENTATIVES_MAX (traiter_boite_envoi --rejouer-echecs)
+- Livraison "au moins une fois" : les gestionnaires sont idempotents
+  (get_or_create, recalcul) ou tolèrent un doublon (email)
+
+EXEMPLES :
+- BoiteEnvoiService.publier('reclamation_creee', reclamation_id=reclamation.pk)
+- BoiteEnvoiService.publier_lot('expedition_en_route', [{'expedition_id': 1}, {'expedition_id': 2}])
+- BoiteEnvoiService.traiter() → {'lot': 12, 'traites': 12, 'echecs': 0}
+- python manage.py traiter_boite_envoi [--boucle] [--rejouer-echecs] [--purger]
+
+WORKER DU PROCESSUS :
+- Démarré par le serveur web seulement (tp1/wsgi.py, tp1/asgi.py, runserver
+  charge WSGI_APPLICATION) si BOITE_ENVOI_ACTIVE : les commandes manage.py
+  (migrate, shell, test...) ne lancent pas de thread
+- Sinon : python manage.py traiter_boite_envoi --boucle dans un processus dédié
+"""
+
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils import timezone
+
+from .metriques_service import MetriquesService
+
+logger = logging.getLogger(__name__)
+
+# Type d'événement → fonction(**donnees)
+GESTIONNAIRES = {}
+
+
+def gestionnaire(type_evenement):
+    """Décorateur : enregistre le gestionnaire d'un type d'événement"""
+    def enregistrer(fonction):
+        GESTIONNAIRES[type_evenement] = fonction
+        return fonction
+    return enregistrer
+
+
+class BoiteEnvoiService:
+    """
+    Boîte d'envoi (outbox) :
+    - publier() dans la transaction métier
+    - traiter() par lots (worker du processus ou commande traiter_boite_envoi)
+    - rejouer() / purger()
+    """
+
+    _reveil = threading.Event()
+    _arret = threading.Event()
+    _worker = None
+    _verrou = threading.Lock()
+
+    EVENEMENTS = MetriquesService.compteur(
+        'transportpro_boite_envoi_total', "Événements de la boîte d'envoi traités", ('type_evenement', 'resultat')
+    )
+
+    # ==================== PUBLICATION ====================
+
+    @staticmethod
+    def publier(type_evenement, **donnees):
+        """
+        Enregistre un événement dans la transaction en cours
+
+        Args:
+            type_evenement (str): clé de GESTIONNAIRES
+            **donnees: arguments JSON du gestionnaire (identifiants, pas d'objets)
+
+        Returns:
+            EvenementSortant
+        """
+        from app1.models import EvenementSortant
+
+        if type_evenement not in GESTIONNAIRES:
+            raise ValueError(f"Type d'événement inconnu : {type_evenement}")
+
+        evenement = EvenementSortant.objects.create(type_evenement=type_evenement, donnees=donnees)
+        transaction.on_commit(BoiteEnvoiService.reveiller)
+        return evenement
+
+    @staticmethod
+    def publier_lot(type_evenement, liste_donnees):
+        """
+        Plusieurs événements du même type en un seul INSERT (bulk_create)
+
+        Returns:
+            int: nombre d'événements enregistrés
+        """
+        from app1.models import EvenementSortant
+
+        if type_evenement not in GESTIONNAIRES:
+            raise ValueError(f"Type d'événement inconnu : {type_evenement}")
+        if not liste_donnees:
+            return 0
+
+        EvenementSortant.objects.bulk_create([
+            EvenementSortant(type_evenement=type_evenement, donnees=donnees) for donnees in liste_donnees
+        ])
+        transaction.on_commit(BoiteEnvoiService.reveiller)
+        return len(liste_donnees)
+
+    # ==================== TRAITEMENT ====================
+
+    @staticmethod
+    def traiter(taille_lot=None):
+        """
+        Réserve puis traite un lot d'événements disponibles
+
+        Returns:
+            dict: {'lot': événements réservés, 'traites': int, 'echecs': int}
+        """
+        from app1.models import EvenementSortant
+
+        taille_lot = taille_lot or getattr(settings, 'BOITE_ENVOI_TAILLE_LOT', 100)
+        maintenant = timezone.now()
+        jeton = uuid.uuid4().hex
+
+        disponibles = EvenementSortant.objects.filter(statut='EN_ATTENTE', disponible_le__lte=maintenant)
+        identifiants = list(disponibles.order_by('disponible_le', 'id').values_list('id', flat=True)[:taille_lot])
+        if not identifiants:
+            return {'lot': 0, 'traites': 0, 'echecs': 0}
+
+        # Réservation : un autre worker qui a lu les mêmes lignes ne les obtient pas
+        # (disponible_le n'est plus <= maintenant une fois l'UPDATE validé)
+        bail = timedelta(seconds=getattr(settings, 'BOITE_ENVOI_BAIL_SECONDES', 300))
+        disponibles.filter(id__in=identifiants).update(disponible_le=maintenant + bail, verrou=jeton)
+        lot = list(EvenementSortant.objects.filter(id__in=identifiants, verrou=jeton).order_by('id'))
+
+        traites = []
+        echecs = 0
+        for evenement in lot:
+            try:
+                fonction = GESTIONNAIRES.get(evenement.type_evenement)
+                if fonction is None:
+                    raise LookupError(f"Aucun gestionnaire pour {evenement.type_evenement}")
+                fonction(**evenement.donnees)
+            except Exception as e:
+                echecs += 1
+                BoiteEnvoiService.EVENEMENTS.inc(type_evenement=evenement.type_evenement, resultat='erreur')
+                BoiteEnvoiService.reprogrammer(evenement, jeton, e)
+            else:
+                traites.append(evenement.pk)
+                BoiteEnvoiService.EVENEMENTS.inc(type_evenement=evenement.type_evenement, resultat='ok')
+
+        if traites:
+            EvenementSortant.objects.filter(id__in=traites, verrou=jeton).update(
+                statut='TRAITE', date_traitement=timezone.now(), verrou=''
+            )
+
+        return {'lot': len(lot), 'traites': len(traites), 'echecs': echecs}
+
+    @staticmethod
+    def reprogrammer(evenement, jeton, erreur):
+        """Nouvelle tentative plus tard (délai doublé à chaque échec), ECHEC au-delà du maximum"""
+        from app1.models import EvenementSortant
+
+        tentatives = evenement.tentatives + 1
+        delai = getattr(settings, 'BOITE_ENVOI_DELAI_SECONDES', 30) * 2 ** (tentatives - 1)
+        abandon = tentatives >= getattr(settings, 'BOITE_ENVOI_TENTATIVES_MAX', 8)
+
+        EvenementSortant.objects.filter(pk=evenement.pk, verrou=jeton).update(
+            tentatives=tentatives,
+            statut='ECHEC' if abandon else 'EN_ATTENTE',
+            disponible_le=timezone.now() + timedelta(seconds=delai),
+            derniere_erreur=f"{type(erreur).__name__} : {erreur}"[:2000],
+            verrou='',
+        )
+
+    @staticmethod
+    def vider(taille_lot=None):
+        """Traite les lots jusqu'à ce qu'aucun événement ne soit disponible"""
+        totaux = {'lot': 0, 'traites': 0, 'echecs': 0}
+        while True:
+            resultat = BoiteEnvoiService.traiter(taille_lot)
+            for cle in totaux:
+                totaux[cle] += resultat[cle]
+            # Lot vide ou uniquement des échecs (reprogrammés plus tard) → terminé
+            if resultat['traites'] == 0:
+                return totaux
+
+    # ==================== MAINTENANCE ====================
+
+    @staticmethod
+    def rejouer():
+        """Remet les événements ECHEC en attente (après correction de la cause)"""
+        from app1.models import EvenementSortant
+
+        return EvenementSortant.objects.filter(statut='ECHEC').update(
+            statut='EN_ATTENTE', tentatives=0, disponible_le=timezone.now()
+        )
+
+    @staticmethod
+    def purger(jours=None):
+        """Supprime les événements traités depuis plus de `jours`"""
+        from app1.models import EvenementSortant
+
+        jours = getattr(settings, 'BOITE_ENVOI_CONSERVATION_JOURS', 7) if jours is None else jours
+        limite = timezone.now() - timedelta(days=jours)
+        supprimes, _ = EvenementSortant.objects.filter(statut='TRAITE', date_traitement__lt=limite).delete()
+        return supprimes
+
+    # ==================== WORKER DU PROCESSUS ====================
+
+    @staticmethod
+    def reveiller():
+        """Appelé après le commit d'une transaction qui a publié"""
+        BoiteEnvoiService._reveil.set()
+
+    @staticmethod
+    def demarrer_serveur():
+        """Appelé par les points d'entrée WSGI/ASGI : lance le worker si BOITE_ENVOI_ACTIVE"""
+        if getattr(settings, 'BOITE_ENVOI_ACTIVE', False):
+            BoiteEnvoiService.demarrer()
+
+    @staticmethod
+    def demarrer():
+        """Lance le worker du processus (thread démon), une seule fois"""
+        with BoiteEnvoiService._verrou:
+            if BoiteEnvoiService._worker is not None and BoiteEnvoiService._worker.is_alive():
+                return
+            BoiteEnvoiService._arret.clear()
+            BoiteEnvoiService._worker = threading.Thread(
+                target=BoiteEnvoiService._boucle, name='boite-envoi', daemon=True
+            )
+            BoiteEnvoiService._worker.start()
+
+    @staticmethod
+    def arreter():
+        """Demande l'arrêt du worker (fin du passage en cours)"""
+        BoiteEnvoiService._arret.set()
+        BoiteEnvoiService._reveil.set()
+
+    @staticmethod
+    def _boucle():
+        while not BoiteEnvoiService._arret.is_set():
+            BoiteEnvoiService._reveil.wait(timeout=getattr(settings, 'BOITE_ENVOI_INTERVALLE_SECONDES', 30))
+            BoiteEnvoiService._reveil.clear()
+            if BoiteEnvoiService._arret.is_set():
+                break
+            if not getattr(settings, 'BOITE_ENVOI_ACTIVE', True):
+                continue
+            try:
+                BoiteEnvoiService.vider()
+            except DatabaseError as e:
+                # Base pas encore migrée, verrou prolongé... → prochain passage
+                logger.warning("Boîte d'envoi non traitée : %s", e)
+            finally:
+                close_old_connections()
+
+
+# ==================== GESTIONNAIRES ====================
+
+@gestionnaire('reclamation_creee')
+def alerter_support_reclamation(reclamation_id):
+    """Email au support pour une nouvelle réclamation"""
+    from app1.models import Reclamation
+    from app1.notification import AlerteEmailService, envoi_synchrone
+
+    reclamation = Reclamation.objects.select_related('client', 'facture').filter(pk=reclamation_id).first()
+    if reclamation is None:
+        return
+    with envoi_synchrone():
+        AlerteEmailService.envoyer_notification_nouvelle_reclamation(reclamation)
+
+
+@gestionnaire('reclamation_repondue')
+def informer_client_reclamation(reclamation_id):
+    """Email au client : réponse apportée à sa réclamation"""
+    from app1.models import Reclamation
+    from app1.notification import AlerteEmailService, envoi_synchrone
+
+    reclamation = Reclamation.objects.select_related('client').filter(pk=reclamation_id).first()
+    if reclamation is None:
+        return
+    with envoi_synchrone():
+        AlerteEmailService.envoyer_reponse_reclamation_client(reclamation)
+
+
+@gestionnaire('expedition_en_route')
+def informer_destinataire(expedition_id):
+    """Email au destinataire : sa tournée a démarré"""
+    from app1.models import Expedition
+    from app1.notification import ExpeditionEmailService, envoi_synchrone
+
+    expedition = Expedition.objects.select_related('destination', 'tournee').filter(pk=expedition_id).first()
+    if expedition is None:
+        return
+    with envoi_synchrone():
+        ExpeditionEmailService.envoyer_notification_colis_en_route(expedition)
+
+
+@gestionnaire('tournee_terminee')
+def demander_kilometrage(tournee_id):
+    """Notification agent : renseigner le kilométrage d'arrivée (une seule ouverte par tournée)"""
+    from app1.models import Notification, Tournee
+
+    tournee = Tournee.objects.select_related('chauffeur', 'vehicule').filter(
+        pk=tournee_id, statut='TERMINEE', kilometrage_arrivee__isnull=True
+    ).first()
+    if tournee is None:
+        # Kilométrage saisi entre-temps : plus rien à demander
+        return
+
+    Notification.objects.get_or_create(
+        type_notification='TOURNEE_TERMINEE',
+        tournee=tournee,
+        statut='NON_LUE',
+        defaults={
+            'titre': f"Tournée terminée - {tournee.get_numero_tournee()}",
+            'message': (
+                f"La tournée {tournee.get_numero_tournee()} est terminée.\n\n"
+                f"Chauffeur : {tournee.chauffeur.prenom} {tournee.chauffeur.nom}\n"
+                f"Véhicule : {tournee.vehicule.numero_immatriculation}\n"
+                f"Kilométrage départ : {tournee.kilometrage_depart} km\n\n"
+                f"Veuillez renseigner le kilométrage d'arrivée pour finaliser la tournée."
+            ),
+            'vehicule': tournee.vehicule,
+        }
+    )
+
+
+@gestionnaire('client_en_credit')
+def signaler_credit_client(client_id, numero_expedition):
+    """Notification agent : client en crédit après l'annulation d'une expédition"""
+    from app1.models import Client, Notification
+
+    client = Client.objects.filter(pk=client_id).first()
+    if client is None or client.solde >= 0:
+        # Crédit déjà résorbé (nouvelle facture, remboursement...)
+        return
+
+    Notification.objects.get_or_create(
+        type_notification='SOLDE_NEGATIF',
+        client=client,
+        titre=f"Client en crédit - {client.nom} {client.prenom}",
+        statut='NON_LUE',
+        defaults={
+            'message': (
+                f"Le client {client.nom} {client.prenom} a un crédit de "
+                f"{abs(client.solde):,.2f} DA suite à l'annulation de l'expédition "
+                f"{numero_expedition}.\n\n"
+                "Un remboursement doit être effectué."
+            ),
+        }
+    )
+
+
+@gestionnaire('tournee_finalisee')
+def enregistrer_mesure_tournee(tournee_id):
+    """Point de la série d'efficacité du véhicule (recalculé s'il existe déjà)"""
+    from .flotte_service import FlotteService
+    FlotteService.enregistrer_tournee(tournee_id)
@@ -0,0 +1,330 @@
+"""
+calendrier_service.py - Calendrier de réservation des chauffeurs et véhicules
+
+UTILISATION :
+La disponibilité d'une ressource n'est plus un simple drapeau (statut_disponibilite,
+Vehicule.statut) : chaque tournée RÉSERVE son chauffeur et son véhicule sur un
+intervalle [début, fin) (table ReservationRessource). On peut donc planifier des
+tournées plusieurs jours à l'avance sans bloquer la ressource d'ici là.
+
+Deux intervalles [d1, f1) et [d2, f2) se chevauchent si d1 < f2 ET f1 > d2.
+
+- En base : index (ressource, début, fin) → "ressources libres sur une fenêtre"
+  en UNE requête (NOT EXISTS réservation chevauchante)
+- En mémoire : ArbreIntervalles (arbre d'intervalles augmenté) pour les grilles de
+  planning où l'on interroge des dizaines de fenêtres sur les mêmes réservations
+
+Les drapeaux restent utilisés pour les indisponibilités sans date de fin
+(congé, maladie, maintenance, hors service) et pour l'affichage "en tournée"
+pendant une tournée EN_COURS.
+
+EXEMPLES :
+- CalendrierService.chauffeurs_libres(debut, fin) → QuerySet
+- CalendrierService.verifier(chauffeur, vehicule, debut, fin) → ValidationError si conflit
+- CalendrierService.reserver_tournee(tournee) → appelé par Tournee.save()
+- CalendrierService.verrouiller(chauffeur_id, vehicule_id, sauter_verrouilles=True) → affectation
+- CalendrierService.planning(date_debut, nb_jours=7) → grille pour la page disponibilités
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+
+# ==================== ARBRE D'INTERVALLES ====================
+
+class ArbreIntervalles:
+    """
+    Arbre d'intervalles statique : intervalles triés par début, arbre binaire
+    implicite (milieu de chaque tranche = nœud) et, par nœud, la fin maximale
+    de son sous-arbre. Recherche des chevauchements en O(log n + k).
+
+    Exemple :
+        arbre = ArbreIntervalles([(debut, fin, reservation), ...])
+        arbre.chevauchements(fenetre_debut, fenetre_fin) → [reservation, ...]
+    """
+
+    def __init__(self, intervalles):
+        intervalles = sorted(intervalles, key=lambda intervalle: intervalle[0])
+        self.debuts = [intervalle[0] for intervalle in intervalles]
+        self.fins = [intervalle[1] for intervalle in intervalles]
+        self.valeurs = [intervalle[2] for intervalle in intervalles]
+        self.fin_max = list(self.fins)
+        self._construire(0, len(intervalles))
+
+    def __len__(self):
+        return len(self.debuts)
+
+    def _construire(self, bas, haut):
+        if bas >= haut:
+            return None
+        milieu = (bas + haut) // 2
+        for enfant in (self._construire(bas, milieu), self._construire(milieu + 1, haut)):
+            if enfant is not None and enfant > self.fin_max[milieu]:
+                self.fin_max[milieu] = enfant
+        return self.fin_max[milieu]
+
+    def chevauchements(self, debut, fin):
+        """Valeurs des intervalles chevauchant [debut, fin)"""
+        resultats = []
+        self._chercher(0, len(self.debuts), debut, fin, resultats)
+        return resultats
+
+    def est_libre(self, debut, fin):
+        return not self.chevauchements(debut, fin)
+
+    def _chercher(self, bas, haut, debut, fin, resultats):
+        if bas >= haut:
+            return
+        milieu = (bas + haut) // 2
+
+        # Aucun intervalle du sous-arbre ne se termine après `debut`
+        if self.fin_max[milieu] <= debut:
+            return
+
+        self._chercher(bas, milieu, debut, fin, resultats)
+
+        # Les intervalles à droite commencent après celui-ci : inutile si déjà >= fin
+        if self.debuts[milieu] < fin:
+            if self.fins[milieu] > debut:
+                resultats.append(self.valeurs[milieu])
+            self._chercher(milieu + 1, haut, debut, fin, resultats)
+
+
+# ==================== SERVICE ====================
+
+class CalendrierService:
+    """
+    Service gérant les réservations de ressources :
+    - Fenêtre d'occupation d'une tournée
+    - Ressources libres sur une fenêtre (une requête)
+    - Vérification des conflits et réservation atomique
+    - Grille de planning (arbres d'intervalles en mémoire)
+    """
+
+    # Indisponibilités sans date de fin (drapeaux)
+    STATUTS_CHAUFFEUR_INDISPONIBLE = ['CONGE', 'MALADIE', 'AUTRE']
+    STATUTS_VEHICULE_INDISPONIBLE = ['EN_MAINTENANCE', 'HORS_SERVICE']
+
+    @staticmethod
+    def duree_par_defaut():
+        return timedelta(hours=getattr(settings, 'DUREE_TOURNEE_DEFAUT_HEURES', 24))
+
+    @staticmethod
+    def fenetre_tournee(tournee):
+        """
+        Intervalle [début, fin) occupé par une tournée
+
+        - début = date de départ
+        - fin = retour réel (tournée TERMINEE), sinon retour prévu,
+          sinon départ + DUREE_TOURNEE_DEFAUT_HEURES
+        """
+        debut = tournee.date_depart
+
+        if tournee.statut == 'TERMINEE':
+            fin = tournee.date_retour_reelle or timezone.now()
+        else:
+            fin = tournee.date_retour_prevue or debut + CalendrierService.duree_par_defaut()
+
+        # Intervalle jamais vide (retour saisi avant le départ, tournée terminée en avance...)
+        if fin <= debut:
+            fin = debut + timedelta(minutes=1)
+
+        return debut, fin
+
+    # ==================== REQUÊTES ====================
+
+    @staticmethod
+    def reservations_chevauchantes(debut, fin, exclure_tournee=None):
+        """
+        Réservations chevauchant [debut, fin)
+        Une tournée EN_COURS bloque sa ressource jusqu'à sa clôture,
+        même si son retour prévu est dépassé
+        """
+        from app1.models import ReservationRessource
+
+        reservations = ReservationRessource.objects.filter(
+            Q(debut__lt=fin, fin__gt=debut) |
+            Q(debut__lt=fin, tournee__statut='EN_COURS')
+        )
+        if exclure_tournee:
+            reservations = reservations.exclude(tournee_id=exclure_tournee)
+        return reservations
+
+    @staticmethod
+    def chauffeurs_operationnels():
+        from app1.models import Chauffeur
+        return Chauffeur.objects.exclude(
+            statut_disponibilite__in=CalendrierService.STATUTS_CHAUFFEUR_INDISPONIBLE
+        )
+
+    @staticmethod
+    def vehicules_operationnels():
+        from app1.models import Vehicule
+        return Vehicule.objects.exclude(
+            statut__in=CalendrierService.STATUTS_VEHICULE_INDISPONIBLE
+        )
+
+    @staticmethod
+    def chauffeurs_libres(debut, fin, exclure_tournee=None):
+        """Chauffeurs sans réservation sur [debut, fin) (une seule requête)"""
+        occupes = CalendrierService.reservations_chevauchantes(debut, fin, exclure_tournee)
+        return CalendrierService.chauffeurs_operationnels().exclude(
+            Exists(occupes.filter(chauffeur_id=OuterRef('pk')))
+        ).order_by('nom', 'prenom')
+
+    @staticmethod
+    def vehicules_libres(debut, fin, exclure_tournee=None):
+        """Véhicules sans réservation sur [debut, fin) (une seule requête)"""
+        occupes = CalendrierService.reservations_chevauchantes(debut, fin, exclure_tournee)
+        return CalendrierService.vehicules_operationnels().exclude(
+            Exists(occupes.filter(vehicule_id=OuterRef('pk')))
+        ).order_by('numero_immatriculation')
+
+    @staticmethod
+    def conflits(chauffeur, vehicule, debut, fin, exclure_tournee=None):
+        """
+        Liste des raisons empêchant de réserver chauffeur + véhicule sur [debut, fin)
+
+        Returns:
+            list: messages (vide si tout est libre)
+        """
+        erreurs = []
+
+        if chauffeur is not None and chauffeur.statut_disponibilite in CalendrierService.STATUTS_CHAUFFEUR_INDISPONIBLE:
+            erreurs.append(f"Chauffeur {chauffeur} indisponible ({chauffeur.get_statut_disponibilite_display()})")
+        if vehicule is not None and vehicule.statut in CalendrierService.STATUTS_VEHICULE_INDISPONIBLE:
+            erreurs.append(f"Véhicule {vehicule.numero_immatriculation} indisponible ({vehicule.get_statut_display()})")
+
+        filtre = Q()
+        if chauffeur is not None:
+            filtre |= Q(chauffeur_id=chauffeur.pk)
+        if vehicule is not None:
+            filtre |= Q(vehicule_id=vehicule.pk)
+
+        reservations = CalendrierService.reservations_chevauchantes(
+            debut, fin, exclure_tournee
+        ).filter(filtre).select_related('tournee')
+
+        for reservation in reservations:
+            ressource = (
+                f"Chauffeur {chauffeur}" if reservation.chauffeur_id
+                else f"Véhicule {vehicule.numero_immatriculation}"
+            )
+            erreurs.append(
+                f"{ressource} déjà réservé du {timezone.localtime(reservation.debut).strftime('%d/%m/%Y %H:%M')} "
+                f"au {timezone.localtime(reservation.fin).strftime('%d/%m/%Y %H:%M')} ({reservation.libelle()})"
+            )
+
+        return erreurs
+
+    @staticmethod
+    def verifier(chauffeur, vehicule, debut, fin, exclure_tournee=None):
+        """Lève ValidationError si chauffeur ou véhicule n'est pas libre sur [debut, fin)"""
+        erreurs = CalendrierService.conflits(chauffeur, vehicule, debut, fin, exclure_tournee)
+        if erreurs:
+            raise ValidationError(erreurs)
+
+    # ==================== RÉSERVATION ====================
+
+    @staticmethod
+    def verrouiller(chauffeur_id, vehicule_id, sauter_verrouilles=False):
+        """
+        Verrouille les lignes chauffeur + véhicule jusqu'à la fin de la transaction
+        (sérialise les réservations concurrentes sur ces ressources)
+
+        - PostgreSQL : SELECT ... FOR UPDATE ; avec `sauter_verrouilles`, SKIP LOCKED :
+          une ressource en cours de réservation par une autre transaction n'est pas
+          attendue, elle est renvoyée None (l'appelant passe au candidat suivant)
+        - SQLite : FOR UPDATE n'existe pas, BEGIN IMMEDIATE sérialise déjà les écritures
+
+        Returns:
+            tuple: (chauffeur ou None, vehicule ou None)
+        """
+        from app1.models import Chauffeur, Vehicule
+
+        sauter = sauter_verrouilles and connection.features.has_select_for_update_skip_locked
+        chauffeur = Chauffeur.objects.select_for_update(skip_locked=sauter).filter(pk=chauffeur_id).first()
+        vehicule = Vehicule.objects.select_for_update(skip_locked=sauter).filter(pk=vehicule_id).first()
+        return chauffeur, vehicule
+
+    @staticmethod
+    @transaction.atomic
+    def reserver_tournee(tournee):
+        """
+        (Re)crée les réservations chauffeur + véhicule d'une tournée
+
+        - PREVUE : vérifie les conflits puis réserve (même transaction)
+        - EN_COURS / TERMINEE : met seulement l'intervalle à jour
+          (une tournée terminée libère ses ressources à son retour réel)
+        """
+        from app1.models import ReservationRessource
+
+        debut, fin = CalendrierService.fenetre_tournee(tournee)
+
+        if tournee.statut == 'PREVUE':
+            chauffeur, vehicule = CalendrierService.verrouiller(tournee.chauffeur_id, tournee.vehicule_id)
+            CalendrierService.verifier(chauffeur, vehicule, debut, fin, exclure_tournee=tournee.pk)
+
+        ReservationRessource.objects.filter(tournee_id=tournee.pk).delete()
+        ReservationRessource.objects.bulk_create([
+            ReservationRessource(chauffeur_id=tournee.chauffeur_id, tournee_id=tournee.pk,
+                                 motif='TOURNEE', debut=debut, fin=fin),
+            ReservationRessource(vehicule_id=tournee.vehicule_id, tournee_id=tournee.pk,
+                                 motif='TOURNEE', debut=debut, fin=fin),
+        ])
+
+    # ==================== PLANNING ====================
+
+    @staticmethod
+    def planning(date_debut, nb_jours=7):
+        """
+        Grille d'occupation jour par jour sur `nb_jours`
+
+        Une requête par type de ressource pour les réservations de l'horizon,
+        puis un ArbreIntervalles par ressource pour interroger chaque journée.
+
+        Returns:
+            dict: {'jours': [date, ...],
+                   'chauffeurs': [(chauffeur, [libellés ou None par jour]), ...],
+                   'vehicules': [(vehicule, [...]), ...]}
+        """
+        from app1.models import Chauffeur, Vehicule
+
+        debut_horizon = timezone.make_aware(datetime.combine(date_debut, time.min))
+        jours = [debut_horizon + timedelta(days=i) for i in range(nb_jours)]
+        fin_horizon = jours[-1] + timedelta(days=1)
+
+        reservations = list(
+            CalendrierService.reservations_chevauchantes(debut_horizon, fin_horizon)
+            .select_related('tournee')
+        )
+
+        def grille(ressources, champ):
+            intervalles = {}
+            for reservation in reservations:
+                ressource_id = getattr(reservation, champ)
+                if ressource_id is not None:
+                    fin = fin_horizon if reservation.est_ouverte() else reservation.fin
+                    intervalles.setdefault(ressource_id, []).append((reservation.debut, fin, reservation))
+
+            arbres = {ressource_id: ArbreIntervalles(liste) for ressource_id, liste in intervalles.items()}
+            lignes = []
+            for ressource in ressources:
+                arbre = arbres.get(ressource.pk)
+                cases = []
+                for jour in jours:
+                    occupations = arbre.chevauchements(jour, jour + timedelta(days=1)) if arbre else []
+                    cases.append(", ".join(reservation.libelle() for reservation in occupations) or None)
+                lignes.append((ressource, cases))
+            return lignes
+
+        return {
+            'jours': [jour.date() for jour in jours],
+            'chauffeurs': grille(Chauffeur.objects.order_by('nom', 'prenom'), 'chauffeur_id'),
+            'vehicules': grille(Vehicule.objects.order_by('numero_immatriculation'), 'vehicule_id'),
+        }
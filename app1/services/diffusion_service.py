@@ -0,0 +1,175 @@
+"""
+diffusion_service.py - Diffusion en direct (pub/sub en mémoire) vers les navigateurs
+
+UTILISATION :
+Le tableau de bord ouvre un flux Server-Sent Events (GET /flux/, servi par
+tp1/asgi.py sous uvicorn) et reçoit les changements au lieu de recharger la page :
+- tournee      : changement de statut d'une tournée
+- notification : nouvelle notification
+- suivi        : nouvelle étape de suivi d'une expédition
+- position     : dernière position GPS d'une tournée (une par lot d'ingestion)
+
+FONCTIONNEMENT :
+- Les signaux publient APRÈS commit (transaction.on_commit) : un événement
+  annulé n'est jamais diffusé
+- publier() peut être appelé depuis n'importe quel thread (vues synchrones,
+  scheduler) : le message est remis à chaque abonné dans SA boucle asyncio
+  (call_soon_threadsafe)
+- Chaque abonné a une file bornée (DIFFUSION_FILE_MAX) : un navigateur trop
+  lent est déconnecté plutôt que de faire grossir la mémoire ; il se
+  reconnecte et reçoit un événement "resync" (recharger la page)
+- Les DIFFUSION_HISTORIQUE derniers événements sont gardés pour rejouer ce
+  qu'un navigateur a manqué pendant une reconnexion (en-tête Last-Event-ID)
+
+⚠️ Broker EN MÉMOIRE : un processus = un broker. Avec plusieurs workers uvicorn,
+un agent ne reçoit que les événements produits par le processus qui le sert.
+
+EXEMPLES :
+- DiffusionService.publier('tournee', {'id': 12, 'statut': 'EN_COURS'})
+- async for message in DiffusionService.flux(dernier_id) → vue flux_direct
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+from collections import deque
+
+from django.conf import settings
+
+
+class Abonne:
+    """Un navigateur connecté : sa boucle asyncio et sa file de messages"""
+
+    def __init__(self, boucle, taille):
+        self.boucle = boucle
+        self.file = asyncio.Queue(maxsize=taille)
+        self.debordement = False
+
+    def remettre(self, message):
+        """Exécuté dans la boucle de l'abonné"""
+        try:
+            self.file.put_nowait(message)
+        except asyncio.QueueFull:
+            self.debordement = True
+
+
+class DiffusionService:
+    """
+    Broker pub/sub du processus :
+    - publier() (tout thread)
+    - flux() (générateur asynchrone au format SSE)
+    """
+
+    _abonnes = set()
+    _historique = None
+    _compteur = itertools.count(1)
+    _verrou = threading.Lock()
+
+    # ==================== PUBLICATION ====================
+
+    @staticmethod
+    def publier(type_evenement, donnees):
+        """
+        Diffuse un événement à tous les abonnés du processus
+
+        Returns:
+            int: identifiant de l'événement
+        """
+        with DiffusionService._verrou:
+            identifiant = next(DiffusionService._compteur)
+            message = DiffusionService.formater(identifiant, type_evenement, donnees)
+            DiffusionService._memoriser(identifiant, message)
+            abonnes = list(DiffusionService._abonnes)
+
+        for abonne in abonnes:
+            try:
+                abonne.boucle.call_soon_threadsafe(abonne.remettre, message)
+            except RuntimeError:
+                # Boucle fermée (serveur arrêté) : l'abonné disparaîtra avec elle
+                pass
+
+        return identifiant
+
+    @staticmethod
+    def publier_apres_commit(type_evenement, donnees):
+        """Publication différée à la fin de la transaction en cours"""
+        from django.db import transaction
+        transaction.on_commit(lambda: DiffusionService.publier(type_evenement, donnees))
+
+    @staticmethod
+    def formater(identifiant, type_evenement, donnees):
+        """Message Server-Sent Events"""
+        return f"id: {identifiant}\nevent: {type_evenement}\ndata: {json.dumps(donnees, default=str)}\n\n"
+
+    @staticmethod
+    def notification(notification):
+        """Contenu diffusé pour une Notification (signal ou bulk_create)"""
+        return {
+            'id': notification.pk,
+            'type': notification.type_notification,
+            'libelle': notification.get_type_notification_display(),
+            'titre': notification.titre,
+        }
+
+    @staticmethod
+    def suivi(suivi):
+        """Contenu diffusé pour une étape TrackingExpedition (signal ou bulk_create)"""
+        return {
+            'expedition_id': suivi.expedition_id,
+            'numero': f"EXP-{suivi.expedition_id:06d}",
+            'statut': suivi.statut_etape,
+            'libelle': suivi.get_statut_etape_display(),
+        }
+
+    @staticmethod
+    def _memoriser(identifiant, message):
+        if DiffusionService._historique is None:
+            DiffusionService._historique = deque(maxlen=getattr(settings, 'DIFFUSION_HISTORIQUE', 500))
+        DiffusionService._historique.append((identifiant, message))
+
+    @staticmethod
+    def nb_abonnes():
+        return len(DiffusionService._abonnes)
+
+    # ==================== ABONNEMENT ====================
+
+    @staticmethod
+    async def flux(dernier_id=None):
+        """
+        Générateur asynchrone de messages SSE pour un navigateur
+
+        Args:
+            dernier_id: en-tête Last-Event-ID (reconnexion) → rejoue les événements manqués
+        """
+        abonne = Abonne(asyncio.get_running_loop(), getattr(settings, 'DIFFUSION_FILE_MAX', 100))
+        battement = getattr(settings, 'DIFFUSION_BATTEMENT_SECONDES', 15)
+
+        with DiffusionService._verrou:
+            DiffusionService._abonnes.add(abonne)
+            historique = list(DiffusionService._historique or [])
+
+        try:
+            # Conseil de reconnexion au navigateur (ms)
+            yield "retry: 3000\n\n"
+
+            if dernier_id is not None:
+                premier = historique[0][0] if historique else None
+                dernier = historique[-1][0] if historique else 0
+                if dernier_id > dernier or (premier is not None and premier > dernier_id + 1):
+                    # Trou dans l'historique (ou serveur redémarré) : le navigateur doit recharger la page
+                    yield DiffusionService.formater(dernier, 'resync', {})
+                else:
+                    for identifiant, message in historique:
+                        if identifiant > dernier_id:
+                            yield message
+
+            while not abonne.debordement:
+                try:
+                    yield await asyncio.wait_for(abonne.file.get(), timeout=battement)
+                except asyncio.TimeoutError:
+                    # Commentaire SSE : garde la connexion ouverte à travers les proxys
+                    yield ": battement\n\n"
+        finally:
+            with DiffusionService._verrou:
+                DiffusionService._abonnes.discard(abonne)
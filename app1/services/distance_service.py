@@ -0,0 +1,347 @@
+"""
+distance_service.py - Matrice des distances et temps de trajet entre destinations
+
+UTILISATION :
+Chaque destination a une latitude / longitude (saisie ou chef-lieu de sa wilaya).
+La matrice destination × destination est précalculée (haversine vectorisée ×
+facteur routier) et stockée sur disque en float32 (numpy.memmap) :
+- distances.f32 : distance routière estimée en km
+- durees.f32    : temps de trajet estimé en heures
+- index.json    : destination_id → ligne de la matrice (ligne 0 = dépôt)
+
+Une lecture est un accès direct O(1) : matrice[ligne_a, ligne_b].
+Une nouvelle destination ne recalcule que SA ligne et SA colonne (O(N)).
+
+Dépôt ↔ destination : on garde distance_estimee (km routiers saisis par l'agent)
+Destination ↔ destination : haversine × FACTEUR_ROUTE
+
+EXEMPLES :
+- DistanceService.distance(None, 12) → km dépôt → destination 12
+- DistanceService.duree(5, 12) → heures de route entre 5 et 12
+- DistanceService.sous_matrice([5, 12, 7]) → matrice 4×4 (dépôt + 3 arrêts)
+- DistanceService.reconstruire() → commande calculer_matrice_distances
+"""
+
+import json
+import math
+import os
+import threading
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+RAYON_TERRE_KM = 6371.0
+
+
+class DistanceService:
+    """
+    Service gérant la géolocalisation des destinations et la matrice des distances
+    """
+
+    # Handle mémoire (par processus) vers les fichiers de la matrice
+    _etat = {'mtime': None, 'index': {}, 'capacite': 0, 'distances': None, 'durees': None}
+    _verrou = threading.RLock()
+
+    # ==================== PARAMÈTRES ====================
+
+    @staticmethod
+    def dossier():
+        return Path(getattr(settings, 'MATRICE_DISTANCES_DIR', Path(settings.BASE_DIR) / 'matrices'))
+
+    @staticmethod
+    def facteur_route():
+        return getattr(settings, 'FACTEUR_ROUTE', 1.3)
+
+    @staticmethod
+    def vitesse_moyenne():
+        return getattr(settings, 'VITESSE_MOYENNE_KMH', 60.0)
+
+    @staticmethod
+    def depot():
+        return getattr(settings, 'DEPOT_COORDONNEES', (36.754, 3.059))
+
+    # ==================== GÉOCODAGE ====================
+
+    @staticmethod
+    def normaliser(nom):
+        """'Sidi Bel-Abbès' → 'sidibelabbes'"""
+        sans_accents = unicodedata.normalize('NFKD', nom or '').encode('ascii', 'ignore').decode()
+        return ''.join(c for c in sans_accents.lower() if c.isalnum())
+
+    @staticmethod
+    def geocoder(destination):
+        """
+        Remplit latitude / longitude depuis le chef-lieu de la wilaya
+        (uniquement pour les destinations en Algérie et si non renseignées)
+
+        Returns:
+            bool: True si des coordonnées ont été trouvées
+        """
+        from app1.constants import COORDONNEES_WILAYAS
+
+        if destination.latitude is not None and destination.longitude is not None:
+            return True
+        if destination.zone_geographique == 'INTERNATIONALE':
+            return False
+
+        coordonnees = COORDONNEES_WILAYAS.get(DistanceService.normaliser(destination.wilaya))
+        if not coordonnees:
+            return False
+
+        destination.latitude, destination.longitude = coordonnees
+        return True
+
+    # ==================== CALCUL VECTORISÉ ====================
+
+    @staticmethod
+    def haversine(lat1, lon1, lat2, lon2):
+        """
+        Distance à vol d'oiseau en km (fonctionne sur des tableaux numpy, avec broadcasting)
+        """
+        lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(a))
+
+    @staticmethod
+    def _points():
+        """
+        Retourne (ids, latitudes, longitudes, distances_depot) avec le dépôt en position 0
+        """
+        from app1.models import Destination
+
+        lignes = list(
+            Destination.objects.filter(latitude__isnull=False, longitude__isnull=False)
+            .order_by('id').values_list('id', 'latitude', 'longitude', 'distance_estimee')
+        )
+        lat_depot, lon_depot = DistanceService.depot()
+
+        ids = [None] + [ligne[0] for ligne in lignes]
+        latitudes = np.array([lat_depot] + [ligne[1] for ligne in lignes], dtype=np.float64)
+        longitudes = np.array([lon_depot] + [ligne[2] for ligne in lignes], dtype=np.float64)
+        distances_depot = np.array([0] + [ligne[3] or 0 for ligne in lignes], dtype=np.float64)
+
+        return ids, latitudes, longitudes, distances_depot
+
+    @staticmethod
+    def _ligne(lat, lon, distance_depot, latitudes, longitudes):
+        """
+        Distances routières (km) d'un point vers tous les points donnés (dépôt en position 0)
+        """
+        ligne = DistanceService.haversine(lat, lon, latitudes, longitudes) * DistanceService.facteur_route()
+        if distance_depot:
+            ligne[0] = distance_depot
+        return ligne
+
+    # ==================== FICHIERS ====================
+
+    @staticmethod
+    def _chemin(nom):
+        return DistanceService.dossier() / nom
+
+    @staticmethod
+    def _ouvrir(mode='r'):
+        """
+        (Ré)ouvre les memmaps si index.json a changé depuis la dernière lecture
+        (un autre processus a pu ajouter une destination)
+        """
+        etat = DistanceService._etat
+        chemin_index = DistanceService._chemin('index.json')
+
+        try:
+            mtime = os.stat(chemin_index).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        if etat['mtime'] == mtime and etat['distances'] is not None and (mode == 'r' or etat['distances'].mode == 'r+'):
+            return etat
+
+        with open(chemin_index, encoding='utf-8') as fichier:
+            index = json.load(fichier)
+
+        capacite = index['capacite']
+        forme = (capacite, capacite)
+        etat.update({
+            'mtime': mtime,
+            'capacite': capacite,
+            'index': {identifiant: rang for rang, identifiant in enumerate(index['ids'])},
+            'distances': np.memmap(DistanceService._chemin('distances.f32'), dtype=np.float32, mode=mode, shape=forme),
+            'durees': np.memmap(DistanceService._chemin('durees.f32'), dtype=np.float32, mode=mode, shape=forme),
+        })
+        return etat
+
+    @staticmethod
+    def _ecrire_index(ids, capacite):
+        """Écriture atomique de index.json (fichier temporaire puis remplacement)"""
+        chemin = DistanceService._chemin('index.json')
+        temporaire = chemin.with_suffix('.tmp')
+        with open(temporaire, 'w', encoding='utf-8') as fichier:
+            json.dump({'capacite': capacite, 'ids': ids}, fichier)
+        os.replace(temporaire, chemin)
+
+    # ==================== CONSTRUCTION ====================
+
+    @staticmethod
+    def reconstruire():
+        """
+        Recalcule toute la matrice (N² distances en une opération vectorisée)
+        La capacité est doublée pour absorber les prochains ajouts sans reconstruction
+
+        Returns:
+            int: nombre de destinations dans la matrice
+        """
+        with DistanceService._verrou:
+            ids, latitudes, longitudes, distances_depot = DistanceService._points()
+            taille = len(ids)
+            capacite = max(64, 2 * taille)
+
+            distances = DistanceService.haversine(
+                latitudes[:, None], longitudes[:, None], latitudes[None, :], longitudes[None, :]
+            ) * DistanceService.facteur_route()
+
+            # Dépôt ↔ destination : distance routière saisie quand elle existe
+            connues = distances_depot > 0
+            distances[0, connues] = distances_depot[connues]
+            distances[connues, 0] = distances_depot[connues]
+
+            dossier = DistanceService.dossier()
+            dossier.mkdir(parents=True, exist_ok=True)
+
+            for nom, valeurs in (('distances.f32', distances), ('durees.f32', distances / DistanceService.vitesse_moyenne())):
+                matrice = np.full((capacite, capacite), np.nan, dtype=np.float32)
+                matrice[:taille, :taille] = valeurs
+                temporaire = DistanceService._chemin(nom + '.tmp')
+                matrice.tofile(temporaire)
+                os.replace(temporaire, DistanceService._chemin(nom))
+
+            DistanceService._ecrire_index(ids, capacite)
+            DistanceService._etat['mtime'] = None
+
+            return taille - 1
+
+    @staticmethod
+    def ajouter_destination(destination):
+        """
+        Ajoute (ou met à jour) UNE destination : seules sa ligne et sa colonne sont calculées
+        Appelé par le signal post_save de Destination
+        """
+        if destination.latitude is None or destination.longitude is None:
+            return
+
+        with DistanceService._verrou:
+            etat = DistanceService._ouvrir(mode='r+')
+            if etat is None:
+                DistanceService.reconstruire()
+                return
+
+            index = etat['index']
+            rang = index.get(destination.id)
+            taille = len(index)
+
+            if rang is None:
+                if taille >= etat['capacite']:
+                    # Plus de place → reconstruction avec une capacité doublée
+                    DistanceService.reconstruire()
+                    return
+                rang = taille
+
+            ids = [None] * taille
+            for identifiant, position in index.items():
+                ids[position] = identifiant
+            if rang == taille:
+                ids.append(destination.id)
+
+            lat_depot, lon_depot = DistanceService.depot()
+            latitudes, longitudes = [lat_depot], [lon_depot]
+            from app1.models import Destination
+            coordonnees = dict(
+                (ligne[0], (ligne[1], ligne[2])) for ligne in
+                Destination.objects.filter(id__in=[i for i in ids if i is not None])
+                .values_list('id', 'latitude', 'longitude')
+            )
+            for identifiant in ids[1:]:
+                lat, lon = coordonnees.get(identifiant, (None, None))
+                latitudes.append(np.nan if lat is None else lat)
+                longitudes.append(np.nan if lon is None else lon)
+
+            ligne = DistanceService._ligne(
+                destination.latitude, destination.longitude, destination.distance_estimee,
+                np.array(latitudes), np.array(longitudes)
+            )
+            ligne[rang] = 0.0
+
+            n = len(ids)
+            for matrice, valeurs in ((etat['distances'], ligne), (etat['durees'], ligne / DistanceService.vitesse_moyenne())):
+                matrice[rang, :n] = valeurs
+                matrice[:n, rang] = valeurs
+                matrice.flush()
+
+            DistanceService._ecrire_index(ids, etat['capacite'])
+            DistanceService._etat['mtime'] = None
+
+    # ==================== LECTURE O(1) ====================
+
+    @staticmethod
+    def _lire(nom_matrice, a, b):
+        with DistanceService._verrou:
+            etat = DistanceService._ouvrir()
+            if etat is None:
+                return None
+            rang_a = etat['index'].get(a)
+            rang_b = etat['index'].get(b)
+            if rang_a is None or rang_b is None:
+                return None
+            valeur = float(etat[nom_matrice][rang_a, rang_b])
+        return None if math.isnan(valeur) else valeur
+
+    @staticmethod
+    def distance(a, b):
+        """Km routiers estimés entre deux destinations (None = dépôt), None si inconnue"""
+        return DistanceService._lire('distances', a, b)
+
+    @staticmethod
+    def duree(a, b):
+        """Heures de route estimées entre deux destinations (None = dépôt), None si inconnue"""
+        return DistanceService._lire('durees', a, b)
+
+    @staticmethod
+    def jours_route(destination):
+        """
+        Nombre de jours de route depuis le dépôt (HEURES_CONDUITE_PAR_JOUR par jour)
+        None si la destination n'est pas dans la matrice
+        """
+        heures = DistanceService.duree(None, destination.id)
+        if heures is None:
+            return None
+        heures_par_jour = getattr(settings, 'HEURES_CONDUITE_PAR_JOUR', 8)
+        return max(1, math.ceil(heures / heures_par_jour))
+
+    @staticmethod
+    def sous_matrice(destination_ids, nom_matrice='distances'):
+        """
+        Matrice (k+1)×(k+1) float32 : dépôt en 0 puis les destinations dans l'ordre donné
+        Les destinations absentes de la matrice sont estimées depuis leur distance_estimee
+
+        Returns:
+            numpy.ndarray
+        """
+        from app1.models import Destination
+
+        with DistanceService._verrou:
+            etat = DistanceService._ouvrir()
+            if etat is not None:
+                rangs = [etat['index'].get(i) for i in [None] + list(destination_ids)]
+                if all(rang is not None for rang in rangs):
+                    return np.array(etat[nom_matrice][np.ix_(rangs, rangs)], dtype=np.float32)
+
+        # Repli : distance via le dépôt (inégalité triangulaire, majorant)
+        distances_depot = dict(
+            Destination.objects.filter(id__in=destination_ids).values_list('id', 'distance_estimee')
+        )
+        depot = np.array([0.0] + [float(distances_depot.get(i) or 0) for i in destination_ids], dtype=np.float32)
+        matrice = depot[:, None] + depot[None, :]
+        np.fill_diagonal(matrice, 0.0)
+        if nom_matrice == 'durees':
+            matrice = matrice / DistanceService.vitesse_moyenne()
+        return matrice.astype(np.float32)
@@ -0,0 +1,839 @@
+"""
+donnees_service.py - Jeu de données synthétique cohérent (bancs d'essai, tests de charge)
+
+UTILISATION :
+Produire un million d'expéditions par Expedition.save() (tarif, affectation,
+facturation, suivi, emails) prendrait des jours. Ici chaque colonne est tirée
+d'un coup par NumPy, puis écrite par lots :
+- Référentiel (types de service, une destination par wilaya + tarifications)
+- Volume : clients, chauffeurs, véhicules, tournées (+ réservations),
+  expéditions, suivis, factures, paiements, grand livre des soldes, incidents
+
+Les signaux sont suspendus pendant la génération (signaux_suspendus) : ce
+qu'ils auraient fait est écrit directement (tarifications) ou recalculé une
+seule fois (matrice des distances, soldes).
+
+Les lignes partent en INSERT ... executemany() avec des valeurs déjà au format
+de la base et des identifiants attribués d'avance. bulk_create prépare chaque
+champ de chaque objet en Python (~10 000 lignes/s) : trop lent pour le palier
+d'un million d'expéditions (ici > 50 000 lignes/s sur SQLite).
+
+Les données respectent les règles de l'application : montants issus des
+tarifications (calculés en centimes, arrondis comme Decimal.quantize),
+statuts cohérents avec la tournée, une tournée par équipe et par jour,
+numéros de facture / paiement / incident réservés dans SequenceDocument,
+Client.solde = somme de ses MouvementSolde (commandes verifier_soldes et
+verifier_factures).
+
+Le jeu est reproductible (même graine → mêmes données) et peut être
+complété : generer(10000) puis generer(90000) → 100 000 expéditions.
+
+EXEMPLES :
+- DonneesService.referentiel()
+- DonneesService.generer(10000, graine=42) → {'expeditions': 10000, 'factures': ..., ...}
+- with signaux_suspendus(): ...  → aucun receiver appelé pendant le bloc
+"""
+
+import itertools
+import math
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, time, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import DecimalField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.utils import timezone
+
+PRENOMS = [
+    'Amine', 'Yacine', 'Karim', 'Sofiane', 'Mehdi', 'Rachid', 'Nassim', 'Walid', 'Bilal', 'Hamza',
+    'Samir', 'Fares', 'Nadia', 'Amina', 'Sarah', 'Lina', 'Meriem', 'Yasmine', 'Imane', 'Khadidja',
+    'Soumia', 'Houda', 'Lamia', 'Nesrine', 'Rym', 'Sabrina', 'Djamel', 'Mourad', 'Lotfi', 'Redouane',
+]
+NOMS = [
+    'Benali', 'Bouzid', 'Mansouri', 'Haddad', 'Khelifi', 'Saidi', 'Belkacem', 'Meziane', 'Cherif', 'Amrani',
+    'Boudiaf', 'Zerrouki', 'Hamidi', 'Ouali', 'Rahmani', 'Slimani', 'Brahimi', 'Tebboune', 'Lounes', 'Guerfi',
+    'Kaci', 'Djebbar', 'Ferhat', 'Benyahia', 'Abbas', 'Mebarki', 'Touati', 'Bensaid', 'Yahiaoui', 'Larbi',
+]
+RUES = ['rue Didouche Mourad', 'boulevard Zighoud Youcef', 'rue Larbi Ben M\'hidi', 'cité 500 logements',
+        'avenue de l\'ALN', 'rue Hassiba Ben Bouali', 'lotissement El Nour', 'cité des Martyrs']
+MARQUES = [('Renault', 'Master', 'FOURGON'), ('Peugeot', 'Boxer', 'FOURGON'), ('Hyundai', 'HD35', 'CAMIONNETTE'),
+           ('Isuzu', 'NPR', 'CAMION'), ('Mercedes', 'Sprinter', 'FOURGON'), ('Toyota', 'Hilux', 'CAMIONNETTE')]
+
+# Types d'incident et part dans les incidents générés
+TYPES_INCIDENT = [('RETARD', 40), ('DESTINATAIRE_ABSENT', 20), ('ADRESSE_INCORRECTE', 10), ('ENDOMMAGEMENT', 10),
+                  ('REFUS_DESTINATAIRE', 8), ('PERTE', 4), ('PROBLEME_TECHNIQUE', 4), ('AUTRE', 4)]
+
+MICROSECONDES = {'seconde': 10 ** 6, 'minute': 60 * 10 ** 6, 'heure': 3600 * 10 ** 6, 'jour': 86400 * 10 ** 6}
+
+
+@contextmanager
+def signaux_suspendus(*signaux):
+    """
+    Aucun receiver appelé le temps du bloc (défaut : pre/post_save, pre/post_delete,
+    m2m_changed). Global au processus : réservé aux commandes, jamais dans une vue
+    """
+    signaux = signaux or (pre_save, post_save, pre_delete, post_delete, m2m_changed)
+    sauvegarde = [(signal, signal.receivers) for signal in signaux]
+    for signal in signaux:
+        signal.receivers = []
+        signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        for signal, receivers in sauvegarde:
+            signal.receivers = receivers
+            signal.sender_receivers_cache.clear()
+
+
+def duree(valeurs, unite):
+    """Tableau (entiers ou réels) d'heures, de jours... → timedelta64[us]"""
+    return (np.asarray(valeurs) * MICROSECONDES[unite]).astype(np.int64).astype('timedelta64[us]')
+
+
+class DonneesService:
+    """
+    Service de génération de données synthétiques :
+    - Référentiel
+    - Volume par lots, colonne par colonne (NumPy), chronologique
+    - Insertion brute (executemany) et recalcul des soldes
+    """
+
+    EXPEDITIONS_PAR_TOURNEE = 20
+    EXPEDITIONS_PAR_CLIENT = 20
+    TAILLE_LOT = 50000            # Expéditions par lot (une transaction par lot)
+    JOURS_FUTURS = 7              # Tournées PREVUE jusqu'à J+7
+    TAUX_INCIDENT = 0.005
+    TAUX_EXPRESS = 0.1
+    TAUX_ECHEC = 0.03
+    EQUIPES_RESERVE = 0.25        # Équipes sans tournée planifiée (en plus de celles du jour le plus chargé)
+
+    # ==================== RÉFÉRENTIEL ====================
+
+    @staticmethod
+    def referentiel():
+        """
+        Types de service + une destination par wilaya et ses tarifications
+        (celles que le signal crée en production). Idempotent : ne crée que ce qui manque
+
+        Returns:
+            int: nombre de destinations créées
+        """
+        from app1.constants import COORDONNEES_WILAYAS
+        from app1.models import Destination, Tarification, TypeService
+        from .distance_service import DistanceService
+
+        types = {type_service: TypeService.objects.get_or_create(type_service=type_service)[0]
+                 for type_service in ('STANDARD', 'EXPRESS', 'INTERNATIONAL')}
+
+        existantes = set(Destination.objects.values_list('wilaya', flat=True))
+        depot = DistanceService.depot()
+        nouvelles = []
+        for cle, (latitude, longitude) in COORDONNEES_WILAYAS.items():
+            wilaya = cle.capitalize()
+            if wilaya in existantes:
+                continue
+            distance = int(round(float(DistanceService.haversine(depot[0], depot[1], latitude, longitude)) * DistanceService.facteur_route()))
+            nouvelles.append(Destination(
+                ville=wilaya,
+                wilaya=wilaya,
+                zone_geographique='LOCALE' if distance < 50 else 'NATIONALE',
+                zone_logistique=DonneesService.zone_logistique(latitude, longitude),
+                distance_estimee=max(distance, 5),
+                latitude=latitude,
+                longitude=longitude,
+                tarif_base=300 + 2 * distance,
+                delai_livraison_estime=1 + distance // 400,
+            ))
+
+        if nouvelles:
+            with transaction.atomic():
+                Destination.objects.bulk_create(nouvelles)
+                Tarification.objects.bulk_create([
+                    Tarification(destination=destination, type_service=types[type_service], tarif_poids=10, tarif_volume=20)
+                    for destination in nouvelles
+                    for type_service in ('STANDARD', 'EXPRESS')
+                ])
+            DistanceService.reconstruire()
+        return len(nouvelles)
+
+    @staticmethod
+    def zone_logistique(latitude, longitude):
+        if latitude < 32.5:
+            return 'SUD'
+        if longitude > 5.0:
+            return 'EST'
+        if longitude < 1.8:
+            return 'OUEST'
+        return 'CENTRE'
+
+    # ==================== VOLUME ====================
+
+    @staticmethod
+    def generer(nb_expeditions, jours=365, graine=42, progression=None, taille_lot=None):
+        """
+        Ajoute `nb_expeditions` expéditions (et tout ce qui les accompagne)
+        réparties sur les `jours` derniers jours et les JOURS_FUTURS prochains
+
+        Args:
+            progression: fonction(nb_expeditions_ecrites) appelée après chaque lot
+            taille_lot: expéditions par transaction (défaut : TAILLE_LOT)
+
+        Returns:
+            dict: nombre de lignes créées par table
+        """
+        from app1.models import Chauffeur, Client, Expedition, Facture, Tournee, Vehicule
+
+        with signaux_suspendus():
+            DonneesService.referentiel()
+            hasard = np.random.default_rng([graine, Expedition.objects.count()])
+            contexte = DonneesService.contexte(hasard)
+            compteurs = Counter()
+
+            # Plan des tournées : décalage en jours du départ de chacune (ordre chronologique)
+            nb_tournees = max(1, math.ceil(nb_expeditions / DonneesService.EXPEDITIONS_PAR_TOURNEE))
+            decalages = DonneesService.planifier(nb_tournees, jours, hasard)
+            # Équipe = rang de la tournée dans sa journée → au plus une tournée par équipe et par jour
+            equipes = np.arange(nb_tournees) - np.searchsorted(decalages, decalages)
+
+            with transaction.atomic():
+                contexte['clients'] = DonneesService.creer_clients(
+                    max(10, nb_expeditions // DonneesService.EXPEDITIONS_PAR_CLIENT), contexte
+                )
+                # Équipes de réserve : disponibles pour les EXPRESS et les tournées créées ensuite
+                nb_equipes = int(equipes.max()) + 1
+                contexte['equipes'] = DonneesService.creer_equipes(
+                    nb_equipes + max(2, math.ceil(nb_equipes * DonneesService.EQUIPES_RESERVE)), contexte
+                )
+            compteurs.update(clients=len(contexte['clients']['ids']),
+                             chauffeurs=len(contexte['equipes']['chauffeurs']),
+                             vehicules=len(contexte['equipes']['vehicules']))
+
+            # Répartition des expéditions entre tournées, lots de tournées consécutives
+            base, reste = divmod(nb_expeditions, nb_tournees)
+            tailles = base + (np.arange(nb_tournees) < reste).astype(np.int64)
+            tournees_par_lot = max(1, (taille_lot or DonneesService.TAILLE_LOT) // DonneesService.EXPEDITIONS_PAR_TOURNEE)
+
+            ecrites = 0
+            for debut in range(0, nb_tournees, tournees_par_lot):
+                lot = slice(debut, debut + tournees_par_lot)
+                with transaction.atomic():
+                    compteurs.update(DonneesService.generer_lot(decalages[lot], equipes[lot], tailles[lot], contexte))
+                ecrites += int(tailles[lot].sum())
+                if progression:
+                    progression(ecrites)
+
+            DonneesService.recalculer_soldes()
+            # Identifiants attribués d'avance : les séquences (PostgreSQL) repartent après
+            DonneesService.reinitialiser_sequences([Client, Chauffeur, Vehicule, Tournee, Expedition, Facture])
+        return dict(compteurs)
+
+    @staticmethod
+    def planifier(nb_tournees, jours, hasard):
+        """
+        Jours de départ des tournées, triés : chaque jour en reçoit autant (à une près),
+        aujourd'hui toujours au moins une (tournées EN_COURS)
+        """
+        calendrier = np.arange(-jours, DonneesService.JOURS_FUTURS + 1)
+        tours, reste = divmod(nb_tournees, len(calendrier))
+        if tours:
+            supplementaires = hasard.choice(calendrier, reste, replace=False)
+        else:
+            supplementaires = np.append(hasard.choice(calendrier[calendrier != 0], reste - 1, replace=False), 0)
+        return np.sort(np.concatenate([np.repeat(calendrier, tours), supplementaires]))
+
+    @staticmethod
+    def contexte(hasard):
+        """Référentiel en tableaux NumPy (tarifs en centimes, délais en jours) + horloge"""
+        from app1.models import Destination, Tarification, TypeService
+
+        maintenant = timezone.now()
+        minuit = timezone.make_aware(datetime.combine(timezone.localdate(maintenant), time()))
+
+        destinations = list(Destination.objects.exclude(zone_geographique='INTERNATIONALE').order_by('id'))
+        rang = {destination.id: i for i, destination in enumerate(destinations)}
+        types = ['STANDARD', 'EXPRESS']
+
+        # Prix = base + poids × tarif_poids + volume × tarif_volume (EXPRESS : base = distance × 25 DA)
+        tarif_base = np.zeros((len(destinations), len(types)), dtype=np.int64)
+        tarif_poids = np.zeros_like(tarif_base)
+        tarif_volume = np.zeros_like(tarif_base)
+        delais = np.zeros_like(tarif_base)
+        tarifs = Tarification.objects.filter(
+            destination__in=destinations, type_service__type_service__in=types
+        ).select_related('destination', 'type_service')
+        for tarif in tarifs:
+            i, j = rang[tarif.destination_id], types.index(tarif.type_service.type_service)
+            base = tarif.destination.distance_estimee * 25 if types[j] == 'EXPRESS' else tarif.destination.tarif_base
+            tarif_base[i, j] = round(base * 100)
+            tarif_poids[i, j] = round(tarif.tarif_poids * 100)
+            tarif_volume[i, j] = round(tarif.tarif_volume * 100)
+            delais[i, j] = tarif.calculer_delai()
+
+        zones = sorted({destination.zone_logistique for destination in destinations})
+        return {
+            'hasard': hasard,
+            'maintenant': DonneesService.instant(maintenant),
+            'minuit': DonneesService.instant(minuit),
+            'types_service': np.array([TypeService.objects.get(type_service=t).pk for t in types]),
+            'destinations': np.array([destination.id for destination in destinations]),
+            'villes': np.array([destination.ville for destination in destinations], dtype=object),
+            'zones': np.array(zones, dtype=object),
+            'destinations_par_zone': [
+                np.array([i for i, destination in enumerate(destinations) if destination.zone_logistique == zone])
+                for zone in zones
+            ],
+            'tarif_base': tarif_base,
+            'tarif_poids': tarif_poids,
+            'tarif_volume': tarif_volume,
+            'delais': delais,
+            'noms_complets': np.array([f"{prenom} {nom}" for prenom in PRENOMS for nom in NOMS], dtype=object),
+        }
+
+    @staticmethod
+    def creer_clients(nombre, contexte):
+        """Clients + probabilités de tirage (quelques gros clients, beaucoup de petits : loi de Pareto)"""
+        from app1.models import Client
+
+        hasard = contexte['hasard']
+        ids = DonneesService.identifiants(Client, nombre)
+        DonneesService.inserer(Client, {
+            'id': ids,
+            'nom': DonneesService.tirer(NOMS, nombre, hasard),
+            'prenom': DonneesService.tirer(PRENOMS, nombre, hasard),
+            'telephone': [f"+2135{i % 10 ** 8:08d}" for i in ids.tolist()],
+            'email': [f"client{i}@exemple.dz" for i in ids.tolist()],
+            'ville': DonneesService.tirer(NOMS, nombre, hasard),
+            'solde': 0,
+        })
+        poids = hasard.pareto(1.2, nombre) + 1
+        return {'ids': ids, 'probabilites': poids / poids.sum()}
+
+    @staticmethod
+    def creer_equipes(nombre, contexte):
+        """Un chauffeur et un véhicule par équipe"""
+        from app1.models import Chauffeur, Vehicule
+
+        hasard = contexte['hasard']
+        aujourd_hui = contexte['maintenant'].astype('datetime64[D]')
+
+        chauffeurs = DonneesService.identifiants(Chauffeur, nombre)
+        DonneesService.inserer(Chauffeur, {
+            'id': chauffeurs,
+            'nom': DonneesService.tirer(NOMS, nombre, hasard),
+            'prenom': DonneesService.tirer(PRENOMS, nombre, hasard),
+            'telephone': [f"+2136{i % 10 ** 8:08d}" for i in chauffeurs.tolist()],
+            'numero_permis': [f"SYN-{i:07d}" for i in chauffeurs.tolist()],
+            'date_obtention_permis': aujourd_hui - hasard.integers(800, 7000, nombre),
+            'date_expiration_permis': aujourd_hui + hasard.integers(200, 3000, nombre),
+            'date_embauche': aujourd_hui - hasard.integers(400, 4000, nombre),
+            'salaire': hasard.integers(45, 90, nombre) * 1000,
+        })
+
+        vehicules = DonneesService.identifiants(Vehicule, nombre)
+        modeles = hasard.integers(0, len(MARQUES), nombre)
+        marques, noms_modeles, types_vehicule = (np.array(colonne, dtype=object)[modeles] for colonne in zip(*MARQUES))
+        kilometrage = hasard.integers(20000, 250000, nombre, endpoint=True)
+        consommation = hasard.integers(90, 160, nombre, endpoint=True) / 10
+        DonneesService.inserer(Vehicule, {
+            'id': vehicules,
+            'numero_immatriculation': [f"SYN-{i:06d}-16" for i in vehicules.tolist()],
+            'marque': marques,
+            'modele': noms_modeles,
+            'annee': hasard.integers(2012, 2024, nombre, endpoint=True),
+            'type_vehicule': types_vehicule,
+            'capacite_poids': hasard.choice([1500, 3500, 7500], nombre),
+            'capacite_volume': hasard.choice([12, 20, 35], nombre),
+            'consommation_moyenne': consommation,
+            'kilometrage': kilometrage,
+            'date_acquisition': aujourd_hui - hasard.integers(365, 4000, nombre),
+            'date_prochaine_revision': aujourd_hui + hasard.integers(30, 180, nombre),
+        })
+        return {'chauffeurs': chauffeurs, 'vehicules': vehicules, 'kilometrage': kilometrage, 'consommation': consommation}
+
+    @staticmethod
+    def generer_lot(decalages, equipes, tailles, contexte):
+        """
+        Un lot de tournées consécutives (décalage en jours, équipe, nb d'expéditions)
+
+        Returns:
+            Counter: lignes créées par table
+        """
+        from app1.models import Chauffeur, Vehicule
+
+        tournees = DonneesService.lot_tournees(decalages, equipes, contexte)
+
+        # Tournées du jour : équipes sur la route
+        en_cours = tournees['statut'] == 'EN_COURS'
+        if en_cours.any():
+            Chauffeur.objects.filter(pk__in=tournees['chauffeur_id'][en_cours].tolist()).update(statut_disponibilite='EN_TOURNEE')
+            Vehicule.objects.filter(pk__in=tournees['vehicule_id'][en_cours].tolist()).update(statut='EN_TOURNEE')
+
+        expeditions = DonneesService.lot_expeditions(tournees, tailles, contexte)
+        factures = DonneesService.lot_factures(expeditions, contexte)
+
+        return Counter(
+            tournees=len(tournees['id']),
+            reservations=DonneesService.lot_reservations(tournees),
+            expeditions=len(expeditions['id']),
+            suivis=DonneesService.lot_suivis(expeditions, tournees, contexte),
+            factures=len(factures['id']),
+            factures_expeditions=len(expeditions['id']),
+            **DonneesService.lot_paiements(factures, contexte),
+            incidents=DonneesService.lot_incidents(expeditions, tournees, contexte),
+        )
+
+    @staticmethod
+    def lot_tournees(decalages, equipes, contexte):
+        from app1.models import Tournee
+
+        hasard = contexte['hasard']
+        equipe = contexte['equipes']
+        nombre = len(decalages)
+
+        depart = contexte['minuit'] + duree(decalages, 'jour') + duree(hasard.uniform(6.5, 9.0, nombre), 'heure')
+        retour = depart + duree(hasard.uniform(7, 12, nombre), 'heure')
+        statut = np.where(decalages < 0, 'TERMINEE', np.where(decalages == 0, 'EN_COURS', 'PREVUE'))
+        terminee = statut == 'TERMINEE'
+        kilometrage = equipe['kilometrage'][equipes]
+        parcouru = hasard.integers(60, 900, nombre, endpoint=True)
+
+        tournees = {
+            'id': DonneesService.identifiants(Tournee, nombre),
+            'chauffeur_id': equipe['chauffeurs'][equipes],
+            'vehicule_id': equipe['vehicules'][equipes],
+            'date_depart': depart,
+            'date_retour_prevue': depart + duree(10, 'heure'),
+            'zone_cible': hasard.integers(0, len(contexte['zones']), nombre),
+            'statut': statut,
+        }
+        DonneesService.inserer(Tournee, {
+            **tournees,
+            'date_retour_reelle': DonneesService.si(terminee, retour),
+            'zone_cible': contexte['zones'][tournees['zone_cible']],
+            'kilometrage_depart': kilometrage,
+            'kilometrage_arrivee': DonneesService.si(terminee, kilometrage + parcouru),
+            'kilometrage_parcouru': DonneesService.si(terminee, parcouru),
+            'kilometrage_estime': DonneesService.si(terminee, np.rint(parcouru * hasard.uniform(0.85, 1.0, nombre))),
+            'consommation_carburant': DonneesService.si(terminee, np.round(parcouru * equipe['consommation'][equipes] / 100, 2)),
+            'date_creation': depart - duree(2, 'jour'),
+        })
+        return {**tournees, 'date_retour_reelle': retour, 'terminee': terminee}
+
+    @staticmethod
+    def lot_reservations(tournees):
+        from app1.models import ReservationRessource
+
+        nombre = len(tournees['id'])
+        fin = np.where(tournees['terminee'], tournees['date_retour_reelle'], tournees['date_retour_prevue'])
+        aucun = np.full(nombre, None)
+        return DonneesService.inserer(ReservationRessource, {
+            'chauffeur_id': np.concatenate([tournees['chauffeur_id'], aucun]),
+            'vehicule_id': np.concatenate([aucun, tournees['vehicule_id']]),
+            'tournee_id': np.tile(tournees['id'], 2),
+            'motif': 'TOURNEE',
+            'debut': np.tile(tournees['date_depart'], 2),
+            'fin': np.tile(fin, 2),
+        })
+
+    @staticmethod
+    def lot_expeditions(tournees, tailles, contexte):
+        from app1.models import Expedition
+
+        hasard = contexte['hasard']
+        tournee = np.repeat(np.arange(len(tailles)), tailles)
+        nombre = len(tournee)
+        ordre = np.arange(nombre) - np.repeat(np.cumsum(tailles) - tailles, tailles) + 1
+
+        # Destination tirée dans la zone de la tournée
+        zone = tournees['zone_cible'][tournee]
+        destination = np.empty(nombre, dtype=np.int64)
+        for indice, candidates in enumerate(contexte['destinations_par_zone']):
+            dans_zone = zone == indice
+            destination[dans_zone] = hasard.choice(candidates, int(dans_zone.sum()))
+        type_service = (hasard.random(nombre) < DonneesService.TAUX_EXPRESS).astype(np.int64)
+
+        # Montant en centimes : poids et volume au centième, tarifs au centime → 1/10 000 DA, arrondi au centime
+        poids = hasard.integers(5, 3000, nombre, endpoint=True)
+        volume = hasard.integers(1, 200, nombre, endpoint=True)
+        montant = np.rint((
+            contexte['tarif_base'][destination, type_service] * 100
+            + poids * contexte['tarif_poids'][destination, type_service]
+            + volume * contexte['tarif_volume'][destination, type_service]
+        ) / 100).astype(np.int64)
+
+        depart = tournees['date_depart'][tournee]
+        creation = np.minimum(depart - duree(hasard.uniform(2, 72, nombre), 'heure'), contexte['maintenant'])
+        terminee = tournees['terminee'][tournee]
+        echec = hasard.random(nombre) < DonneesService.TAUX_ECHEC
+        statut = np.select(
+            [terminee & ~echec, terminee & echec, tournees['statut'][tournee] == 'EN_COURS'],
+            ['LIVRE', 'ECHEC', 'EN_TRANSIT'],
+            'EN_ATTENTE',
+        )
+
+        villes = contexte['villes'][destination].tolist()
+        expeditions = {
+            'id': DonneesService.identifiants(Expedition, nombre),
+            'client_id': hasard.choice(contexte['clients']['ids'], nombre, p=contexte['clients']['probabilites']),
+            'nom_destinataire': contexte['noms_complets'][hasard.integers(0, len(contexte['noms_complets']), nombre)],
+            'statut': statut,
+            'date_creation': creation,
+        }
+        DonneesService.inserer(Expedition, {
+            **expeditions,
+            'destination_id': contexte['destinations'][destination],
+            'type_service_id': contexte['types_service'][type_service],
+            'tournee_id': tournees['id'][tournee],
+            'telephone_destinataire': [f"+2137{n:08d}" for n in hasard.integers(0, 10 ** 8, nombre).tolist()],
+            'email_destinataire': [f"destinataire{n}@exemple.dz" for n in hasard.integers(0, 10 ** 6, nombre).tolist()],
+            'adresse_destinataire': [
+                f"{numero} {rue}, {ville}" for numero, rue, ville in
+                zip(hasard.integers(1, 250, nombre, endpoint=True).tolist(), DonneesService.tirer(RUES, nombre, hasard).tolist(), villes)
+            ],
+            'poids': poids / 100,
+            'volume': volume / 100,
+            'montant_total': montant / 100,
+            'date_livraison_prevue': depart.astype('datetime64[D]') + contexte['delais'][destination, type_service],
+            'date_livraison_reelle': DonneesService.si(statut == 'LIVRE', tournees['date_retour_reelle'][tournee].astype('datetime64[D]')),
+            'ordre_livraison': ordre,
+        })
+        return {**expeditions, 'tournee': tournee, 'destination': destination, 'montant': montant}
+
+    @staticmethod
+    def lot_suivis(expeditions, tournees, contexte):
+        """COLIS_CREE et EN_ATTENTE pour toutes, EN_TRANSIT si la tournée est partie, LIVRE / ECHEC si terminée"""
+        from app1.models import TrackingExpedition
+
+        hasard = contexte['hasard']
+        tournee = expeditions['tournee']
+        nombre = len(tournee)
+        partie = expeditions['statut'] != 'EN_ATTENTE'
+        finie = np.isin(expeditions['statut'], ['LIVRE', 'ECHEC'])
+
+        affectations = np.array([
+            f"Affecté à la tournée #{tournee_id}. Départ prévu: {jour[8:10]}/{jour[5:7]}/{jour[:4]}"
+            for tournee_id, jour in zip(tournees['id'].tolist(),
+                                        np.datetime_as_string(tournees['date_depart'], unit='D').tolist())
+        ], dtype=object)
+        transits = np.array([f"Colis en transit vers {ville}" for ville in contexte['villes']], dtype=object)
+        resultats = np.array([
+            f"Colis livré à {nom}" if statut == 'LIVRE' else "Échec de livraison"
+            for nom, statut in zip(expeditions['nom_destinataire'][finie].tolist(), expeditions['statut'][finie].tolist())
+        ], dtype=object)
+
+        colonnes = {
+            'expedition_id': [expeditions['id'], expeditions['id'], expeditions['id'][partie], expeditions['id'][finie]],
+            'statut_etape': [np.full(nombre, 'COLIS_CREE'), np.full(nombre, 'EN_ATTENTE'),
+                             np.full(int(partie.sum()), 'EN_TRANSIT'), expeditions['statut'][finie]],
+            'date_heure': [
+                expeditions['date_creation'],
+                expeditions['date_creation'] + duree(1, 'seconde'),
+                tournees['date_depart'][tournee[partie]],
+                tournees['date_retour_reelle'][tournee[finie]] - duree(hasard.integers(10, 300, int(finie.sum()), endpoint=True), 'minute'),
+            ],
+            'commentaire': [np.full(nombre, "Colis enregistré dans le système", dtype=object), affectations[tournee],
+                            transits[expeditions['destination'][partie]], resultats],
+        }
+        colonnes = {nom: np.concatenate(morceaux) for nom, morceaux in colonnes.items()}
+
+        # Étapes d'une même expédition consécutives, dans l'ordre chronologique (comme en production)
+        ordre = np.lexsort((colonnes['date_heure'], colonnes['expedition_id']))
+        return DonneesService.inserer(TrackingExpedition, {nom: valeurs[ordre] for nom, valeurs in colonnes.items()})
+
+    @staticmethod
+    def lot_factures(expeditions, contexte):
+        """Une facture par client et par jour de création (+ table de liaison facture ↔ expéditions)"""
+        from app1.models import Facture
+
+        hasard = contexte['hasard']
+        jour = expeditions['date_creation'].astype('datetime64[D]')
+        cles, groupe = np.unique(expeditions['client_id'] * 100000 + jour.astype(np.int64), return_inverse=True)
+        nombre = len(cles)
+        client_id = cles // 100000
+        jour_facture = (cles % 100000).astype('datetime64[D]')
+
+        # Cumuls par facture : expéditions triées par groupe, réduction par tranche
+        tri = np.argsort(groupe, kind='stable')
+        tranches = np.searchsorted(groupe[tri], np.arange(nombre))
+        creation = np.minimum.reduceat(expeditions['date_creation'][tri], tranches)
+        montant_ht = np.add.reduceat(expeditions['montant'][tri], tranches)
+        montant_tva = np.rint(montant_ht * 19 / 100).astype(np.int64)
+        montant_ttc = montant_ht + montant_tva
+
+        jours = [j.replace('-', '') for j in np.datetime_as_string(jour_facture).tolist()]
+        numeros = DonneesService.numeroter('FACTURE', [(f"CL-{c}", j) for c, j in zip(client_id.tolist(), jours)])
+        numero_facture = np.array([
+            f"F-{j}-CL-{c:03d}-{n:03d}" for j, c, n in zip(jours, client_id.tolist(), numeros)
+        ], dtype=object)
+
+        # Règlement : les anciennes factures sont presque toutes soldées
+        tirage = hasard.random(nombre)
+        ancienne = contexte['maintenant'] - creation >= duree(61, 'jour')
+        payee = tirage < np.where(ancienne, 0.90, 0.40)
+        partielle = ~payee & (tirage < np.where(ancienne, 0.95, 0.50))
+        montant_paye = np.select(
+            [payee, partielle],
+            [montant_ttc, np.rint(montant_ttc * hasard.integers(20, 80, nombre, endpoint=True) / 100).astype(np.int64)],
+            0,
+        )
+        statut = np.select([payee, partielle, ancienne], ['PAYEE', 'PARTIELLEMENT_PAYEE', 'EN_RETARD'], 'IMPAYEE')
+
+        factures = {
+            'id': DonneesService.identifiants(Facture, nombre),
+            'client_id': client_id,
+            'numero_facture': numero_facture,
+            'date_creation': creation,
+        }
+        DonneesService.inserer(Facture, {
+            **factures,
+            'montant_ht': montant_ht / 100,
+            'montant_tva': montant_tva / 100,
+            'montant_ttc': montant_ttc / 100,
+            'montant_paye_cumule': montant_paye / 100,
+            'nb_expeditions': np.bincount(groupe, minlength=nombre),
+            'date_echeance': jour_facture + 60,
+            'statut': statut,
+        })
+        DonneesService.inserer(Facture.expeditions.through, {
+            'facture_id': factures['id'][groupe],
+            'expedition_id': expeditions['id'],
+        })
+        return {**factures, 'montant_ttc': montant_ttc, 'montant_paye': montant_paye,
+                'nb_expeditions': np.bincount(groupe, minlength=nombre)}
+
+    @staticmethod
+    def lot_paiements(factures, contexte):
+        """Un paiement par facture réglée + grand livre (facturation, paiements)"""
+        from app1.models import MouvementSolde, Paiement
+
+        hasard = contexte['hasard']
+        reglee = factures['montant_paye'] > 0
+        nombre = int(reglee.sum())
+        modes = Paiement._meta.get_field('mode_paiement').choices
+        mode = hasard.integers(0, len(modes), nombre)
+        date_paiement = np.minimum(
+            factures['date_creation'][reglee] + duree(hasard.integers(0, 45, nombre, endpoint=True), 'jour'),
+            contexte['maintenant'],
+        )
+        numeros = factures['numero_facture'][reglee]
+
+        DonneesService.inserer(Paiement, {
+            'facture_id': factures['id'][reglee],
+            'client_id': factures['client_id'][reglee],
+            'numero_paiement': np.array([f"P-{numero}-01" for numero in numeros.tolist()], dtype=object),
+            'montant_paye': factures['montant_paye'][reglee] / 100,
+            'date_paiement': date_paiement,
+            'mode_paiement': np.array([code for code, _ in modes], dtype=object)[mode],
+        })
+        DonneesService.reserver_sequences('PAIEMENT', [(numero, '') for numero in numeros.tolist()])
+
+        facturation = np.array([f"{nb} expédition(s)" for nb in factures['nb_expeditions'].tolist()], dtype=object)
+        reglements = np.array([f"Paiement {libelle}" for _, libelle in modes], dtype=object)[mode]
+        mouvements = DonneesService.inserer(MouvementSolde, {
+            'client_id': np.concatenate([factures['client_id'], factures['client_id'][reglee]]),
+            'montant': np.concatenate([factures['montant_ttc'], -factures['montant_paye'][reglee]]) / 100,
+            'type_mouvement': np.concatenate([np.full(len(factures['id']), 'FACTURATION'), np.full(nombre, 'PAIEMENT')]),
+            'reference': np.concatenate([factures['numero_facture'], numeros]),
+            'description': np.concatenate([facturation, reglements]),
+            'date_mouvement': np.concatenate([factures['date_creation'], date_paiement]),
+        })
+        return {'paiements': nombre, 'mouvements_solde': mouvements}
+
+    @staticmethod
+    def lot_incidents(expeditions, tournees, contexte):
+        """Incidents sur une petite part des expéditions parties en tournée"""
+        from app1.models import Incident
+
+        hasard = contexte['hasard']
+        parties = np.flatnonzero(expeditions['statut'] != 'EN_ATTENTE')
+        concernees = parties[hasard.random(len(parties)) < DonneesService.TAUX_INCIDENT]
+        nombre = len(concernees)
+        if not nombre:
+            return 0
+
+        tournee = expeditions['tournee'][concernees]
+        date_incident = np.minimum(
+            tournees['date_depart'][tournee] + duree(hasard.uniform(1, 9, nombre), 'heure'),
+            contexte['maintenant'],
+        )
+        jours = [j.replace('-', '') for j in np.datetime_as_string(date_incident, unit='D').tolist()]
+        numeros = DonneesService.numeroter('INCIDENT', [('', j) for j in jours])
+
+        types, parts = zip(*TYPES_INCIDENT)
+        type_incident = hasard.choice(np.array(types, dtype=object), nombre, p=np.array(parts) / sum(parts))
+        libelles = dict(Incident._meta.get_field('type_incident').choices)
+        villes = contexte['villes'][expeditions['destination'][concernees]]
+        recent = contexte['maintenant'] - date_incident < duree(31, 'jour')
+        statut = np.where(
+            recent,
+            hasard.choice(['SIGNALE', 'EN_COURS'], nombre),
+            hasard.choice(['RESOLU', 'CLOS'], nombre),
+        )
+
+        return DonneesService.inserer(Incident, {
+            'expedition_id': expeditions['id'][concernees],
+            'tournee_id': tournees['id'][tournee],
+            'numero_incident': [f"INC-{j}-{n:05d}" for j, n in zip(jours, numeros)],
+            'type_incident': type_incident,
+            'severite': hasard.choice(['FAIBLE', 'MOYENNE', 'MOYENNE', 'ELEVEE'], nombre),
+            'titre': [f"{libelles[t]} - {ville}" for t, ville in zip(type_incident.tolist(), villes.tolist())],
+            'description': "Incident généré (jeu de données synthétique)",
+            'date_heure_incident': date_incident,
+            'statut': statut,
+            'date_resolution': DonneesService.si(~recent, date_incident + duree(2, 'jour')),
+            'date_creation': date_incident,
+        })
+
+    # ==================== INSERTION ====================
+
+    @staticmethod
+    def inserer(modele, colonnes):
+        """
+        INSERT ... executemany() de colonnes (tableaux NumPy, listes ou valeurs uniques)
+        Les champs absents prennent leur valeur par défaut (auto_now / auto_now_add : maintenant),
+        la clé primaire est attribuée par la base si elle n'est pas fournie
+
+        Returns:
+            int: nombre de lignes insérées
+        """
+        champs = {champ.attname: champ for champ in modele._meta.concrete_fields}
+        nombre = next(len(valeurs) for valeurs in colonnes.values() if isinstance(valeurs, (list, np.ndarray)))
+        if not nombre:
+            return 0
+
+        maintenant = timezone.now()
+        valeurs = {}
+        for nom, champ in champs.items():
+            if nom in colonnes:
+                valeur = colonnes[nom]
+            elif champ.primary_key:
+                continue
+            elif getattr(champ, 'auto_now', False) or getattr(champ, 'auto_now_add', False):
+                valeur = maintenant
+            elif champ.has_default() or champ.null:
+                valeur = champ.get_default()
+            else:
+                raise ValueError(f"{modele.__name__}.{nom} : valeur requise")
+
+            if isinstance(valeur, np.ndarray):
+                valeurs[champ.column] = DonneesService.convertir(champ, valeur)
+            elif isinstance(valeur, list):
+                valeurs[champ.column] = valeur
+            else:
+                valeurs[champ.column] = itertools.repeat(champ.get_db_prep_save(valeur, connection), nombre)
+
+        nom_colonnes = ', '.join(connection.ops.quote_name(colonne) for colonne in valeurs)
+        sql = (f"INSERT INTO {connection.ops.quote_name(modele._meta.db_table)} ({nom_colonnes}) "
+               f"VALUES ({', '.join(['%s'] * len(valeurs))})")
+        with connection.cursor() as curseur:
+            curseur.executemany(sql, list(zip(*valeurs.values())))
+        return nombre
+
+    @staticmethod
+    def convertir(champ, valeurs):
+        """Tableau NumPy → liste de valeurs au format de la base (masque → NULL)"""
+        type_champ = champ.get_internal_type()
+        if type_champ == 'DateTimeField':
+            if np.ma.isMaskedArray(valeurs):
+                valeurs = valeurs.filled(np.datetime64('NaT'))
+            # Comme DatabaseOperations.adapt_datetimefield_value : UTC, séparateur espace
+            suffixe = '' if connection.vendor == 'sqlite' else '+00:00'
+            return [None if texte == 'NaT' else texte.replace('T', ' ') + suffixe
+                    for texte in np.datetime_as_string(valeurs.astype('datetime64[us]'), unit='us').tolist()]
+        if type_champ == 'DateField':
+            if np.ma.isMaskedArray(valeurs):
+                valeurs = valeurs.filled(np.datetime64('NaT'))
+            return [None if texte == 'NaT' else texte for texte in np.datetime_as_string(valeurs.astype('datetime64[D]')).tolist()]
+        if type_champ in ('IntegerField', 'PositiveIntegerField', 'PositiveBigIntegerField', 'BigIntegerField') \
+                and valeurs.dtype.kind == 'f':
+            valeurs = valeurs.astype(np.int64)
+        return valeurs.tolist()
+
+    @staticmethod
+    def si(masque, valeurs):
+        """Valeurs là où le masque est vrai, NULL ailleurs"""
+        return np.ma.masked_array(valeurs, mask=~masque)
+
+    @staticmethod
+    def tirer(liste, nombre, hasard):
+        return np.array(liste, dtype=object)[hasard.integers(0, len(liste), nombre)]
+
+    @staticmethod
+    def instant(moment):
+        """datetime (aware) → datetime64[us] UTC"""
+        return np.datetime64(moment.astimezone(dt_timezone.utc).replace(tzinfo=None), 'us')
+
+    @staticmethod
+    def identifiants(modele, nombre):
+        """Identifiants des `nombre` prochaines lignes (à la suite du plus grand)"""
+        debut = (modele.objects.aggregate(dernier=Max('pk'))['dernier'] or 0) + 1
+        return np.arange(debut, debut + nombre, dtype=np.int64)
+
+    @staticmethod
+    def reinitialiser_sequences(modeles):
+        """Après insertion d'identifiants explicites (sans effet sur SQLite, AUTOINCREMENT suit le maximum)"""
+        requetes = connection.ops.sequence_reset_sql(no_style(), modeles)
+        if requetes:
+            with connection.cursor() as curseur:
+                for requete in requetes:
+                    curseur.execute(requete)
+
+    # ==================== NUMÉROTATION ====================
+
+    @staticmethod
+    def numeroter(type_document, cles):
+        """
+        Numéros successifs pour des clés (portée, période), à la suite de SequenceDocument
+        Les séquences sont mises à jour : l'application continue la numérotation après le jeu généré
+
+        Returns:
+            list[int]: un numéro par clé (dans l'ordre des clés)
+        """
+        from app1.models import SequenceDocument
+
+        if not cles:
+            return []
+
+        existants = dict(
+            ((portee, periode), valeur) for portee, periode, valeur in
+            SequenceDocument.objects.filter(
+                type_document=type_document, periode__in={periode for _, periode in cles}
+            ).values_list('portee', 'periode', 'valeur')
+        )
+        numeros = []
+        for cle in cles:
+            existants[cle] = existants.get(cle, 0) + 1
+            numeros.append(existants[cle])
+
+        DonneesService.reserver_sequences(type_document, set(cles), existants)
+        return numeros
+
+    @staticmethod
+    def reserver_sequences(type_document, cles, valeurs=None):
+        """Écrit la valeur courante des séquences (1 par défaut) — INSERT ... ON CONFLICT DO UPDATE"""
+        from app1.models import SequenceDocument
+
+        if not cles:
+            return
+        table = connection.ops.quote_name(SequenceDocument._meta.db_table)
+        with connection.cursor() as curseur:
+            curseur.executemany(
+                f"INSERT INTO {table} (type_document, portee, periode, valeur) VALUES (%s, %s, %s, %s) "
+                f"ON CONFLICT (type_document, portee, periode) DO UPDATE SET valeur = excluded.valeur",
+                [(type_document, portee, periode, (valeurs or {}).get((portee, periode), 1)) for portee, periode in cles],
+            )
+
+    # ==================== SOLDES ====================
+
+    @staticmethod
+    def recalculer_soldes():
+        """Client.solde = somme de ses mouvements (une seule requête UPDATE)"""
+        from app1.models import Client, MouvementSolde
+
+        somme = MouvementSolde.objects.filter(client=OuterRef('pk')).values('client').annotate(total=Sum('montant')).values('total')
+        Client.objects.update(solde=Coalesce(Subquery(somme), Value(Decimal('0.00')), output_field=DecimalField()))
@@ -0,0 +1,285 @@
+"""
+flotte_service.py - Efficacité de la flotte (km, carburant, chargement) et anomalies
+
+UTILISATION :
+Chaque tournée terminée (kilométrage d'arrivée renseigné) ajoute UN point à la
+série de son véhicule (MesureTournee) : km parcourus, litres, taux de
+chargement, et moyennes glissantes sur les FLOTTE_FENETRE dernières tournées
+du véhicule. Le point est calculé à partir des points précédents (une requête) :
+la série n'est jamais recalculée en entier.
+
+ANOMALIES (z-scores vectorisés numpy, "leave-one-out" : chaque point est comparé
+aux AUTRES points de son groupe, sinon une valeur aberrante gonfle elle-même
+l'écart-type qui sert à la détecter) :
+- KM_CIRCUIT   : km parcourus / circuit optimisé très au-dessus du reste de la flotte
+- CONSOMMATION : L/100km relevés anormaux pour CE véhicule (litres estimés ignorés)
+- COMPTEUR     : kilométrage de départ inférieur à l'arrivée de la tournée précédente
+
+RAPPORT :
+Calculé une fois puis servi depuis le cache Django ; chaque nouveau point
+change la "génération" du cache (les rapports précédents ne sont plus lus).
+
+EXEMPLES :
+- FlotteService.enregistrer_tournee(tournee.id) → signal (après commit)
+- FlotteService.rapport(jours=90) → vue efficacite_flotte
+- Commande calculer_efficacite_flotte → reconstruction des séries
+"""
+
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+
+class FlotteService:
+    """
+    Service d'efficacité de la flotte :
+    - Série par véhicule mise à jour à chaque tournée terminée
+    - Détection d'anomalies (z-scores)
+    - Rapport en cache
+    """
+
+    PREFIXE_CACHE = 'flotte'
+    ANOMALIES = {
+        'KM_CIRCUIT': "Km parcourus très au-dessus du circuit optimisé",
+        'CONSOMMATION': "Consommation anormale pour ce véhicule",
+        'COMPTEUR': "Compteur kilométrique en recul",
+    }
+
+    # ==================== SÉRIE PAR VÉHICULE ====================
+
+    @staticmethod
+    def enregistrer_tournee(tournee_id):
+        """
+        Ajoute (ou recalcule) le point d'une tournée terminée
+
+        Returns:
+            MesureTournee ou None si la tournée n'est pas finalisée
+        """
+        from app1.models import MesureTournee, Tournee
+
+        tournee = Tournee.objects.select_related('vehicule').annotate(
+            poids_total=Sum('expeditions__poids')
+        ).filter(
+            pk=tournee_id, statut='TERMINEE', kilometrage_parcouru__isnull=False, consommation_carburant__isnull=False
+        ).first()
+        if tournee is None:
+            return None
+
+        vehicule = tournee.vehicule
+        date_fin = tournee.date_retour_reelle or tournee.date_depart
+        capacite = float(vehicule.capacite_poids or 0)
+        taux_chargement = float(tournee.poids_total or 0) / capacite if capacite else 0.0
+
+        # Fenêtre glissante : ce point + les précédents du même véhicule
+        precedents = list(
+            MesureTournee.objects.filter(vehicule=vehicule, date_fin__lt=date_fin)
+            .exclude(tournee_id=tournee_id)
+            .order_by('-date_fin')
+            .values_list('km_parcouru', 'carburant', 'taux_chargement')[:getattr(settings, 'FLOTTE_FENETRE', 20) - 1]
+        )
+        km = [tournee.kilometrage_parcouru] + [p[0] for p in precedents]
+        litres = [float(tournee.consommation_carburant)] + [float(p[1]) for p in precedents]
+        chargements = [taux_chargement] + [p[2] for p in precedents]
+
+        mesure, _ = MesureTournee.objects.update_or_create(
+            tournee=tournee,
+            defaults={
+                'vehicule': vehicule,
+                'date_fin': date_fin,
+                'kilometrage_depart': tournee.kilometrage_depart,
+                'kilometrage_arrivee': tournee.kilometrage_arrivee,
+                'km_parcouru': tournee.kilometrage_parcouru,
+                'km_estime': tournee.kilometrage_estime,
+                'carburant': tournee.consommation_carburant,
+                'carburant_mesure': tournee.carburant_reel is not None,
+                'taux_chargement': taux_chargement,
+                'km_glissant': sum(km) / len(km),
+                'consommation_glissante': 100 * sum(litres) / sum(km) if sum(km) else 0.0,
+                'chargement_glissant': sum(chargements) / len(chargements),
+            }
+        )
+
+        FlotteService.invalider()
+        return mesure
+
+    # ==================== ANOMALIES ====================
+
+    @staticmethod
+    def zscores(valeurs, groupes, nb_groupes):
+        """
+        z-score de chaque valeur par rapport aux AUTRES valeurs de son groupe
+
+        Args:
+            valeurs: np.array (nan = ignorée)
+            groupes: np.array d'indices de groupe (0..nb_groupes-1)
+
+        Returns:
+            np.array (0 si le groupe a moins de FLOTTE_MIN_POINTS autres valeurs ou aucune dispersion)
+        """
+        valide = np.isfinite(valeurs)
+        x = np.where(valide, valeurs, 0.0)
+
+        n = np.bincount(groupes, weights=valide.astype(float), minlength=nb_groupes)[groupes]
+        somme = np.bincount(groupes, weights=x, minlength=nb_groupes)[groupes]
+        carres = np.bincount(groupes, weights=x * x, minlength=nb_groupes)[groupes]
+
+        # Statistiques du groupe SANS la valeur elle-même
+        autres = n - valide
+        with np.errstate(divide='ignore', invalid='ignore'):
+            moyenne = (somme - x) / autres
+            variance = (carres - x * x) / autres - moyenne * moyenne
+            ecart = np.sqrt(np.maximum(variance, 0.0))
+            z = (x - moyenne) / ecart
+
+        suffisant = valide & (autres >= getattr(settings, 'FLOTTE_MIN_POINTS', 5)) & (ecart > 1e-9)
+        return np.where(suffisant, z, 0.0)
+
+    # ==================== RAPPORT ====================
+
+    @staticmethod
+    def invalider():
+        """Nouvelle génération : les rapports en cache ne sont plus lus"""
+        cle = f"{FlotteService.PREFIXE_CACHE}:generation"
+        cache.add(cle, 0, None)
+        try:
+            cache.incr(cle)
+        except ValueError:
+            cache.set(cle, 1, None)
+
+    @staticmethod
+    def rapport(jours=90):
+        """Rapport d'efficacité des `jours` derniers jours (cache, sinon calcul)"""
+        generation = cache.get_or_set(f"{FlotteService.PREFIXE_CACHE}:generation", 0, None)
+        cle = f"{FlotteService.PREFIXE_CACHE}:rapport:{jours}:{generation}"
+
+        rapport = cache.get(cle)
+        if rapport is None:
+            rapport = FlotteService.calculer_rapport(jours)
+            cache.set(cle, rapport, getattr(settings, 'FLOTTE_RAPPORT_CACHE_SECONDES', 600))
+        return rapport
+
+    @staticmethod
+    def calculer_rapport(jours):
+        """
+        Synthèse par véhicule + liste des anomalies
+
+        Returns:
+            dict: {'jours', 'date_calcul', 'nb_mesures', 'seuil_z', 'vehicules': [...], 'anomalies': [...]}
+        """
+        from app1.models import MesureTournee, Vehicule
+
+        seuil = getattr(settings, 'FLOTTE_SEUIL_Z', 3.0)
+        rapport = {
+            'jours': jours, 'date_calcul': timezone.now(), 'nb_mesures': 0, 'seuil_z': seuil,
+            'vehicules': [], 'anomalies': [],
+        }
+
+        lignes = list(
+            MesureTournee.objects.filter(date_fin__gte=timezone.now() - timedelta(days=jours))
+            .order_by('vehicule_id', 'date_fin', 'id')
+            .values_list(
+                'tournee_id', 'vehicule_id', 'date_fin', 'kilometrage_depart', 'kilometrage_arrivee',
+                'km_parcouru', 'km_estime', 'carburant', 'carburant_mesure', 'taux_chargement',
+                'km_glissant', 'consommation_glissante',
+            )
+        )
+        if not lignes:
+            return rapport
+
+        colonnes = list(zip(*lignes))
+        vehicule_ids = np.array(colonnes[1])
+        depart = np.array(colonnes[3], dtype=float)
+        arrivee = np.array(colonnes[4], dtype=float)
+        km = np.array(colonnes[5], dtype=float)
+        estime = np.array([e if e else np.nan for e in colonnes[6]], dtype=float)
+        litres = np.array(colonnes[7], dtype=float)
+        mesure = np.array(colonnes[8], dtype=bool)
+        chargement = np.array(colonnes[9], dtype=float)
+
+        ids, groupes = np.unique(vehicule_ids, return_inverse=True)
+        toute_la_flotte = np.zeros(len(lignes), dtype=int)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ecart_circuit = km / estime - 1
+            consommation = np.where(mesure & (km > 0), 100 * litres / km, np.nan)
+
+        # 1. Km parcourus / circuit optimisé : comparé au reste de la flotte
+        z_circuit = FlotteService.zscores(ecart_circuit, toute_la_flotte, 1)
+        km_circuit = (z_circuit > seuil) & (ecart_circuit > getattr(settings, 'FLOTTE_ECART_CIRCUIT_MIN', 0.2))
+
+        # 2. L/100km relevés : comparés aux autres tournées du même véhicule
+        z_consommation = FlotteService.zscores(consommation, groupes, len(ids))
+        conso_anormale = np.abs(z_consommation) > seuil
+
+        # 3. Compteur en recul : départ < arrivée précédente du même véhicule (lignes triées)
+        meme_vehicule = np.r_[False, vehicule_ids[1:] == vehicule_ids[:-1]]
+        recul = meme_vehicule & (depart < np.r_[0.0, arrivee[:-1]])
+
+        anomalies = km_circuit | conso_anormale | recul
+
+        # Synthèse par véhicule (bincount) + dernier point de chaque série
+        nb_groupes = len(ids)
+        nb_tournees = np.bincount(groupes, minlength=nb_groupes)
+        km_total = np.bincount(groupes, weights=km, minlength=nb_groupes)
+        litres_total = np.bincount(groupes, weights=litres, minlength=nb_groupes)
+        chargement_total = np.bincount(groupes, weights=chargement, minlength=nb_groupes)
+        nb_anomalies = np.bincount(groupes, weights=anomalies.astype(float), minlength=nb_groupes)
+        derniers = np.flatnonzero(np.r_[vehicule_ids[1:] != vehicule_ids[:-1], True])
+
+        vehicules = {
+            v.pk: v for v in Vehicule.objects.filter(pk__in=ids.tolist()).only(
+                'numero_immatriculation', 'marque', 'modele', 'consommation_moyenne'
+            )
+        }
+
+        for i, vehicule_id in enumerate(ids.tolist()):
+            vehicule = vehicules[vehicule_id]
+            dernier = lignes[derniers[i]]
+            rapport['vehicules'].append({
+                'vehicule_id': vehicule_id,
+                'immatriculation': vehicule.numero_immatriculation,
+                'libelle': f"{vehicule.marque} {vehicule.modele}",
+                'nb_tournees': int(nb_tournees[i]),
+                'km_total': int(km_total[i]),
+                'carburant_total': round(float(litres_total[i]), 1),
+                'consommation': round(float(100 * litres_total[i] / km_total[i]), 2) if km_total[i] else None,
+                'consommation_theorique': float(vehicule.consommation_moyenne),
+                'chargement_moyen': round(float(100 * chargement_total[i] / nb_tournees[i]), 1),
+                'km_glissant': round(dernier[10], 1),
+                'consommation_glissante': round(dernier[11], 2),
+                'nb_anomalies': int(nb_anomalies[i]),
+            })
+        rapport['vehicules'].sort(key=lambda v: (-v['nb_anomalies'], -(v['consommation'] or 0)))
+
+        for i in np.flatnonzero(anomalies).tolist():
+            tournee_id, vehicule_id, date_fin = lignes[i][:3]
+            commun = {
+                'tournee_id': tournee_id,
+                'immatriculation': vehicules[vehicule_id].numero_immatriculation,
+                'date_fin': date_fin,
+            }
+            if km_circuit[i]:
+                rapport['anomalies'].append({
+                    **commun, 'code': 'KM_CIRCUIT', 'z': round(float(z_circuit[i]), 1),
+                    'detail': f"{int(km[i])} km parcourus pour {int(estime[i])} km estimés ({ecart_circuit[i]:+.0%})",
+                })
+            if conso_anormale[i]:
+                rapport['anomalies'].append({
+                    **commun, 'code': 'CONSOMMATION', 'z': round(float(z_consommation[i]), 1),
+                    'detail': f"{consommation[i]:.1f} L/100km (théorique {vehicules[vehicule_id].consommation_moyenne})",
+                })
+            if recul[i]:
+                rapport['anomalies'].append({
+                    **commun, 'code': 'COMPTEUR', 'z': None,
+                    'detail': f"Départ à {int(depart[i])} km après une arrivée à {int(arrivee[i - 1])} km",
+                })
+
+        for anomalie in rapport['anomalies']:
+            anomalie['libelle'] = FlotteService.ANOMALIES[anomalie['code']]
+        rapport['anomalies'].sort(key=lambda a: a['date_fin'], reverse=True)
+        rapport['nb_mesures'] = len(lignes)
+        return rapport
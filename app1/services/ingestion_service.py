@@ -0,0 +1,403 @@
+"""
+ingestion_service.py - Réception des événements de l'application chauffeur
+
+UTILISATION :
+L'application chauffeur envoie ses événements par lots au format NDJSON
+(un objet JSON par ligne) sur POST /api/evenements/ :
+
+    {"id": "c0f3...", "type": "GPS", "tournee": 12, "horodatage": "2025-01-15T09:12:03+01:00", "lat": 36.7, "lon": 3.1}
+    {"id": "c0f4...", "type": "SCAN", "tournee": 12, "expedition": 481, "horodatage": "...", "lat": 36.7, "lon": 3.1}
+    {"id": "c0f5...", "type": "LIVRAISON", "tournee": 12, "expedition": 481, "horodatage": "...", "donnees": {"signataire": "M. Benali"}}
+    {"id": "c0f6...", "type": "ECHEC", "tournee": 12, "expedition": 482, "horodatage": "...", "donnees": {"motif": "Absent"}}
+
+Un lot coûte un nombre FIXE de requêtes quelle que soit sa taille :
+1. Tournées et expéditions référencées (2 requêtes)
+2. Identifiants déjà reçus + expéditions déjà scannées (2 requêtes)
+3. bulk_create des événements (marqués d'un jeton de lot et relus : seuls ceux
+   réellement insérés par ce lot comptent), puis des jalons TrackingExpedition
+
+RÈGLES :
+- Idempotence : l'identifiant `id` est unique ; un lot renvoyé (réseau coupé,
+  timeout) n'insère rien de plus et ne recrée aucun jalon
+- Les lignes invalides sont rejetées une par une, le reste du lot est accepté
+- Contre-pression : au plus INGESTION_CONCURRENCE_MAX lots écrits en même temps
+  par processus ; au-delà → SaturationIngestion (HTTP 503 + Retry-After),
+  l'application garde ses événements et réessaie plus tard
+- Jalons dérivés :
+  SCAN      → TrackingExpedition EN_TRANSIT "scanné à l'arrêt" (premier scan seulement)
+  LIVRAISON → Expedition LIVRE + TrackingExpedition LIVRE
+  ECHEC     → Expedition ECHEC + TrackingExpedition ECHEC
+
+EXEMPLES :
+- IngestionService.ingerer(request) → vue ingerer_evenements
+- IngestionService.ingerer(lignes_ndjson) → commande generer_charge_ingestion
+"""
+
+import json
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+class SaturationIngestion(Exception):
+    """Trop de lots en cours d'écriture : le client doit réessayer plus tard"""
+
+
+class LotTropGros(Exception):
+    """Le lot dépasse INGESTION_LOT_MAX lignes"""
+
+
+_ecritures_en_cours = None
+_verrou_init = threading.Lock()
+
+
+def _semaphore():
+    """Sémaphore partagé par les threads du processus (créé au premier lot)"""
+    global _ecritures_en_cours
+    if _ecritures_en_cours is None:
+        with _verrou_init:
+            if _ecritures_en_cours is None:
+                _ecritures_en_cours = threading.BoundedSemaphore(getattr(settings, 'INGESTION_CONCURRENCE_MAX', 4))
+    return _ecritures_en_cours
+
+
+def _par_paquets(valeurs, taille=900):
+    """Découpe une liste pour rester sous la limite de paramètres SQL"""
+    valeurs = list(valeurs)
+    for i in range(0, len(valeurs), taille):
+        yield valeurs[i:i + taille]
+
+
+class IngestionService:
+    """
+    Service d'ingestion des événements terrain :
+    - Lecture et validation NDJSON (ligne par ligne)
+    - Écriture groupée idempotente (bulk_create)
+    - Contre-pression par processus
+    - Jalons de suivi dérivés des scans
+    """
+
+    TYPES_AVEC_EXPEDITION = ('SCAN', 'LIVRAISON', 'ECHEC')
+
+    # ==================== LECTURE ====================
+
+    @staticmethod
+    def _valider(ligne):
+        """
+        Une ligne NDJSON → dict normalisé
+        Lève ValueError avec un message lisible si la ligne est invalide
+        """
+        from app1.models import EvenementTerrain
+
+        try:
+            brut = json.loads(ligne)
+        except ValueError:
+            raise ValueError("JSON invalide")
+        if not isinstance(brut, dict):
+            raise ValueError("objet JSON attendu")
+
+        evenement_id = brut.get('id')
+        if not isinstance(evenement_id, str) or not 0 < len(evenement_id) <= 64:
+            raise ValueError("'id' manquant ou trop long (64 caractères max)")
+
+        type_evenement = brut.get('type')
+        if type_evenement not in dict(EvenementTerrain.TYPES_EVENEMENT):
+            raise ValueError(f"type inconnu : {type_evenement!r}")
+
+        try:
+            tournee_id = int(brut['tournee'])
+            expedition_id = int(brut['expedition']) if brut.get('expedition') is not None else None
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("'tournee' ou 'expedition' invalide")
+        if type_evenement in IngestionService.TYPES_AVEC_EXPEDITION and expedition_id is None:
+            raise ValueError(f"'expedition' obligatoire pour un événement {type_evenement}")
+
+        horodatage = parse_datetime(str(brut.get('horodatage', '')))
+        if horodatage is None:
+            raise ValueError("'horodatage' invalide (ISO 8601 attendu)")
+        if timezone.is_naive(horodatage):
+            horodatage = timezone.make_aware(horodatage)
+
+        latitude, longitude = brut.get('lat'), brut.get('lon')
+        if latitude is not None or longitude is not None:
+            try:
+                latitude, longitude = float(latitude), float(longitude)
+            except (TypeError, ValueError):
+                raise ValueError("'lat' / 'lon' invalides")
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise ValueError("coordonnées hors limites")
+        elif type_evenement == 'GPS':
+            raise ValueError("'lat' et 'lon' obligatoires pour un événement GPS")
+
+        donnees = brut.get('donnees') or {}
+        if not isinstance(donnees, dict):
+            raise ValueError("'donnees' doit être un objet")
+
+        return {
+            'evenement_id': evenement_id,
+            'type_evenement': type_evenement,
+            'tournee_id': tournee_id,
+            'expedition_id': expedition_id,
+            'horodatage': horodatage,
+            'latitude': latitude,
+            'longitude': longitude,
+            'donnees': donnees,
+        }
+
+    @staticmethod
+    def lire(lignes):
+        """
+        Parcourt les lignes NDJSON (itérable de str ou bytes, ex: la requête HTTP)
+        sans charger le lot entier en mémoire
+
+        Returns:
+            (evenements, erreurs, nb_lignes): evenements = dicts valides (doublons du lot retirés),
+                                              erreurs = [{'ligne': n, 'erreur': message}]
+        Raises:
+            LotTropGros: plus de INGESTION_LOT_MAX lignes
+        """
+        lot_max = getattr(settings, 'INGESTION_LOT_MAX', 5000)
+        evenements = {}
+        erreurs = []
+
+        numero = 0
+        for ligne in lignes:
+            if isinstance(ligne, bytes):
+                ligne = ligne.decode('utf-8', errors='replace')
+            ligne = ligne.strip()
+            if not ligne:
+                continue
+
+            numero += 1
+            if numero > lot_max:
+                raise LotTropGros(f"Lot limité à {lot_max} événements")
+
+            try:
+                evenement = IngestionService._valider(ligne)
+            except ValueError as e:
+                erreurs.append({'ligne': numero, 'erreur': str(e)})
+                continue
+            evenements.setdefault(evenement['evenement_id'], evenement)
+
+        return list(evenements.values()), erreurs, numero
+
+    # ==================== ÉCRITURE ====================
+
+    @staticmethod
+    def ingerer(lignes):
+        """
+        Valide et enregistre un lot d'événements
+
+        Returns:
+            dict: {'recus', 'inseres', 'doublons', 'jalons', 'erreurs'}
+        Raises:
+            SaturationIngestion: trop de lots en cours dans ce processus
+            LotTropGros: lot trop volumineux
+        """
+        semaphore = _semaphore()
+        if not semaphore.acquire(timeout=getattr(settings, 'INGESTION_ATTENTE_MAX_SECONDES', 0.5)):
+            raise SaturationIngestion("Ingestion saturée, réessayez plus tard")
+
+        try:
+            evenements, erreurs, nb_lignes = IngestionService.lire(lignes)
+            doublons_lot = nb_lignes - len(erreurs) - len(evenements)
+            resultat = IngestionService._enregistrer(evenements, erreurs)
+        finally:
+            semaphore.release()
+
+        resultat['recus'] = nb_lignes
+        resultat['doublons'] += doublons_lot
+        resultat['erreurs'] = erreurs
+        return resultat
+
+    @staticmethod
+    def _enregistrer(evenements, erreurs):
+        from app1.models import EvenementTerrain, Expedition, Tournee
+        from app1.routers import marquer_ecriture
+
+        resultat = {'inseres': 0, 'doublons': 0, 'jalons': 0}
+        if not evenements:
+            return resultat
+
+        # 1. Références (2 requêtes)
+        tournees = set()
+        for paquet in _par_paquets({e['tournee_id'] for e in evenements}):
+            tournees.update(Tournee.objects.filter(pk__in=paquet).values_list('pk', flat=True))
+
+        expeditions = {}
+        for paquet in _par_paquets({e['expedition_id'] for e in evenements if e['expedition_id']}):
+            expeditions.update(Expedition.objects.filter(pk__in=paquet).values_list('pk', 'tournee_id'))
+
+        valides = []
+        for evenement in evenements:
+            if evenement['tournee_id'] not in tournees:
+                erreurs.append({'id': evenement['evenement_id'], 'erreur': f"tournée #{evenement['tournee_id']} inconnue"})
+            elif evenement['expedition_id'] and expeditions.get(evenement['expedition_id']) != evenement['tournee_id']:
+                erreurs.append({'id': evenement['evenement_id'],
+                                'erreur': f"expédition #{evenement['expedition_id']} absente de la tournée"})
+            else:
+                valides.append(evenement)
+
+        # 2. Idempotence : identifiants déjà reçus (lot renvoyé en entier → aucune écriture)
+        deja_recus = IngestionService._deja_recus(e['evenement_id'] for e in valides)
+        nouveaux = [e for e in valides if e['evenement_id'] not in deja_recus]
+        resultat['doublons'] = len(valides) - len(nouveaux)
+        if not nouveaux:
+            return resultat
+
+        # 3. Événements + jalons dans la même transaction
+        jeton = uuid.uuid4()
+        with transaction.atomic():
+            # ignore_conflicts : un lot identique reçu en parallèle n'échoue pas, ses lignes
+            # sont ignorées → on relit (par jeton de lot) ce qui a réellement été inséré ici
+            EvenementTerrain.objects.bulk_create(
+                [
+                    EvenementTerrain(jour=timezone.localdate(e['horodatage']), lot=jeton, **e)
+                    for e in nouveaux
+                ],
+                batch_size=getattr(settings, 'INGESTION_TAILLE_PAQUET', 500),
+                ignore_conflicts=True,
+            )
+            inseres = IngestionService._deja_recus((e['evenement_id'] for e in nouveaux), lot=jeton)
+            nouveaux = [e for e in nouveaux if e['evenement_id'] in inseres]
+
+            resultat['inseres'] = len(nouveaux)
+            resultat['doublons'] = len(valides) - len(nouveaux)
+            resultat['jalons'] = IngestionService._jalons(nouveaux)
+            IngestionService._diffuser_positions(nouveaux)
+
+        marquer_ecriture()
+        return resultat
+
+    @staticmethod
+    def _deja_recus(identifiants, lot=None):
+        """Identifiants d'événements déjà enregistrés, éventuellement par un lot donné (une requête par paquet de 900)"""
+        from app1.models import EvenementTerrain
+
+        evenements = EvenementTerrain.objects.filter(lot=lot) if lot else EvenementTerrain.objects.all()
+        recus = set()
+        for paquet in _par_paquets(identifiants):
+            recus.update(evenements.filter(evenement_id__in=paquet).values_list('evenement_id', flat=True))
+        return recus
+
+    @staticmethod
+    def _diffuser_positions(nouveaux):
+        """Dernière position GPS de chaque tournée du lot → flux direct (une par tournée)"""
+        from .diffusion_service import DiffusionService
+
+        positions = {}
+        for e in nouveaux:
+            if e['type_evenement'] == 'GPS' and (
+                e['tournee_id'] not in positions or e['horodatage'] > positions[e['tournee_id']]['horodatage']
+            ):
+                positions[e['tournee_id']] = e
+
+        for tournee_id, e in positions.items():
+            DiffusionService.publier_apres_commit('position', {
+                'tournee_id': tournee_id,
+                'lat': e['latitude'],
+                'lon': e['longitude'],
+                'horodatage': e['horodatage'].isoformat(),
+            })
+
+    # ==================== JALONS DE SUIVI ====================
+
+    @staticmethod
+    def _jalons(nouveaux):
+        """
+        Dérive les étapes TrackingExpedition des scans du lot (bulk_create)
+
+        Returns:
+            int: nombre de jalons créés
+        """
+        from app1.models import EvenementTerrain, Expedition, TrackingExpedition
+
+        scans = {}
+        livraisons = {}
+        echecs = {}
+        for e in sorted(nouveaux, key=lambda e: e['horodatage']):
+            if e['type_evenement'] == 'SCAN':
+                scans.setdefault(e['expedition_id'], e)
+            elif e['type_evenement'] == 'LIVRAISON':
+                livraisons.setdefault(e['expedition_id'], e)
+            elif e['type_evenement'] == 'ECHEC':
+                echecs.setdefault(e['expedition_id'], e)
+
+        # Premier scan seulement : écarter les expéditions déjà scannées avant ce lot
+        if scans:
+            identifiants = [e['evenement_id'] for e in scans.values()]
+            deja_scannees = set(
+                EvenementTerrain.objects.filter(
+                    type_evenement='SCAN', expedition_id__in=list(scans)
+                ).exclude(
+                    evenement_id__in=identifiants
+                ).values_list('expedition_id', flat=True)
+            )
+            scans = {exp_id: e for exp_id, e in scans.items() if exp_id not in deja_scannees}
+
+        # Statuts des expéditions concernées (une requête)
+        concernees = set(scans) | set(livraisons) | set(echecs)
+        statuts = dict(Expedition.objects.filter(pk__in=list(concernees)).values_list('pk', 'statut')) if concernees else {}
+
+        jalons = []
+
+        for expedition_id, e in scans.items():
+            if statuts.get(expedition_id) in ('EN_ATTENTE', 'EN_TRANSIT'):
+                jalons.append(TrackingExpedition(
+                    expedition_id=expedition_id,
+                    statut_etape='EN_TRANSIT',
+                    commentaire=f"📍 Colis scanné à l'arrêt à {timezone.localtime(e['horodatage']).strftime('%H:%M')}",
+                ))
+
+        # Livraison : une preuve l'emporte sur un échec du même lot
+        a_livrer = {
+            expedition_id: e for expedition_id, e in livraisons.items()
+            if statuts.get(expedition_id) in ('EN_ATTENTE', 'EN_TRANSIT', 'ECHEC')
+        }
+        en_echec = {
+            expedition_id: e for expedition_id, e in echecs.items()
+            if expedition_id not in livraisons and statuts.get(expedition_id) in ('EN_ATTENTE', 'EN_TRANSIT')
+        }
+
+        livrees_par_jour = {}
+        for expedition_id, e in a_livrer.items():
+            signataire = e['donnees'].get('signataire')
+            jalons.append(TrackingExpedition(
+                expedition_id=expedition_id,
+                statut_etape='LIVRE',
+                commentaire=f"✅ Colis livré à {timezone.localtime(e['horodatage']).strftime('%d/%m/%Y %H:%M')}"
+                            + (f" (signé par {signataire})" if signataire else ""),
+            ))
+            livrees_par_jour.setdefault(timezone.localdate(e['horodatage']), []).append(expedition_id)
+
+        # Une mise à jour par jour de livraison (en pratique une seule)
+        for jour, expedition_ids in livrees_par_jour.items():
+            Expedition.objects.filter(pk__in=expedition_ids).update(statut='LIVRE', date_livraison_reelle=jour)
+
+        for expedition_id, e in en_echec.items():
+            motif = e['donnees'].get('motif')
+            jalons.append(TrackingExpedition(
+                expedition_id=expedition_id,
+                statut_etape='ECHEC',
+                commentaire=f"❌ Échec de livraison à {timezone.localtime(e['horodatage']).strftime('%H:%M')}"
+                            + (f" : {motif}" if motif else ""),
+            ))
+        if en_echec:
+            Expedition.objects.filter(pk__in=list(en_echec)).update(statut='ECHEC')
+
+        TrackingExpedition.objects.bulk_create(jalons)
+
+        # bulk_create / update ne déclenchent pas les signaux : cache du suivi public + flux direct
+        if jalons:
+            from .diffusion_service import DiffusionService
+            from .suivi_public_service import SuiviPublicService
+            modifiees = {jalon.expedition_id for jalon in jalons}
+            transaction.on_commit(lambda: SuiviPublicService.invalider(modifiees))
+            for jalon in jalons:
+                DiffusionService.publier_apres_commit('suivi', DiffusionService.suivi(jalon))
+
+        return len(jalons)
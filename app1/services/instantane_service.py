@@ -0,0 +1,437 @@
+"""
+instantane_service.py - Instantanés de la base SQLite (sauvegardes à chaud)
+
+UTILISATION :
+Un instantané est une copie cohérente de db.sqlite3 faite avec l'API de
+sauvegarde en ligne de SQLite (sqlite3.Connection.backup, comme la réplica
+analytique), sans bloquer l'application :
+- base en WAL : copie en une étape, les écritures continuent pendant la lecture
+- sinon : paquets de pages avec une pause entre deux paquets, les écritures
+  passent entre les deux (copie relancée si elles touchent la base, voir copier())
+
+Stockage dédupliqué (INSTANTANES_REPERTOIRE) :
+- blocs/ab/abcdef….zz : blocs de INSTANTANES_TAILLE_BLOC octets du fichier,
+  compressés (zlib), nommés par leur SHA-256 → un bloc inchangé d'un
+  instantané à l'autre n'est écrit qu'une fois
+- manifestes/AAAAMMJJ-HHMMSS-mmm.json : liste ordonnée des blocs + SHA-256
+  du fichier complet (un manifeste = un point de restauration)
+
+Rétention (après chaque instantané planifié) : les INSTANTANES_GARDER_DERNIERS
+plus récents, puis le plus récent de chacun des INSTANTANES_GARDER_JOURS
+derniers jours et des INSTANTANES_GARDER_SEMAINES dernières semaines (jours et
+semaines de l'heure locale, TIME_ZONE). Les blocs
+qui ne sont plus référencés sont supprimés.
+
+EXEMPLES :
+- InstantaneService.creer() → {'id': '20250115-080000-000', 'nouveaux_blocs': 3, ...}
+  (scheduler toutes les INSTANTANES_INTERVALLE_MINUTES / commande creer_instantane)
+- InstantaneService.verifier('20250115-080000-000', integrite=True) → {'ok': True, 'erreurs': []}
+- InstantaneService.restaurer('20250115-080000-000') → base remplacée (instantané de sécurité pris avant)
+- InstantaneService.restaurer('20250115-080000-000', cible='/tmp/copie.sqlite3') → fichier autonome
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+class InstantaneIntrouvable(Exception):
+    """Identifiant d'instantané inconnu"""
+
+
+class CopieInterrompue(Exception):
+    """Copie par étapes abandonnée (trop de reprises)"""
+
+
+class InstantaneService:
+    """
+    Service d'instantanés de la base principale :
+    - Copie en ligne par paquets de pages
+    - Stockage des blocs par contenu (déduplication)
+    - Rétention, vérification, restauration
+    """
+
+    # Un seul instantané / nettoyage à la fois par processus
+    _verrou = threading.Lock()
+
+    # Copie par étapes relancée plus de N fois par des écritures → copie en une étape
+    MAX_REPRISES = 3
+
+    # Un bloc plus récent n'est jamais supprimé par le nettoyage (instantané en cours d'écriture)
+    AGE_MIN_NETTOYAGE = 3600
+
+    # ==================== CONFIGURATION ====================
+
+    @staticmethod
+    def base():
+        """Chemin de la base principale (None si ce n'est pas un fichier SQLite)"""
+        principal = settings.DATABASES['default']
+        if connections['default'].vendor != 'sqlite':
+            return None
+        if connections['default'].creation.is_in_memory_db(principal['NAME']):
+            return None
+        return str(principal['NAME'])
+
+    @staticmethod
+    def repertoire():
+        return Path(getattr(settings, 'INSTANTANES_REPERTOIRE', Path(settings.BASE_DIR) / 'instantanes'))
+
+    @staticmethod
+    def chemin_bloc(empreinte):
+        return InstantaneService.repertoire() / 'blocs' / empreinte[:2] / f"{empreinte}.zz"
+
+    @staticmethod
+    def chemin_manifeste(identifiant):
+        return InstantaneService.repertoire() / 'manifestes' / f"{identifiant}.json"
+
+    # ==================== CRÉATION ====================
+
+    @staticmethod
+    def creer(etiquette='', pages_par_etape=None, pause=None):
+        """
+        Copie la base principale et enregistre les blocs nouveaux
+
+        Args:
+            etiquette (str): libellé libre (ex: 'avant-restauration')
+            pages_par_etape (int): pages copiées par étape (défaut : INSTANTANES_PAGES_PAR_ETAPE)
+            pause (float): secondes entre deux étapes (défaut : INSTANTANES_PAUSE_SECONDES)
+
+        Returns:
+            dict: manifeste de l'instantané, ou None si la base n'est pas SQLite
+        """
+        source = InstantaneService.base()
+        if not source:
+            return None
+
+        pages_par_etape = pages_par_etape or getattr(settings, 'INSTANTANES_PAGES_PAR_ETAPE', 256)
+        pause = getattr(settings, 'INSTANTANES_PAUSE_SECONDES', 0.01) if pause is None else pause
+        taille_bloc = getattr(settings, 'INSTANTANES_TAILLE_BLOC', 1 << 20)
+        repertoire = InstantaneService.repertoire()
+        (repertoire / 'manifestes').mkdir(parents=True, exist_ok=True)
+
+        with InstantaneService._verrou:
+            debut = time.time()
+            cree_le = timezone.now()
+            identifiant = f"{cree_le:%Y%m%d-%H%M%S}-{cree_le.microsecond // 1000:03d}"
+
+            descripteur, copie = tempfile.mkstemp(prefix='.copie-', suffix='.sqlite3', dir=repertoire)
+            os.close(descripteur)
+            try:
+                copie_mode = InstantaneService.copier(source, copie, pages_par_etape, pause)
+                connexion_copie = sqlite3.connect(copie)
+                try:
+                    taille_page = connexion_copie.execute("PRAGMA page_size").fetchone()[0]
+                finally:
+                    connexion_copie.close()
+
+                blocs, nouveaux, octets_ecrits, empreinte, taille = [], 0, 0, hashlib.sha256(), 0
+                with open(copie, 'rb') as fichier:
+                    while bloc := fichier.read(taille_bloc):
+                        empreinte.update(bloc)
+                        taille += len(bloc)
+                        blocs.append(hashlib.sha256(bloc).hexdigest())
+                        ecrits = InstantaneService.stocker_bloc(bloc, blocs[-1])
+                        if ecrits:
+                            nouveaux += 1
+                            octets_ecrits += ecrits
+            finally:
+                os.unlink(copie)
+                InstantaneService.supprimer_annexes(copie)
+
+            manifeste = {
+                'id': identifiant,
+                'cree_le': cree_le.isoformat(),
+                'etiquette': etiquette,
+                'taille': taille,
+                'taille_page': taille_page,
+                'taille_bloc': taille_bloc,
+                'sha256': empreinte.hexdigest(),
+                'blocs': blocs,
+                'nouveaux_blocs': nouveaux,
+                'octets_ecrits': octets_ecrits,
+                'copie': copie_mode,
+                'duree': round(time.time() - debut, 3),
+            }
+            InstantaneService.ecrire_atomique(
+                InstantaneService.chemin_manifeste(identifiant), json.dumps(manifeste, indent=1).encode()
+            )
+        return manifeste
+
+    @staticmethod
+    def copier(source, destination, pages_par_etape, pause):
+        """
+        Copie cohérente de `source` vers `destination` (API backup)
+
+        - Base en WAL : une seule étape ; la lecture ne bloque pas les écritures
+        - Sinon : paquets de pages avec pause ; une écriture d'une autre connexion fait
+          repartir la copie de zéro → après MAX_REPRISES reprises, une seule étape
+          (écritures en attente le temps de la copie, busy_timeout de l'application)
+
+        Returns:
+            str: 'wal', 'etapes' ou 'etape_unique'
+        """
+        connexion_source = sqlite3.connect(source, timeout=30)
+        connexion_copie = sqlite3.connect(destination)
+        try:
+            if connexion_source.execute("PRAGMA journal_mode").fetchone()[0] == 'wal':
+                connexion_source.backup(connexion_copie)
+                return 'wal'
+
+            suivi = {'restantes': None, 'reprises': 0}
+
+            def progression(statut, restantes, total):
+                if suivi['restantes'] is not None and restantes > suivi['restantes']:
+                    suivi['reprises'] += 1
+                    if suivi['reprises'] > InstantaneService.MAX_REPRISES:
+                        raise CopieInterrompue
+                suivi['restantes'] = restantes
+
+            try:
+                connexion_source.backup(connexion_copie, pages=pages_par_etape, progress=progression, sleep=pause)
+                return 'etapes'
+            except CopieInterrompue:
+                connexion_source.backup(connexion_copie)
+                return 'etape_unique'
+        finally:
+            connexion_copie.close()
+            connexion_source.close()
+
+    @staticmethod
+    def stocker_bloc(bloc, empreinte):
+        """
+        Écrit le bloc (SHA-256 `empreinte`) s'il n'existe pas encore
+
+        Returns:
+            int: octets écrits (0 si le bloc était déjà stocké)
+        """
+        chemin = InstantaneService.chemin_bloc(empreinte)
+        if chemin.exists():
+            # Rafraîchit la date : le nettoyage ne supprime pas un bloc réutilisé par cet instantané
+            os.utime(chemin)
+            return 0
+        chemin.parent.mkdir(parents=True, exist_ok=True)
+        compresse = zlib.compress(bloc, 6)
+        InstantaneService.ecrire_atomique(chemin, compresse)
+        return len(compresse)
+
+    @staticmethod
+    def ecrire_atomique(chemin, contenu):
+        provisoire = chemin.with_name(f".{chemin.name}.{os.getpid()}.{threading.get_ident()}")
+        provisoire.write_bytes(contenu)
+        os.replace(provisoire, chemin)
+
+    # ==================== LECTURE ====================
+
+    @staticmethod
+    def lister():
+        """Manifestes du plus récent au plus ancien"""
+        dossier = InstantaneService.repertoire() / 'manifestes'
+        if not dossier.exists():
+            return []
+        manifestes = []
+        for chemin in dossier.glob('*.json'):
+            try:
+                manifestes.append(json.loads(chemin.read_text()))
+            except (OSError, ValueError):
+                continue
+        return sorted(manifestes, key=lambda manifeste: manifeste['id'], reverse=True)
+
+    @staticmethod
+    def manifeste(identifiant):
+        """Manifeste d'un instantané ('dernier' = le plus récent)"""
+        if identifiant == 'dernier':
+            manifestes = InstantaneService.lister()
+            if not manifestes:
+                raise InstantaneIntrouvable("Aucun instantané")
+            return manifestes[0]
+        try:
+            return json.loads(InstantaneService.chemin_manifeste(identifiant).read_text())
+        except FileNotFoundError:
+            raise InstantaneIntrouvable(f"Instantané inconnu : {identifiant}")
+
+    @staticmethod
+    def reconstituer(manifeste, fichier):
+        """
+        Écrit le fichier de l'instantané dans `fichier` (ouvert en binaire)
+
+        Returns:
+            list: erreurs (blocs manquants / corrompus, empreinte finale différente)
+        """
+        erreurs = []
+        empreinte = hashlib.sha256()
+        for indice, attendu in enumerate(manifeste['blocs']):
+            try:
+                bloc = zlib.decompress(InstantaneService.chemin_bloc(attendu).read_bytes())
+            except (OSError, zlib.error) as e:
+                erreurs.append(f"Bloc {indice} ({attendu[:12]}) illisible : {e}")
+                continue
+            if hashlib.sha256(bloc).hexdigest() != attendu:
+                erreurs.append(f"Bloc {indice} ({attendu[:12]}) corrompu")
+                continue
+            empreinte.update(bloc)
+            fichier.write(bloc)
+
+        if not erreurs and empreinte.hexdigest() != manifeste['sha256']:
+            erreurs.append("Empreinte du fichier reconstitué différente du manifeste")
+        return erreurs
+
+    @staticmethod
+    def verifier(identifiant, integrite=False):
+        """
+        Vérifie les blocs d'un instantané (et, si `integrite`, PRAGMA integrity_check sur la copie reconstituée)
+
+        Returns:
+            dict: {'id', 'ok', 'erreurs'}
+        """
+        manifeste = InstantaneService.manifeste(identifiant)
+        with tempfile.NamedTemporaryFile(dir=InstantaneService.repertoire(), prefix='.verification-', suffix='.sqlite3') as copie:
+            erreurs = InstantaneService.reconstituer(manifeste, copie)
+            copie.flush()
+            if integrite and not erreurs:
+                # Copie d'une base en WAL : la repasser en journal classique avant de la lire,
+                # sinon SQLite crée .verification-*-wal / -shm à côté (jamais supprimés en lecture seule)
+                connexion = sqlite3.connect(copie.name)
+                try:
+                    connexion.execute("PRAGMA journal_mode=DELETE")
+                    resultat = [ligne[0] for ligne in connexion.execute("PRAGMA integrity_check")]
+                finally:
+                    connexion.close()
+                    InstantaneService.supprimer_annexes(copie.name)
+                if resultat != ['ok']:
+                    erreurs.extend(f"integrity_check : {ligne}" for ligne in resultat)
+
+        return {'id': manifeste['id'], 'ok': not erreurs, 'erreurs': erreurs}
+
+    @staticmethod
+    def supprimer_annexes(chemin):
+        """Fichiers -wal / -shm laissés à côté d'une copie temporaire"""
+        for suffixe in ('-wal', '-shm', '-journal'):
+            Path(f"{chemin}{suffixe}").unlink(missing_ok=True)
+
+    # ==================== RESTAURATION ====================
+
+    @staticmethod
+    def restaurer(identifiant, cible=None):
+        """
+        Restaure un instantané
+
+        Args:
+            cible: fichier à écrire ; None = base principale, remplacée en ligne (API backup :
+                   les connexions ouvertes voient la nouvelle base), après un instantané de sécurité
+
+        Returns:
+            dict: {'id', 'cible', 'securite': id de l'instantané de sécurité ou None}
+        """
+        manifeste = InstantaneService.manifeste(identifiant)
+        repertoire = InstantaneService.repertoire()
+        repertoire.mkdir(parents=True, exist_ok=True)
+
+        descripteur, copie = tempfile.mkstemp(prefix='.restauration-', suffix='.sqlite3', dir=repertoire)
+        try:
+            with os.fdopen(descripteur, 'wb') as fichier:
+                erreurs = InstantaneService.reconstituer(manifeste, fichier)
+            if erreurs:
+                raise ValueError(f"Instantané {manifeste['id']} inutilisable : {'; '.join(erreurs)}")
+
+            securite = None
+            base = InstantaneService.base()
+            if cible is None and base is None:
+                raise ValueError("La base principale n'est pas SQLite : préciser un fichier cible")
+            if cible is None or (base and Path(cible).resolve() == Path(base).resolve()):
+                cible = base
+                securite = InstantaneService.creer(etiquette=f"avant-restauration-{manifeste['id']}")['id']
+                connections['default'].close()
+                connexion_copie = sqlite3.connect(copie)
+                connexion_base = sqlite3.connect(base, timeout=30)
+                try:
+                    connexion_copie.backup(connexion_base)
+                finally:
+                    connexion_base.close()
+                    connexion_copie.close()
+            else:
+                os.replace(copie, cible)
+        finally:
+            if os.path.exists(copie):
+                os.unlink(copie)
+
+        return {'id': manifeste['id'], 'cible': str(cible), 'securite': securite}
+
+    # ==================== RÉTENTION ====================
+
+    @staticmethod
+    def a_conserver(manifestes, maintenant=None):
+        """
+        Identifiants conservés par la politique de rétention
+
+        Args:
+            manifestes: du plus récent au plus ancien (lister())
+        """
+        maintenant = maintenant or timezone.now()
+        derniers = getattr(settings, 'INSTANTANES_GARDER_DERNIERS', 24)
+        jours = getattr(settings, 'INSTANTANES_GARDER_JOURS', 7)
+        semaines = getattr(settings, 'INSTANTANES_GARDER_SEMAINES', 8)
+
+        conserves = {manifeste['id'] for manifeste in manifestes[:derniers]}
+        jours_vus, semaines_vues = set(), set()
+        for manifeste in manifestes:
+            cree_le = parse_datetime(manifeste['cree_le'])
+            # Jours et semaines du calendrier local (TIME_ZONE), pas UTC
+            local = timezone.localtime(cree_le)
+            jour = local.date()
+            semaine = local.isocalendar()[:2]
+            if cree_le >= maintenant - timedelta(days=jours) and jour not in jours_vus:
+                jours_vus.add(jour)
+                conserves.add(manifeste['id'])
+            if cree_le >= maintenant - timedelta(weeks=semaines) and semaine not in semaines_vues:
+                semaines_vues.add(semaine)
+                conserves.add(manifeste['id'])
+        return conserves
+
+    @staticmethod
+    def appliquer_retention():
+        """
+        Supprime les manifestes hors politique puis les blocs orphelins
+
+        Returns:
+            dict: {'instantanes_supprimes', 'blocs_supprimes', 'octets_liberes'}
+        """
+        with InstantaneService._verrou:
+            manifestes = InstantaneService.lister()
+            conserves = InstantaneService.a_conserver(manifestes)
+            supprimes = 0
+            for manifeste in manifestes:
+                if manifeste['id'] not in conserves:
+                    InstantaneService.chemin_manifeste(manifeste['id']).unlink(missing_ok=True)
+                    supprimes += 1
+
+            references = {bloc for manifeste in manifestes if manifeste['id'] in conserves for bloc in manifeste['blocs']}
+            limite = time.time() - InstantaneService.AGE_MIN_NETTOYAGE
+            blocs_supprimes, octets = 0, 0
+            for chemin in (InstantaneService.repertoire() / 'blocs').glob('*/*.zz'):
+                statut = chemin.stat()
+                if chemin.stem not in references and statut.st_mtime < limite:
+                    chemin.unlink(missing_ok=True)
+                    blocs_supprimes += 1
+                    octets += statut.st_size
+
+        return {'instantanes_supprimes': supprimes, 'blocs_supprimes': blocs_supprimes, 'octets_liberes': octets}
+
+    @staticmethod
+    def planifie():
+        """Instantané + rétention (scheduler)"""
+        manifeste = InstantaneService.creer()
+        if manifeste is None:
+            return None
+        return {**manifeste, **InstantaneService.appliquer_retention()}
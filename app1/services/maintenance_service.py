@@ -0,0 +1,302 @@
+"""
+maintenance_service.py - Planification des révisions sur un horizon de plusieurs jours
+
+UTILISATION :
+Chaque soir (17h30), le planificateur examine toutes les révisions prévues
+dans les MAINTENANCE_HORIZON_JOURS prochains jours, en un nombre FIXE de
+requêtes quelle que soit la taille de la flotte :
+
+1. Une requête annotée (Exists) : véhicules à réviser + tournée réservée le jour
+   de la révision ? + notification déjà ouverte ? + révision déjà au calendrier ?
+2. Une requête : réservations de la période (créneaux de remplacement)
+3. bulk_create des réservations MAINTENANCE et des notifications
+
+RÈGLES :
+- Révision sans conflit → le jour est réservé au calendrier (motif MAINTENANCE),
+  le véhicule ne peut plus être affecté à une tournée ce jour-là
+- Révision en conflit avec une tournée → notification "Reporter ?" avec les
+  créneaux les moins perturbants (véhicule libre, flotte peu chargée, proche
+  de la date prévue, de préférence avant)
+- Révision DEMAIN sans conflit → notification de confirmation (comme avant)
+- Une notification MAINTENANCE_AVANT encore ouverte n'est jamais recréée
+
+EXEMPLES :
+- PlanificationMaintenanceService.planifier() → scheduler (17h30)
+- PlanificationMaintenanceService.notifier_retours() → scheduler (8h)
+"""
+
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from .calendrier_service import ArbreIntervalles, CalendrierService
+
+# Marque les réservations créées par le planificateur (les autres sont saisies à la main)
+REMARQUE_REVISION = "Révision périodique (planificateur)"
+
+
+class PlanificationMaintenanceService:
+    """
+    Service de planification des maintenances :
+    - Scan de l'horizon en une requête annotée
+    - Réservation du jour de révision au calendrier
+    - Notifications (conflit / confirmation / retour) en bulk_create
+    - Proposition de créneaux de remplacement
+    """
+
+    NB_CRENEAUX = 3
+
+    @staticmethod
+    def horizon():
+        return getattr(settings, 'MAINTENANCE_HORIZON_JOURS', 7)
+
+    @staticmethod
+    def bornes_jour(jour):
+        """[00:00, 00:00 du lendemain) d'une date"""
+        debut = timezone.make_aware(datetime.combine(jour, time.min))
+        return debut, debut + timedelta(days=1)
+
+    # ==================== REQUÊTE ANNOTÉE ====================
+
+    @staticmethod
+    def vehicules_a_reviser(premier_jour, dernier_jour):
+        """
+        Véhicules dont la révision tombe dans [premier_jour, dernier_jour], annotés :
+        - tournee_le_jour : une tournée est réservée le jour de la révision
+        - notification_ouverte : une notification MAINTENANCE_AVANT non traitée existe
+        - revision_reservee : le jour de révision est déjà au calendrier
+        """
+        from app1.models import Notification, ReservationRessource, Vehicule
+
+        jour_revision = OuterRef('date_prochaine_revision')
+
+        reservations_tournee = ReservationRessource.objects.filter(
+            vehicule_id=OuterRef('pk'),
+            tournee__isnull=False,
+            debut__date__lte=jour_revision,
+        ).filter(
+            Q(fin__date__gte=jour_revision) | Q(tournee__statut='EN_COURS')
+        )
+
+        return Vehicule.objects.filter(
+            date_prochaine_revision__range=(premier_jour, dernier_jour)
+        ).exclude(
+            statut='HORS_SERVICE'
+        ).annotate(
+            tournee_le_jour=Exists(reservations_tournee),
+            notification_ouverte=Exists(Notification.objects.filter(
+                vehicule_id=OuterRef('pk'),
+                type_notification='MAINTENANCE_AVANT',
+                statut__in=['NON_LUE', 'LUE'],
+            )),
+            revision_reservee=Exists(ReservationRessource.objects.filter(
+                vehicule_id=OuterRef('pk'),
+                motif='MAINTENANCE',
+                debut__date=jour_revision,
+            )),
+        ).order_by('date_prochaine_revision', 'numero_immatriculation')
+
+    # ==================== CRÉNEAUX ====================
+
+    @staticmethod
+    def _charger_reservations(premier_jour, dernier_jour):
+        """Réservations véhicules de la période (une requête) → (arbres par véhicule, arbre flotte)"""
+        debut, _ = PlanificationMaintenanceService.bornes_jour(premier_jour)
+        _, fin = PlanificationMaintenanceService.bornes_jour(dernier_jour)
+
+        reservations = CalendrierService.reservations_chevauchantes(debut, fin).filter(
+            vehicule__isnull=False
+        ).select_related('tournee')
+
+        par_vehicule = {}
+        flotte = []
+        for reservation in reservations:
+            fin_reservation = fin if reservation.est_ouverte() else reservation.fin
+            intervalle = (reservation.debut, fin_reservation, reservation.vehicule_id)
+            par_vehicule.setdefault(reservation.vehicule_id, []).append(intervalle)
+            flotte.append(intervalle)
+
+        arbres = {vehicule_id: ArbreIntervalles(liste) for vehicule_id, liste in par_vehicule.items()}
+        return arbres, ArbreIntervalles(flotte)
+
+    @staticmethod
+    def _meilleurs_creneaux(vehicule_id, date_prevue, premier_jour, dernier_jour, arbres, arbre_flotte):
+        """
+        Jours où le véhicule est libre, du moins perturbant au plus perturbant
+        Score = véhicules de la flotte déjà réservés ce jour-là
+                + 0.5 par jour d'écart avant la date prévue (1 par jour après : révision en retard)
+        """
+        arbre_vehicule = arbres.get(vehicule_id)
+        candidats = []
+
+        jour = premier_jour
+        while jour <= dernier_jour:
+            debut, fin = PlanificationMaintenanceService.bornes_jour(jour)
+            if jour != date_prevue and (arbre_vehicule is None or arbre_vehicule.est_libre(debut, fin)):
+                occupation = len(set(arbre_flotte.chevauchements(debut, fin)))
+                ecart = (jour - date_prevue).days
+                score = occupation + (0.5 * -ecart if ecart < 0 else 1.0 * ecart)
+                candidats.append((score, jour))
+            jour += timedelta(days=1)
+
+        candidats.sort()
+        return [jour for _, jour in candidats[:PlanificationMaintenanceService.NB_CRENEAUX]]
+
+    # ==================== PLANIFICATION (17h30) ====================
+
+    @staticmethod
+    @transaction.atomic
+    def planifier(horizon_jours=None):
+        """
+        Scanne les révisions des `horizon_jours` prochains jours
+
+        Returns:
+            dict: statistiques (mêmes clés qu'avant + réservations créées / retirées)
+        """
+        from app1.models import Notification, ReservationRessource
+
+        horizon_jours = horizon_jours or PlanificationMaintenanceService.horizon()
+        demain = date.today() + timedelta(days=1)
+        dernier_jour = demain + timedelta(days=horizon_jours - 1)
+        fin_recherche = dernier_jour + timedelta(days=getattr(settings, 'MAINTENANCE_RECHERCHE_JOURS', 14))
+
+        stats = {
+            'notifications_vehicule_en_tournee': 0,
+            'notifications_confirmation': 0,
+            'revisions_reservees': 0,
+            'revisions_retirees': 0,
+        }
+
+        # 1. Réservations de révision devenues obsolètes (date de révision modifiée)
+        stats['revisions_retirees'], _ = ReservationRessource.objects.filter(
+            motif='MAINTENANCE',
+            remarques=REMARQUE_REVISION,
+            debut__date__gte=date.today(),
+        ).filter(
+            ~Q(debut__date=F('vehicule__date_prochaine_revision'))
+        ).delete()
+
+        # 2. Véhicules à réviser sur l'horizon (une requête annotée)
+        vehicules = list(PlanificationMaintenanceService.vehicules_a_reviser(demain, dernier_jour))
+        if not vehicules:
+            return stats
+
+        # 3. Réservations de la période de recherche (une requête) pour les créneaux
+        en_conflit = [vehicule for vehicule in vehicules if vehicule.tournee_le_jour and not vehicule.notification_ouverte]
+        if en_conflit:
+            arbres, arbre_flotte = PlanificationMaintenanceService._charger_reservations(demain, fin_recherche)
+
+        notifications = []
+        reservations = []
+
+        for vehicule in vehicules:
+            date_revision = vehicule.date_prochaine_revision
+            libelle_date = date_revision.strftime('%d/%m/%Y')
+
+            if vehicule.tournee_le_jour:
+                # ⚠️ Tournée réservée le jour de la révision → proposer un report
+                if vehicule.notification_ouverte:
+                    continue
+
+                creneaux = PlanificationMaintenanceService._meilleurs_creneaux(
+                    vehicule.pk, date_revision, demain, fin_recherche, arbres, arbre_flotte
+                )
+                propositions = ", ".join(jour.strftime('%d/%m/%Y') for jour in creneaux) or "aucun créneau libre"
+
+                notifications.append(Notification(
+                    type_notification='MAINTENANCE_AVANT',
+                    titre=f"Véhicule en tournée - {vehicule.numero_immatriculation}",
+                    message=f"Le véhicule {vehicule.numero_immatriculation} est réservé pour une tournée "
+                            f"le jour de sa révision ({libelle_date}). "
+                            f"Voulez-vous modifier la date de prochaine révision ? "
+                            f"Créneaux proposés : {propositions}.",
+                    vehicule=vehicule,
+                    statut='NON_LUE',
+                ))
+                stats['notifications_vehicule_en_tournee'] += 1
+                continue
+
+            # ✅ Véhicule libre ce jour-là → bloquer le jour au calendrier
+            if not vehicule.revision_reservee:
+                debut, fin = PlanificationMaintenanceService.bornes_jour(date_revision)
+                reservations.append(ReservationRessource(
+                    vehicule=vehicule,
+                    motif='MAINTENANCE',
+                    debut=debut,
+                    fin=fin,
+                    remarques=REMARQUE_REVISION,
+                ))
+                stats['revisions_reservees'] += 1
+
+            # Révision DEMAIN → confirmation (J-1)
+            if date_revision == demain and not vehicule.notification_ouverte:
+                notifications.append(Notification(
+                    type_notification='MAINTENANCE_AVANT',
+                    titre=f"Confirmation maintenance - {vehicule.numero_immatriculation}",
+                    message=f"Le véhicule {vehicule.numero_immatriculation} ({vehicule.marque} {vehicule.modele}) "
+                            f"a une maintenance prévue demain ({libelle_date}). "
+                            f"Confirmez-vous que le véhicule ira en maintenance demain ?",
+                    vehicule=vehicule,
+                    statut='NON_LUE',
+                ))
+                stats['notifications_confirmation'] += 1
+
+        # 4. Écritures groupées
+        ReservationRessource.objects.bulk_create(reservations)
+        Notification.objects.bulk_create(notifications)
+        PlanificationMaintenanceService._diffuser(notifications)
+
+        return stats
+
+    # ==================== RETOURS DE MAINTENANCE (8h) ====================
+
+    @staticmethod
+    def notifier_retours():
+        """
+        Véhicules EN_MAINTENANCE dont la révision est passée → "Est-il revenu ?"
+        Une seule requête (Exists pour ne pas recréer une notification ouverte)
+        + un bulk_create
+
+        Returns:
+            dict: {'notifications_retour': int}
+        """
+        from app1.models import Notification, Vehicule
+
+        vehicules = Vehicule.objects.filter(
+            statut='EN_MAINTENANCE',
+            date_prochaine_revision__lt=date.today(),
+        ).exclude(
+            Exists(Notification.objects.filter(
+                vehicule_id=OuterRef('pk'),
+                type_notification='MAINTENANCE_APRES',
+                statut__in=['NON_LUE', 'LUE'],
+            ))
+        )
+
+        notifications = [
+            Notification(
+                type_notification='MAINTENANCE_APRES',
+                titre=f"Retour de maintenance - {vehicule.numero_immatriculation}",
+                message=f"Le véhicule {vehicule.numero_immatriculation} ({vehicule.marque} {vehicule.modele}) "
+                        f"est en maintenance depuis le {vehicule.date_prochaine_revision.strftime('%d/%m/%Y')}. "
+                        f"Est-il revenu de maintenance ?",
+                vehicule=vehicule,
+                statut='NON_LUE',
+            )
+            for vehicule in vehicules
+        ]
+        Notification.objects.bulk_create(notifications)
+        PlanificationMaintenanceService._diffuser(notifications)
+
+        return {'notifications_retour': len(notifications)}
+
+    @staticmethod
+    def _diffuser(notifications):
+        """bulk_create ne déclenche pas les signaux : flux direct du tableau de bord"""
+        from .diffusion_service import DiffusionService
+
+        for notification in notifications:
+            DiffusionService.publier_apres_commit('notification', DiffusionService.notification(notification))
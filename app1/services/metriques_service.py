@@ -0,0 +1,282 @@
+"""
+metriques_service.py - Compteurs et histogrammes de durée (format Prometheus)
+
+UTILISATION :
+Les opérations métier sont chronométrées en continu, en production :
+- @MetriquesService.instrumenter sur une classe de service → toutes ses
+  méthodes statiques publiques (ex: FacturationService.gerer_facture_expedition)
+- @MetriquesService.chronometrer('Expedition.save') sur une fonction / méthode
+- with MetriquesService.chronometre('taches_quotidiennes.matin'): ... pour un bloc
+
+GET /metrics renvoie l'état au format texte Prometheus (histogrammes cumulés,
+_sum, _count). Les métriques sont PAR PROCESSUS : avec plusieurs workers,
+chaque worker expose les siennes (Prometheus les agrège par instance).
+
+COÛT :
+Une observation = 2 lectures d'horloge + une recherche dans les seuils
+(bisect), sans verrou (une part d'histogramme par thread) : ~0,3 µs pour
+l'observation, ~0,8 µs enveloppe comprise sur une petite VM. Ce n'est PAS négligeable
+pour une fonction de quelques microsecondes appelée en boucle : chronométrer
+plutôt la boucle entière (with MetriquesService.chronometre(...)).
+METRIQUES_ACTIVES est lu au premier appel (et relu si le réglage change) ;
+à False, l'enveloppe appelle directement la fonction.
+
+EXEMPLES :
+- MetriquesService.compteur('transportpro_emails_total', "Emails envoyés").inc(resultat='ok')
+- MetriquesService.exposition() → texte de /metrics
+"""
+
+import bisect
+import functools
+import threading
+import time
+from threading import get_ident
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+# Seuils (secondes) des histogrammes de durée : de 1 ms à 1 minute
+SEUILS_DUREE = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _echapper(valeur):
+    return str(valeur).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquettes(noms, valeurs):
+    """{a="1",b="2"} (valeurs échappées selon le format Prometheus)"""
+    if not noms:
+        return ''
+    return '{' + ','.join(f'{nom}="{_echapper(valeur)}"' for nom, valeur in zip(noms, valeurs)) + '}'
+
+
+class Compteur:
+    """Valeur qui ne fait qu'augmenter, par combinaison d'étiquettes"""
+
+    type_prometheus = 'counter'
+
+    def __init__(self, nom, aide, etiquettes=()):
+        self.nom = nom
+        self.aide = aide
+        self.etiquettes = tuple(etiquettes)
+        self._valeurs = {}
+        self._verrou = threading.Lock()
+
+    def inc(self, valeur=1, **etiquettes):
+        cle = tuple(str(etiquettes.get(nom, '')) for nom in self.etiquettes)
+        with self._verrou:
+            self._valeurs[cle] = self._valeurs.get(cle, 0) + valeur
+
+    def lignes(self):
+        with self._verrou:
+            valeurs = sorted(self._valeurs.items())
+        for cle, valeur in valeurs:
+            yield f"{self.nom}{_etiquettes(self.etiquettes, cle)} {valeur}"
+
+
+class SerieHistogramme:
+    """
+    Une combinaison d'étiquettes d'un histogramme (résolue une fois, observée souvent)
+    Une part par thread : chaque thread n'écrit que la sienne, l'observation ne prend
+    aucun verrou (seule la création d'une part et la lecture en prennent un)
+    """
+
+    __slots__ = ('seuils', 'parts', 'verrou')
+
+    def __init__(self, seuils):
+        self.seuils = seuils
+        self.parts = {}   # Identifiant de thread → comptes non cumulés (dernier = au-delà du plus grand seuil) + somme
+        self.verrou = threading.Lock()
+
+    def observer(self, valeur):
+        part = self.parts.get(get_ident())
+        if part is None:
+            part = self._nouvelle_part()
+        part[bisect.bisect_left(self.seuils, valeur)] += 1
+        part[-1] += valeur
+
+    def _nouvelle_part(self):
+        with self.verrou:
+            return self.parts.setdefault(get_ident(), [0] * (len(self.seuils) + 1) + [0.0])
+
+    def totaux(self):
+        """(comptes non cumulés, somme) toutes parts confondues"""
+        with self.verrou:
+            parts = [list(part) for part in self.parts.values()]
+        comptes = [sum(colonne) for colonne in zip(*(part[:-1] for part in parts))] or [0] * (len(self.seuils) + 1)
+        return comptes, sum(part[-1] for part in parts)
+
+
+class Histogramme:
+    """Répartition de valeurs (durées) dans des seuils fixes, par combinaison d'étiquettes"""
+
+    type_prometheus = 'histogram'
+
+    def __init__(self, nom, aide, etiquettes=(), seuils=SEUILS_DUREE):
+        self.nom = nom
+        self.aide = aide
+        self.etiquettes = tuple(etiquettes)
+        self.seuils = tuple(seuils)
+        self._series = {}
+        self._verrou = threading.Lock()
+
+    def serie(self, **etiquettes):
+        cle = tuple(str(etiquettes.get(nom, '')) for nom in self.etiquettes)
+        serie = self._series.get(cle)
+        if serie is None:
+            with self._verrou:
+                serie = self._series.setdefault(cle, SerieHistogramme(self.seuils))
+        return serie
+
+    def observer(self, valeur, **etiquettes):
+        self.serie(**etiquettes).observer(valeur)
+
+    def lignes(self):
+        with self._verrou:
+            series = sorted(self._series.items())
+        for cle, serie in series:
+            comptes, somme = serie.totaux()
+
+            cumul = 0
+            for seuil, compte in zip(self.seuils + ('+Inf',), comptes):
+                cumul += compte
+                etiquettes = _etiquettes(self.etiquettes + ('le',), cle + (seuil,))
+                yield f"{self.nom}_bucket{etiquettes} {cumul}"
+            etiquettes = _etiquettes(self.etiquettes, cle)
+            yield f"{self.nom}_sum{etiquettes} {somme:.6f}"
+            yield f"{self.nom}_count{etiquettes} {cumul}"
+
+
+class Chronometre:
+    """Context manager : durée du bloc → histogramme des opérations (+ erreurs)"""
+
+    __slots__ = ('operation', 'serie', 'debut')
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.serie = MetriquesService.DUREES.serie(operation=operation)
+
+    def __enter__(self):
+        self.debut = time.perf_counter()
+        return self
+
+    def __exit__(self, type_exception, exception, trace):
+        if MetriquesService.actif():
+            self.serie.observer(time.perf_counter() - self.debut)
+            if type_exception is not None:
+                MetriquesService.ERREURS.inc(operation=self.operation, exception=type_exception.__name__)
+        return False
+
+
+class MetriquesService:
+    """
+    Registre des métriques du processus :
+    - Chronométrage des opérations (décorateurs, context manager)
+    - Compteurs / histogrammes libres
+    - Exposition au format Prometheus
+    """
+
+    _actif = None
+    _registre = {}
+    _verrou = threading.Lock()
+
+    @staticmethod
+    def actif():
+        """
+        METRIQUES_ACTIVES, lu au premier appel puis gardé (lire settings coûte ~0,5 µs)
+        Relu après un setting_changed (override_settings dans les tests)
+        """
+        if MetriquesService._actif is None:
+            MetriquesService._actif = getattr(settings, 'METRIQUES_ACTIVES', True)
+        return MetriquesService._actif
+
+    # ==================== REGISTRE ====================
+
+    @staticmethod
+    def _enregistrer(classe, nom, *args, **kwargs):
+        with MetriquesService._verrou:
+            metrique = MetriquesService._registre.get(nom)
+            if metrique is None:
+                metrique = MetriquesService._registre[nom] = classe(nom, *args, **kwargs)
+            return metrique
+
+    @staticmethod
+    def compteur(nom, aide, etiquettes=()):
+        """Compteur `nom` (créé au premier appel)"""
+        return MetriquesService._enregistrer(Compteur, nom, aide, etiquettes)
+
+    @staticmethod
+    def histogramme(nom, aide, etiquettes=(), seuils=SEUILS_DUREE):
+        """Histogramme `nom` (créé au premier appel)"""
+        return MetriquesService._enregistrer(Histogramme, nom, aide, etiquettes, seuils)
+
+    # ==================== CHRONOMÉTRAGE ====================
+
+    @staticmethod
+    def chronometre(operation):
+        """with MetriquesService.chronometre('operation'): ..."""
+        return Chronometre(operation)
+
+    @staticmethod
+    def chronometrer(operation):
+        """Décorateur : durée de chaque appel (et exceptions levées) sous le nom `operation`"""
+        def decorateur(fonction):
+            observer = MetriquesService.DUREES.serie(operation=operation).observer
+            horloge = time.perf_counter
+
+            @functools.wraps(fonction)
+            def enveloppe(*args, **kwargs):
+                if not MetriquesService.actif():
+                    return fonction(*args, **kwargs)
+                debut = horloge()
+                try:
+                    return fonction(*args, **kwargs)
+                except Exception as e:
+                    MetriquesService.ERREURS.inc(operation=operation, exception=type(e).__name__)
+                    raise
+                finally:
+                    observer(horloge() - debut)
+
+            return enveloppe
+        return decorateur
+
+    @staticmethod
+    def instrumenter(classe):
+        """Décorateur de classe : chronomètre toutes les méthodes statiques publiques"""
+        for nom, attribut in list(vars(classe).items()):
+            if isinstance(attribut, staticmethod) and not nom.startswith('_'):
+                fonction = MetriquesService.chronometrer(f"{classe.__name__}.{nom}")(attribut.__func__)
+                setattr(classe, nom, staticmethod(fonction))
+        return classe
+
+    # ==================== EXPOSITION ====================
+
+    @staticmethod
+    def exposition():
+        """Texte au format d'exposition Prometheus (version 0.0.4)"""
+        with MetriquesService._verrou:
+            metriques = sorted(MetriquesService._registre.values(), key=lambda m: m.nom)
+
+        lignes = []
+        for metrique in metriques:
+            lignes.append(f"# HELP {metrique.nom} {metrique.aide}")
+            lignes.append(f"# TYPE {metrique.nom} {metrique.type_prometheus}")
+            lignes.extend(metrique.lignes())
+        return '\n'.join(lignes) + '\n'
+
+
+# Métriques communes à toutes les opérations chronométrées
+MetriquesService.DUREES = MetriquesService.histogramme(
+    'transportpro_operation_duree_secondes', "Durée des opérations métier chronométrées", ('operation',)
+)
+MetriquesService.ERREURS = MetriquesService.compteur(
+    'transportpro_operation_erreurs_total', "Exceptions levées par les opérations chronométrées", ('operation', 'exception')
+)
+
+
+@receiver(setting_changed)
+def _recharger_reglage(setting, **kwargs):
+    if setting == 'METRIQUES_ACTIVES':
+        MetriquesService._actif = None
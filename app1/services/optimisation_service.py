@@ -0,0 +1,254 @@
+"""
+optimisation_service.py - Ordre de livraison des arrêts d'une tournée
+
+UTILISATION :
+Une tournée part du dépôt, visite chaque destination de ses expéditions puis
+revient au dépôt. Le service calcule un ordre de passage court :
+1. Plus proche voisin depuis le dépôt (solution de départ)
+2. Recherche locale 2-opt (inversion d'un segment) et Or-opt (déplacement de
+   1 à 3 arrêts consécutifs) tant qu'elle améliore et que le budget de temps
+   n'est pas épuisé
+
+Les distances viennent de la matrice précalculée (DistanceService.sous_matrice).
+Les boucles internes sont vectorisées avec numpy : 300 arrêts < 1 seconde.
+
+RÉSULTAT :
+- Expedition.ordre_livraison (1, 2, 3... ; même numéro pour une même destination)
+- Tournee.kilometrage_estime (à comparer au kilométrage réel en fin de tournée)
+
+EXEMPLES :
+- OptimisationTourneeService.optimiser_tournee(tournee)
+- OptimisationTourneeService.optimiser_tournees_prevues(processus=4) → commande optimiser_tournees
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+
+# ==================== ALGORITHME (sans base de données) ====================
+
+def longueur_circuit(matrice, circuit):
+    """Longueur d'un circuit fermé [0, a, b, ..., 0]"""
+    circuit = np.asarray(circuit)
+    return float(matrice[circuit[:-1], circuit[1:]].sum())
+
+
+def plus_proche_voisin(matrice):
+    """Circuit initial : depuis le dépôt (0), toujours l'arrêt non visité le plus proche"""
+    taille = len(matrice)
+    visite = np.zeros(taille, dtype=bool)
+    visite[0] = True
+    circuit = [0]
+    courant = 0
+
+    for _ in range(taille - 1):
+        distances = np.where(visite, np.inf, matrice[courant])
+        courant = int(np.argmin(distances))
+        visite[courant] = True
+        circuit.append(courant)
+
+    circuit.append(0)
+    return np.array(circuit)
+
+
+def deux_opt(matrice, circuit, limite_temps):
+    """
+    2-opt : pour chaque arête (a, b), cherche en une opération vectorisée
+    l'arête (c, d) dont l'échange [a→c, b→d] raccourcit le plus le circuit
+
+    Returns:
+        (circuit, amélioré)
+    """
+    ameliore = False
+    n = len(circuit)
+
+    for i in range(n - 3):
+        if time.perf_counter() > limite_temps:
+            break
+        a, b = circuit[i], circuit[i + 1]
+        c = circuit[i + 2:n - 1]
+        d = circuit[i + 3:n]
+        gains = matrice[a, b] + matrice[c, d] - matrice[a, c] - matrice[b, d]
+        meilleur = int(np.argmax(gains))
+        if gains[meilleur] > 1e-6:
+            j = i + 2 + meilleur
+            circuit[i + 1:j + 1] = circuit[i + 1:j + 1][::-1].copy()
+            ameliore = True
+
+    return circuit, ameliore
+
+
+def or_opt(matrice, circuit, limite_temps):
+    """
+    Or-opt : déplace un segment de 1 à 3 arrêts consécutifs à la meilleure
+    position d'insertion (évaluée en une opération vectorisée)
+
+    Returns:
+        (circuit, amélioré)
+    """
+    ameliore = False
+
+    for longueur in (1, 2, 3):
+        i = 1
+        while i + longueur < len(circuit):
+            if time.perf_counter() > limite_temps:
+                return circuit, ameliore
+
+            precedent, suivant = circuit[i - 1], circuit[i + longueur]
+            premier, dernier = circuit[i], circuit[i + longueur - 1]
+            gain_retrait = matrice[precedent, premier] + matrice[dernier, suivant] - matrice[precedent, suivant]
+
+            reste = np.concatenate([circuit[:i], circuit[i + longueur:]])
+            x, y = reste[:-1], reste[1:]
+            # Insertion entre x et y, dans le sens normal ou inversé
+            cout_normal = matrice[x, premier] + matrice[dernier, y] - matrice[x, y]
+            cout_inverse = matrice[x, dernier] + matrice[premier, y] - matrice[x, y]
+            couts = np.minimum(cout_normal, cout_inverse)
+            position = int(np.argmin(couts))
+
+            if gain_retrait - couts[position] > 1e-6:
+                segment = circuit[i:i + longueur]
+                if cout_inverse[position] < cout_normal[position]:
+                    segment = segment[::-1]
+                circuit = np.concatenate([reste[:position + 1], segment, reste[position + 1:]])
+                ameliore = True
+            else:
+                i += 1
+
+    return circuit, ameliore
+
+
+def optimiser_ordre(matrice, budget_secondes=0.5):
+    """
+    Calcule un ordre de visite court pour la matrice donnée (dépôt en 0)
+
+    Args:
+        matrice (numpy.ndarray): distances (k+1)×(k+1)
+        budget_secondes (float): temps maximum de recherche locale
+
+    Returns:
+        (ordre, longueur): ordre = indices des arrêts (1..k) dans l'ordre de visite
+    """
+    matrice = np.asarray(matrice, dtype=np.float64)
+    if len(matrice) <= 2:
+        ordre = list(range(1, len(matrice)))
+        return ordre, longueur_circuit(matrice, [0] + ordre + [0])
+
+    limite = time.perf_counter() + budget_secondes
+    circuit = plus_proche_voisin(matrice)
+
+    ameliore = True
+    while ameliore and time.perf_counter() < limite:
+        circuit, ameliore_2opt = deux_opt(matrice, circuit, limite)
+        circuit, ameliore_oropt = or_opt(matrice, circuit, limite)
+        ameliore = ameliore_2opt or ameliore_oropt
+
+    return [int(arret) for arret in circuit[1:-1]], longueur_circuit(matrice, circuit)
+
+
+def _optimiser_lot(travail):
+    """Exécuté dans un processus du pool : (tournee_id, matrice, budget) → résultat"""
+    tournee_id, matrice, budget = travail
+    ordre, longueur = optimiser_ordre(matrice, budget)
+    return tournee_id, ordre, longueur
+
+
+# ==================== SERVICE ====================
+
+class OptimisationTourneeService:
+    """
+    Service appliquant l'optimisation aux tournées en base
+    """
+
+    @staticmethod
+    def budget():
+        return getattr(settings, 'OPTIMISATION_BUDGET_SECONDES', 0.5)
+
+    @staticmethod
+    def _preparer(tournee):
+        """
+        Retourne (expeditions, destination_ids, matrice) pour une tournée
+        Les expéditions d'une même destination forment un seul arrêt
+        """
+        from .distance_service import DistanceService
+
+        expeditions = list(tournee.expeditions.only('id', 'destination_id'))
+        destination_ids = list(dict.fromkeys(exp.destination_id for exp in expeditions))
+        matrice = DistanceService.sous_matrice(destination_ids)
+        return expeditions, destination_ids, matrice
+
+    @staticmethod
+    def _enregistrer(tournee_id, expeditions, destination_ids, ordre, longueur):
+        """Écrit ordre_livraison (bulk_update) et kilometrage_estime"""
+        from app1.models import Expedition, Tournee
+
+        rang_destination = {destination_ids[arret - 1]: rang for rang, arret in enumerate(ordre, start=1)}
+        for exp in expeditions:
+            exp.ordre_livraison = rang_destination.get(exp.destination_id)
+
+        Expedition.objects.bulk_update(expeditions, ['ordre_livraison'])
+        Tournee.objects.filter(pk=tournee_id).update(kilometrage_estime=round(longueur))
+
+        return {
+            'tournee_id': tournee_id,
+            'nb_arrets': len(destination_ids),
+            'kilometrage_estime': round(longueur),
+        }
+
+    @staticmethod
+    def optimiser_tournee(tournee, budget_secondes=None):
+        """
+        Optimise l'ordre de livraison d'une tournée
+
+        Returns:
+            dict: {'tournee_id', 'nb_arrets', 'kilometrage_estime'}
+        """
+        expeditions, destination_ids, matrice = OptimisationTourneeService._preparer(tournee)
+        if not destination_ids:
+            return {'tournee_id': tournee.id, 'nb_arrets': 0, 'kilometrage_estime': 0}
+
+        ordre, longueur = optimiser_ordre(matrice, budget_secondes or OptimisationTourneeService.budget())
+        return OptimisationTourneeService._enregistrer(tournee.id, expeditions, destination_ids, ordre, longueur)
+
+    @staticmethod
+    def optimiser_tournees_prevues(processus=None):
+        """
+        Optimise toutes les tournées PREVUE
+        Les calculs tournent dans des processus séparés (ProcessPoolExecutor) ;
+        la lecture et l'écriture en base restent dans le processus principal
+
+        Returns:
+            list: résultats de optimiser_tournee pour chaque tournée
+        """
+        from app1.models import Tournee
+
+        budget = OptimisationTourneeService.budget()
+        preparations = {}
+        travaux = []
+
+        for tournee in Tournee.objects.filter(statut='PREVUE'):
+            expeditions, destination_ids, matrice = OptimisationTourneeService._preparer(tournee)
+            if destination_ids:
+                preparations[tournee.id] = (expeditions, destination_ids)
+                travaux.append((tournee.id, matrice, budget))
+
+        if not travaux:
+            return []
+
+        if processus == 1 or len(travaux) == 1:
+            resultats = map(_optimiser_lot, travaux)
+            return [
+                OptimisationTourneeService._enregistrer(tournee_id, *preparations[tournee_id], ordre, longueur)
+                for tournee_id, ordre, longueur in resultats
+            ]
+
+        with ProcessPoolExecutor(max_workers=processus) as pool:
+            resultats = list(pool.map(_optimiser_lot, travaux))
+
+        return [
+            OptimisationTourneeService._enregistrer(tournee_id, *preparations[tournee_id], ordre, longueur)
+            for tournee_id, ordre, longueur in resultats
+        ]
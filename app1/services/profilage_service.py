@@ -0,0 +1,388 @@
+"""
+profilage_service.py - Profilage par échantillonnage des requêtes lentes et des tâches planifiées
+
+UTILISATION :
+Désactivé par défaut (PROFILAGE_ACTIF, variable d'environnement PROFILAGE_ACTIF=1).
+Une fois activé :
+- ProfilageMiddleware échantillonne chaque requête HTTP ; le profil n'est écrit
+  que si la requête a duré plus de PROFILAGE_SEUIL_MS
+- chaque exécution d'une tâche du scheduler est profilée et écrite (@ProfilageService.profiler)
+
+Un seul thread "échantillonneur" relève toutes les PROFILAGE_INTERVALLE_MS la pile
+du thread de chaque session en cours (sys._current_frames) : aucun traçage des
+appels, le code profilé tourne à vitesse normale. Le thread dort quand rien n'est profilé.
+Les sessions sont indépendantes du thread qui les porte : sous ASGI, plusieurs
+requêtes synchrones peuvent partager un thread, chacune garde sa session
+(la session courante est portée par une ContextVar, pas par le thread).
+
+Les profils sont écrits dans PROFILAGE_REPERTOIRE, avec un quota par catégorie
+(les plus anciens supprimés au-delà) : PROFILAGE_FICHIERS_MAX pour les requêtes,
+PROFILAGE_FICHIERS_MAX_TACHES pour les tâches (écrites à chaque exécution, elles
+ne chassent jamais les profils de requêtes lentes). Formats :
+- 'speedscope' : fichier .speedscope.json à ouvrir sur https://www.speedscope.app
+- 'collapsed'  : fichier .folded (une pile par ligne, "a;b;c 12"), pour flamegraph.pl
+Page de consultation (responsables) : /diagnostic/profils/
+
+EXEMPLES :
+- session = ProfilageService.debut('GET /') ... ProfilageService.fin(session) → fichier du profil
+- @ProfilageService.profiler('tache:taches_matin') sur une fonction
+- ProfilageService.fichiers() → profils disponibles, les plus récents d'abord
+- ProfilageService.frames_chaudes(nom) → frames les plus échantillonnées d'un profil
+"""
+
+import contextvars
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+
+EXTENSIONS = {'speedscope': '.speedscope.json', 'collapsed': '.folded'}
+CATEGORIES = ('requete', 'tache')
+
+# Session en cours dans ce contexte (requête, tâche) : une tâche appelée pendant
+# une requête profilée n'ouvre pas de seconde session
+_session_courante = contextvars.ContextVar('profilage_session', default=None)
+
+
+class SessionProfilage:
+    """Échantillons de pile du thread d'une requête / tâche entre debut() et fin()"""
+
+    def __init__(self, nom, thread_id, categorie='requete'):
+        self.nom = nom
+        self.thread_id = thread_id
+        self.categorie = categorie
+        self.jeton = None                # ContextVar rétablie par fin()
+        self.echantillons = Counter()   # {(code racine, ..., code feuille): nombre}
+        self.debut = time.perf_counter()
+        self.horodatage = timezone.now()
+        self.duree = None
+
+    def ajouter(self, frame):
+        pile = []
+        while frame is not None:
+            pile.append(frame.f_code)
+            frame = frame.f_back
+        pile.reverse()
+        self.echantillons[tuple(pile)] += 1
+
+
+class Echantillonneur(threading.Thread):
+    """Thread unique qui relève périodiquement la pile du thread de chaque session"""
+
+    def __init__(self):
+        super().__init__(name='echantillonneur-profilage', daemon=True)
+        self.sessions = set()           # Plusieurs sessions peuvent partager un thread
+        self.verrou = threading.Lock()
+        self.reveil = threading.Event()
+
+    def suivre(self, session):
+        with self.verrou:
+            self.sessions.add(session)
+        self.reveil.set()
+
+    def arreter(self, session):
+        with self.verrou:
+            self.sessions.discard(session)
+
+    def run(self):
+        intervalle = getattr(settings, 'PROFILAGE_INTERVALLE_MS', 10) / 1000
+        while True:
+            if not self.sessions:
+                self.reveil.wait()
+                self.reveil.clear()
+                continue
+
+            frames = sys._current_frames()
+            with self.verrou:
+                for session in self.sessions:
+                    frame = frames.get(session.thread_id)
+                    if frame is not None:
+                        session.ajouter(frame)
+            del frames
+            time.sleep(intervalle)
+
+
+class ProfilageService:
+    """
+    Service de profilage :
+    - Sessions d'échantillonnage par thread
+    - Écriture des profils (speedscope / collapsed) avec rotation
+    - Lecture des profils pour la page de consultation
+    """
+
+    _echantillonneur = None
+    _verrou = threading.Lock()
+
+    # ==================== ÉCHANTILLONNAGE ====================
+
+    @staticmethod
+    def actif():
+        return getattr(settings, 'PROFILAGE_ACTIF', False)
+
+    @staticmethod
+    def echantillonneur():
+        """Thread échantillonneur du processus (démarré au premier profil)"""
+        if ProfilageService._echantillonneur is None:
+            with ProfilageService._verrou:
+                if ProfilageService._echantillonneur is None:
+                    echantillonneur = Echantillonneur()
+                    echantillonneur.start()
+                    ProfilageService._echantillonneur = echantillonneur
+        return ProfilageService._echantillonneur
+
+    @staticmethod
+    def debut(nom, categorie='requete'):
+        """Commence à échantillonner le thread courant pour une nouvelle session"""
+        session = SessionProfilage(nom, threading.get_ident(), categorie)
+        session.jeton = _session_courante.set(session)
+        ProfilageService.echantillonneur().suivre(session)
+        return session
+
+    @staticmethod
+    def session_courante():
+        """Session ouverte dans ce contexte (requête / tâche en cours) ou None"""
+        return _session_courante.get()
+
+    @staticmethod
+    def fin(session, seuil_ms=0):
+        """
+        Arrête l'échantillonnage ; écrit le profil si la durée dépasse `seuil_ms`
+
+        Returns:
+            Path | None: fichier écrit
+        """
+        ProfilageService.echantillonneur().arreter(session)
+        session.duree = time.perf_counter() - session.debut
+        try:
+            _session_courante.reset(session.jeton)
+        except ValueError:
+            # fin() appelée depuis un autre contexte que debut()
+            pass
+
+        if session.duree * 1000 < seuil_ms or not session.echantillons:
+            return None
+        return ProfilageService.ecrire(session)
+
+    @staticmethod
+    def profiler(nom):
+        """
+        Décorateur : profil écrit à CHAQUE appel (tâches planifiées, commandes), quota des tâches
+        Appelée pendant une session déjà ouverte (requête profilée) : comptée dans celle-ci
+        """
+        def decorateur(fonction):
+            @wraps(fonction)
+            def enveloppe(*args, **kwargs):
+                if not ProfilageService.actif() or _session_courante.get() is not None:
+                    return fonction(*args, **kwargs)
+                session = ProfilageService.debut(nom, categorie='tache')
+                try:
+                    return fonction(*args, **kwargs)
+                finally:
+                    ProfilageService.fin(session)
+            return enveloppe
+        return decorateur
+
+    # ==================== ÉCRITURE ====================
+
+    @staticmethod
+    def repertoire():
+        return Path(getattr(settings, 'PROFILAGE_REPERTOIRE', Path(settings.BASE_DIR) / 'profils'))
+
+    @staticmethod
+    def libelle(code):
+        """'app1/views.py:home:120' (chemin relatif au projet ou à site-packages)"""
+        chemin = code.co_filename
+        if 'site-packages' + os.sep in chemin:
+            chemin = chemin.split('site-packages' + os.sep, 1)[1]
+        else:
+            base = str(settings.BASE_DIR) + os.sep
+            if chemin.startswith(base):
+                chemin = chemin[len(base):]
+        return f"{chemin}:{code.co_name}:{code.co_firstlineno}"
+
+    @staticmethod
+    def ecrire(session):
+        """Écrit le profil d'une session terminée puis applique la rotation"""
+        repertoire = ProfilageService.repertoire()
+        repertoire.mkdir(parents=True, exist_ok=True)
+
+        format_profil = getattr(settings, 'PROFILAGE_FORMAT', 'speedscope')
+        nom = re.sub(r'[^A-Za-z0-9_.-]+', '-', session.nom).strip('-')[:80]
+        horodatage = timezone.localtime(session.horodatage).strftime('%Y%m%d-%H%M%S-%f')
+        chemin = repertoire / (
+            f"{horodatage}_{session.categorie}_{nom}_{round(session.duree * 1000)}ms{EXTENSIONS[format_profil]}"
+        )
+
+        libelles = {}
+        for pile in session.echantillons:
+            for code in pile:
+                if code not in libelles:
+                    libelles[code] = ProfilageService.libelle(code)
+        piles = [([libelles[code] for code in pile], nombre) for pile, nombre in session.echantillons.most_common()]
+
+        if format_profil == 'collapsed':
+            contenu = ''.join(f"{';'.join(pile)} {nombre}\n" for pile, nombre in piles)
+        else:
+            contenu = json.dumps(ProfilageService.speedscope(session, piles))
+
+        temporaire = chemin.with_name(chemin.name + '.tmp')
+        temporaire.write_text(contenu, encoding='utf-8')
+        os.replace(temporaire, chemin)
+
+        ProfilageService.rotation(session.categorie)
+        return chemin
+
+    @staticmethod
+    def speedscope(session, piles):
+        """Profil "sampled" au format de fichier speedscope (poids en millisecondes)"""
+        intervalle = getattr(settings, 'PROFILAGE_INTERVALLE_MS', 10)
+        index = {}
+        frames = []
+        echantillons = []
+        poids = []
+
+        for pile, nombre in piles:
+            indices = []
+            for libelle in pile:
+                if libelle not in index:
+                    index[libelle] = len(frames)
+                    fichier, fonction, ligne = libelle.rsplit(':', 2)
+                    frames.append({'name': fonction, 'file': fichier, 'line': int(ligne)})
+                indices.append(index[libelle])
+            echantillons.append(indices)
+            poids.append(nombre * intervalle)
+
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': session.nom,
+            'exporter': 'transportpro',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': f"{session.nom} ({round(session.duree * 1000)} ms)",
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': sum(poids),
+                'samples': echantillons,
+                'weights': poids,
+            }],
+        }
+
+    @staticmethod
+    def rotation(categorie='requete'):
+        """Supprime les profils les plus anciens de la catégorie au-delà de son quota"""
+        if categorie == 'tache':
+            maximum = getattr(settings, 'PROFILAGE_FICHIERS_MAX_TACHES', 50)
+        else:
+            maximum = getattr(settings, 'PROFILAGE_FICHIERS_MAX', 200)
+        profils = [profil for profil in ProfilageService.fichiers() if profil['categorie'] == categorie]
+        for ancien in profils[maximum:]:
+            (ProfilageService.repertoire() / ancien['nom']).unlink(missing_ok=True)
+
+    # ==================== CONSULTATION ====================
+
+    # Catégorie absente : profils écrits avant les quotas séparés (requêtes)
+    MOTIF_FICHIER = re.compile(r'^(\d{8}-\d{6}-\d{6})_(?:(requete|tache)_)?(.+)_(\d+)ms(\.speedscope\.json|\.folded)$')
+
+    @staticmethod
+    def fichiers():
+        """Profils disponibles (les plus récents d'abord)"""
+        repertoire = ProfilageService.repertoire()
+        if not repertoire.is_dir():
+            return []
+
+        profils = []
+        for entree in os.scandir(repertoire):
+            correspondance = ProfilageService.MOTIF_FICHIER.match(entree.name)
+            if correspondance is None:
+                continue
+            horodatage, categorie, nom, duree, extension = correspondance.groups()
+            profils.append({
+                'nom': entree.name,
+                'date': datetime.strptime(horodatage, '%Y%m%d-%H%M%S-%f'),
+                'categorie': categorie or 'requete',
+                'source': nom,
+                'duree_ms': int(duree),
+                'format': 'speedscope' if extension == '.speedscope.json' else 'collapsed',
+                'taille_ko': round(entree.stat().st_size / 1024, 1),
+            })
+        return sorted(profils, key=lambda profil: profil['nom'], reverse=True)
+
+    @staticmethod
+    def chemin(nom):
+        """Chemin d'un profil existant (None si le nom n'est pas un profil du répertoire)"""
+        if ProfilageService.MOTIF_FICHIER.match(nom) is None:
+            return None
+        chemin = ProfilageService.repertoire() / nom
+        return chemin if chemin.is_file() else None
+
+    @staticmethod
+    def lire(nom):
+        """Piles d'un profil : [(liste de libellés racine → feuille, nombre d'échantillons)]"""
+        chemin = ProfilageService.chemin(nom)
+        if chemin is None:
+            return []
+
+        if nom.endswith('.folded'):
+            piles = []
+            for ligne in chemin.read_text(encoding='utf-8').splitlines():
+                pile, _, nombre = ligne.rpartition(' ')
+                if pile:
+                    piles.append((pile.split(';'), int(nombre)))
+            return piles
+
+        donnees = json.loads(chemin.read_text(encoding='utf-8'))
+        frames = [f"{f['file']}:{f['name']}:{f['line']}" for f in donnees['shared']['frames']]
+        profil = donnees['profiles'][0]
+        intervalle = getattr(settings, 'PROFILAGE_INTERVALLE_MS', 10)
+        return [
+            ([frames[i] for i in indices], max(1, round(poids / intervalle)))
+            for indices, poids in zip(profil['samples'], profil['weights'])
+        ]
+
+    @staticmethod
+    def frames_chaudes(nom, limite=30, prefixe='app1'):
+        """
+        Frames les plus présentes dans les échantillons d'un profil
+
+        - propre : échantillons où la frame est en haut de pile (temps passé DANS la fonction)
+        - cumule : échantillons où la frame apparaît (temps passé dans la fonction ET ses appels)
+        - prefixe : ne garder que les frames du code de l'application (None = toutes)
+
+        Returns:
+            dict: total d'échantillons et frames triées par temps cumulé
+        """
+        piles = ProfilageService.lire(nom)
+        total = sum(nombre for _, nombre in piles)
+        propre = Counter()
+        cumule = Counter()
+
+        for pile, nombre in piles:
+            if not pile:
+                continue
+            propre[pile[-1]] += nombre
+            for libelle in set(pile):
+                cumule[libelle] += nombre
+
+        frames = [
+            {
+                'frame': libelle,
+                'cumule': nombre,
+                'cumule_pct': round(100 * nombre / total, 1),
+                'propre': propre[libelle],
+                'propre_pct': round(100 * propre[libelle] / total, 1),
+            }
+            for libelle, nombre in cumule.most_common()
+            if prefixe is None or libelle.startswith(prefixe)
+        ]
+        return {'total': total, 'frames': frames[:limite]}
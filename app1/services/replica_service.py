@@ -0,0 +1,146 @@
+"""
+replica_service.py - Réplica analytique SQLite
+
+UTILISATION :
+La base 'analytics' est une copie de db.sqlite3 faite avec l'API de sauvegarde
+en ligne de SQLite (sqlite3.Connection.backup). La copie avance par paquets de
+pages pour ne pas bloquer les écritures de l'application.
+
+EXEMPLES :
+- ReplicaService.rafraichir() → nouvelle copie (scheduler / commande rafraichir_replica)
+- ReplicaService.retard() → âge de la copie en secondes (indicateur de retard)
+"""
+
+import sqlite3
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+class ReplicaService:
+    """
+    Service gérant la copie périodique de la base principale vers la réplica
+    """
+
+    # Table de métadonnées écrite dans la réplica après chaque copie
+    TABLE_META = 'replica_meta'
+
+    # Cache (par processus) de l'horodatage de la copie, relu toutes les N secondes
+    DUREE_CACHE = 5
+    _cache = {'horodatage': None, 'lu_le': 0.0}
+
+    @staticmethod
+    def _chemins():
+        principal = settings.DATABASES['default']
+        replica = settings.DATABASES.get('analytics')
+
+        if not replica:
+            return None, None
+        if connections['default'].vendor != 'sqlite' or connections['analytics'].vendor != 'sqlite':
+            return None, None
+
+        return str(principal['NAME']), str(replica['NAME'])
+
+    @staticmethod
+    def rafraichir(pages_par_etape=1024, pause=0.005):
+        """
+        Copie la base principale vers la réplica (API backup SQLite)
+
+        Args:
+            pages_par_etape (int): nombre de pages copiées à chaque étape
+            pause (float): pause (secondes) entre deux étapes pour laisser passer les écritures
+
+        Returns:
+            dict: {'duree': secondes, 'horodatage': epoch de la copie} ou None si non SQLite
+        """
+        source, destination = ReplicaService._chemins()
+        if not source:
+            return None
+
+        debut = time.time()
+
+        # Horodatage pris AVANT la copie : toute écriture postérieure est considérée non copiée
+        horodatage = debut
+
+        connexion_source = sqlite3.connect(source)
+        connexion_replica = sqlite3.connect(destination)
+        try:
+            connexion_source.backup(connexion_replica, pages=pages_par_etape, sleep=pause)
+
+            connexion_replica.execute(
+                f"CREATE TABLE IF NOT EXISTS {ReplicaService.TABLE_META} (cle TEXT PRIMARY KEY, valeur TEXT)"
+            )
+            connexion_replica.execute(
+                f"INSERT OR REPLACE INTO {ReplicaService.TABLE_META} (cle, valeur) VALUES ('horodatage', ?)",
+                (str(horodatage),)
+            )
+            connexion_replica.commit()
+        finally:
+            connexion_replica.close()
+            connexion_source.close()
+
+        ReplicaService._cache = {'horodatage': horodatage, 'lu_le': time.time()}
+
+        return {
+            'duree': round(time.time() - debut, 3),
+            'horodatage': horodatage,
+        }
+
+    @staticmethod
+    def horodatage_copie():
+        """
+        Epoch de la dernière copie (None si la réplica n'a jamais été rafraîchie)
+        Lu dans la réplica elle-même pour fonctionner entre plusieurs processus
+        """
+        maintenant = time.time()
+        cache = ReplicaService._cache
+        if maintenant - cache['lu_le'] < ReplicaService.DUREE_CACHE:
+            return cache['horodatage']
+
+        _, destination = ReplicaService._chemins()
+        horodatage = None
+
+        if destination:
+            try:
+                connexion = sqlite3.connect(f"file:{destination}?mode=ro", uri=True)
+                try:
+                    ligne = connexion.execute(
+                        f"SELECT valeur FROM {ReplicaService.TABLE_META} WHERE cle = 'horodatage'"
+                    ).fetchone()
+                finally:
+                    connexion.close()
+                if ligne:
+                    horodatage = float(ligne[0])
+            except sqlite3.Error:
+                horodatage = None
+
+        ReplicaService._cache = {'horodatage': horodatage, 'lu_le': maintenant}
+        return horodatage
+
+    @staticmethod
+    def retard():
+        """
+        Indicateur de retard de la réplica en secondes (None si jamais copiée)
+        """
+        horodatage = ReplicaService.horodatage_copie()
+        if horodatage is None:
+            return None
+        return round(time.time() - horodatage, 1)
+
+    @staticmethod
+    def etat():
+        """
+        Résumé pour l'affichage (tableau de bord)
+        """
+        from app1.routers import base_analytique
+
+        retard = ReplicaService.retard()
+        retard_max = getattr(settings, 'REPLICA_RETARD_MAX', 600)
+
+        return {
+            'active': getattr(settings, 'REPLICA_ANALYTIQUE_ACTIVE', False),
+            'retard': retard,
+            'en_retard': retard is None or retard > retard_max,
+            'base_utilisee': base_analytique(),
+        }
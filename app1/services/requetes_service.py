@@ -0,0 +1,179 @@
+"""
+requetes_service.py - Mesure des requêtes SQL par vue (budgets, détection N+1)
+
+UTILISATION :
+BudgetRequetesMiddleware mesure chaque requête HTTP :
+- nombre de requêtes SQL et temps SQL total (toutes les bases : principale + réplica)
+- "empreintes" répétées : même SQL à des valeurs près (WHERE id = 1, 2, 3...)
+  exécuté REQUETES_SEUIL_REPETITION fois ou plus → N+1 probable
+
+Les budgets sont déclarés dans app1/urls.py (BUDGETS_REQUETES, par nom d'URL).
+Dépassement de budget ou N+1 :
+- avertissement dans le journal "app1.requetes"
+- vue ajoutée aux "contrevenants" (GET /api/diagnostic/requetes/)
+- exception BudgetRequetesDepasse si REQUETES_BUDGET_STRICT (tests, CI)
+
+Chaque réponse porte un en-tête Server-Timing (temps SQL visible dans les
+outils de développement du navigateur).
+
+EXEMPLES :
+- with RequetesService.mesurer() as mesure: ... → mesure.nb, mesure.duree, mesure.repetitions()
+- RequetesService.contrevenants() → vues hors budget depuis le démarrage
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('app1.requetes')
+
+
+class BudgetRequetesDepasse(AssertionError):
+    """Vue au-delà de son budget de requêtes (mode strict)"""
+
+
+class MesureRequetes:
+    """
+    Enregistre les requêtes exécutées dans un bloc `with`, sur toutes les bases
+    (connection.execute_wrapper : aucun coût quand aucune mesure n'est active)
+    """
+
+    def __init__(self):
+        self.requetes = []   # [(empreinte, sql, durée)]
+        self._pile = None
+
+    def __enter__(self):
+        self._pile = ExitStack()
+        for alias in connections:
+            self._pile.enter_context(connections[alias].execute_wrapper(self._enregistrer))
+        return self
+
+    def __exit__(self, *exc):
+        self._pile.close()
+        return False
+
+    def _enregistrer(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.requetes.append((RequetesService.empreinte(sql), sql, time.perf_counter() - debut))
+
+    @property
+    def nb(self):
+        return len(self.requetes)
+
+    @property
+    def duree(self):
+        """Temps SQL total (secondes)"""
+        return sum(duree for _, _, duree in self.requetes)
+
+    def repetitions(self, seuil=None):
+        """
+        Empreintes exécutées au moins `seuil` fois (défaut : REQUETES_SEUIL_REPETITION)
+
+        Returns:
+            list: [(nombre, exemple de SQL)] du plus répété au moins répété
+        """
+        seuil = seuil or getattr(settings, 'REQUETES_SEUIL_REPETITION', 5)
+        compteur = Counter(empreinte for empreinte, _, _ in self.requetes)
+        exemples = {empreinte: sql for empreinte, sql, _ in self.requetes}
+        return [(nombre, exemples[empreinte]) for empreinte, nombre in compteur.most_common() if nombre >= seuil]
+
+
+class RequetesService:
+    """
+    Service de mesure SQL :
+    - Empreintes de requêtes
+    - Budgets par nom d'URL
+    - Registre des contrevenants du processus
+    """
+
+    _contrevenants = {}
+    _verrou = threading.Lock()
+
+    # ==================== EMPREINTES ====================
+
+    LITTERAUX = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    LISTES = re.compile(r"\((?:\s*%s\s*,)+\s*%s\s*\)|\((?:\s*\?\s*,)+\s*\?\s*\)")
+
+    @staticmethod
+    def empreinte(sql):
+        """SQL sans ses valeurs : 'WHERE id = 3' et 'WHERE id = 7' ont la même empreinte"""
+        sql = RequetesService.LITTERAUX.sub('?', sql)
+        return RequetesService.LISTES.sub('(...)', sql)
+
+    # ==================== MESURE ====================
+
+    @staticmethod
+    def mesurer():
+        """Context manager : with RequetesService.mesurer() as mesure: ..."""
+        return MesureRequetes()
+
+    @staticmethod
+    def budget(nom_url):
+        """Budget déclaré dans app1/urls.py (None = pas de limite)"""
+        from app1.urls import BUDGETS_REQUETES
+        return BUDGETS_REQUETES.get(nom_url, getattr(settings, 'REQUETES_BUDGET_DEFAUT', None))
+
+    @staticmethod
+    def controler(nom_url, mesure):
+        """
+        Compare une mesure au budget de la vue
+
+        Returns:
+            list: problèmes constatés (vide si la vue respecte son budget)
+        """
+        problemes = []
+
+        budget = RequetesService.budget(nom_url)
+        if budget is not None and mesure.nb > budget:
+            problemes.append(f"{mesure.nb} requêtes pour un budget de {budget}")
+
+        for nombre, sql in mesure.repetitions():
+            problemes.append(f"N+1 probable ({nombre}×) : {sql[:200]}")
+
+        return problemes
+
+    @staticmethod
+    def signaler(nom_url, chemin, mesure, problemes):
+        """Journal + registre des contrevenants ; exception en mode strict"""
+        message = (
+            f"{nom_url} ({chemin}) : {mesure.nb} requêtes, {mesure.duree * 1000:.1f} ms SQL — "
+            + " ; ".join(problemes)
+        )
+        logger.warning(message)
+
+        with RequetesService._verrou:
+            entree = RequetesService._contrevenants.setdefault(nom_url, {
+                'vue': nom_url, 'occurrences': 0, 'requetes_max': 0, 'duree_sql_max_ms': 0.0,
+                'budget': RequetesService.budget(nom_url),
+            })
+            entree['occurrences'] += 1
+            entree['requetes_max'] = max(entree['requetes_max'], mesure.nb)
+            entree['duree_sql_max_ms'] = max(entree['duree_sql_max_ms'], round(mesure.duree * 1000, 1))
+            entree['dernier_chemin'] = chemin
+            entree['problemes'] = problemes
+
+        if getattr(settings, 'REQUETES_BUDGET_STRICT', False):
+            raise BudgetRequetesDepasse(message)
+
+    @staticmethod
+    def contrevenants():
+        """Vues hors budget depuis le démarrage du processus, les plus gourmandes d'abord"""
+        with RequetesService._verrou:
+            return sorted(
+                (dict(entree) for entree in RequetesService._contrevenants.values()),
+                key=lambda entree: entree['requetes_max'], reverse=True
+            )
+
+    @staticmethod
+    def reinitialiser():
+        with RequetesService._verrou:
+            RequetesService._contrevenants.clear()
@@ -0,0 +1,522 @@
+"""
+sauvegarde_service.py - Sauvegarde / restauration des données en flux
+
+UTILISATION :
+loaddata lit tout le fichier en mémoire puis enregistre les objets un par un
+(save() → signaux : creer_tarifications_automatiquement recrée au passage des
+tarifications déjà présentes dans la sauvegarde). Ici, la mémoire dépend de la
+taille des lots, pas de celle de la base :
+
+- Sauvegarde : NDJSON (un objet dumpdata par ligne, format "jsonl" de Django,
+  relisible par loaddata), une table par worker, tables dans l'ordre des
+  dépendances, compression selon l'extension (.gz, .bz2, .xz)
+- Restauration : objets décodés un à un (JSON dumpdata, même indenté, ou
+  NDJSON ; lignes parasites en tête ignorées, ex. sorties du scheduler
+  capturées par `dumpdata > fichier`), bulk_create par modèle et par lot,
+  signaux suspendus, horodatages (auto_now) conservés, le tout dans une seule
+  transaction : contraintes vérifiées à la fin, rien n'est écrit en cas d'erreur
+
+Les types de contenu et permissions (recréés par migrate, avec des ids
+propres à chaque base) sont référencés par clé naturelle.
+
+Cohérence de la sauvegarde parallèle : sur PostgreSQL, les workers partagent
+l'instantané de la transaction principale (pg_export_snapshot). Sur SQLite, la
+transaction principale tient le verrou d'écriture (les écrivains attendent) et
+chaque worker lit dans une transaction de lecture (transaction_lecture : BEGIN
+différé, sans la porte d'écriture que tient déjà la transaction principale).
+
+EXEMPLES :
+- SauvegardeService.sauvegarder('sauvegardes/base.jsonl.gz', workers=4)
+  → {'app1.client': 5, 'app1.expedition': 4, ...}
+- SauvegardeService.restaurer('backup_data.json')
+  → {'app1.client': 5, ...}
+- SauvegardeService.restaurer('sauvegarde_data.json', exclus=SauvegardeService.EXCLUS + ['admin'])
+  (journal d'administration d'une autre base : utilisateurs absents du fichier)
+"""
+
+import bz2
+import gzip
+import itertools
+import json
+import lzma
+import os
+import shutil
+import tempfile
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.serializers.python import Deserializer
+from django.db import DEFAULT_DB_ALIAS, connections, models, reset_queries, transaction
+from django.utils.encoding import is_protected_type
+
+from app1.backends.sqlite.base import transaction_lecture
+
+from .donnees_service import signaux_suspendus
+from .sequence_service import SequenceService
+
+# Extension → module de compression (flux concaténables : une partie compressée par table)
+COMPRESSIONS = {'.gz': gzip, '.bz2': bz2, '.xz': lzma}
+SIGNATURES = [(b'\x1f\x8b', gzip), (b'BZh', bz2), (b'\xfd7zXZ\x00', lzma)]
+
+
+@contextmanager
+def horodatages_conserves(modele):
+    """
+    Désactive auto_now / auto_now_add du modèle le temps d'un bulk_create
+    (sinon Django remplace les dates sauvegardées par l'heure courante)
+    """
+    champs = [champ for champ in modele._meta.concrete_fields
+              if getattr(champ, 'auto_now', False) or getattr(champ, 'auto_now_add', False)]
+    sauvegarde = [(champ, champ.auto_now, champ.auto_now_add) for champ in champs]
+    for champ in champs:
+        champ.auto_now = champ.auto_now_add = False
+    try:
+        yield
+    finally:
+        for champ, auto_now, auto_now_add in sauvegarde:
+            champ.auto_now, champ.auto_now_add = auto_now, auto_now_add
+
+
+class SauvegardeService:
+    """
+    Service de sauvegarde / restauration :
+    - Fichiers (compression, lecture incrémentale)
+    - Sauvegarde parallèle par table
+    - Restauration par lots
+    """
+
+    TAILLE_LOT = 2000
+    TAILLE_BLOC = 1 << 16        # Caractères lus à la fois pendant la restauration
+    EXCLUS = ['contenttypes', 'auth.permission', 'sessions']
+    TYPES_NATIFS = (             # Valeurs déjà sérialisables (None, nombres, textes, dates) ; pas les sous-classes
+        models.AutoField, models.BigAutoField, models.SmallAutoField, models.BigIntegerField,
+        models.BooleanField, models.CharField, models.DateField, models.DateTimeField,
+        models.DecimalField, models.EmailField, models.FloatField, models.IntegerField,
+        models.PositiveBigIntegerField, models.PositiveIntegerField, models.PositiveSmallIntegerField,
+        models.SmallIntegerField, models.TextField, models.TimeField,
+    )
+    NUMEROTES = {'app1.facture', 'app1.paiement', 'app1.incident', 'app1.reclamation', 'app1.sequencedocument'}
+    NIVEAU_GZIP = 6              # 9 (défaut de gzip) : 3x plus lent pour quelques % gagnés
+
+    # ==================== FICHIERS ====================
+
+    @staticmethod
+    def ouvrir(chemin, mode='rt'):
+        """Fichier texte UTF-8, compressé selon l'extension (écriture) ou la signature (lecture)"""
+        module = COMPRESSIONS.get(Path(chemin).suffix)
+        if 'r' in mode:
+            with open(chemin, 'rb') as fichier:
+                entete = fichier.read(6)
+            module = next((module for signature, module in SIGNATURES if entete.startswith(signature)), None)
+        if module is None:
+            return open(chemin, mode, encoding='utf-8')
+        if module is gzip and 'w' in mode:
+            return gzip.open(chemin, mode, compresslevel=SauvegardeService.NIVEAU_GZIP, encoding='utf-8')
+        return module.open(chemin, mode, encoding='utf-8')
+
+    @staticmethod
+    def lire_objets(flux):
+        """
+        Objets d'un fichier dumpdata (tableau JSON, indenté ou non) ou NDJSON, un à la fois
+        Les lignes qui précèdent le premier '[' ou '{' sont ignorées
+        """
+        decodeur = json.JSONDecoder()
+        tampon = ''
+        for ligne in flux:
+            if ligne.lstrip().startswith(('[', '{')):
+                tampon = ligne
+                break
+
+        position = 0
+        while True:
+            # Séparateurs entre objets : blancs, virgules, crochet ouvrant ; crochet fermant = fin
+            while position < len(tampon) and tampon[position] in ' \t\r\n,[':
+                position += 1
+            if position < len(tampon) and tampon[position] == ']':
+                return
+            try:
+                if position >= len(tampon):
+                    raise ValueError
+                objet, position = decodeur.raw_decode(tampon, position)
+            except ValueError:
+                # Objet incomplet (ou tampon vide) : lire la suite
+                bloc = flux.read(SauvegardeService.TAILLE_BLOC)
+                if not bloc:
+                    if tampon[position:].strip():
+                        raise
+                    return
+                tampon, position = tampon[position:] + bloc, 0
+                continue
+            yield objet
+
+    # ==================== MODÈLES ====================
+
+    @staticmethod
+    def modeles(etiquettes=None, exclus=None):
+        """
+        Modèles à sauvegarder, dans l'ordre des dépendances (clés étrangères d'abord)
+
+        Args:
+            etiquettes: ['app1', 'auth.group', ...] (défaut : toutes les applications)
+            exclus: applications / modèles ignorés (défaut : EXCLUS)
+        """
+        exclus = {e.lower() for e in (SauvegardeService.EXCLUS if exclus is None else exclus)}
+        if etiquettes:
+            candidats = []
+            for etiquette in etiquettes:
+                if '.' in etiquette:
+                    candidats.append(apps.get_model(etiquette))
+                else:
+                    candidats.extend(apps.get_app_config(etiquette).get_models())
+        else:
+            candidats = apps.get_models()
+
+        modeles = [
+            modele for modele in dict.fromkeys(candidats)
+            if not modele._meta.proxy and modele._meta.managed
+            and modele._meta.app_label not in exclus and modele._meta.label_lower not in exclus
+        ]
+        return SauvegardeService.trier(modeles)
+
+    @staticmethod
+    def trier(modeles):
+        """Tri topologique sur les relations (cycle : ordre d'origine, contraintes vérifiées en fin de transaction)"""
+        restants = list(modeles)
+        ordre = []
+        while restants:
+            places = set(ordre)
+            suivant = next(
+                (modele for modele in restants
+                 if all(dependance in places or dependance not in restants or dependance is modele
+                        for dependance in SauvegardeService.dependances(modele))),
+                restants[0],
+            )
+            ordre.append(suivant)
+            restants.remove(suivant)
+        return ordre
+
+    @staticmethod
+    def dependances(modele):
+        return {
+            champ.related_model for champ in [*modele._meta.concrete_fields, *modele._meta.many_to_many]
+            if champ.is_relation and champ.related_model is not None
+        }
+
+    @staticmethod
+    def cles_naturelles():
+        """
+        {modèle: {pk: clé naturelle}} des références recréées par migrate avec des ids propres à chaque base
+        (petites tables : chargées une fois par sauvegarde)
+        """
+        from django.contrib.auth.models import Permission
+        from django.contrib.contenttypes.models import ContentType
+
+        cles = {}
+        for modele in (ContentType, Permission):
+            if modele._meta.app_config is not None and apps.is_installed(modele._meta.app_config.name):
+                requete = modele._base_manager.using(DEFAULT_DB_ALIAS)
+                if modele is Permission:
+                    requete = requete.select_related('content_type')
+                cles[modele] = {objet.pk: list(objet.natural_key()) for objet in requete}
+        return cles
+
+    # ==================== SAUVEGARDE ====================
+
+    @staticmethod
+    def sauvegarder(chemin, etiquettes=None, exclus=None, workers=4, taille_lot=None, progression=None):
+        """
+        Sauvegarde NDJSON : une partie par table (en parallèle), assemblées dans l'ordre des dépendances
+        L'écriture est atomique : le fichier n'apparaît qu'une fois complet
+
+        Args:
+            progression: fonction(modèle, nb_objets) appelée à la fin de chaque table
+
+        Returns:
+            dict: {'app.modele': nombre d'objets}
+        """
+        chemin = Path(chemin)
+        chemin.parent.mkdir(parents=True, exist_ok=True)
+        modeles = SauvegardeService.modeles(etiquettes, exclus)
+        cles = SauvegardeService.cles_naturelles()
+        taille_lot = taille_lot or SauvegardeService.TAILLE_LOT
+        compteurs = {}
+
+        repertoire = Path(tempfile.mkdtemp(prefix='.sauvegarde-', dir=chemin.parent))
+        try:
+            with SauvegardeService.instantane(workers) as instantane:
+                def exporter(indice):
+                    modele = modeles[indice]
+                    partie = repertoire / f"{indice:04d}{chemin.suffix if chemin.suffix in COMPRESSIONS else ''}"
+                    try:
+                        nombre = SauvegardeService.exporter_table(modele, partie, cles, taille_lot, instantane)
+                    finally:
+                        if workers > 1:
+                            connections[DEFAULT_DB_ALIAS].close()
+                    if progression:
+                        progression(modele, nombre)
+                    return modele._meta.label_lower, nombre
+
+                if workers > 1:
+                    with ThreadPoolExecutor(max_workers=workers) as executeur:
+                        compteurs = dict(executeur.map(exporter, range(len(modeles))))
+                else:
+                    compteurs = dict(map(exporter, range(len(modeles))))
+
+            # Parties compressées indépendamment : la concaténation reste un flux valide
+            provisoire = chemin.with_name(chemin.name + '.tmp')
+            with open(provisoire, 'wb') as sortie:
+                for partie in sorted(repertoire.iterdir()):
+                    with open(partie, 'rb') as entree:
+                        shutil.copyfileobj(entree, sortie)
+            os.replace(provisoire, chemin)
+        finally:
+            shutil.rmtree(repertoire, ignore_errors=True)
+        return compteurs
+
+    @staticmethod
+    @contextmanager
+    def instantane(workers):
+        """
+        Transaction de lecture de la sauvegarde
+        PostgreSQL : REPEATABLE READ, instantané exporté pour les workers (identifiant retourné)
+        SQLite : transaction d'écriture (BEGIN IMMEDIATE) qui gèle la base pendant que les workers
+        lisent ; workers=1 : tout est lu dans cette transaction. Retour : None
+        """
+        connexion = connections[DEFAULT_DB_ALIAS]
+        identifiant = None
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            if connexion.vendor == 'postgresql':
+                with connexion.cursor() as curseur:
+                    curseur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                    if workers > 1:
+                        curseur.execute("SELECT pg_export_snapshot()")
+                        identifiant = curseur.fetchone()[0]
+            yield identifiant
+
+    @staticmethod
+    def exporter_table(modele, chemin, cles, taille_lot, instantane=None):
+        """
+        Une table → une partie NDJSON, lue par lots de `taille_lot` lignes
+        Même contenu que dumpdata (champs sérialisables, m2m), sans instancier les modèles :
+        values_list + une requête par lot et par relation m2m
+        """
+        connexion = connections[DEFAULT_DB_ALIAS]
+        meta = modele._meta
+        champs = [champ for champ in meta.local_fields if champ.serialize]
+        relations = [
+            champ for champ in meta.local_many_to_many
+            if champ.serialize and champ.remote_field.through._meta.auto_created
+        ]
+        conversions = [SauvegardeService.conversion(champ, cles) for champ in champs]
+        lignes = modele._base_manager.using(DEFAULT_DB_ALIAS).order_by('pk').values_list(
+            meta.pk.attname, *(champ.attname for champ in champs)
+        ).iterator(chunk_size=taille_lot)
+
+        nombre = 0
+        with transaction_lecture(DEFAULT_DB_ALIAS), SauvegardeService.ouvrir(chemin, 'wt') as fichier:
+            if instantane:
+                with connexion.cursor() as curseur:
+                    curseur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                    curseur.execute("SET TRANSACTION SNAPSHOT %s", [instantane])
+            while lot := list(itertools.islice(lignes, taille_lot)):
+                liens = {champ.name: SauvegardeService.liens(champ, [ligne[0] for ligne in lot], cles) for champ in relations}
+                for cle, *valeurs in lot:
+                    donnees = {
+                        champ.name: valeur if convertir is None else convertir(valeur)
+                        for champ, convertir, valeur in zip(champs, conversions, valeurs)
+                    }
+                    for nom, cibles in liens.items():
+                        donnees[nom] = cibles.get(cle, [])
+                    fichier.write(json.dumps(
+                        {'model': meta.label_lower, 'pk': cle, 'fields': donnees},
+                        cls=DjangoJSONEncoder, ensure_ascii=False,
+                    ))
+                    fichier.write('\n')
+                nombre += len(lot)
+                reset_queries()           # DEBUG : requêtes journalisées, sinon la mémoire croît par lot
+        return nombre
+
+    @staticmethod
+    def conversion(champ, cles):
+        """
+        Valeur brute → valeur dumpdata (types simples tels quels, sinon value_to_string ; clés naturelles)
+        None : valeur reprise telle quelle
+        """
+        if champ.is_relation and champ.related_model in cles:
+            correspondance = cles[champ.related_model]
+            return lambda valeur: correspondance.get(valeur, valeur)
+
+        if isinstance(champ, models.FileField):
+            # Comme dumpdata : fichier absent → ''
+            return lambda valeur: valeur or ''
+
+        if type(champ.target_field if champ.is_relation else champ) in SauvegardeService.TYPES_NATIFS:
+            return None
+
+        def convertir(valeur):
+            if is_protected_type(valeur):
+                return valeur
+            return champ.value_to_string(SimpleNamespace(**{champ.attname: valeur}))
+        return convertir
+
+    @staticmethod
+    def liens(champ, cles_sources, cles):
+        """{pk source: [pk cibles]} d'une relation m2m pour un lot"""
+        intermediaire = champ.remote_field.through
+        source = intermediaire._meta.get_field(champ.m2m_field_name()).attname
+        cible = intermediaire._meta.get_field(champ.m2m_reverse_field_name()).attname
+        correspondance = cles.get(champ.related_model, {})
+        liens = defaultdict(list)
+        for cle, valeur in intermediaire._base_manager.using(DEFAULT_DB_ALIAS).filter(
+            **{f'{source}__in': cles_sources}
+        ).order_by('pk').values_list(source, cible).iterator():
+            liens[cle].append(correspondance.get(valeur, valeur))
+        return liens
+
+    # ==================== RESTAURATION ====================
+
+    @staticmethod
+    def restaurer(chemin, taille_lot=None, ignorer_champs_absents=False, exclus=None, progression=None):
+        """
+        Restaure un fichier dumpdata ou une sauvegarde (compressés ou non) par lots
+        Les objets existants (même clé primaire) sont mis à jour, les autres créés
+
+        Args:
+            ignorer_champs_absents: ignorer les champs / modèles inconnus de la base (loaddata -i)
+            exclus: applications / modèles ignorés (défaut : EXCLUS, recréés par migrate)
+            progression: fonction(modèle, nb_objets) appelée après chaque lot
+
+        Returns:
+            dict: {'app.modele': nombre d'objets}
+        """
+        taille_lot = taille_lot or SauvegardeService.TAILLE_LOT
+        exclus = {e.lower() for e in (SauvegardeService.EXCLUS if exclus is None else exclus)}
+        connexion = connections[DEFAULT_DB_ALIAS]
+        tampons = defaultdict(list)
+        compteurs = Counter()
+        modeles = {}
+        differes = []
+
+        def vider(modele):
+            objets = tampons.pop(modele, [])
+            if objets:
+                SauvegardeService.inserer_lot(modele, objets)
+                reset_queries()
+                compteurs[modele._meta.label_lower] += len(objets)
+                modeles[modele] = None
+                if progression:
+                    progression(modele, compteurs[modele._meta.label_lower])
+
+        with SauvegardeService.ouvrir(chemin) as flux, signaux_suspendus(), \
+                transaction.atomic(using=DEFAULT_DB_ALIAS), connexion.constraint_checks_disabled():
+            retenus = (
+                donnees for donnees in SauvegardeService.lire_objets(flux)
+                if str(donnees.get('model')).lower() not in exclus
+                and str(donnees.get('model')).lower().split('.')[0] not in exclus
+            )
+            objets = Deserializer(
+                retenus, using=DEFAULT_DB_ALIAS,
+                ignorenonexistent=ignorer_champs_absents, handle_forward_references=True,
+            )
+            for objet in objets:
+                modele = type(objet.object)
+                tampons[modele].append(objet)
+                if objet.deferred_fields:
+                    differes.append(objet)
+                if len(tampons[modele]) >= taille_lot:
+                    vider(modele)
+            for modele in list(tampons):
+                vider(modele)
+
+            # Clés naturelles vers des objets placés plus loin dans le fichier
+            for objet in differes:
+                objet.save_deferred_fields(using=DEFAULT_DB_ALIAS)
+
+            # Documents numérotés restaurés : les prochains continuent après
+            if {modele._meta.label_lower for modele in modeles} & SauvegardeService.NUMEROTES:
+                SequenceService.resynchroniser()
+
+            sequences = connexion.ops.sequence_reset_sql(no_style(), list(modeles))
+            if sequences:
+                with connexion.cursor() as curseur:
+                    for requete in sequences:
+                        curseur.execute(requete)
+
+            tables = [modele._meta.db_table for modele in modeles] + [
+                champ.remote_field.through._meta.db_table
+                for modele in modeles for champ in modele._meta.many_to_many
+                if champ.remote_field.through._meta.auto_created
+            ]
+            connexion.check_constraints(table_names=tables)
+
+        return dict(compteurs)
+
+    @staticmethod
+    def inserer_lot(modele, objets):
+        """Un lot d'objets désérialisés d'un même modèle : upsert sur la clé primaire puis relations m2m"""
+        gestionnaire = modele._base_manager.using(DEFAULT_DB_ALIAS)
+        cle = modele._meta.pk
+        champs = [champ.name for champ in modele._meta.concrete_fields if not champ.primary_key]
+
+        SauvegardeService.completer(modele, objets)
+        with horodatages_conserves(modele):
+            if champs:
+                gestionnaire.bulk_create(
+                    [objet.object for objet in objets],
+                    update_conflicts=True, unique_fields=[cle.name], update_fields=champs,
+                )
+            else:
+                gestionnaire.bulk_create([objet.object for objet in objets], ignore_conflicts=True)
+
+        # Relations m2m : celles du fichier remplacent celles de la base
+        for champ in modele._meta.many_to_many:
+            intermediaire = champ.remote_field.through
+            if not intermediaire._meta.auto_created:
+                continue
+            concernes = [objet for objet in objets if objet.m2m_data and champ.name in objet.m2m_data]
+            if not concernes:
+                continue
+            source = intermediaire._meta.get_field(champ.m2m_field_name()).attname
+            cible = intermediaire._meta.get_field(champ.m2m_reverse_field_name()).attname
+            intermediaire._base_manager.using(DEFAULT_DB_ALIAS).filter(
+                **{f'{source}__in': [objet.object.pk for objet in concernes]}
+            ).delete()
+            intermediaire._base_manager.using(DEFAULT_DB_ALIAS).bulk_create([
+                intermediaire(**{source: objet.object.pk, cible: valeur})
+                for objet in concernes for valeur in objet.m2m_data[champ.name]
+            ])
+
+    @staticmethod
+    def completer(modele, objets):
+        """
+        Fichiers antérieurs à la numérotation des paiements (migration 0010, ex: backup_data.json) :
+        numéro attribué comme à la création, P-<facture>-NN
+        """
+        from app1.models import Facture, Paiement
+
+        if modele is not Paiement:
+            return
+        sans_numero = sorted((objet.object for objet in objets if not objet.object.numero_paiement), key=lambda p: p.pk)
+        if not sans_numero:
+            return
+
+        # Paiement déjà restauré : il garde son numéro
+        existants = dict(Paiement._base_manager.using(DEFAULT_DB_ALIAS).filter(
+            pk__in=[paiement.pk for paiement in sans_numero]
+        ).exclude(numero_paiement='').values_list('pk', 'numero_paiement'))
+        factures = dict(Facture._base_manager.using(DEFAULT_DB_ALIAS).filter(
+            pk__in={paiement.facture_id for paiement in sans_numero}
+        ).values_list('pk', 'numero_facture'))
+        for paiement in sans_numero:
+            numero_facture = factures.get(paiement.facture_id)
+            if paiement.pk in existants:
+                paiement.numero_paiement = existants[paiement.pk]
+            elif numero_facture:
+                nb = SequenceService.suivant('PAIEMENT', portee=numero_facture)
+                paiement.numero_paiement = f"P-{numero_facture}-{nb:02d}"
@@ -0,0 +1,164 @@
+"""
+sequence_service.py - Numérotation des documents (factures, paiements, incidents, réclamations)
+
+UTILISATION :
+Chaque numéro est obtenu en UNE requête atomique sur la table SequenceDocument :
+    INSERT ... ON CONFLICT (type_document, portee, periode)
+    DO UPDATE SET valeur = valeur + n RETURNING valeur
+
+→ plus de COUNT(*) ni de double save() (INSERT puis UPDATE) dans les modèles
+→ deux créations simultanées ne peuvent pas obtenir le même numéro
+
+Le compteur est incrémenté dans la transaction en cours : si la création du
+document échoue (rollback), le numéro est libéré → numérotation sans trou.
+Facture, Paiement, Incident et Reclamation attribuent leur numéro et s'insèrent
+dans une même transaction.atomic().
+
+PRÉ-ALLOCATION PAR BLOC (optionnelle, settings.SEQUENCE_BLOC > 1) :
+Un processus réserve N numéros d'un coup et les distribue depuis sa mémoire.
+Uniquement hors transaction (sinon un rollback rendrait le bloc en mémoire faux) :
+ne concerne donc pas les save() des modèles ci-dessus.
+Des trous sont alors possibles (bloc non consommé à l'arrêt du processus).
+
+EXEMPLES :
+- SequenceService.suivant('FACTURE', portee='CL-3', periode='20250115') → 4
+- SequenceService.suivant('PAIEMENT', portee='F-20250115-CL-003-004') → 1
+- SequenceService.resynchroniser() → 12 (séquences avancées après une restauration)
+"""
+
+import re
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+
+class SequenceService:
+    """
+    Service d'attribution des numéros de documents
+    """
+
+    # Blocs pré-alloués (par processus) : (type, portee, periode) → [prochain, dernier]
+    _blocs = {}
+    _verrou = threading.Lock()
+
+    @staticmethod
+    def taille_bloc():
+        return getattr(settings, 'SEQUENCE_BLOC', 1)
+
+    @staticmethod
+    def suivant(type_document, portee='', periode=''):
+        """
+        Retourne le prochain numéro (1, 2, 3...) pour ce type / cette portée / cette période
+        """
+        cle = (type_document, portee or '', periode or '')
+        bloc = SequenceService.taille_bloc()
+
+        if bloc <= 1 or connection.in_atomic_block:
+            return SequenceService._allouer(cle, 1)
+
+        with SequenceService._verrou:
+            reserve = SequenceService._blocs.get(cle)
+            if reserve and reserve[0] <= reserve[1]:
+                numero = reserve[0]
+                reserve[0] += 1
+                return numero
+
+            dernier = SequenceService._allouer(cle, bloc)
+            premier = dernier - bloc + 1
+            SequenceService._blocs[cle] = [premier + 1, dernier]
+            return premier
+
+    @staticmethod
+    def _allouer(cle, quantite):
+        """
+        Réserve `quantite` numéros en une seule requête et retourne le dernier réservé
+        (SQLite >= 3.35 et PostgreSQL : INSERT ... ON CONFLICT ... RETURNING)
+        """
+        from app1.models import SequenceDocument
+
+        table = SequenceDocument._meta.db_table
+        type_document, portee, periode = cle
+
+        with connection.cursor() as curseur:
+            curseur.execute(
+                f"INSERT INTO {table} (type_document, portee, periode, valeur) "
+                f"VALUES (%s, %s, %s, %s) "
+                f"ON CONFLICT (type_document, portee, periode) "
+                f"DO UPDATE SET valeur = {table}.valeur + excluded.valeur "
+                f"RETURNING valeur",
+                [type_document, portee, periode, quantite]
+            )
+            return curseur.fetchone()[0]
+
+    @staticmethod
+    def resynchroniser(taille_lot=5000):
+        """
+        Amène chaque séquence au plus grand numéro déjà attribué (jamais en arrière)
+        → après une restauration, les prochains documents ne reprennent pas un numéro existant
+        Documents lus en flux, séquences écrites par lots de `taille_lot` (mémoire constante)
+
+        Returns:
+            int: nombre de séquences écrites
+        """
+        from app1.models import SequenceDocument
+
+        table = SequenceDocument._meta.db_table
+        sequences = {}
+        ecrites = 0
+
+        def ecrire():
+            with connection.cursor() as curseur:
+                curseur.executemany(
+                    f"INSERT INTO {table} (type_document, portee, periode, valeur) "
+                    f"VALUES (%s, %s, %s, %s) "
+                    f"ON CONFLICT (type_document, portee, periode) "
+                    f"DO UPDATE SET valeur = CASE WHEN excluded.valeur > {table}.valeur "
+                    f"THEN excluded.valeur ELSE {table}.valeur END",
+                    [(*cle, valeur) for cle, valeur in sequences.items()]
+                )
+            sequences.clear()
+
+        for cle, numero in SequenceService.numeros_attribues():
+            if numero > sequences.get(cle, 0):
+                if cle not in sequences and len(sequences) >= taille_lot:
+                    ecrites += len(sequences)
+                    ecrire()
+                sequences[cle] = numero
+        ecrites += len(sequences)
+        if sequences:
+            ecrire()
+
+        SequenceService.reinitialiser_cache()
+        return ecrites
+
+    @staticmethod
+    def numeros_attribues():
+        """(type, portee, periode), numéro de chaque document existant, regroupés par séquence"""
+        from app1.models import Facture, Incident, Paiement, Reclamation
+
+        factures = Facture.objects.order_by('client_id', 'numero_facture').values_list('client_id', 'numero_facture')
+        for client_id, numero_facture in factures.iterator():
+            trouve = re.match(r'^F-(\d{8})-CL-\d+-(\d+)$', numero_facture or '')
+            if trouve:
+                yield ('FACTURE', f"CL-{client_id}", trouve.group(1)), int(trouve.group(2))
+
+        for numero_paiement in Paiement.objects.order_by('numero_paiement').values_list('numero_paiement', flat=True).iterator():
+            trouve = re.match(r'^P-(.+)-(\d+)$', numero_paiement or '')
+            if trouve:
+                yield ('PAIEMENT', trouve.group(1), ''), int(trouve.group(2))
+
+        for type_document, modele, champ, prefixe in (
+            ('INCIDENT', Incident, 'numero_incident', 'INC'),
+            ('RECLAMATION', Reclamation, 'numero_reclamation', 'REC'),
+        ):
+            for numero_document in modele.objects.order_by(champ).values_list(champ, flat=True).iterator():
+                trouve = re.match(rf'^{prefixe}-(\d{{8}})-(\d+)$', numero_document or '')
+                if trouve:
+                    yield (type_document, '', trouve.group(1)), int(trouve.group(2))
+
+    @staticmethod
+    def reinitialiser_cache():
+        """Oublie les blocs pré-alloués (tests, changement de configuration)"""
+        with SequenceService._verrou:
+            SequenceService._blocs = {}
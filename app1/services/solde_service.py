@@ -0,0 +1,220 @@
+"""
+solde_service.py - Grand livre des soldes clients
+
+UTILISATION :
+Toute modification de Client.solde passe par ce service :
+- Une ligne MouvementSolde est AJOUTÉE (jamais modifiée ni supprimée)
+- Le solde est mis à jour en base avec UPDATE ... SET solde = solde + montant (F())
+  → pas de lecture-modification-écriture en Python, pas de mise à jour perdue
+
+Des "snapshots" périodiques (SnapshotSolde) permettent de retrouver le solde
+d'un client à une date donnée sans relire tout son historique.
+
+EXEMPLES :
+- SoldeService.appliquer(client, Decimal('1190.00'), 'FACTURATION', reference='F-...')
+- SoldeService.ajuster(client, Decimal('0.00'), 'REMBOURSEMENT') → remise à 0
+- SoldeService.corriger(client, Decimal('-250.00')) → correction manuelle (variation signée)
+- SoldeService.solde_a_date(client, datetime(2025, 1, 31)) → solde au 31 janvier
+- SoldeService.creer_snapshots() → scheduler (chaque nuit)
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+CENTIME = Decimal('0.01')
+
+
+class SoldeService:
+    """
+    Service gérant le solde des clients et son grand livre :
+    - Mouvements atomiques (F() + insertion MouvementSolde)
+    - Ajustement vers une valeur cible (remboursement)
+    - Correction manuelle par variation signée
+    - Solde à une date (snapshot + mouvements postérieurs)
+    - Vérification solde / grand livre (commande verifier_soldes)
+    """
+
+    # Un mouvement plus récent peut appartenir à une transaction pas encore validée
+    MARGE_VALIDATION = timedelta(minutes=10)
+
+    # ==================== MOUVEMENTS ====================
+
+    @staticmethod
+    @transaction.atomic
+    def appliquer(client, montant, type_mouvement, reference='', description=''):
+        """
+        Ajoute `montant` au solde du client (positif = dette, négatif = crédit)
+
+        Args:
+            client: instance Client (son attribut solde est rafraîchi)
+            montant (Decimal): variation du solde
+            type_mouvement (str): voir MouvementSolde.TYPES_MOUVEMENT
+            reference (str): numéro de facture / incident / réclamation
+            description (str): libellé libre
+
+        Returns:
+            Decimal: nouveau solde du client
+        """
+        from app1.models import Client, MouvementSolde
+
+        montant = Decimal(str(montant))
+
+        if montant != 0:
+            MouvementSolde.objects.create(
+                client_id=client.pk,
+                montant=montant,
+                type_mouvement=type_mouvement,
+                reference=reference or '',
+                description=description or '',
+            )
+            Client.objects.filter(pk=client.pk).update(solde=F('solde') + montant)
+
+        client.solde = Client.objects.filter(pk=client.pk).values_list('solde', flat=True).get()
+        return client.solde
+
+    @staticmethod
+    @transaction.atomic
+    def ajuster(client, solde_cible, type_mouvement='AJUSTEMENT', reference='', description=''):
+        """
+        Ramène le solde du client à `solde_cible` (ex: 0 après remboursement)
+        Le mouvement enregistré est la différence avec le solde actuel en base
+
+        Returns:
+            Decimal: montant du mouvement enregistré
+        """
+        from app1.models import Client
+
+        solde_actuel = Client.objects.select_for_update().values_list('solde', flat=True).get(pk=client.pk)
+        difference = Decimal(str(solde_cible)) - solde_actuel
+
+        SoldeService.appliquer(client, difference, type_mouvement, reference, description)
+        return difference
+
+    @staticmethod
+    @transaction.atomic
+    def corriger(client, montant, type_mouvement='AJUSTEMENT', reference='', description=''):
+        """
+        Correction manuelle : ajoute la variation signée `montant` au solde,
+        ligne du client verrouillée (select_for_update) comme pour ajuster()
+
+        Returns:
+            Decimal: nouveau solde du client
+        """
+        from app1.models import Client
+
+        Client.objects.select_for_update().filter(pk=client.pk).values_list('pk', flat=True).get()
+        return SoldeService.appliquer(client, montant, type_mouvement, reference, description)
+
+    # ==================== SOLDE À UNE DATE ====================
+
+    @staticmethod
+    def solde_a_date(client, date_limite):
+        """
+        Solde du client à `date_limite`
+
+        Dernier snapshot <= date (index client + date) puis somme des seuls
+        mouvements postérieurs à ce snapshot.
+        """
+        from app1.models import MouvementSolde, SnapshotSolde
+
+        snapshot = SnapshotSolde.objects.filter(
+            client_id=client.pk,
+            date_snapshot__lte=date_limite
+        ).order_by('-date_snapshot', '-id').first()
+
+        mouvements = MouvementSolde.objects.filter(client_id=client.pk, date_mouvement__lte=date_limite)
+        solde = Decimal('0.00')
+
+        if snapshot:
+            solde = snapshot.solde
+            mouvements = mouvements.filter(id__gt=snapshot.dernier_mouvement_id)
+
+        total = solde + (mouvements.aggregate(total=Sum('montant'))['total'] or Decimal('0.00'))
+        return total.quantize(CENTIME)
+
+    @staticmethod
+    @transaction.atomic
+    def creer_snapshots():
+        """
+        Fige le solde issu du grand livre pour chaque client ayant eu des mouvements
+        depuis le dernier snapshot. Appelé chaque nuit par le scheduler.
+
+        Les ids sont attribués à l'insertion, pas au commit (PostgreSQL) : un
+        mouvement d'id plus petit peut devenir visible après un plus grand. Le
+        repère ne couvre donc que les mouvements plus vieux que MARGE_VALIDATION,
+        dont la transaction est terminée ; les plus récents vont au snapshot suivant.
+
+        Returns:
+            int: nombre de snapshots créés
+        """
+        from app1.models import Client, MouvementSolde, SnapshotSolde
+
+        limite = timezone.now() - SoldeService.MARGE_VALIDATION
+        dernier_mouvement = MouvementSolde.objects.filter(date_mouvement__lt=limite).aggregate(m=Max('id'))['m']
+        precedent = SnapshotSolde.objects.aggregate(m=Max('dernier_mouvement_id'))['m'] or 0
+
+        if dernier_mouvement is None or dernier_mouvement <= precedent:
+            return 0
+
+        variations = dict(
+            MouvementSolde.objects.filter(
+                id__gt=precedent,
+                id__lte=dernier_mouvement
+            ).values('client_id').annotate(total=Sum('montant')).values_list('client_id', 'total')
+        )
+
+        dernier_snapshot = SnapshotSolde.objects.filter(
+            client_id=OuterRef('pk')
+        ).order_by('-date_snapshot', '-id')
+
+        soldes_precedents = dict(
+            Client.objects.filter(id__in=variations.keys()).annotate(
+                solde_precedent=Subquery(dernier_snapshot.values('solde')[:1])
+            ).values_list('id', 'solde_precedent')
+        )
+
+        maintenant = timezone.now()
+        snapshots = [
+            SnapshotSolde(
+                client_id=client_id,
+                date_snapshot=maintenant,
+                solde=((soldes_precedents.get(client_id) or Decimal('0.00')) + variation).quantize(CENTIME),
+                dernier_mouvement_id=dernier_mouvement,
+            )
+            for client_id, variation in variations.items()
+            if client_id in soldes_precedents
+        ]
+        SnapshotSolde.objects.bulk_create(snapshots)
+
+        return len(snapshots)
+
+    # ==================== VÉRIFICATION ====================
+
+    @staticmethod
+    def verifier_clients(client_ids):
+        """
+        Compare Client.solde avec la somme des mouvements du grand livre
+
+        Returns:
+            list: [(client_id, solde, solde_grand_livre), ...] pour les écarts uniquement
+        """
+        from app1.models import Client, MouvementSolde
+
+        soldes = dict(Client.objects.filter(id__in=client_ids).values_list('id', 'solde'))
+        grand_livre = dict(
+            MouvementSolde.objects.filter(client_id__in=client_ids)
+            .values('client_id').annotate(total=Sum('montant'))
+            .values_list('client_id', 'total')
+        )
+
+        ecarts = []
+        for client_id, solde in soldes.items():
+            attendu = (grand_livre.get(client_id) or Decimal('0.00')).quantize(CENTIME)
+            if solde != attendu:
+                ecarts.append((client_id, solde, attendu))
+
+        return ecarts
@@ -13,6 +13,7 @@ EXEMPLES :
 from django.db.models import Count, Sum, Avg, Q, F
 from datetime import datetime, timedelta
 from decimal import Decimal
+from app1.routers import base_analytique
 
 
 class StatsService:
@@ -28,10 +29,11 @@ class StatsService:
         Retourne les statistiques générales du système
         """
         from app1.models import Expedition, Tournee, Client, Chauffeur, Vehicule, Incident, Facture, Reclamation
+        db = base_analytique()
         
-        expeditions = Expedition.objects.all()
-        tournees = Tournee.objects.all()
-        factures = Facture.objects.all()
+        expeditions = Expedition.objects.using(db).all()
+        tournees = Tournee.objects.using(db).all()
+        factures = Facture.objects.using(db).all()
         
         if date_debut and date_fin:
             expeditions = expeditions.filter(date_creation__range=[date_debut, date_fin])
@@ -40,16 +42,16 @@ class StatsService:
         
         return {
             'total_expeditions': expeditions.count(),
-            'total_clients': Client.objects.filter(est_actif=True).count(),
-            'total_chauffeurs': Chauffeur.objects.filter(disponibilite=True).count(),
-            'total_vehicules': Vehicule.objects.filter(etat='OPERATIONNEL').count(),
+            'total_clients': Client.objects.using(db).filter(est_actif=True).count(),
+            'total_chauffeurs': Chauffeur.objects.using(db).filter(disponibilite=True).count(),
+            'total_vehicules': Vehicule.objects.using(db).filter(etat='OPERATIONNEL').count(),
             'total_tournees': tournees.count(),
             'ca_total': factures.aggregate(total=Sum('montant_ttc'))['total'] or 0,
             'expeditions_en_cours': expeditions.filter(
                 statut__in=['EN_ATTENTE', 'EN_TRANSIT', 'EN_LIVRAISON']
             ).count(),
-            'incidents_actifs': Incident.objects.filter(statut='EN_COURS').count(),
-            'reclamations_ouvertes': Reclamation.objects.filter(
+            'incidents_actifs': Incident.objects.using(db).filter(statut='EN_COURS').count(),
+            'reclamations_ouvertes': Reclamation.objects.using(db).filter(
                 statut__in=['OUVERTE', 'EN_COURS']
             ).count(),
         }
@@ -62,8 +64,9 @@ class StatsService:
         Calcule les KPI liés aux expéditions
         """
         from app1.models import Expedition
+        db = base_analytique()
         
-        expeditions = Expedition.objects.all()
+        expeditions = Expedition.objects.using(db).all()
         
         if annee:
             expeditions = expeditions.filter(date_creation__year=annee)
@@ -88,9 +91,10 @@ class StatsService:
         Calcule les KPI financiers
         """
         from app1.models import Facture, Paiement, Client
+        db = base_analytique()
         
-        factures = Facture.objects.all()
-        paiements = Paiement.objects.all()
+        factures = Facture.objects.using(db).all()
+        paiements = Paiement.objects.using(db).all()
         
         if annee:
             factures = factures.filter(date_creation__year=annee)
@@ -112,8 +116,8 @@ class StatsService:
             'nb_factures_impayees': factures_impayees,
             'taux_paiement': (factures_payees / total_factures * 100) if total_factures > 0 else 0,
             'montant_moyen_facture': factures.aggregate(avg=Avg('montant_ttc'))['avg'] or 0,
-            'clients_debiteurs': Client.objects.filter(solde__gt=0).count(),
-            'total_creances': Client.objects.aggregate(total=Sum('solde'))['total'] or 0
+            'clients_debiteurs': Client.objects.using(db).filter(solde__gt=0).count(),
+            'total_creances': Client.objects.using(db).aggregate(total=Sum('solde'))['total'] or 0
         }
     
     # ==================== KPI OPÉRATIONNELS ====================
@@ -124,8 +128,9 @@ class StatsService:
         Calcule les KPI opérationnels (tournées, véhicules, chauffeurs)
         """
         from app1.models import Tournee, Vehicule, Chauffeur
+        db = base_analytique()
         
-        tournees = Tournee.objects.all()
+        tournees = Tournee.objects.using(db).all()
         
         if annee:
             tournees = tournees.filter(date_depart__year=annee)
@@ -151,9 +156,10 @@ class StatsService:
         Calcule les KPI de qualité de service
         """
         from app1.models import Incident, Reclamation
+        db = base_analytique()
         
-        incidents = Incident.objects.all()
-        reclamations = Reclamation.objects.all()
+        incidents = Incident.objects.using(db).all()
+        reclamations = Reclamation.objects.using(db).all()
         
         if annee:
             incidents = incidents.filter(date_heure_incident__year=annee)
@@ -175,9 +181,10 @@ class StatsService:
     def _calculer_taux_disponibilite_chauffeurs():
         """Calcule le taux de disponibilité des chauffeurs"""
         from app1.models import Chauffeur
+        db = base_analytique()
         
-        total = Chauffeur.objects.count()
-        disponibles = Chauffeur.objects.filter(disponibilite=True).count()
+        total = Chauffeur.objects.using(db).count()
+        disponibles = Chauffeur.objects.using(db).filter(disponibilite=True).count()
         
         return (disponibles / total * 100) if total > 0 else 0
     
@@ -185,9 +192,10 @@ class StatsService:
     def _calculer_taux_incidents(annee=None):
         """Calcule le taux d'incidents par rapport aux expéditions"""
         from app1.models import Expedition, Incident
+        db = base_analytique()
         
-        expeditions = Expedition.objects.all()
-        incidents = Incident.objects.filter(expedition__isnull=False)
+        expeditions = Expedition.objects.using(db).all()
+        incidents = Incident.objects.using(db).filter(expedition__isnull=False)
         
         if annee:
             expeditions = expeditions.filter(date_creation__year=annee)
@@ -206,13 +214,14 @@ class StatsService:
         Compare les performances entre deux périodes
         """
         from app1.models import Expedition
+        db = base_analytique()
         
         # Période 1
-        exp1 = Expedition.objects.filter(date_creation__range=[date_debut1, date_fin1])
+        exp1 = Expedition.objects.using(db).filter(date_creation__range=[date_debut1, date_fin1])
         ca1 = exp1.aggregate(total=Sum('montant_total'))['total'] or 0
         
         # Période 2
-        exp2 = Expedition.objects.filter(date_creation__range=[date_debut2, date_fin2])
+        exp2 = Expedition.objects.using(db).filter(date_creation__range=[date_debut2, date_fin2])
         ca2 = exp2.aggregate(total=Sum('montant_total'))['total'] or 0
         
         return {
@@ -249,8 +258,9 @@ class StatsService:
         """
         from app1.models import Expedition
         from django.db.models.functions import TruncMonth
+        db = base_analytique()
         
-        expeditions = Expedition.objects.filter(date_creation__year=annee)
+        expeditions = Expedition.objects.using(db).filter(date_creation__year=annee)
         
         # Par trimestre
         par_trimestre = []
@@ -288,8 +298,9 @@ class StatsService:
         Analyse la rentabilité par destination
         """
         from app1.models import Expedition
+        db = base_analytique()
         
-        expeditions = Expedition.objects.all()
+        expeditions = Expedition.objects.using(db).all()
         
         if annee:
             expeditions = expeditions.filter(date_creation__year=annee)
@@ -311,23 +322,25 @@ class StatsService:
     def analyse_performance_vehicules(annee=None):
         """
         Analyse les performances des véhicules
+        Lue dans les séries MesureTournee (index vehicule/date_fin), voir flotte_service.py
         """
-        from app1.models import Tournee
+        from app1.models import MesureTournee
+        db = base_analytique()
         
-        tournees = Tournee.objects.filter(statut='TERMINEE')
+        mesures = MesureTournee.objects.using(db).all()
         
         if annee:
-            tournees = tournees.filter(date_depart__year=annee)
+            mesures = mesures.filter(date_fin__year=annee)
         
-        performance = tournees.values(
-            'vehicule__immatriculation',
+        performance = mesures.values(
+            'vehicule__numero_immatriculation',
             'vehicule__marque',
             'vehicule__modele'
         ).annotate(
             nb_tournees=Count('id'),
-            km_total=Sum('kilometrage_parcouru'),
-            consommation_totale=Sum('consommation_carburant'),
-            consommation_moyenne=Avg('consommation_carburant')
+            km_total=Sum('km_parcouru'),
+            consommation_totale=Sum('carburant'),
+            consommation_moyenne=Avg('carburant')
         ).order_by('-nb_tournees')
         
         return list(performance)
\ No newline at end of file
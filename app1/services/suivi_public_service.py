@@ -0,0 +1,167 @@
+"""
+suivi_public_service.py - Suivi de colis en libre accès pour les destinataires
+
+UTILISATION :
+Le destinataire saisit sur /suivi/ le numéro d'expédition (EXP-000123) et le
+code de suivi reçu par email. Aucun compte n'est nécessaire.
+
+CODE DE SUIVI :
+HMAC(SECRET_KEY, numéro) tronqué : rien à stocker, impossible à deviner à
+partir du numéro (numéros séquentiels). Un numéro inconnu et un mauvais code
+donnent la même réponse (pas d'énumération des expéditions).
+
+CACHE (lecture à travers) :
+L'état affiché (statut, destination, dernières étapes) est lu en base au
+premier accès puis servi depuis le cache Django. Il est invalidé :
+- à chaque nouvelle étape TrackingExpedition ou modification de l'expédition (signaux)
+- par les écritures groupées qui contournent les signaux (IngestionService)
+- par l'archivage de l'historique (ArchiveService : étapes retirées de TrackingExpedition)
+SUIVI_PUBLIC_CACHE_SECONDES borne l'écart si plusieurs processus ont chacun
+leur cache local (LocMemCache).
+
+LIMITATION DE DÉBIT :
+SUIVI_PUBLIC_LIMITE_PAR_MINUTE requêtes par adresse IP et par minute (0 = sans
+limite) ; au-delà → HTTP 429 + Retry-After.
+
+EXEMPLES :
+- SuiviPublicService.jeton(expedition.id) → code envoyé au destinataire
+- SuiviPublicService.verifier('EXP-000123', 'K3J...') → 123 ou None
+- SuiviPublicService.etat(123) → dict affiché par la page publique
+- Commande charge_suivi_public → test de charge
+"""
+
+import base64
+import hashlib
+import hmac
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class SuiviPublicService:
+    """
+    Service du suivi public :
+    - Codes de suivi (HMAC, sans stockage)
+    - État de l'expédition en cache (lecture à travers + invalidation)
+    - Limitation de débit par adresse IP
+    """
+
+    PREFIXE_CACHE = 'suivi_public'
+    LONGUEUR_JETON = 16
+    NB_ETAPES = 10
+    FORMAT_NUMERO = re.compile(r'^(?:EXP-?)?0*(\d{1,12})$', re.IGNORECASE)
+
+    # ==================== CODE DE SUIVI ====================
+
+    @staticmethod
+    def jeton(expedition_id):
+        """Code de suivi d'une expédition (16 caractères A-Z / 2-7)"""
+        empreinte = hmac.new(
+            settings.SECRET_KEY.encode(), f"suivi-public:{expedition_id}".encode(), hashlib.sha256
+        ).digest()
+        return base64.b32encode(empreinte).decode()[:SuiviPublicService.LONGUEUR_JETON]
+
+    @staticmethod
+    def verifier(numero, jeton):
+        """
+        Returns:
+            int: identifiant de l'expédition si le couple numéro / code est valide, sinon None
+        """
+        correspondance = SuiviPublicService.FORMAT_NUMERO.match((numero or '').strip())
+        if not correspondance:
+            return None
+
+        expedition_id = int(correspondance.group(1))
+        attendu = SuiviPublicService.jeton(expedition_id)
+        fourni = (jeton or '').strip().upper().replace(' ', '')
+        if not hmac.compare_digest(fourni.encode(), attendu.encode()):
+            return None
+        return expedition_id
+
+    # ==================== ÉTAT EN CACHE ====================
+
+    @staticmethod
+    def cle(expedition_id):
+        return f"{SuiviPublicService.PREFIXE_CACHE}:etat:{expedition_id}"
+
+    @staticmethod
+    def etat(expedition_id):
+        """
+        État public de l'expédition (cache, sinon base)
+
+        Returns:
+            dict ou None si l'expédition n'existe plus
+        """
+        cle = SuiviPublicService.cle(expedition_id)
+        etat = cache.get(cle)
+        if etat is None:
+            etat = SuiviPublicService._lire_etat(expedition_id)
+            if etat is None:
+                return None
+            cache.set(cle, etat, getattr(settings, 'SUIVI_PUBLIC_CACHE_SECONDES', 30))
+        return etat
+
+    @staticmethod
+    def _lire_etat(expedition_id):
+        """
+        Lecture en base (2 requêtes) : expédition + dernières étapes
+        Les commentaires ne sont pas publiés (noms, adresses)
+        """
+        from app1.models import Expedition, TrackingExpedition
+
+        expedition = Expedition.objects.select_related('destination', 'type_service').filter(pk=expedition_id).first()
+        if expedition is None:
+            return None
+
+        etapes = [
+            {'date': suivi.date_heure.isoformat(), 'statut': suivi.statut_etape, 'libelle': suivi.get_statut_etape_display()}
+            for suivi in TrackingExpedition.objects.filter(
+                expedition_id=expedition_id
+            ).order_by('-date_heure', '-id')[:SuiviPublicService.NB_ETAPES]
+        ]
+
+        return {
+            'numero': expedition.get_numero_expedition(),
+            'statut': expedition.statut,
+            'libelle_statut': expedition.get_statut_display(),
+            'service': expedition.type_service.get_type_service_display(),
+            'destination': expedition.destination.ville,
+            'date_livraison_prevue': expedition.date_livraison_prevue.isoformat() if expedition.date_livraison_prevue else None,
+            'date_livraison_reelle': expedition.date_livraison_reelle.isoformat() if expedition.date_livraison_reelle else None,
+            'etapes': etapes,
+        }
+
+    @staticmethod
+    def invalider(expedition_ids):
+        """Retire du cache l'état des expéditions modifiées"""
+        cache.delete_many([SuiviPublicService.cle(expedition_id) for expedition_id in expedition_ids])
+
+    # ==================== LIMITATION DE DÉBIT ====================
+
+    @staticmethod
+    def autoriser(adresse_ip):
+        """
+        Compteur par IP sur une fenêtre fixe d'une minute
+
+        Returns:
+            (autorisé, secondes avant la prochaine fenêtre)
+        """
+        limite = getattr(settings, 'SUIVI_PUBLIC_LIMITE_PAR_MINUTE', 60)
+        if not limite:
+            return True, 0
+
+        maintenant = time.time()
+        fenetre = int(maintenant // 60)
+        cle = f"{SuiviPublicService.PREFIXE_CACHE}:ip:{adresse_ip}:{fenetre}"
+
+        cache.add(cle, 0, 60)
+        try:
+            compteur = cache.incr(cle)
+        except ValueError:
+            # Clé expirée entre add et incr
+            cache.set(cle, 1, 60)
+            compteur = 1
+
+        return compteur <= limite, int(60 - maintenant % 60) + 1
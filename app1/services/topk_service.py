@@ -0,0 +1,447 @@
+"""
+topk_service.py - Classements approximatifs (Top-K) en mémoire
+
+UTILISATION :
+Ce service maintient des "sketches" Space-Saving mis à jour à chaque création
+d'expédition ou de réclamation. Les classements (meilleurs clients, destinations
+populaires, motifs de réclamation...) sont alors lus en O(K) au lieu de relancer
+un GROUP BY complet sur toute la table.
+
+GARANTIE (algorithme Space-Saving) :
+- Estimation >= valeur réelle
+- Estimation - valeur réelle <= total / capacité
+
+PLUSIEURS PROCESSUS :
+Chaque processus garde ses sketches en mémoire ET le delta exact de ce qu'il a
+vu depuis sa dernière sauvegarde. sauvegarder() verrouille la ligne SketchTopK,
+y fusionne le delta puis recharge le résultat : aucun processus n'écrase les
+comptes des autres, et chacun voit les leurs au plus tard à sa sauvegarde suivante.
+
+APPROXIMATION :
+Suppressions et changements de client / destination / montant sont retirés des
+sketches (retirer), mais Space-Saving ne sait pas "rendre" la place d'une clé
+évincée : l'estimation reste une borne supérieure, la borne d'erreur peut se
+relâcher. reconstruire() repart d'une agrégation exacte (scheduler, chaque nuit).
+
+EXEMPLES :
+- TopKService.top('clients_volume', 10, annee=2025) → 10 meilleurs clients
+- TopKService.sauvegarder() → fusion périodique dans la base (scheduler)
+- TopKService.reconstruire() → recalcul exact de tous les sketches (scheduler)
+"""
+
+import threading
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum
+
+
+class SpaceSaving:
+    """
+    Structure "heavy hitters" Space-Saving (Metwally et al.)
+
+    Garde au plus `capacite` compteurs. Quand un nouvel élément arrive et que la
+    table est pleine, il remplace l'élément de plus petit compteur et hérite de
+    ce compteur comme erreur maximale.
+    """
+
+    def __init__(self, capacite):
+        self.capacite = capacite
+        self.total = 0.0
+        self.compteurs = {}  # cle → [compte, erreur]
+
+    def ajouter(self, cle, poids=1.0):
+        """Ajoute `poids` occurrences de `cle` au flux"""
+        poids = float(poids)
+        self.total += poids
+
+        entree = self.compteurs.get(cle)
+        if entree is not None:
+            entree[0] += poids
+            return
+
+        if len(self.compteurs) < self.capacite:
+            self.compteurs[cle] = [poids, 0.0]
+            return
+
+        # Table pleine → remplacer le plus petit compteur
+        cle_min = min(self.compteurs, key=lambda c: self.compteurs[c][0])
+        compte_min = self.compteurs.pop(cle_min)[0]
+        self.compteurs[cle] = [compte_min + poids, compte_min]
+
+    def retirer(self, cle, poids=1.0):
+        """
+        Retire `poids` occurrences de `cle` (suppression, correction)
+        Une clé non suivie n'a pas de compteur : seul le total diminue
+        """
+        poids = float(poids)
+        self.total = max(self.total - poids, 0.0)
+
+        entree = self.compteurs.get(cle)
+        if entree is not None:
+            entree[0] = max(entree[0] - poids, 0.0)
+
+    def appliquer(self, delta):
+        """Applique un delta exact {cle: poids signé}"""
+        for cle, poids in delta.items():
+            if poids > 0:
+                self.ajouter(cle, poids)
+            elif poids < 0:
+                self.retirer(cle, -poids)
+
+    def estimer(self, cle):
+        """
+        Estimation (borne supérieure) du compte d'une clé
+        Une clé non suivie a au plus le plus petit compteur
+        """
+        entree = self.compteurs.get(cle)
+        if entree is not None:
+            return entree[0]
+        if len(self.compteurs) < self.capacite:
+            return 0.0
+        return min(c[0] for c in self.compteurs.values())
+
+    def top(self, limite):
+        """Retourne les `limite` plus gros compteurs : [(cle, compte, erreur), ...]"""
+        tries = sorted(self.compteurs.items(), key=lambda item: item[1][0], reverse=True)
+        return [(cle, compte, erreur) for cle, (compte, erreur) in tries[:limite]]
+
+    def vers_dict(self):
+        return {
+            'capacite': self.capacite,
+            'total': self.total,
+            'compteurs': [[cle, compte, erreur] for cle, (compte, erreur) in self.compteurs.items()],
+        }
+
+    @classmethod
+    def depuis_dict(cls, donnees):
+        sketch = cls(donnees['capacite'])
+        sketch.total = donnees['total']
+        sketch.compteurs = {cle: [compte, erreur] for cle, compte, erreur in donnees['compteurs']}
+        return sketch
+
+
+class TopKService:
+    """
+    Service gérant les classements approximatifs :
+    - Mise à jour incrémentale (signaux post_save / post_delete Expedition / Reclamation)
+    - Lecture des classements en O(K)
+    - Fusion périodique dans la table SketchTopK
+    - Reconstruction exacte depuis la base (aucun sketch persisté, ou chaque nuit)
+
+    Chaque sketch existe en version globale ('*') et par année de création.
+    """
+
+    # Sketches alimentés par les expéditions
+    SKETCHES_EXPEDITION = ['clients_volume', 'clients_valeur', 'destinations_volume', 'destinations_valeur']
+    # Sketches alimentés par les réclamations (pas de découpage par année)
+    SKETCHES_RECLAMATION = ['reclamations_clients', 'reclamations_natures']
+
+    _sketches = {}
+    _deltas = {}   # nom complet → {cle: poids signé} depuis la dernière sauvegarde
+    _verrou = threading.Lock()
+
+    @staticmethod
+    def capacite():
+        return getattr(settings, 'TOPK_CAPACITE', 500)
+
+    @staticmethod
+    def _nom_complet(nom, annee=None):
+        return f"{nom}:{annee if annee else '*'}"
+
+    # ==================== MISE À JOUR ====================
+
+    @staticmethod
+    def _increments_expedition(valeurs, signe=1):
+        """
+        valeurs : (client_id, destination_id, montant_total, date_creation)
+        Returns: [(nom, annee, cle, poids signé), ...] (globaux + année de création)
+        """
+        client_id, destination_id, montant_total, date_creation = valeurs
+        annee = date_creation.year if date_creation else None
+        montant = float(montant_total or 0)
+        increments = {
+            'clients_volume': (client_id, 1),
+            'clients_valeur': (client_id, montant),
+            'destinations_volume': (destination_id, 1),
+            'destinations_valeur': (destination_id, montant),
+        }
+        return [
+            (nom, periode, cle, signe * poids)
+            for nom, (cle, poids) in increments.items()
+            for periode in (None, annee)
+        ]
+
+    @staticmethod
+    def _increments_reclamation(valeurs, signe=1):
+        """valeurs : (client_id, nature)"""
+        client_id, nature = valeurs
+        return [('reclamations_clients', None, client_id, signe), ('reclamations_natures', None, nature, signe)]
+
+    @staticmethod
+    def _appliquer(increments):
+        """
+        Applique [(nom, annee, cle, poids signé)] aux sketches et aux deltas à sauvegarder
+        Un sketch reconstruit depuis la base contient déjà l'événement (commité) : ignoré
+        """
+        sketches = {}
+        for nom, periode, _, _ in increments:
+            cle_sketch = (nom, periode)
+            if cle_sketch not in sketches:
+                sketches[cle_sketch] = TopKService._obtenir(nom, periode)[1]
+
+        with TopKService._verrou:
+            for nom, periode, cle, poids in increments:
+                if sketches[(nom, periode)] or not poids:
+                    continue
+                nom_complet = TopKService._nom_complet(nom, periode)
+                sketch = TopKService._sketches.get(nom_complet)
+                if sketch is None:
+                    continue    # reinitialiser() entre-temps
+                sketch.appliquer({cle: poids})
+                delta = TopKService._deltas.setdefault(nom_complet, {})
+                delta[cle] = delta.get(cle, 0.0) + poids
+
+    @staticmethod
+    def enregistrer_expedition(expedition):
+        """
+        Ajoute une nouvelle expédition aux sketches (globaux + année de création)
+        Appelé par le signal post_save de Expedition (création)
+        """
+        TopKService._appliquer(TopKService._increments_expedition(expedition.valeurs_topk()))
+
+    @staticmethod
+    def modifier_expedition(origine, valeurs):
+        """
+        Corrige les sketches quand client, destination ou montant d'une expédition changent
+        origine / valeurs : Expedition.valeurs_topk() avant (lues en base) / après
+        """
+        TopKService._appliquer(
+            TopKService._increments_expedition(origine, signe=-1)
+            + TopKService._increments_expedition(valeurs)
+        )
+
+    @staticmethod
+    def retirer_expedition(valeurs):
+        """Retire une expédition supprimée (signal post_delete)"""
+        TopKService._appliquer(TopKService._increments_expedition(valeurs, signe=-1))
+
+    @staticmethod
+    def enregistrer_reclamation(reclamation):
+        """
+        Ajoute une nouvelle réclamation aux sketches
+        Appelé par le signal post_save de Reclamation (création)
+        """
+        TopKService._appliquer(TopKService._increments_reclamation(reclamation.valeurs_topk()))
+
+    @staticmethod
+    def modifier_reclamation(origine, valeurs):
+        """Corrige les sketches quand le client ou la nature d'une réclamation changent"""
+        TopKService._appliquer(
+            TopKService._increments_reclamation(origine, signe=-1)
+            + TopKService._increments_reclamation(valeurs)
+        )
+
+    @staticmethod
+    def retirer_reclamation(valeurs):
+        """Retire une réclamation supprimée (signal post_delete)"""
+        TopKService._appliquer(TopKService._increments_reclamation(valeurs, signe=-1))
+
+    # ==================== LECTURE ====================
+
+    @staticmethod
+    def top(nom, limite=10, annee=None):
+        """
+        Retourne le classement [(cle, estimation, erreur_max), ...] en O(K)
+        """
+        sketch, _ = TopKService._obtenir(nom, annee)
+        with TopKService._verrou:
+            return sketch.top(limite)
+
+    @staticmethod
+    def estimer(nom, cle, annee=None):
+        """Estimation d'une clé précise dans un sketch"""
+        sketch, _ = TopKService._obtenir(nom, annee)
+        with TopKService._verrou:
+            return sketch.estimer(cle)
+
+    @staticmethod
+    def total(nom, annee=None):
+        """Nombre total (ou montant total) d'événements vus par un sketch"""
+        sketch, _ = TopKService._obtenir(nom, annee)
+        with TopKService._verrou:
+            return sketch.total
+
+    # ==================== PERSISTANCE ====================
+
+    @staticmethod
+    def _obtenir(nom, annee=None):
+        """
+        Retourne (sketch, reconstruit)
+
+        ORDRE DE RECHERCHE :
+        1. Mémoire du processus
+        2. Table SketchTopK (dernière sauvegarde)
+        3. Reconstruction exacte depuis la base (reconstruit=True)
+
+        Les requêtes (2, 3) tournent hors du verrou : une reconstruction ne bloque
+        pas les autres threads. Si deux threads chargent le même sketch, le premier
+        installé gagne et l'autre l'utilise (reconstruit=False).
+        """
+        from app1.models import SketchTopK
+
+        nom_complet = TopKService._nom_complet(nom, annee)
+        with TopKService._verrou:
+            sketch = TopKService._sketches.get(nom_complet)
+        if sketch is not None:
+            return sketch, False
+
+        persiste = SketchTopK.objects.filter(nom=nom_complet).first()
+        charge = SpaceSaving.depuis_dict(persiste.donnees) if persiste else TopKService._reconstruire(nom, annee)
+
+        with TopKService._verrou:
+            sketch = TopKService._sketches.setdefault(nom_complet, charge)
+            reconstruit = sketch is charge and persiste is None
+            if reconstruit:
+                # Pas encore en base : à écrire à la prochaine sauvegarde
+                TopKService._deltas.setdefault(nom_complet, {})
+        return sketch, reconstruit
+
+    @staticmethod
+    def _reconstruire(nom, annee=None):
+        """
+        Reconstruit un sketch à partir d'une agrégation exacte (une seule fois)
+        """
+        from app1.models import Expedition, Reclamation
+
+        sketch = SpaceSaving(TopKService.capacite())
+
+        if nom in TopKService.SKETCHES_EXPEDITION:
+            expeditions = Expedition.objects.all()
+            if annee:
+                expeditions = expeditions.filter(date_creation__year=annee)
+
+            champ = 'client_id' if nom.startswith('clients') else 'destination_id'
+            lignes = expeditions.values(champ).annotate(
+                nb=Count('id'),
+                ca=Sum('montant_total')
+            ).order_by()
+
+            for ligne in lignes:
+                poids = ligne['nb'] if nom.endswith('volume') else float(ligne['ca'] or 0)
+                sketch.ajouter(ligne[champ], poids)
+
+        elif nom in TopKService.SKETCHES_RECLAMATION:
+            champ = 'client_id' if nom == 'reclamations_clients' else 'nature'
+            lignes = Reclamation.objects.values(champ).annotate(nb=Count('id')).order_by()
+            for ligne in lignes:
+                sketch.ajouter(ligne[champ], ligne['nb'])
+
+        else:
+            raise ValueError(f"Sketch inconnu : {nom}")
+
+        return sketch
+
+    @staticmethod
+    def sauvegarder():
+        """
+        Fusionne dans SketchTopK les deltas vus depuis la dernière sauvegarde
+        Appelé périodiquement par le scheduler
+
+        Returns:
+            int: nombre de sketches sauvegardés
+        """
+        with TopKService._verrou:
+            deltas = TopKService._deltas
+            TopKService._deltas = {}
+            etats = {
+                nom: TopKService._sketches[nom].vers_dict()
+                for nom in deltas
+                if nom in TopKService._sketches
+            }
+
+        for nom, delta in deltas.items():
+            if nom not in etats:
+                continue
+            donnees = TopKService._fusionner(nom, delta, etats[nom])
+
+            # Vue locale = base (deltas de tous les processus) + ce qui est arrivé depuis
+            sketch = SpaceSaving.depuis_dict(donnees)
+            with TopKService._verrou:
+                if nom in TopKService._sketches:
+                    sketch.appliquer(TopKService._deltas.get(nom, {}))
+                    TopKService._sketches[nom] = sketch
+
+        return len(etats)
+
+    @staticmethod
+    def _fusionner(nom, delta, etat):
+        """
+        Applique `delta` à la ligne SketchTopK verrouillée (select_for_update)
+        Ligne absente → `etat` (sketch complet du processus) est écrit tel quel
+
+        Returns:
+            dict: données écrites
+        """
+        from app1.models import SketchTopK
+
+        with transaction.atomic():
+            persiste = SketchTopK.objects.select_for_update().filter(nom=nom).first()
+            if persiste is None:
+                try:
+                    with transaction.atomic():
+                        SketchTopK.objects.create(nom=nom, donnees=etat)
+                    return etat
+                except IntegrityError:
+                    # Créée par un autre processus entre-temps → fusion
+                    persiste = SketchTopK.objects.select_for_update().get(nom=nom)
+
+            sketch = SpaceSaving.depuis_dict(persiste.donnees)
+            sketch.appliquer(delta)
+            persiste.donnees = sketch.vers_dict()
+            persiste.save(update_fields=['donnees', 'date_mise_a_jour'])
+            return persiste.donnees
+
+    @staticmethod
+    def reconstruire():
+        """
+        Recalcule exactement tous les sketches connus (base + mémoire) et les persiste
+        Corrige l'approximation des retraits (scheduler, chaque nuit)
+
+        Le delta du processus est vidé AVANT l'agrégation : un événement concurrent
+        est au pire compté deux fois (surestimation), jamais perdu.
+
+        Returns:
+            int: nombre de sketches reconstruits
+        """
+        from app1.models import SketchTopK
+
+        noms = set(SketchTopK.objects.values_list('nom', flat=True))
+        with TopKService._verrou:
+            noms |= set(TopKService._sketches)
+
+        for nom_complet in sorted(noms):
+            nom, _, periode = nom_complet.partition(':')
+            annee = None if periode == '*' else int(periode)
+
+            with TopKService._verrou:
+                TopKService._deltas.pop(nom_complet, None)
+            sketch = TopKService._reconstruire(nom, annee)
+            SketchTopK.objects.update_or_create(nom=nom_complet, defaults={'donnees': sketch.vers_dict()})
+
+            with TopKService._verrou:
+                sketch.appliquer(TopKService._deltas.get(nom_complet, {}))
+                TopKService._sketches[nom_complet] = sketch
+
+        return len(noms)
+
+    @staticmethod
+    def reinitialiser():
+        """
+        Vide les sketches (mémoire + base) : ils seront reconstruits à la prochaine lecture
+        """
+        from app1.models import SketchTopK
+
+        with TopKService._verrou:
+            TopKService._sketches = {}
+            TopKService._deltas = {}
+        SketchTopK.objects.all().delete()
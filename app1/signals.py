@@ -1,9 +1,10 @@
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 from decimal import Decimal
-from .models import Destination, TypeService, Tarification, Expedition, Tournee, Client, Paiement, Incident
+from .models import Destination, TypeService, Tarification, Expedition, Tournee, Client, Paiement, Incident, Reclamation, TrackingExpedition, Notification
 from django.db import transaction
+from .services.solde_service import SoldeService
 
 # ========== SIGNAL 1 : Création automatique des tarifications ==========
 @receiver(post_save, sender=Destination)
@@ -57,7 +58,7 @@ def gerer_suppression_expedition(sender, instance, **kwargs):
     Signal appelé AVANT la suppression d'une expédition.
     Gère TOUTE la logique : validation + facture + solde + notification
     """
-    from .models import Facture, Notification, Client
+    from .models import Facture, Client
     from django.db.models import Sum
     from datetime import date
     
@@ -110,50 +111,44 @@ def gerer_suppression_expedition(sender, instance, **kwargs):
     # Exemple : solde = 1000.45 DA, expédition = 1100.45 DA, payé = 100 DA
     # Nouveau solde = 1000.45 - 1100.45 = -100 DA (crédit de 100 DA) ✅
     
-    client.solde -= montant_exp_ttc
-    client.save()
+    SoldeService.appliquer(
+        client, -montant_exp_ttc, 'ANNULATION_EXPEDITION',
+        reference=facture.numero_facture,
+        description=f"Suppression expédition {instance.get_numero_expedition()}"
+    )
     
     # ========== MISE À JOUR FACTURE ==========
     
-    facture.expeditions.remove(instance)
+    from .utils import FacturationService
+    FacturationService.retirer_expedition(facture, instance)
     
-    if facture.expeditions.count() == 0:
+    if facture.nb_expeditions == 0:
         # Plus d'expéditions → Annuler la facture
         
         # ✅ Annuler les paiements (changer le statut uniquement, ne PAS les supprimer)
-        # Cela permet de garder l'historique des paiements
-        for paiement in facture.paiements.filter(statut='VALIDE'):
-            paiement.statut = 'ANNULE'
-            paiement.save()
+        # Cela permet de garder l'historique des paiements ; le montant payé reste
+        # au client en crédit (déjà compté par le retrait de l'expédition ci-dessus)
+        FacturationService.annuler_paiements_facture(facture)
         
         facture.statut = 'ANNULEE'
         facture.montant_ht = Decimal('0.00')
         facture.montant_tva = Decimal('0.00')
         facture.montant_ttc = Decimal('0.00')
-        facture.save()
+        facture.save(update_fields=['statut', 'montant_ht', 'montant_tva', 'montant_ttc'])
     else:
-        # Recalculer la facture avec les expéditions restantes
-        from .utils import FacturationService
-        FacturationService.calculer_montants_facture(facture)
+        # Montants déjà mis à jour par delta → seul le statut est réévalué
         FacturationService.mettre_a_jour_statut_facture(facture)
     
     # Supprimer le tracking
     instance.suivis.all().delete()
     
-    # ========== NOTIFICATION SI SOLDE NÉGATIF ==========
+    # ========== NOTIFICATION SI SOLDE NÉGATIF (après commit) ==========
     
+    client.refresh_from_db(fields=['solde'])
     if client.solde < 0:
-        Notification.objects.create(
-            type_notification='SOLDE_NEGATIF',
-            titre=f"Client en crédit - {client.nom} {client.prenom}",
-            message=(
-                f"Le client {client.nom} {client.prenom} a un crédit de "
-                f"{abs(client.solde):,.2f} DA suite à l'annulation de l'expédition "
-                f"{instance.get_numero_expedition()}.\n\n"
-                "Un remboursement doit être effectué."
-            ),
-            client=client,
-            statut='NON_LUE'
+        from .services.boite_envoi_service import BoiteEnvoiService
+        BoiteEnvoiService.publier(
+            'client_en_credit', client_id=client.pk, numero_expedition=instance.get_numero_expedition()
         )
 
 # ========== SIGNAL 3 : Gestion suppression tournée ==========
@@ -164,11 +159,13 @@ def gerer_suppression_tournee(sender, instance, **kwargs):
     
     Ce signal gère 2 choses :
     1. BLOQUER la suppression si tournée EN_COURS ou TERMINEE
-    2. LIBÉRER les ressources (chauffeur + véhicule) si tournée PREVUE
+    2. Les réservations chauffeur + véhicule de la tournée sont supprimées
+       en cascade (ReservationRessource) → ressources libérées
     
     LOGIQUE :
     - Tournée EN_COURS ou TERMINEE → ❌ ERREUR, suppression bloquée
-    - Tournée PREVUE → ✅ OK, on libère chauffeur et véhicule puis suppression
+    - Tournée PREVUE → ✅ OK, suppression (les statuts ne changent pas :
+      une tournée PREVUE ne met plus ses ressources EN_TOURNEE)
     """
     
     # Validation : Empêcher suppression si tournée en cours ou terminée
@@ -178,16 +175,6 @@ def gerer_suppression_tournee(sender, instance, **kwargs):
             "Seules les tournées PREVUES peuvent être supprimées."
         )
     
-    # Libération des ressources si tournée PREVUE
-    if instance.statut == 'PREVUE':
-        # Remettre le chauffeur DISPONIBLE
-        instance.chauffeur.statut_disponibilite = 'DISPONIBLE'
-        instance.chauffeur.save()
-        
-        # Remettre le véhicule DISPONIBLE
-        instance.vehicule.statut = 'DISPONIBLE'
-        instance.vehicule.save()
-    
 # ========== SIGNAL 4 : Gestion suppression paiement ==========
 @receiver(pre_delete, sender=Paiement)
 @transaction.atomic
@@ -205,11 +192,15 @@ def gerer_suppression_paiement(sender, instance, **kwargs):
         client = Client.objects.select_for_update().get(id=instance.client.id)
         
         # ANNULER la diminution du solde (remettre la dette)
-        client.solde += instance.montant_paye
-        client.save()
+        SoldeService.appliquer(
+            client, instance.montant_paye, 'ANNULATION_PAIEMENT',
+            reference=instance.facture.numero_facture,
+            description="Suppression du paiement"
+        )
         
-        # Mettre à jour le statut de la facture après suppression
+        # Retirer le paiement du cumul puis mettre à jour le statut de la facture
         from .utils import FacturationService
+        FacturationService.appliquer_delta_facture(instance.facture, montant_paye=-instance.montant_paye)
         FacturationService.mettre_a_jour_statut_facture(instance.facture)
 
    # ======= SIGNAL POUR REMBOURSEMENT AUTOMATIQUE =======
@@ -219,30 +210,145 @@ def gerer_suppression_paiement(sender, instance, **kwargs):
 def notifier_tournee_terminee(sender, instance, created, **kwargs):
     """
     Quand une tournée passe à TERMINEE, créer une notification
-    pour demander le kilométrage d'arrivée
+    pour demander le kilométrage d'arrivée (après commit, via la boîte d'envoi)
     """
     if not created:  # Seulement lors d'une modification
-        from .models import Notification
-        
-        # Vérifier si la tournée vient de passer à TERMINEE
-        if instance.statut == 'TERMINEE':
-            # Vérifier si le kilométrage d'arrivée n'est pas déjà renseigné
-            if not instance.kilometrage_arrivee:
-                # Créer une notification
-                Notification.objects.get_or_create(
-                    type_notification='TOURNEE_TERMINEE',
-                    tournee=instance,
-                    statut='NON_LUE',
-                    defaults={
-                        'titre': f"Tournée terminée - {instance.get_numero_tournee()}",
-                        'message': (
-                            f"La tournée {instance.get_numero_tournee()} est terminée.\n\n"
-                            f"Chauffeur : {instance.chauffeur.prenom} {instance.chauffeur.nom}\n"
-                            f"Véhicule : {instance.vehicule.numero_immatriculation}\n"
-                            f"Kilométrage départ : {instance.kilometrage_depart} km\n\n"
-                            f"Veuillez renseigner le kilométrage d'arrivée pour finaliser la tournée."
-                        ),
-                        'vehicule': instance.vehicule,
-                    }
-                )
+        # Tournée TERMINEE sans kilométrage d'arrivée
+        if instance.statut == 'TERMINEE' and not instance.kilometrage_arrivee:
+            from .services.boite_envoi_service import BoiteEnvoiService
+            BoiteEnvoiService.publier('tournee_terminee', tournee_id=instance.pk)
+
+# ========== SIGNAL 6 : Mise à jour des classements Top-K ==========
+def mettre_a_jour_topk(instance, created, ajouter, modifier):
+    """
+    Après le commit : création → ajout ; client / destination / montant (ou nature)
+    modifiés depuis la lecture en base → retrait des anciennes valeurs + ajout
+    """
+    if created:
+        instance._topk_origine = instance.valeurs_topk()
+        transaction.on_commit(lambda: ajouter(instance))
+        return
+
+    origine = getattr(instance, '_topk_origine', None)
+    valeurs = instance.valeurs_topk()
+    if origine is None or None in origine or origine == valeurs:
+        return
+    instance._topk_origine = valeurs
+    transaction.on_commit(lambda: modifier(origine, valeurs))
+
+@receiver(post_save, sender=Expedition)
+def mettre_a_jour_topk_expedition(sender, instance, created, **kwargs):
+    """
+    Sketches Top-K des expéditions (meilleurs clients, destinations populaires)
+    """
+    from .services.topk_service import TopKService
+    mettre_a_jour_topk(instance, created, TopKService.enregistrer_expedition, TopKService.modifier_expedition)
+
+@receiver(post_save, sender=Reclamation)
+def mettre_a_jour_topk_reclamation(sender, instance, created, **kwargs):
+    """
+    Sketches Top-K des réclamations (clients réclamants, motifs récurrents)
+    """
+    from .services.topk_service import TopKService
+    mettre_a_jour_topk(instance, created, TopKService.enregistrer_reclamation, TopKService.modifier_reclamation)
+
+@receiver(post_delete, sender=Expedition)
+def retirer_topk_expedition(sender, instance, **kwargs):
+    """Expédition supprimée → retirée des sketches après le commit"""
+    from .services.topk_service import TopKService
+    valeurs = getattr(instance, '_topk_origine', None) or instance.valeurs_topk()
+    transaction.on_commit(lambda: TopKService.retirer_expedition(valeurs))
+
+@receiver(post_delete, sender=Reclamation)
+def retirer_topk_reclamation(sender, instance, **kwargs):
+    """Réclamation supprimée → retirée des sketches après le commit"""
+    from .services.topk_service import TopKService
+    valeurs = getattr(instance, '_topk_origine', None) or instance.valeurs_topk()
+    transaction.on_commit(lambda: TopKService.retirer_reclamation(valeurs))
+
+# ========== SIGNAL 7 : Mémoriser les écritures (réplica analytique) ==========
+@receiver(post_save)
+@receiver(post_delete)
+def memoriser_ecriture(sender, **kwargs):
+    """
+    Toute écriture épingle le contexte courant sur la base principale
+    tant que la réplica analytique ne l'a pas recopiée (voir routers.py)
+    """
+    from .routers import marquer_ecriture
+    marquer_ecriture()
+
+# ========== SIGNAL 8 : Matrice des distances (mise à jour incrémentale) ==========
+@receiver(post_save, sender=Destination)
+def mettre_a_jour_matrice_distances(sender, instance, **kwargs):
+    """
+    Nouvelle destination (ou coordonnées modifiées) → calcul de SA ligne
+    et de SA colonne dans la matrice des distances, après commit
+    """
+    from .services.distance_service import DistanceService
+
+    def mettre_a_jour():
+        try:
+            DistanceService.ajouter_destination(instance)
+        except OSError as e:
+            print(f"⚠️ Matrice des distances non mise à jour : {e}")
+
+    transaction.on_commit(mettre_a_jour)
+
+# ========== SIGNAL 9 : Cache du suivi public ==========
+@receiver(post_save, sender=TrackingExpedition)
+@receiver(post_save, sender=Expedition)
+def invalider_suivi_public(sender, instance, **kwargs):
+    """
+    Nouvelle étape de suivi ou expédition modifiée → l'état public en cache
+    est retiré après commit (relu en base à la prochaine consultation)
+    """
+    from .services.suivi_public_service import SuiviPublicService
+
+    expedition_id = instance.expedition_id if sender is TrackingExpedition else instance.pk
+    transaction.on_commit(lambda: SuiviPublicService.invalider([expedition_id]))
+
+# ========== SIGNAL 10 : Diffusion en direct (tableau de bord) ==========
+@receiver(post_save, sender=Tournee)
+def diffuser_tournee(sender, instance, **kwargs):
+    """
+    Changement de tournée → flux SSE des agents connectés (après commit)
+    Aucune requête : libellés seulement si chauffeur / véhicule sont déjà chargés
+    (le navigateur affiche sinon les identifiants)
+    """
+    from .services.diffusion_service import DiffusionService
+
+    chauffeur = instance.chauffeur if Tournee.chauffeur.is_cached(instance) else None
+    vehicule = instance.vehicule if Tournee.vehicule.is_cached(instance) else None
+
+    DiffusionService.publier_apres_commit('tournee', {
+        'id': instance.pk,
+        'statut': instance.statut,
+        'libelle_statut': instance.get_statut_display(),
+        'chauffeur_id': instance.chauffeur_id,
+        'vehicule_id': instance.vehicule_id,
+        'chauffeur': f"{chauffeur.prenom} {chauffeur.nom}" if chauffeur else None,
+        'vehicule': vehicule.numero_immatriculation if vehicule else None,
+    })
+
+@receiver(post_save, sender=Notification)
+def diffuser_notification(sender, instance, created, **kwargs):
+    """Nouvelle notification → flux SSE"""
+    if created:
+        from .services.diffusion_service import DiffusionService
+        DiffusionService.publier_apres_commit('notification', DiffusionService.notification(instance))
+
+@receiver(post_save, sender=TrackingExpedition)
+def diffuser_suivi(sender, instance, created, **kwargs):
+    """Nouvelle étape de suivi → flux SSE"""
+    if created:
+        from .services.diffusion_service import DiffusionService
+        DiffusionService.publier_apres_commit('suivi', DiffusionService.suivi(instance))
+
+# ========== SIGNAL 11 : Série d'efficacité de la flotte ==========
+@receiver(post_save, sender=Tournee)
+def enregistrer_mesure_tournee(sender, instance, **kwargs):
+    """Tournée finalisée (kilométrage d'arrivée) → nouveau point de la série du véhicule (boîte d'envoi)"""
+    if instance.statut == 'TERMINEE' and instance.kilometrage_parcouru is not None:
+        from .services.boite_envoi_service import BoiteEnvoiService
+        BoiteEnvoiService.publier('tournee_finalisee', tournee_id=instance.pk)
 
@@ -1,3 +1,2227 @@
-from django.test import TestCase
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import Mock, patch
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    AgentUtilisateur, ArchiveHistorique, Chauffeur, Client, Destination, Expedition, Notification,
+    ReservationRessource, Tournee, TrackingExpedition, TypeService, Vehicule,
+)
+from .routers import base_analytique, marquer_ecriture, reinitialiser_ecriture, retablir_ecriture
+from .services.banc_service import BancService
+from .services.boite_envoi_service import GESTIONNAIRES, BoiteEnvoiService
+from .services.donnees_service import DonneesService, signaux_suspendus
+from .services.ingestion_service import IngestionService
+from .services.instantane_service import InstantaneService
+from .services.requetes_service import BudgetRequetesDepasse, RequetesService
+from .services.sauvegarde_service import SauvegardeService
+from .services.topk_service import SpaceSaving, TopKService
+from .urls import BUDGETS_REQUETES, urlpatterns
+
+
+def setUpModule():
+    """Fichiers écrits par les services (matrice des distances) : dossier temporaire, jamais BASE_DIR"""
+    import tempfile
+    from pathlib import Path
+    from .services.distance_service import DistanceService
+
+    global _dossier_tests, _reglages_tests
+    _dossier_tests = tempfile.TemporaryDirectory()
+    _reglages_tests = override_settings(MATRICE_DISTANCES_DIR=Path(_dossier_tests.name) / 'matrices')
+    _reglages_tests.enable()
+    DistanceService._etat['mtime'] = None
+
+
+def tearDownModule():
+    from .services.distance_service import DistanceService
+
+    _reglages_tests.disable()
+    _dossier_tests.cleanup()
+    DistanceService._etat.update(mtime=None, distances=None, durees=None)
+
+
+def creer_referentiel():
+    """Types de service + une destination (tarifications créées par signal)"""
+    type_service = TypeService.objects.create(type_service='STANDARD')
+    TypeService.objects.create(type_service='EXPRESS')
+    destination = Destination.objects.create(ville='Alger', wilaya='Alger', zone_geographique='NATIONALE', distance_estimee=10)
+    return type_service, destination
+
+
+def creer_equipe(i):
+    """Un chauffeur et un véhicule disponibles"""
+    chauffeur = Chauffeur.objects.create(
+        nom=f'Chauffeur{i}', prenom='C', telephone=f'06600002{i:02d}', numero_permis=f'Q{i}',
+        date_obtention_permis=date(2015, 1, 1), date_expiration_permis=date(2035, 1, 1), date_embauche=date(2020, 1, 1),
+    )
+    vehicule = Vehicule.objects.create(
+        numero_immatriculation=f'{i:05d} 121 16', marque='Renault', modele='Master', annee=2020,
+        type_vehicule='FOURGON', capacite_poids=Decimal('1500'), capacite_volume=Decimal('12'),
+        consommation_moyenne=Decimal('9'), date_acquisition=date(2020, 1, 1),
+    )
+    return chauffeur, vehicule
+
+
+def creer_expedition(client, destination, type_service, **champs):
+    return Expedition.objects.create(
+        client=client, destination=destination, type_service=type_service,
+        nom_destinataire='Destinataire', telephone_destinataire='0550999999',
+        email_destinataire='d@example.com', adresse_destinataire='Rue 1',
+        poids=champs.pop('poids', Decimal('2.5')), volume=champs.pop('volume', Decimal('0.1')), **champs,
+    )
+
+
+class SpaceSavingTests(SimpleTestCase):
+    """
+    Vérifie les garanties de l'algorithme Space-Saving utilisé par TopKService
+    """
+
+    def _flux_zipf(self, nb_evenements, nb_cles, graine=42):
+        generateur = random.Random(graine)
+        poids = [1.0 / (rang + 1) for rang in range(nb_cles)]
+        return generateur.choices(range(nb_cles), weights=poids, k=nb_evenements)
+
+    def test_erreur_bornee(self):
+        """Estimation >= valeur réelle et estimation - réelle <= total / capacité"""
+        capacite = 50
+        flux = self._flux_zipf(20000, 1000)
+        sketch = SpaceSaving(capacite)
+        reels = {}
+
+        for cle in flux:
+            sketch.ajouter(cle)
+            reels[cle] = reels.get(cle, 0) + 1
+
+        borne = sketch.total / capacite
+        for cle, compte_reel in reels.items():
+            estimation = sketch.estimer(cle)
+            self.assertGreaterEqual(estimation, compte_reel)
+            self.assertLessEqual(estimation - compte_reel, borne)
+
+    def test_top_k_retrouve_les_gros_clients(self):
+        """Tout élément de fréquence > total / capacité est présent dans le sketch"""
+        capacite = 50
+        flux = self._flux_zipf(20000, 1000, graine=7)
+        sketch = SpaceSaving(capacite)
+        reels = {}
+
+        for cle in flux:
+            sketch.ajouter(cle)
+            reels[cle] = reels.get(cle, 0) + 1
+
+        seuil = sketch.total / capacite
+        gros = {cle for cle, compte in reels.items() if compte > seuil}
+        suivis = {cle for cle, _, _ in sketch.top(capacite)}
+        self.assertTrue(gros.issubset(suivis))
+
+        top_reel = sorted(reels, key=reels.get, reverse=True)[:5]
+        top_sketch = [cle for cle, _, _ in sketch.top(5)]
+        self.assertEqual(top_reel[0], top_sketch[0])
+
+    def test_poids_et_serialisation(self):
+        """Les poids (montants) sont cumulés et le sketch survit à la sauvegarde JSON"""
+        sketch = SpaceSaving(3)
+        sketch.ajouter(1, 100.5)
+        sketch.ajouter(2, 50)
+        sketch.ajouter(1, 10)
+
+        copie = SpaceSaving.depuis_dict(sketch.vers_dict())
+        self.assertEqual(copie.estimer(1), 110.5)
+        self.assertEqual(copie.total, 160.5)
+        self.assertEqual(copie.top(1)[0][0], 1)
+
+
+class TopKServiceTests(TestCase):
+    """
+    Sketches Top-K : fusion entre processus, retraits, reconstruction hors verrou, signaux
+    """
+
+    def setUp(self):
+        TopKService.reinitialiser()
+        self.addCleanup(TopKService.reinitialiser)
+
+    @staticmethod
+    def reclamation(client_id, nature='RETARD_LIVRAISON'):
+        return type('Reclamation', (), {'valeurs_topk': lambda self: (client_id, nature)})()
+
+    @contextmanager
+    def processus(self, etat):
+        """Exécute le bloc avec la mémoire d'un autre processus (sketches + deltas)"""
+        TopKService._sketches, TopKService._deltas = etat['sketches'], etat['deltas']
+        try:
+            yield
+        finally:
+            etat['sketches'], etat['deltas'] = TopKService._sketches, TopKService._deltas
+            TopKService._sketches, TopKService._deltas = {}, {}
+
+    def test_sauvegardes_fusionnees(self):
+        """Deux processus sauvegardent le même sketch : aucun ne perd les comptes de l'autre"""
+        from .models import SketchTopK
+
+        a = {'sketches': {}, 'deltas': {}}
+        b = {'sketches': {}, 'deltas': {}}
+        with self.processus(a):
+            TopKService.top('reclamations_clients')       # reconstruit (vide) depuis la base
+            for _ in range(3):
+                TopKService.enregistrer_reclamation(self.reclamation(1))
+            self.assertEqual(TopKService.sauvegarder(), 2)     # clients + natures
+        with self.processus(b):
+            self.assertEqual(TopKService.estimer('reclamations_clients', 1), 3)
+            TopKService.enregistrer_reclamation(self.reclamation(2))
+            TopKService.enregistrer_reclamation(self.reclamation(2))
+        with self.processus(a):
+            TopKService.enregistrer_reclamation(self.reclamation(1))
+            TopKService.sauvegarder()
+        with self.processus(b):
+            TopKService.sauvegarder()
+            # Vue locale rechargée depuis la base : comptes de A inclus
+            self.assertEqual(TopKService.estimer('reclamations_clients', 1), 4)
+            TopKService.retirer_reclamation((2, 'RETARD_LIVRAISON'))
+            self.assertEqual(TopKService.estimer('reclamations_clients', 2), 1)
+            TopKService.sauvegarder()
+
+        persiste = SpaceSaving.depuis_dict(SketchTopK.objects.get(nom='reclamations_clients:*').donnees)
+        self.assertEqual((persiste.estimer(1), persiste.estimer(2), persiste.total), (4, 1, 5))
+
+    def test_reconstruction_hors_verrou(self):
+        """Pendant une reconstruction (requête lente), les autres sketches restent lisibles"""
+        TopKService.top('reclamations_clients')
+        lecteur = threading.Thread(target=TopKService.estimer, args=('reclamations_clients', 1))
+        reconstruire = TopKService._reconstruire
+
+        def reconstruction_lente(nom, annee=None):
+            lecteur.start()
+            lecteur.join(5)
+            return reconstruire(nom, annee)
+
+        with patch.object(TopKService, '_reconstruire', side_effect=reconstruction_lente):
+            TopKService.top('reclamations_natures')
+        self.assertFalse(lecteur.is_alive())
+
+    def test_signaux_creation_modification_suppression(self):
+        """Création → ajout ; changement de client → transfert ; suppression → retrait"""
+        type_service, destination = creer_referentiel()
+        creer_equipe(0)
+        premier = Client.objects.create(nom='Premier', prenom='P', telephone='0550000011')
+        second = Client.objects.create(nom='Second', prenom='S', telephone='0550000012')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            expedition = creer_expedition(premier, destination, type_service)
+        with self.captureOnCommitCallbacks(execute=True):
+            creer_expedition(premier, destination, type_service)
+        self.assertEqual(TopKService.estimer('clients_volume', premier.pk), 2)
+        montant = float(expedition.montant_total)
+        self.assertAlmostEqual(TopKService.estimer('clients_valeur', premier.pk), 2 * montant)
+
+        expedition = Expedition.objects.get(pk=expedition.pk)
+        expedition.client = second
+        with self.captureOnCommitCallbacks(execute=True):
+            expedition.save()
+        self.assertEqual(TopKService.estimer('clients_volume', premier.pk), 1)
+        self.assertEqual(TopKService.estimer('clients_volume', second.pk), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            expedition.delete()
+        self.assertEqual(TopKService.estimer('clients_volume', second.pk), 0)
+        self.assertEqual(TopKService.total('destinations_volume'), 1)
+
+
+class ReplicaRoutageTests(SimpleTestCase):
+    """
+    Réplica analytique : copie en ligne, repli sur la base principale, lecture de ses écritures
+    """
+
+    def setUp(self):
+        from .services.replica_service import ReplicaService
+
+        self.enterContext(patch.dict(ReplicaService._cache, {'horodatage': None, 'lu_le': 0.0}))
+        self.enterContext(override_settings(REPLICA_ANALYTIQUE_ACTIVE=True, REPLICA_RETARD_MAX=600))
+        jeton = reinitialiser_ecriture(None)
+        self.addCleanup(retablir_ecriture, jeton)
+
+    def copie(self, age):
+        from .services.replica_service import ReplicaService
+        return patch.object(ReplicaService, 'horodatage_copie', return_value=time.time() - age)
+
+    def test_repli_sur_la_base_principale(self):
+        """Désactivée, jamais copiée ou trop en retard → 'default' ; sinon 'analytics'"""
+        from .services.replica_service import ReplicaService
+
+        with self.copie(10):
+            self.assertEqual(base_analytique(), 'analytics')
+            with override_settings(REPLICA_ANALYTIQUE_ACTIVE=False):
+                self.assertEqual(base_analytique(), 'default')
+        with self.copie(601):
+            self.assertEqual(base_analytique(), 'default')
+        with patch.object(ReplicaService, 'horodatage_copie', return_value=None):
+            self.assertEqual(base_analytique(), 'default')
+
+    def test_lecture_de_ses_propres_ecritures(self):
+        """Écriture postérieure à la copie → 'default' ; antérieure → 'analytics'"""
+        with self.copie(10):
+            marquer_ecriture(time.time() - 60)
+            self.assertEqual(base_analytique(), 'analytics')
+            marquer_ecriture()
+            self.assertEqual(base_analytique(), 'default')
+
+    def test_middleware_cookie(self):
+        """POST réussi → cookie d'écriture ; la requête suivante qui le renvoie reste sur 'default'"""
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .middleware import EpinglagePrimaireMiddleware
+
+        vues = []
+        middleware = EpinglagePrimaireMiddleware(lambda request: vues.append(base_analytique()) or HttpResponse())
+        fabrique = RequestFactory()
+        with self.copie(10):
+            reponse = middleware(fabrique.post('/'))
+            cookie = reponse.cookies[EpinglagePrimaireMiddleware.NOM_COOKIE].value
+
+            suivante = fabrique.get('/')
+            suivante.COOKIES[EpinglagePrimaireMiddleware.NOM_COOKIE] = cookie
+            middleware(suivante)
+            middleware(fabrique.get('/'))
+        self.assertEqual(vues, ['analytics', 'default', 'analytics'])
+
+    def test_routeur(self):
+        """Écriture toujours sur 'default', relations suivies sur la base de l'instance"""
+        from .routers import AnalyticsRouter
+
+        routeur = AnalyticsRouter()
+        client = Client(pk=1)
+        client._state.db = 'analytics'
+        self.assertEqual(routeur.db_for_read(Expedition, instance=client), 'analytics')
+        self.assertEqual(routeur.db_for_read(Expedition), 'default')
+        self.assertEqual(routeur.db_for_write(Client, instance=client), 'default')
+        self.assertFalse(routeur.allow_migrate('analytics', 'app1'))
+
+    def test_rafraichir(self):
+        """Copie en ligne + horodatage relu dans la réplica"""
+        import sqlite3
+        import tempfile
+        from pathlib import Path
+        from .services.replica_service import ReplicaService
+
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        source, replica = Path(dossier.name) / 'base.sqlite3', Path(dossier.name) / 'replica.sqlite3'
+        connexion = sqlite3.connect(source)
+        connexion.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+        connexion.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(100)])
+        connexion.commit()
+        connexion.close()
+
+        with patch.object(ReplicaService, '_chemins', return_value=(str(source), str(replica))):
+            copie = ReplicaService.rafraichir()
+            ReplicaService._cache['lu_le'] = 0.0
+            self.assertEqual(ReplicaService.horodatage_copie(), copie['horodatage'])
+        connexion = sqlite3.connect(replica)
+        self.assertEqual(connexion.execute("SELECT COUNT(*) FROM t").fetchone()[0], 100)
+        connexion.close()
+
+    def test_copie_par_le_serveur_uniquement(self):
+        """Pas de copie planifiée par les commandes manage.py ; le scheduler serveur la planifie une fois"""
+        from . import scheduler
+
+        self.enterContext(override_settings(INSTANTANES_ACTIFS=False))
+        self.assertIsNone(scheduler._scheduler_serveur)
+        self.addCleanup(setattr, scheduler, '_scheduler_serveur', None)
+        with patch.object(scheduler, 'BackgroundScheduler') as classe:
+            classe.return_value.get_jobs.return_value = ['rafraichir_replica']
+            scheduler.demarrer_scheduler_serveur()
+            scheduler.demarrer_scheduler_serveur()
+        ajout = classe.return_value.add_job
+        ajout.assert_called_once()
+        self.assertEqual(ajout.call_args.kwargs['id'], 'rafraichir_replica')
+        classe.return_value.start.assert_called_once_with()
+
+
+class ModificationClientTests(TestCase):
+    """
+    Le formulaire client ne réécrit jamais le solde : correction par variation signée
+    """
+
+    def setUp(self):
+        self.agent = AgentUtilisateur.objects.create_user(username='agent', password='x', telephone='0550000000')
+        self.client.force_login(self.agent)
+        self.fiche = Client.objects.create(nom='Solde', prenom='S', telephone='0550000021', solde=Decimal('100.00'))
+        self.donnees = {'nom': 'Solde', 'prenom': 'S', 'date_naissance': '1990-01-01', 'telephone': '0550000021',
+                        'compensation_autorisee': 'on'}
+
+    def modifier(self, **champs):
+        return self.client.post(reverse('modifier_client', args=[self.fiche.pk]), {**self.donnees, **champs})
+
+    def test_solde_absent_du_formulaire(self):
+        """Un solde périmé renvoyé par le navigateur n'écrase pas un mouvement concurrent"""
+        from .forms import ClientForm
+        from .services.solde_service import SoldeService
+
+        self.assertNotIn('solde', ClientForm().fields)
+        SoldeService.appliquer(self.fiche, Decimal('50.00'), 'FACTURATION')
+
+        reponse = self.modifier(solde='100.00', ville='Blida')
+        self.assertEqual(reponse.status_code, 302)
+        self.fiche.refresh_from_db()
+        self.assertEqual((self.fiche.solde, self.fiche.ville), (Decimal('150.00'), 'Blida'))
+        self.assertFalse(self.fiche.mouvements_solde.filter(type_mouvement='AJUSTEMENT').exists())
+
+    def test_correction_signee(self):
+        """Correction -30 → un mouvement AJUSTEMENT de -30, solde = grand livre"""
+        from django.db.models import Sum
+
+        self.modifier(correction_solde='-30', motif_correction='Geste commercial')
+        self.fiche.refresh_from_db()
+        self.assertEqual(self.fiche.solde, Decimal('70.00'))
+        mouvement = self.fiche.mouvements_solde.get(type_mouvement='AJUSTEMENT')
+        self.assertEqual((mouvement.montant, mouvement.description), (Decimal('-30.00'), 'Geste commercial'))
+        self.assertEqual(self.fiche.mouvements_solde.aggregate(total=Sum('montant'))['total'], Decimal('70.00'))
+
+
+class SnapshotSoldeTests(TestCase):
+    """
+    Snapshots du grand livre : un mouvement validé après un id plus grand n'est pas perdu
+    """
+
+    def test_id_hors_ordre(self):
+        """Id réservé par une transaction lente, validé après le snapshot → pris au suivant"""
+        from datetime import timedelta
+        from django.db.models import F
+        from .models import MouvementSolde
+        from .services.solde_service import SoldeService
+
+        client = Client.objects.create(nom='Livre', prenom='L', telephone='0550000022', solde=Decimal('100.00'))
+        SoldeService.appliquer(client, Decimal('50.00'), 'FACTURATION')
+        MouvementSolde.objects.update(date_mouvement=timezone.now() - timedelta(hours=1))
+
+        # id suivant réservé (transaction en cours) ; le suivant est déjà validé
+        reserve = MouvementSolde.objects.latest('id').id + 1
+        MouvementSolde.objects.create(id=reserve + 1, client=client, montant=Decimal('20.00'), type_mouvement='FACTURATION')
+        Client.objects.filter(pk=client.pk).update(solde=F('solde') + Decimal('20.00'))
+        self.assertEqual(SoldeService.creer_snapshots(), 1)
+
+        MouvementSolde.objects.create(id=reserve, client=client, montant=Decimal('-30.00'), type_mouvement='PAIEMENT')
+        Client.objects.filter(pk=client.pk).update(solde=F('solde') - Decimal('30.00'))
+        client.refresh_from_db()
+        self.assertEqual(SoldeService.solde_a_date(client, timezone.now()), client.solde)
+
+        with patch('app1.services.solde_service.timezone.now', return_value=timezone.now() + timedelta(hours=1)):
+            self.assertEqual(SoldeService.creer_snapshots(), 1)
+        self.assertEqual(SoldeService.solde_a_date(client, timezone.now() + timedelta(hours=2)), Decimal('140.00'))
+
+
+class PaiementStatutTests(TestCase):
+    """
+    Statut de la facture suivant les paiements (création, annulation, revalidation)
+    """
+
+    def test_transitions(self):
+        """VALIDE → PAYEE ; ANNULE → IMPAYEE ; revalidé → PAYEE"""
+        from .models import Facture, Paiement
+
+        type_service, destination = creer_referentiel()
+        creer_equipe(0)
+        client = Client.objects.create(nom='Payeur', prenom='P', telephone='0550000031')
+        creer_expedition(client, destination, type_service)
+        facture = Facture.objects.get(client=client)
+
+        paiement = Paiement.objects.create(facture=facture, client=client, montant_paye=facture.montant_ttc, mode_paiement='ESPECES')
+        facture.refresh_from_db()
+        self.assertEqual(facture.statut, 'PAYEE')
+
+        paiement.statut = 'ANNULE'
+        paiement.save()
+        facture.refresh_from_db()
+        self.assertEqual((facture.statut, facture.montant_paye_cumule), ('IMPAYEE', Decimal('0.00')))
+
+        paiement.statut = 'VALIDE'
+        paiement.save()
+        facture.refresh_from_db()
+        self.assertEqual((facture.statut, facture.montant_paye_cumule), ('PAYEE', facture.montant_ttc))
+
+    def test_annulation_corrige_le_solde(self):
+        """Paiement VALIDE annulé → facture IMPAYEE et dette remise au solde (grand livre) ; revalidé → soldé"""
+        from django.db.models import Sum
+        from .models import Facture, Paiement
+
+        type_service, destination = creer_referentiel()
+        creer_equipe(0)
+        client = Client.objects.create(nom='Annule', prenom='A', telephone='0550000032')
+        creer_expedition(client, destination, type_service)
+        facture = Facture.objects.get(client=client)
+        client.refresh_from_db()
+        solde_initial = client.solde
+
+        paiement = Paiement.objects.create(facture=facture, client=client, montant_paye=facture.montant_ttc, mode_paiement='ESPECES')
+        paiement.statut = 'ANNULE'
+        paiement.save()
+        facture.refresh_from_db()
+        client.refresh_from_db()
+        self.assertEqual(facture.statut, 'IMPAYEE')
+        self.assertEqual(client.solde, solde_initial)
+        annulation = client.mouvements_solde.get(type_mouvement='ANNULATION_PAIEMENT')
+        self.assertEqual((annulation.montant, annulation.reference), (facture.montant_ttc, facture.numero_facture))
+
+        paiement.statut = 'VALIDE'
+        paiement.save()
+        client.refresh_from_db()
+        self.assertEqual(client.solde, solde_initial - facture.montant_ttc)
+        self.assertEqual(client.mouvements_solde.aggregate(total=Sum('montant'))['total'], client.solde)
+
+
+    def payer_partiellement(self, telephone):
+        """Client à solde nul, une expédition facturée, 10.00 DA payés"""
+        from .models import Facture, Paiement
+
+        type_service, destination = creer_referentiel()
+        creer_equipe(0)
+        client = Client.objects.create(nom='Credit', prenom='C', telephone=telephone)
+        expedition = creer_expedition(client, destination, type_service)
+        facture = Facture.objects.get(client=client)
+        Paiement.objects.create(facture=facture, client=client, montant_paye=Decimal('10.00'), mode_paiement='ESPECES')
+        return client, expedition, facture
+
+    def verifier_credit(self, client, facture):
+        """Solde = -10.00 (payé gardé en crédit), égal au grand livre, paiement annulé hors grand livre"""
+        from django.db.models import Sum
+
+        client.refresh_from_db()
+        facture.refresh_from_db()
+        self.assertEqual(client.solde, Decimal('-10.00'))
+        self.assertEqual(client.mouvements_solde.aggregate(total=Sum('montant'))['total'], client.solde)
+        self.assertFalse(client.mouvements_solde.filter(type_mouvement='ANNULATION_PAIEMENT').exists())
+        self.assertEqual((facture.statut, facture.montant_paye_cumule), ('ANNULEE', Decimal('0.00')))
+        self.assertFalse(facture.paiements.filter(statut='VALIDE').exists())
+
+    def test_annulation_facture_garde_le_credit(self):
+        """annuler_facture_simple : facture retirée du solde une fois, le payé reste en crédit"""
+        from .utils import FacturationService
+
+        client, _, facture = self.payer_partiellement('0550000033')
+        ttc = client.mouvements_solde.get(type_mouvement='FACTURATION').montant
+        FacturationService.annuler_facture_simple(facture)
+        self.verifier_credit(client, facture)
+        annulations = client.mouvements_solde.filter(type_mouvement='ANNULATION_FACTURE').order_by('id')
+        self.assertEqual(list(annulations.values_list('montant', flat=True)), [Decimal('-10.00'), Decimal('10.00') - ttc])
+
+    def test_suppression_expedition_garde_le_credit(self):
+        """Suppression de la seule expédition : -TTC au solde, payé en crédit, événement client_en_credit"""
+        from .models import EvenementSortant
+
+        client, expedition, facture = self.payer_partiellement('0550000034')
+        ttc = client.mouvements_solde.get(type_mouvement='FACTURATION').montant
+        expedition.delete()
+        self.verifier_credit(client, facture)
+        self.assertEqual(client.mouvements_solde.get(type_mouvement='ANNULATION_EXPEDITION').montant, -ttc)
+        self.assertTrue(EvenementSortant.objects.filter(type_evenement='client_en_credit').exists())
+
+
+class NumerotationTests(TestCase):
+    """
+    Numéro de document et insertion dans la même transaction : un échec ne consomme pas de numéro
+    """
+
+    def test_insertion_echouee_sans_trou(self):
+        """INSERT en échec (NOT NULL) → séquence intacte ; document suivant : numéro 1"""
+        from django.db import IntegrityError
+        from .models import Facture, Incident, SequenceDocument
+
+        client = Client.objects.create(nom='Sequence', prenom='S', telephone='0550000041')
+        with self.assertRaises(IntegrityError):
+            Incident(type_incident='RETARD', titre='Retard', description='...').save()
+        with self.assertRaises(IntegrityError):
+            Facture(client=client, date_echeance=None).save()
+        self.assertFalse(SequenceDocument.objects.exists())
+
+        incident = Incident.objects.create(type_incident='RETARD', titre='Retard', description='...',
+                                           date_heure_incident=timezone.now())
+        self.assertTrue(incident.numero_incident.endswith('-00001'))
+
+    def creer_facture(self, client, montant_ttc=Decimal('100.00'), **champs):
+        from .models import Facture
+
+        facture = Facture.objects.create(client=client, date_echeance=date.today(), **champs)
+        Facture.objects.filter(pk=facture.pk).update(montant_ttc=montant_ttc)
+        facture.refresh_from_db()
+        return facture
+
+    def payer(self, facture):
+        from .models import Paiement
+        return Paiement.objects.create(facture=facture, client=facture.client, montant_paye=Decimal('10.00'), mode_paiement='ESPECES')
+
+    def creer_incident(self, **champs):
+        from .models import Incident
+        return Incident.objects.create(type_incident='RETARD', titre='Retard', description='...',
+                                       date_heure_incident=timezone.now(), **champs)
+
+    def creer_reclamation(self, client, **champs):
+        from .models import Reclamation
+        return Reclamation.objects.create(client=client, type_reclamation='SERVICE', service_concerne='LIVRAISON',
+                                          nature='MAUVAIS_SERVICE', objet='Objet', description='...', **champs)
+
+    def test_formats_par_type(self):
+        """Facture : par client et par jour ; paiement : par facture ; incident, réclamation : par jour"""
+        jour = timezone.now().strftime('%Y%m%d')
+        premier = Client.objects.create(nom='Premier', prenom='P', telephone='0550000042')
+        second = Client.objects.create(nom='Second', prenom='S', telephone='0550000043')
+
+        factures = [self.creer_facture(premier), self.creer_facture(premier), self.creer_facture(second)]
+        self.assertEqual([f.numero_facture for f in factures], [
+            f"F-{jour}-CL-{premier.pk:03d}-001", f"F-{jour}-CL-{premier.pk:03d}-002", f"F-{jour}-CL-{second.pk:03d}-001",
+        ])
+
+        paiements = [self.payer(factures[0]), self.payer(factures[0]), self.payer(factures[1])]
+        self.assertEqual([p.numero_paiement for p in paiements], [
+            f"P-{factures[0].numero_facture}-01", f"P-{factures[0].numero_facture}-02", f"P-{factures[1].numero_facture}-01",
+        ])
+
+        self.assertEqual([self.creer_incident().numero_incident for _ in range(2)], [f"INC-{jour}-00001", f"INC-{jour}-00002"])
+        self.assertEqual([self.creer_reclamation(premier).numero_reclamation for _ in range(2)],
+                         [f"REC-{jour}-00001", f"REC-{jour}-00002"])
+
+    def test_allocations_successives(self):
+        """Même clé : numéros consécutifs, jamais deux fois le même (y compris par blocs pré-alloués)"""
+        from .services.sequence_service import SequenceService
+
+        numeros = [SequenceService.suivant('INCIDENT', periode='20300101') for _ in range(20)]
+        self.assertEqual(numeros, list(range(1, 21)))
+        self.assertEqual(SequenceService.suivant('INCIDENT', periode='20300102'), 1)
+
+        # Deux processus (caches séparés) qui réservent chacun un bloc de 5
+        self.addCleanup(SequenceService.reinitialiser_cache)
+        from django.db import connections
+
+        with override_settings(SEQUENCE_BLOC=5), patch.object(connections['default'], 'in_atomic_block', False):
+            premier = [SequenceService.suivant('RECLAMATION', periode='20300101') for _ in range(3)]
+            SequenceService.reinitialiser_cache()
+            second = [SequenceService.suivant('RECLAMATION', periode='20300101') for _ in range(3)]
+        self.assertEqual((premier, second), ([1, 2, 3], [6, 7, 8]))
+
+    def test_migration_reprend_apres_les_numeros_existants(self):
+        """Amorçage de 0010 : chaque séquence repart après le plus grand numéro déjà attribué"""
+        import importlib
+        from django.apps import apps
+        from .models import Paiement, SequenceDocument
+
+        migration = importlib.import_module('app1.migrations.0010_sequences_documents')
+        jour = timezone.now().strftime('%Y%m%d')
+        client = Client.objects.create(nom='Historique', prenom='H', telephone='0550000044')
+        facture = self.creer_facture(client, numero_facture=f"F-{jour}-CL-{client.pk:03d}-007")
+        self.payer(facture)
+        self.payer(facture)
+        self.creer_incident(numero_incident=f"INC-{jour}-00041")
+        self.creer_reclamation(client, numero_reclamation=f"REC-{jour}-00003")
+
+        SequenceDocument.objects.all().delete()
+        for pk in Paiement.objects.values_list('pk', flat=True):
+            Paiement.objects.filter(pk=pk).update(numero_paiement=f"ANCIEN-{pk}")
+        migration.initialiser_sequences(apps, None)
+
+        self.assertEqual(sorted(Paiement.objects.values_list('numero_paiement', flat=True)),
+                         [f"P-{facture.numero_facture}-01", f"P-{facture.numero_facture}-02"])
+        self.assertEqual(self.payer(facture).numero_paiement, f"P-{facture.numero_facture}-03")
+        self.assertEqual(self.creer_facture(client).numero_facture, f"F-{jour}-CL-{client.pk:03d}-008")
+        self.assertEqual(self.creer_incident().numero_incident, f"INC-{jour}-00042")
+        self.assertEqual(self.creer_reclamation(client).numero_reclamation, f"REC-{jour}-00004")
+
+
+class MatriceDistancesTests(TestCase):
+    """
+    Matrice des distances sur disque (memmap) : reconstruction, ajout incrémental, relecture
+    """
+
+    def setUp(self):
+        import tempfile
+        from pathlib import Path
+
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.enterContext(override_settings(MATRICE_DISTANCES_DIR=Path(dossier.name), FACTEUR_ROUTE=1.3, VITESSE_MOYENNE_KMH=60.0))
+        TypeService.objects.create(type_service='STANDARD')
+        TypeService.objects.create(type_service='EXPRESS')
+        self.destinations = [
+            Destination.objects.create(ville=ville, wilaya=ville, zone_geographique='NATIONALE', distance_estimee=km)
+            for ville, km in (('Blida', 50), ('Oran', 430), ('Constantine', 430))
+        ]
+
+    @staticmethod
+    def relire():
+        """Autre processus : memmaps rouverts depuis les fichiers"""
+        from .services.distance_service import DistanceService
+        DistanceService._etat.update(mtime=None, distances=None, durees=None)
+
+    def test_reconstruire_puis_relire(self):
+        """N² distances : dépôt = distance saisie, sinon haversine × facteur ; durée = distance / vitesse"""
+        from .services.distance_service import DistanceService
+
+        blida, oran, constantine = self.destinations
+        self.assertEqual(DistanceService.reconstruire(), 3)
+        self.assertTrue((DistanceService.dossier() / 'distances.f32').exists())
+        self.relire()
+
+        attendu = float(DistanceService.haversine(oran.latitude, oran.longitude, constantine.latitude, constantine.longitude)) * 1.3
+        self.assertAlmostEqual(DistanceService.distance(oran.id, constantine.id), attendu, delta=0.01)
+        self.assertEqual(DistanceService.distance(constantine.id, oran.id), DistanceService.distance(oran.id, constantine.id))
+        self.assertEqual(DistanceService.distance(None, blida.id), 50)
+        self.assertEqual(DistanceService.distance(blida.id, blida.id), 0)
+        self.assertAlmostEqual(DistanceService.duree(None, oran.id), 430 / 60, places=4)
+        self.assertEqual(DistanceService.jours_route(oran), 1)
+
+        matrice = DistanceService.sous_matrice([oran.id, blida.id])
+        self.assertEqual(matrice.shape, (3, 3))
+        self.assertEqual(float(matrice[0, 1]), 430)
+
+    def test_ajout_incremental(self):
+        """Nouvelle destination après commit : sa ligne et sa colonne, sans reconstruction"""
+        from .services.distance_service import DistanceService
+
+        DistanceService.reconstruire()
+        with patch.object(DistanceService, 'reconstruire') as reconstruction, self.captureOnCommitCallbacks(execute=True):
+            setif = Destination.objects.create(ville='Setif', wilaya='Setif', zone_geographique='NATIONALE', distance_estimee=300)
+        reconstruction.assert_not_called()
+        self.relire()
+
+        self.assertEqual(DistanceService.distance(None, setif.id), 300)
+        self.assertIsNotNone(DistanceService.distance(setif.id, self.destinations[1].id))
+        self.assertEqual(DistanceService.distance(setif.id, self.destinations[1].id),
+                         DistanceService.distance(self.destinations[1].id, setif.id))
+
+
+class OptimisationTourneeTests(TestCase):
+    """
+    Ordre de livraison : qualité du circuit (algorithme) et écriture en base (service)
+    """
+
+    def test_circuit_optimal_petites_instances(self):
+        """Permutation des arrêts, longueur exacte, égale à l'optimum (force brute) sur 7 arrêts"""
+        import itertools
+        import numpy as np
+        from .services.optimisation_service import longueur_circuit, optimiser_ordre, plus_proche_voisin
+
+        generateur = np.random.default_rng(7)
+        for _ in range(5):
+            points = generateur.uniform(0, 100, (8, 2))
+            matrice = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+
+            ordre, longueur = optimiser_ordre(matrice, budget_secondes=1)
+            self.assertEqual(sorted(ordre), list(range(1, 8)))
+            self.assertAlmostEqual(longueur, longueur_circuit(matrice, [0] + ordre + [0]))
+            optimum = min(longueur_circuit(matrice, [0, *p, 0]) for p in itertools.permutations(range(1, 8)))
+            self.assertAlmostEqual(longueur, optimum, places=6)
+            self.assertLessEqual(longueur, longueur_circuit(matrice, plus_proche_voisin(matrice)) + 1e-9)
+
+    def test_cercle(self):
+        """Arrêts mélangés sur un cercle → le circuit trouvé est le polygone (ni croisement, ni détour)"""
+        import numpy as np
+        from .services.optimisation_service import optimiser_ordre
+
+        angles = np.random.default_rng(3).permutation(np.linspace(0, 2 * np.pi, 60, endpoint=False))
+        points = np.vstack([[0, 0], np.c_[np.cos(angles), np.sin(angles)] * 50 + [50, 0]])
+        matrice = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+
+        _, longueur = optimiser_ordre(matrice, budget_secondes=2)
+        polygone = 60 * 2 * 50 * np.sin(np.pi / 60)
+        # Dépôt sur le cercle (angle pi) : circuit = polygone exactement
+        self.assertAlmostEqual(longueur, polygone, delta=polygone * 0.01)
+
+    def test_optimiser_tournee(self):
+        """ordre_livraison 1..k (même rang pour une même destination) et kilométrage estimé"""
+        import tempfile
+        from .services.optimisation_service import OptimisationTourneeService
+
+        vide = tempfile.TemporaryDirectory()
+        self.addCleanup(vide.cleanup)
+        self.enterContext(override_settings(MATRICE_DISTANCES_DIR=vide.name))
+        type_service, alger = creer_referentiel()
+        chauffeur, vehicule = creer_equipe(0)
+        oran = Destination.objects.create(ville='Oran', wilaya='Oran', zone_geographique='NATIONALE', distance_estimee=430)
+        setif = Destination.objects.create(ville='Setif', wilaya='Setif', zone_geographique='NATIONALE', distance_estimee=300)
+        client = Client.objects.create(nom='Ordre', prenom='O', telephone='0550000051')
+        tournee = Tournee.objects.create(chauffeur=chauffeur, vehicule=vehicule, zone_cible='CENTRE',
+                                         date_depart=timezone.now() + timedelta(days=3))
+        # Expéditions insérées directement dans la tournée (sans affectation automatique)
+        expeditions = Expedition.objects.bulk_create([
+            Expedition(client=client, destination=destination, type_service=type_service, tournee=tournee,
+                       nom_destinataire='D', telephone_destinataire='0550999999', email_destinataire='d@example.com',
+                       adresse_destinataire='Rue 1', poids=Decimal('1'), volume=Decimal('0.1'), montant_total=Decimal('500'))
+            for destination in (alger, oran, setif, oran)
+        ])
+
+        resultat = OptimisationTourneeService.optimiser_tournee(tournee)
+        # Sans matrice sur disque : distances via le dépôt → circuit = 2 × somme des distances au dépôt
+        self.assertEqual(resultat, {'tournee_id': tournee.pk, 'nb_arrets': 3, 'kilometrage_estime': 2 * (10 + 430 + 300)})
+
+        rangs = dict(Expedition.objects.filter(tournee=tournee).values_list('pk', 'ordre_livraison'))
+        self.assertEqual(sorted(set(rangs.values())), [1, 2, 3])
+        self.assertEqual(rangs[expeditions[1].pk], rangs[expeditions[3].pk])
+        tournee.refresh_from_db()
+        self.assertEqual(tournee.kilometrage_estime, 1480)
+
+
+@override_settings(DUREE_TOURNEE_DEFAUT_HEURES=24)
+class CalendrierRessourcesTests(TestCase):
+    """
+    Calendrier des ressources : arbre d'intervalles, conflits, auto-démarrage, page disponibilités
+    """
+
+    def setUp(self):
+        self.chauffeur, self.vehicule = creer_equipe(0)
+        self.autre_chauffeur, self.autre_vehicule = creer_equipe(1)
+        self.depart = timezone.now().replace(microsecond=0) + timedelta(days=2)
+
+    def tournee(self, chauffeur, vehicule, depart):
+        return Tournee.objects.create(chauffeur=chauffeur, vehicule=vehicule, date_depart=depart, zone_cible='CENTRE')
+
+    def test_arbre_intervalles(self):
+        """Mêmes chevauchements qu'un parcours exhaustif ([d, f) : bornes jointives libres)"""
+        from .services.calendrier_service import ArbreIntervalles
+
+        generateur = random.Random(5)
+        intervalles = []
+        for i in range(300):
+            debut = generateur.randrange(0, 1000)
+            intervalles.append((debut, debut + generateur.randrange(1, 50), i))
+        arbre = ArbreIntervalles(intervalles)
+        for _ in range(200):
+            debut = generateur.randrange(0, 1050)
+            fin = debut + generateur.randrange(1, 80)
+            attendus = {i for d, f, i in intervalles if d < fin and f > debut}
+            self.assertEqual(set(arbre.chevauchements(debut, fin)), attendus)
+        self.assertTrue(ArbreIntervalles([(0, 10, 'a')]).est_libre(10, 20))
+
+    def test_conflits(self):
+        """Chevauchement → ValidationError ; fenêtre jointive ou autre équipe → accepté"""
+        from .services.calendrier_service import CalendrierService
+
+        self.tournee(self.chauffeur, self.vehicule, self.depart)
+        with self.assertRaises(ValidationError) as erreur:
+            self.tournee(self.chauffeur, self.autre_vehicule, self.depart + timedelta(hours=12))
+        self.assertIn('déjà réservé', str(erreur.exception))
+        with self.assertRaises(ValidationError):
+            self.tournee(self.autre_chauffeur, self.vehicule, self.depart - timedelta(hours=12))
+
+        self.tournee(self.chauffeur, self.vehicule, self.depart + timedelta(hours=24))
+        self.tournee(self.autre_chauffeur, self.autre_vehicule, self.depart + timedelta(hours=6))
+        self.assertEqual(Tournee.objects.count(), 3)
+
+        fenetre = (self.depart + timedelta(days=3), self.depart + timedelta(days=4))
+        self.assertEqual(list(CalendrierService.chauffeurs_libres(*fenetre)), [self.chauffeur, self.autre_chauffeur])
+        self.assertEqual(list(CalendrierService.chauffeurs_libres(self.depart + timedelta(hours=6), self.depart + timedelta(hours=7))), [])
+        Chauffeur.objects.filter(pk=self.autre_chauffeur.pk).update(statut_disponibilite='CONGE')
+        self.assertEqual(list(CalendrierService.chauffeurs_libres(*fenetre)), [self.chauffeur])
+
+    def test_planning(self):
+        """Grille jour par jour : la tournée occupe son jour de départ (et le lendemain, 24 h)"""
+        from .services.calendrier_service import CalendrierService
+
+        tournee = self.tournee(self.chauffeur, self.vehicule, self.depart)
+        grille = CalendrierService.planning(timezone.localdate(), 5)
+        cases = dict(grille['chauffeurs'])[self.chauffeur]
+        jour = (timezone.localtime(self.depart).date() - timezone.localdate()).days
+        self.assertIn(f'#{tournee.pk}', cases[jour])
+        self.assertIsNone(cases[0])
+        self.assertEqual(dict(grille['chauffeurs'])[self.autre_chauffeur], [None] * 5)
+
+    def test_auto_demarrage(self):
+        """Tournée PREVUE dont le départ est passé → EN_COURS, chauffeur et véhicule EN_TOURNEE"""
+        tournee = self.tournee(self.chauffeur, self.vehicule, self.depart)
+        Tournee.objects.filter(pk=tournee.pk).update(date_depart=timezone.now() - timedelta(hours=1))
+        tournee.refresh_from_db()
+        tournee.save()
+
+        tournee.refresh_from_db()
+        self.chauffeur.refresh_from_db()
+        self.vehicule.refresh_from_db()
+        self.assertEqual(tournee.statut, 'EN_COURS')
+        self.assertEqual((self.chauffeur.statut_disponibilite, self.vehicule.statut), ('EN_TOURNEE', 'EN_TOURNEE'))
+
+        nouvelle = self.tournee(self.autre_chauffeur, self.autre_vehicule, timezone.now() - timedelta(minutes=5))
+        self.autre_chauffeur.refresh_from_db()
+        self.assertEqual((nouvelle.statut, self.autre_chauffeur.statut_disponibilite), ('EN_COURS', 'EN_TOURNEE'))
+
+    def test_page_disponibilites(self):
+        """Fenêtre valide → ressources libres ; date impossible ou fin avant début → 400"""
+        agent = AgentUtilisateur.objects.create_user(username='agent', password='x', telephone='0550000000')
+        self.client.force_login(agent)
+        url = reverse('disponibilites_ressources')
+
+        reponse = self.client.get(url, {'debut': '2030-01-01T08:00', 'fin': '2030-01-01T18:00'})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(len(reponse.context['chauffeurs_libres']), 2)
+
+        for debut, fin in (('2024-13-40T00:00', '2024-12-01T00:00'), ('2030-01-02T08:00', '2030-01-01T08:00')):
+            with self.subTest(debut=debut):
+                self.assertEqual(self.client.get(url, {'debut': debut, 'fin': fin}).status_code, 400)
+
+
+class AffectationTests(TestCase):
+    """
+    Choix du couple chauffeur / véhicule : notation des candidats et repli sur le suivant
+    """
+
+    def setUp(self):
+        self.debut = timezone.now().replace(microsecond=0) + timedelta(days=3)
+        self.fin = self.debut + timedelta(hours=10)
+
+    @staticmethod
+    def vehicule(immatriculation, type_vehicule, capacite, **champs):
+        return Vehicule.objects.create(
+            numero_immatriculation=immatriculation, marque='M', modele='M', annee=2020, type_vehicule=type_vehicule,
+            capacite_poids=Decimal(capacite), capacite_volume=Decimal('20'), consommation_moyenne=Decimal('9'),
+            date_acquisition=date(2020, 1, 1), **champs
+        )
+
+    def test_vehicules_notes(self):
+        """EXPRESS 2 kg → la moto ; STANDARD → le camion ; révision pendant la tournée ou capacité insuffisante → exclu"""
+        from .services.affectation_service import AffectationService
+
+        moto = self.vehicule('MOTO-1', 'MOTO', 50)
+        fourgon = self.vehicule('FOURGON-1', 'FOURGON', 1500)
+        camion = self.vehicule('CAMION-1', 'CAMION', 7500)
+        self.vehicule('CAMION-2', 'CAMION', 7500, date_prochaine_revision=self.debut.date())
+
+        express = AffectationService.vehicules_candidats(self.debut, self.fin, Decimal('2'), type_service='EXPRESS')
+        self.assertEqual(list(express), [moto, fourgon, camion])
+        standard = AffectationService.vehicules_candidats(self.debut, self.fin, Decimal('100'), type_service='STANDARD')
+        self.assertEqual(list(standard)[:2], [camion, fourgon])
+        self.assertNotIn(moto, standard)
+
+        # Révision en retard : pénalisée, plus classée en tête
+        Vehicule.objects.filter(pk=moto.pk).update(date_prochaine_revision=self.debut.date() - timedelta(days=1))
+        express = AffectationService.vehicules_candidats(self.debut, self.fin, Decimal('2'), type_service='EXPRESS')
+        self.assertEqual(list(express)[0], fourgon)
+
+    def test_chauffeurs_par_charge(self):
+        """Le chauffeur qui a beaucoup roulé récemment passe après celui qui est resté au dépôt"""
+        from .services.affectation_service import AffectationService
+
+        charge, vehicule = creer_equipe(0)
+        repose, _ = creer_equipe(1)
+        tournee = Tournee.objects.create(chauffeur=charge, vehicule=vehicule, date_depart=timezone.now() - timedelta(days=5), zone_cible='CENTRE')
+        Tournee.objects.filter(pk=tournee.pk).update(statut='TERMINEE', kilometrage_parcouru=600)
+
+        candidats = list(AffectationService.chauffeurs_candidats(self.debut, self.fin))
+        self.assertEqual(candidats, [repose, charge])
+        self.assertAlmostEqual(candidats[1].charge_heures, 600 / 60 + 1)
+
+    def test_candidat_pris_entre_temps(self):
+        """Meilleur chauffeur réservé par un autre agent après la notation → le suivant"""
+        from .services.affectation_service import AffectationService
+
+        type_service, destination = creer_referentiel()
+        pris, vehicule_pris = creer_equipe(0)
+        libre, vehicule = creer_equipe(1)
+        expedition = Expedition(type_service=type_service, poids=Decimal('2'), volume=Decimal('0.1'))
+
+        notes = list(AffectationService.chauffeurs_candidats(self.debut, self.fin))
+        Tournee.objects.create(chauffeur=pris, vehicule=vehicule_pris, date_depart=self.debut, zone_cible='CENTRE')
+        with patch.object(AffectationService, 'chauffeurs_candidats', return_value=notes):
+            tournee = AffectationService.creer_tournee(self.debut, self.fin, expedition, zone_cible='CENTRE')
+
+        self.assertEqual(notes[0], pris)
+        self.assertEqual((tournee.chauffeur, tournee.vehicule), (libre, vehicule))
+
+
+class PlanificationMaintenanceTests(TestCase):
+    """
+    Révisions sur l'horizon : réservation du jour, report proposé en cas de tournée, pas de doublon
+    """
+
+    def setUp(self):
+        self.demain = date.today() + timedelta(days=1)
+
+    @staticmethod
+    def planifier():
+        from .services.maintenance_service import PlanificationMaintenanceService
+        with patch('app1.services.diffusion_service.DiffusionService.publier_apres_commit'):
+            return PlanificationMaintenanceService.planifier(horizon_jours=7)
+
+    @staticmethod
+    def reviser(vehicule, jour):
+        Vehicule.objects.filter(pk=vehicule.pk).update(date_prochaine_revision=jour)
+
+    def test_revision_libre_reservee_une_fois(self):
+        """Véhicule libre dans 3 jours → jour bloqué au calendrier, sans notification ; second passage sans effet"""
+        _, vehicule = creer_equipe(0)
+        jour = self.demain + timedelta(days=2)
+        self.reviser(vehicule, jour)
+
+        stats = self.planifier()
+        self.assertEqual(stats['revisions_reservees'], 1)
+        self.assertEqual(stats['notifications_confirmation'], 0)
+        reservation = ReservationRessource.objects.get(vehicule=vehicule, motif='MAINTENANCE')
+        self.assertEqual(timezone.localtime(reservation.debut).date(), jour)
+        self.assertEqual(reservation.fin - reservation.debut, timedelta(days=1))
+
+        stats = self.planifier()
+        self.assertEqual(stats['revisions_reservees'], 0)
+        self.assertEqual(ReservationRessource.objects.filter(motif='MAINTENANCE').count(), 1)
+
+    def test_revision_demain_confirmation(self):
+        """Révision demain → réservation + demande de confirmation, jamais recréée tant qu'elle est ouverte"""
+        _, vehicule = creer_equipe(0)
+        self.reviser(vehicule, self.demain)
+
+        self.assertEqual(self.planifier()['notifications_confirmation'], 1)
+        self.assertEqual(self.planifier()['notifications_confirmation'], 0)
+        self.assertEqual(Notification.objects.filter(vehicule=vehicule, type_notification='MAINTENANCE_AVANT').count(), 1)
+
+    def test_conflit_tournee_propose_report(self):
+        """Tournée réservée le jour de la révision → notification avec créneaux, jour non bloqué"""
+        chauffeur, vehicule = creer_equipe(0)
+        jour = self.demain + timedelta(days=2)
+        depart = timezone.make_aware(datetime.combine(jour, datetime.min.time())) + timedelta(hours=8)
+        Tournee.objects.create(chauffeur=chauffeur, vehicule=vehicule, date_depart=depart,
+                               date_retour_prevue=depart + timedelta(hours=6), zone_cible='CENTRE')
+        self.reviser(vehicule, jour)
+
+        stats = self.planifier()
+        self.assertEqual(stats['notifications_vehicule_en_tournee'], 1)
+        self.assertEqual(stats['revisions_reservees'], 0)
+        notification = Notification.objects.get(vehicule=vehicule)
+        self.assertIn('Créneaux proposés', notification.message)
+        self.assertNotIn(jour.strftime('%d/%m/%Y') + ',', notification.message.split('Créneaux proposés')[1])
+        # Report proposé de préférence avant la date prévue
+        self.assertIn((jour - timedelta(days=1)).strftime('%d/%m/%Y'), notification.message)
+
+        self.assertEqual(self.planifier()['notifications_vehicule_en_tournee'], 0)
+
+    def test_date_modifiee_reservation_retiree(self):
+        """Date de révision déplacée → l'ancienne réservation du planificateur est retirée, la nouvelle posée"""
+        _, vehicule = creer_equipe(0)
+        self.reviser(vehicule, self.demain + timedelta(days=2))
+        self.planifier()
+
+        nouveau_jour = self.demain + timedelta(days=4)
+        self.reviser(vehicule, nouveau_jour)
+        stats = self.planifier()
+
+        self.assertEqual(stats['revisions_retirees'], 1)
+        reservation = ReservationRessource.objects.get(vehicule=vehicule, motif='MAINTENANCE')
+        self.assertEqual(timezone.localtime(reservation.debut).date(), nouveau_jour)
+
+    def test_creneaux_moins_perturbants(self):
+        """Jour prévu exclu, jours occupés exclus, la veille avant le lendemain"""
+        from .services.calendrier_service import ArbreIntervalles
+        from .services.maintenance_service import PlanificationMaintenanceService as Service
+
+        prevu = date(2030, 6, 10)
+        occupe_debut, occupe_fin = Service.bornes_jour(prevu - timedelta(days=1))
+        arbres = {1: ArbreIntervalles([(occupe_debut, occupe_fin, 1)])}
+        flotte = ArbreIntervalles([(occupe_debut, occupe_fin, 1)])
+
+        creneaux = Service._meilleurs_creneaux(1, prevu, prevu - timedelta(days=3), prevu + timedelta(days=3), arbres, flotte)
+        self.assertEqual(creneaux, [prevu - timedelta(days=2), prevu + timedelta(days=1), prevu - timedelta(days=3)])
+
+    def test_retour_maintenance(self):
+        """Véhicule EN_MAINTENANCE après sa révision → une seule question « Est-il revenu ? »"""
+        from .services.maintenance_service import PlanificationMaintenanceService
+
+        _, vehicule = creer_equipe(0)
+        Vehicule.objects.filter(pk=vehicule.pk).update(statut='EN_MAINTENANCE', date_prochaine_revision=date.today() - timedelta(days=2))
+
+        with patch('app1.services.diffusion_service.DiffusionService.publier_apres_commit'):
+            self.assertEqual(PlanificationMaintenanceService.notifier_retours(), {'notifications_retour': 1})
+            self.assertEqual(PlanificationMaintenanceService.notifier_retours(), {'notifications_retour': 0})
+
+
+class IngestionTests(TestCase):
+    """
+    Lots NDJSON de l'application chauffeur : idempotence et jalons dérivés
+    """
+
+    def setUp(self):
+        type_service, destination = creer_referentiel()
+        creer_equipe(0)
+        client = Client.objects.create(nom='Terrain', prenom='T', telephone='0550000031')
+        self.expedition = creer_expedition(client, destination, type_service)
+        self.tournee_id = self.expedition.tournee_id
+        self.horodatage = timezone.now().replace(microsecond=0)
+
+    def ligne(self, evenement_id, type_evenement, minutes=0, **champs):
+        evenement = {
+            'id': evenement_id, 'type': type_evenement, 'tournee': self.tournee_id,
+            'horodatage': (self.horodatage + timedelta(minutes=minutes)).isoformat(), 'lat': 36.7, 'lon': 3.1,
+        }
+        if type_evenement != 'GPS':
+            evenement['expedition'] = self.expedition.pk
+        evenement.update(champs)
+        return json.dumps(evenement)
+
+    def lot(self):
+        return [
+            self.ligne('gps-1', 'GPS'),
+            self.ligne('scan-1', 'SCAN', 1),
+            self.ligne('livraison-1', 'LIVRAISON', 2, donnees={'signataire': 'M. Benali'}),
+        ]
+
+    def test_lot_renvoye(self):
+        """Le même lot envoyé deux fois : rien de plus inséré, aucun jalon recréé"""
+        premier = IngestionService.ingerer(self.lot())
+        self.assertEqual((premier['inseres'], premier['doublons'], premier['jalons']), (3, 0, 2))
+        self.expedition.refresh_from_db()
+        self.assertEqual(self.expedition.statut, 'LIVRE')
+        nb_jalons = TrackingExpedition.objects.filter(expedition=self.expedition).count()
+
+        second = IngestionService.ingerer(self.lot())
+        self.assertEqual((second['recus'], second['inseres'], second['doublons'], second['jalons']), (3, 0, 3, 0))
+        self.assertEqual(TrackingExpedition.objects.filter(expedition=self.expedition).count(), nb_jalons)
+
+    def test_lot_concurrent(self):
+        """
+        Lot identique inséré par un autre processus entre la vérification et le bulk_create :
+        ignore_conflicts écarte les lignes, ni comptées ni transformées en jalons
+        """
+        IngestionService.ingerer(self.lot())
+        nb_jalons = TrackingExpedition.objects.count()
+        lecture = IngestionService._deja_recus
+        appels = []
+
+        def deja_recus(identifiants, lot=None):
+            # La vérification d'idempotence ne voit pas encore le lot concurrent
+            appels.append(lot)
+            return set() if len(appels) == 1 else lecture(identifiants, lot)
+
+        with patch.object(IngestionService, '_deja_recus', side_effect=deja_recus):
+            resultat = IngestionService.ingerer(self.lot())
+
+        self.assertEqual((resultat['inseres'], resultat['doublons'], resultat['jalons']), (0, 3, 0))
+        self.assertEqual(TrackingExpedition.objects.count(), nb_jalons)
+
+    def test_doublons_et_erreurs_dans_le_lot(self):
+        """Identifiant répété dans le lot → un seul événement ; ligne invalide → rejetée seule"""
+        lignes = self.lot() + [self.ligne('gps-1', 'GPS'), '{"id": "x"', self.ligne('gps-2', 'GPS', tournee=999999)]
+        resultat = IngestionService.ingerer(lignes)
+
+        self.assertEqual((resultat['recus'], resultat['inseres'], resultat['doublons']), (6, 3, 1))
+        self.assertEqual(
+            [erreur.get('ligne', erreur.get('id')) for erreur in resultat['erreurs']],
+            [5, 'gps-2'],
+        )
+
+
+class ArchiveTests(TestCase):
+    """
+    Archivage compressé de l'historique : déplacement, fusion, cache du suivi public
+    """
+
+    def setUp(self):
+        type_service, destination = creer_referentiel()
+        creer_equipe(0)
+        client = Client.objects.create(nom='Archive', prenom='A', telephone='0550000041')
+        self.expedition = creer_expedition(client, destination, type_service)
+        TrackingExpedition.objects.create(expedition=self.expedition, statut_etape='LIVRE', commentaire='Livré')
+        Expedition.objects.filter(pk=self.expedition.pk).update(statut='LIVRE')
+        self.vieillir()
+
+    def vieillir(self):
+        TrackingExpedition.objects.filter(expedition=self.expedition).update(date_heure=timezone.now() - timedelta(days=400))
+
+    def archiver(self, **options):
+        from .services.archive_service import ArchiveService
+        with self.captureOnCommitCallbacks(execute=True):
+            return ArchiveService.archiver(mois=12, **options)
+
+    def test_archivage_et_relecture(self):
+        """Étapes retirées de la table chaude, relues à l'identique depuis l'archive"""
+        from .services.archive_service import ArchiveService
+
+        nb_etapes = TrackingExpedition.objects.filter(expedition=self.expedition).count()
+        stats = self.archiver()
+
+        self.assertEqual((stats['EXPEDITION']['objets'], stats['EXPEDITION']['lignes']), (1, nb_etapes))
+        self.assertFalse(TrackingExpedition.objects.filter(expedition=self.expedition).exists())
+        resume = ArchiveService.resume('EXPEDITION', self.expedition.pk)
+        self.assertEqual((resume.dernier_statut, resume.nb_lignes), ('LIVRE', nb_etapes))
+        etapes = ArchiveService.historique('EXPEDITION', self.expedition.pk, using='default')
+        self.assertEqual(len(etapes), nb_etapes)
+        self.assertIn('LIVRE', {etape.statut_etape for etape in etapes})
+
+    def test_simulation(self):
+        """--simulation : statistiques calculées, rien n'est déplacé"""
+        stats = self.archiver(simulation=True)
+        self.assertEqual(stats['EXPEDITION']['objets'], 1)
+        self.assertTrue(TrackingExpedition.objects.filter(expedition=self.expedition).exists())
+        self.assertFalse(ArchiveHistorique.objects.exists())
+
+    def test_fusion_apres_reactivation(self):
+        """Nouvelle étape après archivage → fusionnée dans la même archive au passage suivant"""
+        nb_etapes = TrackingExpedition.objects.filter(expedition=self.expedition).count()
+        self.archiver()
+        TrackingExpedition.objects.create(expedition=self.expedition, statut_etape='LIVRE', commentaire='Relivré')
+        self.vieillir()
+        self.archiver()
+
+        archive = ArchiveHistorique.objects.get(type_objet='EXPEDITION', objet_id=self.expedition.pk)
+        self.assertEqual(archive.nb_lignes, nb_etapes + 1)
+
+    def test_cache_suivi_public_invalide(self):
+        """Les étapes quittent la table chaude → l'état public en cache est relu"""
+        from django.core.cache import cache
+        from .services.suivi_public_service import SuiviPublicService
+
+        self.assertTrue(SuiviPublicService.etat(self.expedition.pk)['etapes'])
+        self.archiver()
+        self.assertIsNone(cache.get(SuiviPublicService.cle(self.expedition.pk)))
+        self.assertEqual(SuiviPublicService.etat(self.expedition.pk)['etapes'], [])
+
+    def test_export_pdf_meme_base(self):
+        """L'export PDF lit l'archive dans la même base que l'expédition et ses étapes"""
+        agent = AgentUtilisateur.objects.create_user(username='archive', password='x', telephone='0550000042')
+        self.client.force_login(agent)
+
+        with patch('app1.views.ArchiveService.historique', return_value=[]) as historique:
+            reponse = self.client.get(reverse('exporter_expedition_detail_pdf', args=[self.expedition.pk]))
+
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(historique.call_args.kwargs['using'], base_analytique())
+
+
+class SuiviPublicTests(TestCase):
+    """
+    Suivi public : code HMAC, réponse identique pour numéro inconnu / mauvais code, limitation de débit
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        from .services.suivi_public_service import SuiviPublicService
+
+        cache.clear()
+        type_service, destination = creer_referentiel()
+        creer_equipe(0)
+        client = Client.objects.create(nom='Public', prenom='P', telephone='0550000051')
+        self.expedition = creer_expedition(client, destination, type_service)
+        self.numero = self.expedition.get_numero_expedition()
+        self.jeton = SuiviPublicService.jeton(self.expedition.pk)
+
+    def test_code_de_suivi(self):
+        """Numéro sous toutes ses formes + code (casse et espaces tolérés) ; autre code ou autre numéro refusés"""
+        from .services.suivi_public_service import SuiviPublicService
+
+        self.assertEqual(len(self.jeton), SuiviPublicService.LONGUEUR_JETON)
+        for numero in (self.numero, self.numero.lower(), str(self.expedition.pk), f' {self.numero} '):
+            self.assertEqual(SuiviPublicService.verifier(numero, self.jeton), self.expedition.pk)
+        self.assertEqual(SuiviPublicService.verifier(self.numero, f' {self.jeton[:8].lower()} {self.jeton[8:]}'), self.expedition.pk)
+
+        self.assertIsNone(SuiviPublicService.verifier(self.numero, SuiviPublicService.jeton(self.expedition.pk + 1)))
+        self.assertIsNone(SuiviPublicService.verifier(self.numero, ''))
+        self.assertIsNone(SuiviPublicService.verifier('EXP-ABC', self.jeton))
+        with override_settings(SECRET_KEY='autre-cle'):
+            self.assertIsNone(SuiviPublicService.verifier(self.numero, self.jeton))
+
+    def test_api(self):
+        """Bon couple → état sans commentaires ; numéro inconnu et mauvais code → même 404"""
+        from .services.suivi_public_service import SuiviPublicService
+
+        reponse = self.client.get(reverse('api_suivi_public', args=[self.numero]), {'jeton': self.jeton})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.json()['numero'], self.numero)
+        self.assertNotIn('commentaire', reponse.json()['etapes'][0])
+
+        mauvais_code = self.client.get(reverse('api_suivi_public', args=[self.numero]), {'jeton': 'AAAAAAAAAAAAAAAA'})
+        inconnu = self.client.get(reverse('api_suivi_public', args=['EXP-999999']), {'jeton': SuiviPublicService.jeton(999999)})
+        self.assertEqual((mauvais_code.status_code, inconnu.status_code), (404, 404))
+        self.assertEqual(mauvais_code.json(), inconnu.json())
+
+    @override_settings(SUIVI_PUBLIC_LIMITE_PAR_MINUTE=2)
+    def test_limitation_de_debit(self):
+        """Au-delà de la limite par minute → 429 + Retry-After, pour cette adresse seulement"""
+        url = reverse('suivi_public')
+        parametres = {'numero': self.numero, 'jeton': self.jeton}
+
+        with patch('app1.services.suivi_public_service.time.time', return_value=6000.0):
+            statuts = [self.client.get(url, parametres, REMOTE_ADDR='10.0.0.1').status_code for _ in range(3)]
+            bloquee = self.client.get(url, parametres, REMOTE_ADDR='10.0.0.1')
+            autre = self.client.get(url, parametres, REMOTE_ADDR='10.0.0.2')
+
+        self.assertEqual(statuts, [200, 200, 429])
+        self.assertEqual(bloquee['Retry-After'], '61')
+        self.assertEqual(autre.status_code, 200)
+
+        # Minute suivante : compteur remis à zéro
+        with patch('app1.services.suivi_public_service.time.time', return_value=6060.0):
+            self.assertEqual(self.client.get(url, parametres, REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+
+class DiffusionTourneeTests(TestCase):
+    """
+    Signal diffuser_tournee : aucune requête supplémentaire à chaque enregistrement de tournée
+    """
+
+    def setUp(self):
+        self.chauffeur, self.vehicule = creer_equipe(0)
+        self.tournee = Tournee.objects.create(
+            chauffeur=self.chauffeur, vehicule=self.vehicule, date_depart=timezone.now() + timedelta(days=1), zone_cible='CENTRE'
+        )
+
+    def diffuser(self, tournee):
+        from .signals import diffuser_tournee
+
+        with patch('app1.services.diffusion_service.DiffusionService.publier') as publier:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertNumQueries(0):
+                    diffuser_tournee(Tournee, tournee)
+        return publier.call_args.args
+
+    def test_sans_requete(self):
+        """Tournée relue sans ses relations → identifiants seulement, pas de requête chauffeur / véhicule"""
+        type_evenement, donnees = self.diffuser(Tournee.objects.get(pk=self.tournee.pk))
+
+        self.assertEqual(type_evenement, 'tournee')
+        self.assertEqual(
+            (donnees['chauffeur_id'], donnees['vehicule_id'], donnees['chauffeur'], donnees['vehicule']),
+            (self.chauffeur.pk, self.vehicule.pk, None, None),
+        )
+
+    def test_libelles_si_deja_charges(self):
+        """Relations déjà en mémoire (formulaire, create) → libellés inclus, toujours sans requête"""
+        tournee = Tournee.objects.select_related('chauffeur', 'vehicule').get(pk=self.tournee.pk)
+        _, donnees = self.diffuser(tournee)
+
+        self.assertEqual(donnees['chauffeur'], f"{self.chauffeur.prenom} {self.chauffeur.nom}")
+        self.assertEqual(donnees['vehicule'], self.vehicule.numero_immatriculation)
+
+
+class TerminerTourneeTests(TestCase):
+    """
+    Fin de tournée : les litres relevés invalides sont refusés proprement, jamais en erreur 500
+    """
+
+    def setUp(self):
+        chauffeur, vehicule = creer_equipe(0)
+        self.tournee = Tournee.objects.create(
+            chauffeur=chauffeur, vehicule=vehicule, date_depart=timezone.now() - timedelta(hours=8), zone_cible='CENTRE'
+        )
+        Tournee.objects.filter(pk=self.tournee.pk).update(statut='TERMINEE', kilometrage_depart=1000)
+        agent = AgentUtilisateur.objects.create_user(username='fin', password='x', telephone='0550000061')
+        self.client.force_login(agent)
+        self.url = reverse('terminer_tournee', args=[self.tournee.pk])
+
+    def test_litres_invalides(self):
+        for valeur in ('nan', 'NaN', 'inf', '-Infinity', '1e10', '12345.6', '1.234', '-5', '0', 'abc'):
+            with self.subTest(valeur=valeur):
+                reponse = self.client.post(self.url, {'kilometrage_arrivee': '1100', 'carburant_reel': valeur})
+                self.assertEqual(reponse.status_code, 200)
+                self.assertContains(reponse, 'Les litres relevés doivent être un nombre positif')
+                self.tournee.refresh_from_db()
+                self.assertIsNone(self.tournee.kilometrage_arrivee)
+
+    def test_litres_valides(self):
+        reponse = self.client.post(self.url, {'kilometrage_arrivee': '1100', 'carburant_reel': '45,5'})
+        self.assertRedirects(reponse, reverse('detail_tournee', args=[self.tournee.pk]), fetch_redirect_response=False)
+        self.tournee.refresh_from_db()
+        self.assertEqual((self.tournee.kilometrage_arrivee, self.tournee.carburant_reel), (1100, Decimal('45.50')))
+
+    def test_litres_facultatifs(self):
+        reponse = self.client.post(self.url, {'kilometrage_arrivee': '1100', 'carburant_reel': ''})
+        self.assertEqual(reponse.status_code, 302)
+        self.tournee.refresh_from_db()
+        self.assertIsNone(self.tournee.carburant_reel)
+
+
+@override_settings(FLOTTE_FENETRE=3, FLOTTE_MIN_POINTS=5, FLOTTE_SEUIL_Z=3.0, FLOTTE_ECART_CIRCUIT_MIN=0.2)
+class EfficaciteFlotteTests(TestCase):
+    """
+    Séries par véhicule (moyennes glissantes), anomalies par z-score leave-one-out, rapport en cache
+    """
+
+    # (km parcourus, km du circuit, litres relevés) ; 3 = plein anormal, 5 = détour, 6 = compteur en recul
+    TOURNEES = [(100, 100, 9.0), (102, 100, 9.3), (98, 100, 8.7), (100, 100, 20.0), (101, 100, 9.1),
+                (200, 100, 18.0), (99, 100, 8.9), (103, 100, 9.2), (97, 100, 8.8)]
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+        chauffeur, self.vehicule = creer_equipe(0)
+        debut = timezone.now() - timedelta(days=20)
+        compteur, tournees = 10000, []
+        for i, (km, circuit, litres) in enumerate(self.TOURNEES):
+            depart = compteur - 50 if i == 6 else compteur
+            compteur = depart + km
+            tournees.append(Tournee(
+                chauffeur=chauffeur, vehicule=self.vehicule, zone_cible='CENTRE', statut='TERMINEE',
+                date_depart=debut + timedelta(days=2 * i), date_retour_reelle=debut + timedelta(days=2 * i, hours=8),
+                kilometrage_depart=depart, kilometrage_arrivee=compteur, kilometrage_parcouru=km,
+                kilometrage_estime=circuit, consommation_carburant=Decimal(str(litres)), carburant_reel=Decimal(str(litres)),
+            ))
+        # bulk_create : pas de save() (calendrier, statuts), seulement des tournées terminées
+        self.tournees = Tournee.objects.bulk_create(tournees)
+
+    def enregistrer(self):
+        from .services.flotte_service import FlotteService
+        return [FlotteService.enregistrer_tournee(tournee.pk) for tournee in self.tournees]
+
+    def test_moyennes_glissantes(self):
+        """Chaque point : moyennes sur lui-même et les FLOTTE_FENETRE - 1 tournées précédentes du véhicule"""
+        mesures = self.enregistrer()
+
+        self.assertEqual(mesures[0].km_glissant, 100)
+        dernier = mesures[-1]
+        self.assertAlmostEqual(dernier.km_glissant, (99 + 103 + 97) / 3)
+        self.assertAlmostEqual(dernier.consommation_glissante, 100 * (8.9 + 9.2 + 8.8) / (99 + 103 + 97))
+        self.assertTrue(dernier.carburant_mesure)
+        self.assertEqual(dernier.chargement_glissant, 0.0)
+
+    def test_anomalies(self):
+        """Une anomalie de chaque type, sur la bonne tournée, et aucune autre"""
+        from .services.flotte_service import FlotteService
+
+        self.enregistrer()
+        rapport = FlotteService.calculer_rapport(90)
+
+        self.assertEqual(rapport['nb_mesures'], len(self.TOURNEES))
+        self.assertEqual(
+            sorted((a['tournee_id'], a['code']) for a in rapport['anomalies']),
+            sorted([(self.tournees[5].pk, 'KM_CIRCUIT'), (self.tournees[3].pk, 'CONSOMMATION'),
+                    (self.tournees[6].pk, 'COMPTEUR')]),
+        )
+        vehicule, = rapport['vehicules']
+        self.assertEqual((vehicule['nb_tournees'], vehicule['nb_anomalies']), (len(self.TOURNEES), 3))
+        self.assertEqual(vehicule['km_total'], sum(km for km, _, _ in self.TOURNEES))
+
+    def test_cache_invalide_par_generation(self):
+        """Rapport calculé une fois ; une nouvelle mesure change de génération → recalcul"""
+        from .services.flotte_service import FlotteService
+
+        dernier = self.tournees.pop()
+        self.enregistrer()
+        with patch.object(FlotteService, 'calculer_rapport', wraps=FlotteService.calculer_rapport) as calcul:
+            self.assertEqual(FlotteService.rapport(90)['nb_mesures'], len(self.TOURNEES) - 1)
+            FlotteService.rapport(90)
+            self.assertEqual(calcul.call_count, 1)
+
+            FlotteService.enregistrer_tournee(dernier.pk)
+            self.assertEqual(FlotteService.rapport(90)['nb_mesures'], len(self.TOURNEES))
+            self.assertEqual(calcul.call_count, 2)
+
+    def test_migration_remplit_les_series(self):
+        """0016 : tournées terminées avant la migration → mêmes points que le signal, statistiques non vides"""
+        import importlib
+        from django.apps import apps
+        from .models import MesureTournee
+        from .services.stats_service import StatsService
+
+        migration = importlib.import_module('app1.migrations.0016_efficacite_flotte')
+        attendu = {m.tournee_id: (m.km_glissant, m.consommation_glissante) for m in self.enregistrer()}
+        MesureTournee.objects.all().delete()
+
+        migration.remplir_mesures(apps, None)
+
+        obtenu = dict(MesureTournee.objects.values_list('tournee_id', 'km_glissant'))
+        self.assertEqual(obtenu.keys(), attendu.keys())
+        for tournee_id, (km_glissant, consommation) in attendu.items():
+            mesure = MesureTournee.objects.get(tournee_id=tournee_id)
+            self.assertAlmostEqual(mesure.km_glissant, km_glissant)
+            self.assertAlmostEqual(mesure.consommation_glissante, consommation)
+        performance, = StatsService.analyse_performance_vehicules()
+        self.assertEqual(performance['nb_tournees'], len(self.TOURNEES))
+
+
+class MetriquesTests(SimpleTestCase):
+    """
+    Chronométrage : réglage relu après override_settings, parts par thread additionnées sans perte
+    """
+
+    def test_desactivation(self):
+        from .services.metriques_service import MetriquesService
+
+        serie = MetriquesService.DUREES.serie(operation='tests.desactivation')
+        fonction = MetriquesService.chronometrer('tests.desactivation')(lambda: 42)
+
+        with override_settings(METRIQUES_ACTIVES=False):
+            self.assertEqual(fonction(), 42)
+            with MetriquesService.chronometre('tests.desactivation'):
+                pass
+        self.assertEqual(sum(serie.totaux()[0]), 0)
+
+        self.assertEqual(fonction(), 42)
+        self.assertEqual(sum(serie.totaux()[0]), 1)
+
+    def test_parts_par_thread(self):
+        from .services.metriques_service import Histogramme
+
+        histogramme = Histogramme('tests_parts', "Test", ('operation',), seuils=(0.5,))
+        serie = histogramme.serie(operation='x')
+
+        def observer():
+            for _ in range(5000):
+                serie.observer(0.25)
+            serie.observer(1.0)
+
+        threads = [threading.Thread(target=observer) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(serie.totaux(), ([20000, 4], 5004.0))
+        lignes = list(histogramme.lignes())
+        self.assertIn('tests_parts_bucket{operation="x",le="+Inf"} 20004', lignes)
+        self.assertIn('tests_parts_count{operation="x"} 20004', lignes)
+
+
+class ProfilageTests(SimpleTestCase):
+    """
+    Sessions de profilage indépendantes du thread, quotas séparés requêtes / tâches
+    """
+
+    def setUp(self):
+        import tempfile
+        from pathlib import Path
+
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        reglages = override_settings(PROFILAGE_REPERTOIRE=Path(dossier.name), PROFILAGE_FICHIERS_MAX=2, PROFILAGE_FICHIERS_MAX_TACHES=1)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    @staticmethod
+    def session(nom, categorie):
+        import sys
+        from .services.profilage_service import SessionProfilage
+
+        session = SessionProfilage(nom, threading.get_ident(), categorie)
+        session.ajouter(sys._getframe())
+        session.duree = 0.01
+        return session
+
+    def test_sessions_partageant_un_thread(self):
+        """Deux requêtes sur le même thread (ASGI) : terminer l'une ne retire pas l'autre de l'échantillonnage"""
+        from .services.profilage_service import ProfilageService
+
+        premiere = ProfilageService.debut('GET /a')
+        seconde = ProfilageService.debut('GET /b')
+        self.assertIs(ProfilageService.session_courante(), seconde)
+        ProfilageService.fin(seconde, seuil_ms=10 ** 6)
+        self.assertIs(ProfilageService.session_courante(), premiere)
+
+        suivies = ProfilageService.echantillonneur().sessions
+        self.assertIn(premiere, suivies)
+        ProfilageService.fin(premiere, seuil_ms=10 ** 6)
+        self.assertNotIn(premiere, suivies)
+        self.assertIsNone(ProfilageService.session_courante())
+
+    @override_settings(PROFILAGE_ACTIF=True)
+    def test_tache_dans_une_requete(self):
+        """Tâche appelée pendant une requête profilée : comptée dans la requête, pas de second profil"""
+        from .services.profilage_service import ProfilageService
+
+        sessions = []
+        tache = ProfilageService.profiler('tache.test')(lambda: sessions.append(ProfilageService.session_courante()))
+
+        requete = ProfilageService.debut('GET /c')
+        tache()
+        ProfilageService.fin(requete, seuil_ms=10 ** 6)
+        self.assertEqual(sessions, [requete])
+
+        with patch.object(ProfilageService, 'fin') as fin:
+            tache()
+        self.assertEqual(fin.call_args.args[0].categorie, 'tache')
+
+    def test_quotas_separes(self):
+        """Les profils des tâches (un par exécution) ne chassent pas ceux des requêtes lentes"""
+        from .services.profilage_service import ProfilageService
+
+        for i in range(3):
+            ProfilageService.ecrire(self.session(f'vue.lente{i}', 'requete'))
+        for i in range(3):
+            ProfilageService.ecrire(self.session(f'tache.soir{i}', 'tache'))
+
+        profils = ProfilageService.fichiers()
+        self.assertEqual(
+            sorted((profil['categorie'], profil['source']) for profil in profils),
+            [('requete', 'vue.lente1'), ('requete', 'vue.lente2'), ('tache', 'tache.soir2')],
+        )
+        self.assertTrue(ProfilageService.frames_chaudes(profils[0]['nom'], prefixe=None)['total'])
+
+
+class BudgetRequetesTests(TestCase):
+    """
+    Budgets de requêtes SQL (app1/urls.py : BUDGETS_REQUETES) sur des données
+    assez nombreuses pour qu'un N+1 dépasse REQUETES_SEUIL_REPETITION
+    """
+
+    NB_LIGNES = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = AgentUtilisateur.objects.create_user(
+            username='agent', password='x', telephone='0550000000', is_responsable=True
+        )
+        # Les tarifications sont créées par signal à la création de la destination
+        type_service = TypeService.objects.create(type_service='STANDARD')
+        TypeService.objects.create(type_service='EXPRESS')
+        destination = Destination.objects.create(
+            ville='Alger', wilaya='Alger', zone_geographique='NATIONALE', distance_estimee=10
+        )
+
+        # Chauffeurs et véhicules d'abord : chaque expédition est affectée à une tournée
+        cls.chauffeurs = []
+        cls.vehicules = []
+        for i in range(cls.NB_LIGNES // 2):
+            cls.chauffeurs.append(Chauffeur.objects.create(
+                nom=f'Chauffeur{i}', prenom='C', telephone=f'06600001{i:02d}', numero_permis=f'P{i}',
+                date_obtention_permis=date(2015, 1, 1), date_expiration_permis=date(2035, 1, 1),
+                date_embauche=date(2020, 1, 1),
+            ))
+            cls.vehicules.append(Vehicule.objects.create(
+                numero_immatriculation=f'{i:05d} 120 16', marque='Renault', modele='Master', annee=2020,
+                type_vehicule='FOURGON', capacite_poids=Decimal('1500'), capacite_volume=Decimal('12'),
+                consommation_moyenne=Decimal('9'), date_acquisition=date(2020, 1, 1),
+            ))
+
+        cls.clients = []
+        for i in range(cls.NB_LIGNES):
+            client = Client.objects.create(nom=f'Nom{i}', prenom=f'Prenom{i}', telephone=f'05500001{i:02d}')
+            cls.clients.append(client)
+            Expedition.objects.create(
+                client=client, destination=destination, type_service=type_service,
+                nom_destinataire='Destinataire', telephone_destinataire='0550999999',
+                email_destinataire='d@example.com', adresse_destinataire='Rue 1',
+                poids=Decimal('2.5'), volume=Decimal('0.1'),
+            )
+        for i in range(cls.NB_LIGNES):
+            Expedition.objects.create(
+                client=cls.clients[0], destination=destination, type_service=type_service,
+                nom_destinataire='Destinataire', telephone_destinataire='0550999999',
+                email_destinataire='d@example.com', adresse_destinataire='Rue 1',
+                poids=Decimal('1'), volume=Decimal('0.1'),
+            )
+
+    def setUp(self):
+        self.client.force_login(self.agent)
+
+    def test_empreinte_ignore_les_valeurs(self):
+        """Même requête à des valeurs près → même empreinte"""
+        self.assertEqual(
+            RequetesService.empreinte("SELECT * FROM t WHERE id = 3 AND nom = 'a'"),
+            RequetesService.empreinte("SELECT * FROM t WHERE id = 17 AND nom = 'b'"),
+        )
+        self.assertEqual(
+            RequetesService.empreinte("SELECT * FROM t WHERE id IN (%s, %s)"),
+            RequetesService.empreinte("SELECT * FROM t WHERE id IN (%s, %s, %s, %s)"),
+        )
+
+    def test_detection_n_plus_1(self):
+        """Un accès à une relation par ligne est détecté, select_related non"""
+        with RequetesService.mesurer() as mesure:
+            [expedition.client.nom for expedition in Expedition.objects.all()]
+        self.assertTrue(mesure.repetitions())
+
+        with RequetesService.mesurer() as mesure:
+            [expedition.client.nom for expedition in Expedition.objects.select_related('client')]
+        self.assertEqual(mesure.nb, 1)
+        self.assertFalse(mesure.repetitions())
+
+    def test_budgets_des_vues(self):
+        """Chaque vue budgétée respecte son budget, sans N+1, sur les données de test"""
+        identifiants = {
+            'client_id': self.clients[0].pk,
+            'chauffeur_id': self.chauffeurs[0].pk,
+            'vehicule_id': self.vehicules[0].pk,
+            'tournee_id': Tournee.objects.first().pk,
+            'expedition_id': Expedition.objects.first().pk,
+        }
+        for nom_url, budget in BUDGETS_REQUETES.items():
+            with self.subTest(vue=nom_url):
+                motif = next(p for p in urlpatterns if p.name == nom_url)
+                url = reverse(nom_url, kwargs={cle: identifiants[cle] for cle in motif.pattern.converters})
+
+                with RequetesService.mesurer() as mesure:
+                    reponse = self.client.get(url)
+
+                self.assertLess(reponse.status_code, 400)
+                self.assertLessEqual(mesure.nb, budget, f"{nom_url} : {mesure.nb} requêtes")
+                self.assertFalse(mesure.repetitions(), f"{nom_url} : N+1")
+
+    @override_settings(REQUETES_BUDGET_STRICT=True)
+    def test_mode_strict(self):
+        """Dépassement en mode strict → exception (CI) et contrevenant enregistré"""
+        RequetesService.reinitialiser()
+        with patch.dict(BUDGETS_REQUETES, {'liste_clients': 1}), self.assertLogs('app1.requetes', 'WARNING'):
+            with self.assertRaises(BudgetRequetesDepasse):
+                self.client.get(reverse('liste_clients'))
+        self.assertEqual(RequetesService.contrevenants()[0]['vue'], 'liste_clients')
+
+
+class BancEssaiTests(TestCase):
+    """
+    Jeu de données synthétique du banc (DonneesService) et comparaison de deux exécutions
+    """
+
+    def test_donnees_coherentes(self):
+        """Soldes = grand livre, cumuls des factures = paiements valides, une tournée par chauffeur et par jour"""
+        from django.db.models import Count, Sum
+        from .models import Facture, MouvementSolde, Paiement
+
+        compteurs = DonneesService.generer(200, jours=30)
+        self.assertEqual(Expedition.objects.count(), 200)
+        self.assertEqual(compteurs['expeditions'], 200)
+
+        mouvements = dict(MouvementSolde.objects.values('client').annotate(total=Sum('montant')).values_list('client', 'total'))
+        for client_id, solde in Client.objects.values_list('id', 'solde'):
+            # SUM() SQLite sur des décimaux → arrondi au centime
+            self.assertEqual(solde, mouvements.get(client_id, Decimal('0.00')).quantize(Decimal('0.01')))
+
+        for facture in Facture.objects.all():
+            paye = Paiement.objects.filter(facture=facture, statut='VALIDE').aggregate(total=Sum('montant_paye'))['total']
+            self.assertEqual(facture.montant_paye_cumule, (paye or Decimal('0.00')).quantize(Decimal('0.01')))
+
+        doublons = Tournee.objects.values('chauffeur', 'date_depart__date').annotate(nb=Count('id')).filter(nb__gt=1)
+        self.assertFalse(doublons.exists())
+        # Toujours des tournées du jour (scénarios de finalisation), même sur un petit jeu
+        self.assertTrue(Tournee.objects.filter(statut='EN_COURS').exists())
+
+    def test_generation_petite_echelle(self):
+        """Plusieurs lots puis un complément : lignes annoncées écrites, clés étrangères valides, cumuls et soldes justes"""
+        from io import StringIO
+        from django.core.management import call_command
+        from django.db.models import Count, F, Sum
+        from .models import Facture, Incident, MouvementSolde, Paiement, SequenceDocument
+        from .services.solde_service import SoldeService
+
+        tables = {
+            'clients': Client, 'chauffeurs': Chauffeur, 'vehicules': Vehicule, 'tournees': Tournee,
+            'reservations': ReservationRessource, 'expeditions': Expedition, 'suivis': TrackingExpedition,
+            'factures': Facture, 'factures_expeditions': Facture.expeditions.through, 'paiements': Paiement,
+            'mouvements_solde': MouvementSolde, 'incidents': Incident,
+        }
+        premier = DonneesService.generer(150, jours=20, taille_lot=50)
+        self.assertEqual({nom: modele.objects.count() for nom, modele in tables.items()},
+                         {nom: premier.get(nom, 0) for nom in tables})
+        second = DonneesService.generer(50, jours=20, graine=7)
+        self.assertEqual({nom: modele.objects.count() for nom, modele in tables.items()},
+                         {nom: premier.get(nom, 0) + second.get(nom, 0) for nom in tables})
+
+        connection.check_constraints()
+        self.assertFalse(Expedition.objects.filter(tournee__isnull=True).exists())
+        self.assertFalse(Paiement.objects.exclude(client=F('facture__client')).exists())
+        for ht, tva, ttc in Facture.objects.values_list('montant_ht', 'montant_tva', 'montant_ttc'):
+            self.assertEqual(ttc, ht + tva)
+        self.assertFalse(Facture.objects.annotate(nb_reel=Count('expeditions')).exclude(nb_expeditions=F('nb_reel')).exists())
+        # Facturation au grand livre = TTC des factures du client
+        facture_par_client = dict(Facture.objects.order_by().values('client').annotate(t=Sum('montant_ttc')).values_list('client', 't'))
+        facturation = MouvementSolde.objects.filter(type_mouvement='FACTURATION').order_by().values('client').annotate(t=Sum('montant'))
+        self.assertEqual({c: t.quantize(Decimal('0.01')) for c, t in facturation.values_list('client', 't')},
+                         {c: t.quantize(Decimal('0.01')) for c, t in facture_par_client.items()})
+
+        # Montants HT et cumuls payés (commande de contrôle), soldes = grand livre
+        call_command('verifier_factures', stdout=StringIO())
+        self.assertEqual(SoldeService.verifier_clients(Client.objects.values_list('id', flat=True)), [])
+
+        # Numéros uniques, séquences réservées pour la suite
+        numeros = Facture.objects.values_list('numero_facture', flat=True)
+        self.assertEqual(len(set(numeros)), len(numeros))
+        self.assertTrue(SequenceDocument.objects.filter(type_document='FACTURE').exists())
+
+    def test_signaux_suspendus(self):
+        """Aucun receiver dans le bloc (pas de tarifications créées), rétablis à la sortie"""
+        from .models import Tarification
+
+        TypeService.objects.create(type_service='STANDARD')
+        TypeService.objects.create(type_service='EXPRESS')
+        with signaux_suspendus():
+            muette = Destination.objects.create(ville='Oran', wilaya='Oran', zone_geographique='NATIONALE', distance_estimee=400)
+        parlante = Destination.objects.create(ville='Blida', wilaya='Blida', zone_geographique='NATIONALE', distance_estimee=50)
+        self.assertFalse(Tarification.objects.filter(destination=muette).exists())
+        self.assertEqual(Tarification.objects.filter(destination=parlante).count(), 2)
+
+    def test_comparer(self):
+        """Débit en baisse ou requêtes en plus → REGRESSION ; scénario ajouté / retiré signalé"""
+        def execution(*resultats):
+            return {'resultats': [
+                {'scenario': nom, 'taille': 1000, 'ops_par_s': ops, 'requetes_par_op': requetes}
+                for nom, ops, requetes in resultats
+            ]}
+
+        reference = execution(('a', 100, 10), ('b', 100, 10), ('c', 100, 10), ('d', 100, 10))
+        candidat = execution(('a', 80, 10), ('b', 100, 12), ('c', 130, 10), ('e', 100, 10))
+        verdicts = {ligne['scenario']: ligne['verdict'] for ligne in BancService.comparer(reference, candidat)}
+        self.assertEqual(verdicts, {
+            'a': 'REGRESSION', 'b': 'REGRESSION', 'c': 'AMELIORATION', 'd': 'ABSENT', 'e': 'NOUVEAU',
+        })
+
+
+class SauvegardeTests(TestCase):
+    """
+    Sauvegarde / restauration en flux (SauvegardeService)
+    """
+
+    def test_lire_objets(self):
+        """Lignes parasites ignorées, tableau indenté ou NDJSON, objets à cheval sur deux blocs"""
+        import io
+        import json
+
+        objets = [{'model': 'app1.client', 'pk': i, 'fields': {'nom': 'x' * i}} for i in range(1, 40)]
+        tableau = "Scheduler démarré\n✓ Tâche terminée\n" + json.dumps(objets, indent=2)
+        lignes = '\n'.join(json.dumps(objet) for objet in objets) + '\n'
+
+        with patch.object(SauvegardeService, 'TAILLE_BLOC', 16):
+            for contenu in (tableau, lignes):
+                self.assertEqual(list(SauvegardeService.lire_objets(io.StringIO(contenu))), objets)
+
+    def test_aller_retour(self):
+        """Sauvegarde compressée puis restauration : objets remplacés, horodatages conservés, séquences suivies"""
+        import tempfile
+        from pathlib import Path
+        from .models import Facture, Paiement, SequenceDocument
+
+        DonneesService.generer(60, jours=10)
+        facture = Facture.objects.exclude(expeditions=None).first()
+        client = Client.objects.first()
+        attendu = {modele: modele.objects.count() for modele in (Client, Expedition, Facture, Paiement)}
+
+        with tempfile.TemporaryDirectory() as repertoire:
+            chemin = Path(repertoire) / 'sauvegarde.jsonl.gz'
+            SauvegardeService.sauvegarder(chemin, etiquettes=['app1'], workers=1)
+
+            Client.objects.filter(pk=client.pk).update(nom='Modifié')
+            facture.expeditions.clear()
+            SequenceDocument.objects.all().delete()
+            compteurs = SauvegardeService.restaurer(chemin, taille_lot=25)
+
+        self.assertEqual(compteurs['app1.expedition'], attendu[Expedition])
+        self.assertEqual({modele: modele.objects.count() for modele in attendu}, attendu)
+        client.refresh_from_db()
+        self.assertNotEqual(client.nom, 'Modifié')
+        self.assertTrue(Facture.objects.get(pk=facture.pk).expeditions.exists())
+        # Format dumpdata : dates à la milliseconde
+        milli = facture.date_creation.microsecond // 1000 * 1000
+        self.assertEqual(Facture.objects.get(pk=facture.pk).date_creation, facture.date_creation.replace(microsecond=milli))
+        self.assertTrue(SequenceDocument.objects.filter(type_document='FACTURE').exists())
+
+
+class InstantaneTests(SimpleTestCase):
+    """
+    Instantanés SQLite dédupliqués (InstantaneService) sur une base temporaire
+    """
+
+    def setUp(self):
+        import sqlite3
+        import tempfile
+        from pathlib import Path
+
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.base = Path(dossier.name) / 'base.sqlite3'
+        connexion = sqlite3.connect(self.base)
+        connexion.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, valeur TEXT)")
+        connexion.executemany("INSERT INTO t (valeur) VALUES (?)", [(str(i) * 50,) for i in range(5000)])
+        connexion.commit()
+        connexion.close()
+
+        self.enterContext(override_settings(
+            INSTANTANES_REPERTOIRE=Path(dossier.name) / 'instantanes', INSTANTANES_TAILLE_BLOC=16384
+        ))
+        self.enterContext(patch.object(InstantaneService, 'base', return_value=str(self.base)))
+
+    def test_deduplication_et_restauration(self):
+        """Seuls les blocs modifiés sont écrits ; bloc corrompu détecté ; restauration vers un fichier"""
+        import sqlite3
+
+        premier = InstantaneService.creer()
+        connexion = sqlite3.connect(self.base)
+        connexion.execute("UPDATE t SET valeur = 'modifié' WHERE id = 4000")
+        connexion.commit()
+        connexion.close()
+        second = InstantaneService.creer()
+
+        self.assertEqual(premier['nouveaux_blocs'], len(premier['blocs']))
+        self.assertLess(second['nouveaux_blocs'], 3)
+        self.assertTrue(InstantaneService.verifier(premier['id'], integrite=True)['ok'])
+
+        cible = self.base.with_name('restauree.sqlite3')
+        InstantaneService.restaurer(premier['id'], cible=str(cible))
+        connexion = sqlite3.connect(cible)
+        self.assertEqual(connexion.execute("SELECT valeur FROM t WHERE id = 4000").fetchone()[0], '3999' * 50)
+        connexion.close()
+
+        modifie = next(bloc for bloc in second['blocs'] if bloc not in premier['blocs'])
+        InstantaneService.chemin_bloc(modifie).write_bytes(b'corrompu')
+        self.assertFalse(InstantaneService.verifier(second['id'])['ok'])
+        self.assertTrue(InstantaneService.verifier(premier['id'])['ok'])
+
+    def test_retention(self):
+        """N derniers + dernier de chaque jour + dernier de chaque semaine"""
+        maintenant = timezone.now()
+        manifestes = [
+            {'id': str(heures), 'cree_le': (maintenant - timedelta(hours=heures)).isoformat()}
+            for heures in range(0, 24 * 60, 6)
+        ]
+        with override_settings(INSTANTANES_GARDER_DERNIERS=2, INSTANTANES_GARDER_JOURS=3, INSTANTANES_GARDER_SEMAINES=4):
+            conserves = InstantaneService.a_conserver(manifestes, maintenant)
+
+        self.assertTrue({'0', '6'} <= conserves)
+        jours = {(maintenant - timedelta(hours=int(i))).date() for i in conserves if int(i) < 72}
+        self.assertGreaterEqual(len(jours), 3)
+        self.assertFalse(any(int(i) > 24 * 7 * 4 + 24 * 7 for i in conserves))
+        self.assertLess(len(conserves), 12)
+
+
+    def test_verification_base_wal(self):
+        """Instantané d'une base en WAL : la vérification d'intégrité ne laisse aucun fichier -wal / -shm"""
+        import sqlite3
+
+        connexion = sqlite3.connect(self.base)
+        self.assertEqual(connexion.execute("PRAGMA journal_mode=WAL").fetchone()[0], 'wal')
+        connexion.close()
+
+        manifeste = InstantaneService.creer()
+        self.assertEqual(manifeste['copie'], 'wal')
+        self.assertTrue(InstantaneService.verifier(manifeste['id'], integrite=True)['ok'])
+        self.assertEqual(
+            [chemin.name for chemin in InstantaneService.repertoire().iterdir() if chemin.name.startswith('.')], []
+        )
+
+    @override_settings(TIME_ZONE='Africa/Algiers', INSTANTANES_GARDER_DERNIERS=0,
+                       INSTANTANES_GARDER_JOURS=7, INSTANTANES_GARDER_SEMAINES=0)
+    def test_retention_jour_local(self):
+        """0h15 UTC et 23h45 UTC la veille : même jour à Alger (UTC+1), un seul conservé ; 22h30 UTC la veille : jour précédent"""
+        from datetime import timezone as fuseaux
+
+        def manifeste(heure, minute, jour=15):
+            return {'id': f'{jour}-{heure}{minute}', 'cree_le': datetime(2030, 1, jour, heure, minute, tzinfo=fuseaux.utc).isoformat()}
+
+        manifestes = [manifeste(0, 15, jour=16), manifeste(23, 45), manifeste(22, 30)]
+        conserves = InstantaneService.a_conserver(manifestes, datetime(2030, 1, 16, 12, tzinfo=fuseaux.utc))
+        self.assertEqual(conserves, {'16-015', '15-2230'})
+
+    @override_settings(REPLICA_ANALYTIQUE_ACTIVE=False, INSTANTANES_ACTIFS=True, INSTANTANES_INTERVALLE_MINUTES=60)
+    def test_planifie_par_le_serveur_uniquement(self):
+        """Opt-in ; planifiés par le scheduler du serveur web, pas par celui des commandes manage.py"""
+        from . import scheduler
+
+        self.addCleanup(setattr, scheduler, '_scheduler_serveur', None)
+        with patch.object(scheduler, 'BackgroundScheduler') as classe:
+            scheduler.demarrer_scheduler_serveur()
+        self.assertEqual([appel.kwargs['id'] for appel in classe.return_value.add_job.call_args_list], ['instantane_base'])
+
+
+@override_settings(SQLITE_PORTE_ATTENTE_SECONDES=2)
+class TransactionLectureTests(TransactionTestCase):
+    """
+    Lectures groupées (exports, sauvegarde parallèle) sans la porte d'écriture du processus
+    """
+
+    def test_lecture_pendant_une_ecriture(self):
+        """Un autre thread tient la porte d'écriture : la transaction de lecture n'attend pas"""
+        from .backends.sqlite.base import transaction_lecture
+
+        Client.objects.create(nom='Lecture', prenom='L', telephone='0550000071')
+        porte_prise, fin = threading.Event(), threading.Event()
+
+        def ecrivain():
+            try:
+                with transaction.atomic():
+                    porte_prise.set()
+                    fin.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=ecrivain)
+        thread.start()
+        try:
+            porte_prise.wait(10)
+            debut = time.perf_counter()
+            with transaction_lecture():
+                self.assertEqual(Client.objects.count(), 1)
+            self.assertLess(time.perf_counter() - debut, 1)
+        finally:
+            fin.set()
+            thread.join()
+
+    def test_sauvegarde_parallele(self):
+        """workers > 1 sur SQLite : la transaction principale tient la porte, les workers lisent quand même"""
+        import tempfile
+        from pathlib import Path
+
+        Client.objects.bulk_create([
+            Client(nom=f'Client{i}', prenom='C', telephone=f'05500002{i:02d}') for i in range(20)
+        ])
+
+        with tempfile.TemporaryDirectory() as repertoire:
+            compteurs = SauvegardeService.sauvegarder(Path(repertoire) / 'base.jsonl', etiquettes=['app1'], workers=4)
+
+        self.assertEqual(compteurs['app1.client'], 20)
+
+
+class ConcurrenceEcrituresTests(TransactionTestCase):
+    """
+    Écrivains concurrents (une connexion par thread) sans "database is locked", sans
+    mise à jour perdue ni double réservation : SQLite (app1.backends.sqlite) comme
+    PostgreSQL (BASE_MOTEUR=postgresql python manage.py test)
+    """
+
+    NB_THREADS = 8
+
+    def executer(self, fonction, nb_threads=NB_THREADS):
+        """Lance `fonction(i)` dans nb_threads threads démarrés ensemble → {i: résultat ou exception}"""
+        depart = threading.Barrier(nb_threads)
+        resultats = {}
+
+        def travail(i):
+            try:
+                depart.wait()
+                resultats[i] = fonction(i)
+            except Exception as e:
+                resultats[i] = e
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=travail, args=(i,)) for i in range(nb_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return resultats
+
+    def test_solde_sans_mise_a_jour_perdue(self):
+        """Lecture (select_for_update) puis écriture du solde : aucun incrément perdu, porte ou pas"""
+        client = Client.objects.create(nom='Concurrence', prenom='C', telephone='0550000001')
+        iterations = 25
+
+        def crediter(i):
+            for _ in range(iterations):
+                with transaction.atomic():
+                    solde = Client.objects.select_for_update().values_list('solde', flat=True).get(pk=client.pk)
+                    Client.objects.filter(pk=client.pk).update(solde=solde + 1)
+
+        for porte in (True, False):
+            with self.subTest(porte=porte), override_settings(SQLITE_PORTE_ECRITURE=porte):
+                Client.objects.filter(pk=client.pk).update(solde=0)
+                resultats = self.executer(crediter)
+                self.assertEqual([r for r in resultats.values() if r is not None], [])
+                client.refresh_from_db()
+                self.assertEqual(client.solde, self.NB_THREADS * iterations)
+
+    def test_vehicule_jamais_reserve_deux_fois(self):
+        """Même véhicule, même créneau, chauffeurs différents : une seule tournée passe"""
+        from .models import ReservationRessource
+
+        vehicule = Vehicule.objects.create(
+            numero_immatriculation='00001 120 16', marque='Renault', modele='Master', annee=2020,
+            type_vehicule='FOURGON', capacite_poids=Decimal('1500'), capacite_volume=Decimal('12'),
+            consommation_moyenne=Decimal('9'), date_acquisition=date(2020, 1, 1),
+        )
+        chauffeurs = [
+            Chauffeur.objects.create(
+                nom=f'Chauffeur{i}', prenom='C', telephone=f'06600002{i:02d}', numero_permis=f'P{i}',
+                date_obtention_permis=date(2015, 1, 1), date_expiration_permis=date(2035, 1, 1),
+                date_embauche=date(2020, 1, 1),
+            )
+            for i in range(self.NB_THREADS)
+        ]
+        depart = timezone.now() + timedelta(days=2)
+
+        def planifier(i):
+            return Tournee.objects.create(chauffeur=chauffeurs[i], vehicule=vehicule, date_depart=depart, zone_cible='CENTRE')
+
+        resultats = self.executer(planifier).values()
+        reussies = [r for r in resultats if isinstance(r, Tournee)]
+        self.assertEqual(len(reussies), 1)
+        self.assertTrue(all(isinstance(r, ValidationError) for r in resultats if r not in reussies))
+        self.assertEqual(Tournee.objects.count(), 1)
+        self.assertEqual(ReservationRessource.objects.filter(vehicule=vehicule).count(), 1)
+        self.assertEqual(ReservationRessource.objects.count(), 2)
+
+
+@skipUnless(connection.vendor == 'postgresql', "Chemins PostgreSQL : BASE_MOTEUR=postgresql python manage.py test")
+@override_settings(BOITE_ENVOI_ACTIVE=False)
+class PostgreSQLTests(TransactionTestCase):
+    """
+    Chemins propres à PostgreSQL, sous vraie concurrence (une connexion par thread) :
+    séquences INSERT ... ON CONFLICT ... RETURNING, SKIP LOCKED, instantané exporté
+    """
+
+    NB_THREADS = 8
+    executer = ConcurrenceEcrituresTests.executer
+
+    def test_sequences_concurrentes(self):
+        """Threads qui allouent sur la même clé : numéros tous distincts et sans trou, avec ou sans blocs"""
+        from .models import SequenceDocument
+        from .services.sequence_service import SequenceService
+
+        self.addCleanup(SequenceService.reinitialiser_cache)
+        iterations = 25
+        for bloc, periode in ((1, '20300101'), (5, '20300102')):
+            with self.subTest(bloc=bloc), override_settings(SEQUENCE_BLOC=bloc):
+                resultats = self.executer(
+                    lambda i: [SequenceService.suivant('INCIDENT', periode=periode) for _ in range(iterations)]
+                )
+                numeros = sorted(n for lot in resultats.values() for n in lot)
+                self.assertEqual(numeros, list(range(1, self.NB_THREADS * iterations + 1)))
+                self.assertEqual(
+                    SequenceDocument.objects.get(type_document='INCIDENT', periode=periode).valeur,
+                    self.NB_THREADS * iterations,
+                )
+
+    def test_ressources_verrouillees_sautees(self):
+        """SKIP LOCKED : chauffeur et véhicule verrouillés par une autre transaction → None, sans attendre"""
+        from .services.calendrier_service import CalendrierService
+
+        self.assertTrue(connection.features.has_select_for_update_skip_locked)
+        chauffeur, vehicule = creer_equipe(0)
+        tient, libere = threading.Event(), threading.Event()
+
+        def detenteur():
+            try:
+                with transaction.atomic():
+                    CalendrierService.verrouiller(chauffeur.pk, vehicule.pk)
+                    tient.set()
+                    libere.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=detenteur)
+        thread.start()
+        try:
+            self.assertTrue(tient.wait(10))
+            with transaction.atomic():
+                self.assertEqual(CalendrierService.verrouiller(chauffeur.pk, vehicule.pk, sauter_verrouilles=True), (None, None))
+        finally:
+            libere.set()
+            thread.join()
+        with transaction.atomic():
+            self.assertEqual(CalendrierService.verrouiller(chauffeur.pk, vehicule.pk, sauter_verrouilles=True), (chauffeur, vehicule))
+
+    def test_boite_envoi_workers_concurrents(self):
+        """Plusieurs workers sur la même boîte : chaque événement traité exactement une fois"""
+        from collections import Counter
+        from .models import EvenementSortant
+
+        appels, verrou = Counter(), threading.Lock()
+
+        def compter(numero):
+            with verrou:
+                appels[numero] += 1
+
+        with patch.dict(GESTIONNAIRES, {'essai': compter}):
+            with transaction.atomic():
+                BoiteEnvoiService.publier_lot('essai', [{'numero': n} for n in range(60)])
+            resultats = self.executer(lambda i: BoiteEnvoiService.vider(taille_lot=5), nb_threads=4)
+
+        self.assertEqual([r for r in resultats.values() if isinstance(r, Exception)], [])
+        self.assertEqual(sum(r['traites'] for r in resultats.values()), 60)
+        self.assertEqual(appels, Counter(range(60)))
+        self.assertFalse(EvenementSortant.objects.exclude(statut='TRAITE').exists())
+
+    def test_instantane_exporte(self):
+        """pg_export_snapshot : un worker lit la base telle qu'au début de la sauvegarde"""
+        import tempfile
+        from pathlib import Path
+
+        for i in range(3):
+            Client.objects.create(nom=f'Avant{i}', prenom='A', telephone=f'05500001{i:02d}')
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        cles = SauvegardeService.cles_naturelles()
+
+        def ajouter(i):
+            Client.objects.create(nom='Apres', prenom='A', telephone='0550000199')
+
+        def exporter(i):
+            return SauvegardeService.exporter_table(Client, Path(dossier.name) / 'clients.jsonl', cles, 2, instantane)
+
+        with SauvegardeService.instantane(workers=2) as instantane:
+            self.assertIsNotNone(instantane)
+            self.assertEqual(self.executer(ajouter, nb_threads=1), {0: None})
+            self.assertEqual(self.executer(exporter, nb_threads=1), {0: 3})
+        self.assertEqual(Client.objects.count(), 4)
+
+
+@override_settings(BOITE_ENVOI_ACTIVE=False, BOITE_ENVOI_DELAI_SECONDES=0, BOITE_ENVOI_TENTATIVES_MAX=2)
+class BoiteEnvoiTests(TestCase):
+    """
+    Boîte d'envoi : événement écrit avec la transaction, traité après, repris en cas d'erreur
+    (worker du processus désactivé : traiter() est appelé par le test)
+    """
+
+    def setUp(self):
+        self.client_credit = Client.objects.create(nom='Credit', prenom='C', telephone='0550000002')
+        Client.objects.filter(pk=self.client_credit.pk).update(solde=Decimal('-150.00'))
+
+    def test_publication_transactionnelle(self):
+        """Annulé avec la transaction ; sinon traité une seule fois, après le commit"""
+        from .models import EvenementSortant, Notification
+
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            BoiteEnvoiService.publier('client_en_credit', client_id=self.client_credit.pk, numero_expedition='EXP-1')
+            1 / 0
+        self.assertFalse(EvenementSortant.objects.exists())
+
+        with self.captureOnCommitCallbacks() as rappels:
+            BoiteEnvoiService.publier('client_en_credit', client_id=self.client_credit.pk, numero_expedition='EXP-1')
+        self.assertEqual(len(rappels), 1)
+        self.assertFalse(Notification.objects.exists())
+
+        self.assertEqual(BoiteEnvoiService.traiter(), {'lot': 1, 'traites': 1, 'echecs': 0})
+        self.assertEqual(BoiteEnvoiService.traiter()['lot'], 0)
+        self.assertEqual(EvenementSortant.objects.get().statut, 'TRAITE')
+        self.assertEqual(Notification.objects.filter(type_notification='SOLDE_NEGATIF', client=self.client_credit).count(), 1)
+
+    def test_reprises_puis_echec(self):
+        """Erreur → nouvelle tentative, ECHEC au-delà du maximum, rejouer() remet en attente"""
+        from .models import EvenementSortant
+
+        evenement = BoiteEnvoiService.publier('client_en_credit', client_id=self.client_credit.pk, numero_expedition='EXP-2')
+
+        def en_panne(**donnees):
+            raise ConnectionError("SMTP indisponible")
+
+        with patch.dict(GESTIONNAIRES, {'client_en_credit': en_panne}):
+            self.assertEqual(BoiteEnvoiService.traiter()['echecs'], 1)
+            evenement.refresh_from_db()
+            self.assertEqual((evenement.statut, evenement.tentatives, evenement.verrou), ('EN_ATTENTE', 1, ''))
+
+            BoiteEnvoiService.traiter()
+            evenement.refresh_from_db()
+            self.assertEqual((evenement.statut, evenement.tentatives), ('ECHEC', 2))
+            self.assertIn('SMTP indisponible', evenement.derniere_erreur)
+            self.assertEqual(BoiteEnvoiService.traiter()['lot'], 0)
+
+        self.assertEqual(BoiteEnvoiService.rejouer(), 1)
+        self.assertEqual(BoiteEnvoiService.vider()['traites'], 1)
+        self.assertEqual(EvenementSortant.objects.get().statut, 'TRAITE')
+
+    def test_worker_serveur_uniquement(self):
+        """Pas de thread dans les commandes manage.py (dont test) ; le point d'entrée serveur respecte le réglage"""
+        self.assertIsNone(BoiteEnvoiService._worker)
+
+        with patch.object(BoiteEnvoiService, 'demarrer') as demarrer:
+            with override_settings(BOITE_ENVOI_ACTIVE=False):
+                BoiteEnvoiService.demarrer_serveur()
+            demarrer.assert_not_called()
+            with override_settings(BOITE_ENVOI_ACTIVE=True):
+                BoiteEnvoiService.demarrer_serveur()
+            demarrer.assert_called_once_with()
+
+    @override_settings(BOITE_ENVOI_ACTIVE=True)
+    def test_boucle_journalise_erreur(self):
+        """Erreur de base dans le worker → avertissement dans le journal, pas sur la sortie standard"""
+        from django.db import DatabaseError
+
+        # Au plus 2 passages, quoi que fassent les autres mocks
+        arret = Mock()
+        arret.is_set.side_effect = [False, False, False, False, True]
+
+        with patch.object(BoiteEnvoiService, '_reveil') as reveil, \
+                patch.object(BoiteEnvoiService, '_arret', arret), \
+                patch.object(BoiteEnvoiService, 'vider', side_effect=[DatabaseError('base verrouillée'), {}]) as vider, \
+                patch('app1.services.boite_envoi_service.close_old_connections'), \
+                self.assertLogs('app1.services.boite_envoi_service', 'WARNING') as journal:
+            BoiteEnvoiService._boucle()
+        self.assertEqual(reveil.wait.call_count, 2)
+        self.assertEqual(vider.call_count, 2)
+        self.assertIn('base verrouillée', journal.output[0])
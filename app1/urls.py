@@ -39,6 +39,7 @@ urlpatterns = [
     path('vehicules/<int:vehicule_id>/modifier/', views.modifier_vehicule, name='modifier_vehicule'),
     path('vehicules/<int:vehicule_id>/supprimer/', views.supprimer_vehicule, name='supprimer_vehicule'),
     path('vehicules/<int:vehicule_id>/modifier-statut/', views.modifier_statut_vehicule, name='modifier_statut_vehicule'),
+    path('vehicules/efficacite/', views.efficacite_flotte, name='efficacite_flotte'),
     path('vehicules/export-pdf/', views.exporter_vehicules_pdf, name='exporter_vehicules_pdf'),
     path('vehicules/<int:vehicule_id>/export-pdf/', views.exporter_vehicule_detail_pdf, name='exporter_vehicule_detail_pdf'),
 
@@ -69,6 +70,7 @@ urlpatterns = [
     path('tournees/', views.liste_tournees, name='liste_tournees'),
     path('tournees/<int:tournee_id>/', views.detail_tournee, name='detail_tournee'),
     path('tournees/creer/', views.creer_tournee, name='creer_tournee'),
+    path('tournees/disponibilites/', views.disponibilites_ressources, name='disponibilites_ressources'),
     path('tournees/<int:tournee_id>/modifier/', views.modifier_tournee, name='modifier_tournee'),
     path('tournees/<int:tournee_id>/supprimer/', views.supprimer_tournee, name='supprimer_tournee'),
     path('tournees/<int:tournee_id>/modifier-statut/', views.modifier_statut_tournee, name='modifier_statut_tournee'),
@@ -86,6 +88,15 @@ urlpatterns = [
     
     path('trackings/', views.liste_trackings, name='liste_trackings'),
     path('trackings/<int:expedition_id>/', views.detail_tracking, name='detail_tracking'),
+    path('api/evenements/', views.ingerer_evenements, name='ingerer_evenements'),
+    path('suivi/', views.suivi_public, name='suivi_public'),
+    path('api/suivi/<str:numero>/', views.api_suivi_public, name='api_suivi_public'),
+    path('flux/', views.flux_direct, name='flux_direct'),
+    path('api/diagnostic/requetes/', views.diagnostic_requetes, name='diagnostic_requetes'),
+    path('diagnostic/profils/', views.liste_profils, name='liste_profils'),
+    path('diagnostic/profils/<str:nom>/', views.detail_profil, name='detail_profil'),
+    path('diagnostic/profils/<str:nom>/telecharger/', views.telecharger_profil, name='telecharger_profil'),
+    path('metrics', views.metriques, name='metriques'),
 
     path('factures/', views.liste_factures, name='liste_factures'),
     path('factures/<int:facture_id>/', views.detail_facture, name='detail_facture'),
@@ -125,4 +136,22 @@ urlpatterns = [
     path('reclamations/<int:reclamation_id>/resoudre/', views.resoudre_reclamation, name='resoudre_reclamation'),
     path('reclamations/<int:reclamation_id>/cloturer/', views.cloturer_reclamation, name='cloturer_reclamation'),
     path('reclamations/<int:reclamation_id>/annuler/', views.annuler_reclamation, name='annuler_reclamation'),
-]
\ No newline at end of file
+]
+
+# Budgets de requêtes SQL par nom d'URL (BudgetRequetesMiddleware, voir services/requetes_service.py)
+BUDGETS_REQUETES = {
+    'home': 10,
+    'liste_clients': 8,
+    'detail_client': 9,
+    'exporter_client_detail_pdf': 10,
+    'liste_chauffeurs': 9,
+    'liste_vehicules': 11,
+    'liste_tournees': 10,
+    'detail_tournee': 10,
+    'liste_expeditions': 10,
+    'detail_expedition': 8,
+    'creer_expedition': 8,
+    'liste_trackings': 6,
+    'creer_incident': 7,
+    'creer_reclamation': 7,
+}
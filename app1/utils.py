@@ -5,13 +5,15 @@ from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.db.models import Sum
 from django.db import transaction
-from .models import Chauffeur, Vehicule
+from .services.metriques_service import MetriquesService
+from .services.solde_service import SoldeService
 
 
+@MetriquesService.instrumenter
 class TourneeService:
     """
     Service gérant toutes les opérations liées aux tournées :
-    - Validation disponibilité chauffeur/véhicule
+    - Validation disponibilité chauffeur/véhicule (calendrier de réservations)
     - Calculs kilométrage et consommation
     - Gestion des statuts (ressources + expéditions)
     """
@@ -23,9 +25,8 @@ class TourneeService:
         Appelé automatiquement par le signal post_save de Tournee
         """
         
-        # 1. Vérifier disponibilité (nouvelle tournée uniquement)
-        if tournee.pk is None:
-            TourneeService.verifier_disponibilite(tournee)
+        # 1. Disponibilité : vérifiée et réservée par CalendrierService.reserver_tournee()
+        #    dans la même transaction que l'enregistrement (voir Tournee.save)
         
         # 2. Kilométrage départ (enregistrer le km actuel du véhicule)
         if tournee.pk is None and not tournee.kilometrage_depart:
@@ -35,41 +36,42 @@ class TourneeService:
         if tournee.kilometrage_arrivee and tournee.kilometrage_depart:
             TourneeService.calculer_kilometrage_et_consommation(tournee)
         
-        # 4. Gérer statuts ressources (chauffeur, véhicule, expéditions)
-        TourneeService.gerer_statuts_ressources(tournee)
-        
-        # 5. Auto-démarrage si date départ atteinte
+        # 4. Auto-démarrage si date départ atteinte
         if tournee.statut == 'PREVUE' and timezone.now() >= tournee.date_depart:
             tournee.statut = 'EN_COURS'
+        
+        # 5. Gérer statuts ressources (chauffeur, véhicule, expéditions) avec le statut final
+        TourneeService.gerer_statuts_ressources(tournee)
 
     @staticmethod
-    @transaction.atomic
     def verifier_disponibilite(tournee):
         """
-        Vérifie que chauffeur ET véhicule sont DISPONIBLES
+        Vérifie que chauffeur ET véhicule sont libres sur la fenêtre de la tournée
+        [date_depart, retour) : aucune autre réservation qui chevauche, et pas
+        d'indisponibilité en cours (congé, maintenance...)
         
-        IMPORTANT : Utilise select_for_update() pour éviter les RACE CONDITIONS
-        (2 agents ne peuvent pas affecter le même chauffeur/véhicule simultanément)
+        Lève ValidationError sinon
         """
-        # Lock les ressources (personne d'autre ne peut les modifier pendant la vérification)
-        chauffeur = Chauffeur.objects.select_for_update().get(id=tournee.chauffeur.id)
-        vehicule = Vehicule.objects.select_for_update().get(id=tournee.vehicule.id)
+        from .services.calendrier_service import CalendrierService
         
-        if chauffeur.statut_disponibilite != 'DISPONIBLE':
-            raise ValidationError(f"Chauffeur {chauffeur} non disponible")
-        
-        if vehicule.statut != 'DISPONIBLE':
-            raise ValidationError(f"Véhicule {vehicule.numero_immatriculation} non disponible")
+        debut, fin = CalendrierService.fenetre_tournee(tournee)
+        with transaction.atomic():
+            # Lignes verrouillées (PostgreSQL) : pas de réservation concurrente pendant la vérification
+            chauffeur, vehicule = CalendrierService.verrouiller(tournee.chauffeur_id, tournee.vehicule_id)
+            CalendrierService.verifier(chauffeur, vehicule, debut, fin, exclure_tournee=tournee.pk)
     
     @staticmethod
     def calculer_kilometrage_et_consommation(tournee):
         """
         Calcule le kilométrage parcouru et la consommation de carburant
         Formule : Consommation = (km parcouru × conso moyenne) / 100
+        Si les litres ont été relevés (carburant_reel), ils priment sur l'estimation
         """
         tournee.kilometrage_parcouru = tournee.kilometrage_arrivee - tournee.kilometrage_depart
         
-        if tournee.kilometrage_parcouru > 0:
+        if tournee.carburant_reel is not None:
+            tournee.consommation_carburant = tournee.carburant_reel
+        elif tournee.kilometrage_parcouru > 0:
             tournee.consommation_carburant = (
                 Decimal(str(tournee.kilometrage_parcouru)) * 
                 tournee.vehicule.consommation_moyenne / 100
@@ -81,33 +83,38 @@ class TourneeService:
         Gère les statuts automatiques selon l'état de la tournée
         
         LOGIQUE :
-        - PREVUE / EN_COURS → Chauffeur + Véhicule = EN_TOURNEE
-        - EN_COURS → Expéditions = EN_TRANSIT
+        - PREVUE → rien (la réservation est dans le calendrier, les ressources
+          restent libres en dehors de la fenêtre de la tournée)
+        - EN_COURS → Chauffeur + Véhicule = EN_TOURNEE, Expéditions = EN_TRANSIT
         - TERMINEE → Chauffeur + Véhicule = DISPONIBLE, Expéditions = LIVRE
         """
         
-        if tournee.statut in ['PREVUE', 'EN_COURS']:
-            # Réserver les ressources
+        if tournee.statut == 'PREVUE':
+            return
+        
+        if tournee.statut == 'EN_COURS':
+            # Ressources sur la route
             tournee.chauffeur.statut_disponibilite = 'EN_TOURNEE'
             tournee.vehicule.statut = 'EN_TOURNEE'
             
-            # Si tournée démarre → mettre expéditions EN_TRANSIT
-            if tournee.statut == 'EN_COURS':
-                from .models import TrackingExpedition
-                for exp in tournee.expeditions.all():
-                    if exp.statut != 'EN_TRANSIT':
-                        exp.statut = 'EN_TRANSIT'
-                        exp.save(update_fields=['statut'])
-                        
-                        # Créer suivi de tracking
-                        TrackingService.creer_suivi(
-                            exp,
-                            'EN_TRANSIT',
-                            f"Colis en transit vers {exp.destination.ville}"
-                        )
+            # Tournée démarrée → mettre expéditions EN_TRANSIT (une tournée pas encore créée n'en a pas)
+            from .models import TrackingExpedition
+            en_route = []
+            for exp in (tournee.expeditions.all() if tournee.pk else []):
+                if exp.statut != 'EN_TRANSIT':
+                    exp.statut = 'EN_TRANSIT'
+                    exp.save(update_fields=['statut'])
+                    
+                    # Créer suivi de tracking
+                    TrackingService.creer_suivi(
+                        exp,
+                        'EN_TRANSIT',
+                        f"Colis en transit vers {exp.destination.ville}"
+                    )
+                    en_route.append(exp)
 
-                        ExpeditionService.envoyer_notification_destinataire(exp)
-        
+            ExpeditionService.envoyer_notifications_destinataires(en_route)
+    
         elif tournee.statut == 'TERMINEE':
             # Libérer les ressources
             tournee.chauffeur.statut_disponibilite = 'DISPONIBLE'
@@ -153,6 +160,7 @@ class TourneeService:
         
         return True, ""
 
+@MetriquesService.instrumenter
 class ExpeditionService:
     """
     Service gérant les opérations sur les expéditions :
@@ -250,41 +258,46 @@ class ExpeditionService:
     def creer_nouvelle_tournee(expedition):
         """
         Crée une nouvelle tournée PARTAGÉE pour l'expédition STANDARD
-        """
-        from .models import Tournee, Chauffeur, Vehicule
-        
-        chauffeur = Chauffeur.objects.filter(statut_disponibilite='DISPONIBLE').first()
-        vehicule = Vehicule.objects.filter(statut='DISPONIBLE').first()
-        
-        if not chauffeur or not vehicule:
-            raise ValidationError(
-                "⚠️ Aucune tournée compatible et aucun chauffeur/véhicule disponible. "
-                "L'expédition sera créée sans tournée. Veuillez l'affecter manuellement plus tard."
-            )
-        
-        # Calculer délai selon la zone
-        zone = expedition.destination.zone_logistique
-        if zone == 'CENTRE':
-            jours_delai = 1
-        elif zone in ['EST', 'OUEST']:
-            jours_delai = 2
-        elif zone == 'SUD':
-            jours_delai = 3
-        else:
-            jours_delai = 1
+        Chauffeur et véhicule : libres sur toute la fenêtre aller-retour,
+        choisis par AffectationService (capacité, type, révision, charge)
+        """
+        from .services.affectation_service import AffectationService
+        
+        # Calculer délai selon le temps de route (matrice des distances)
+        from .services.distance_service import DistanceService
+        jours_delai = DistanceService.jours_route(expedition.destination)
+        
+        # Destination hors matrice → délai selon la zone
+        if jours_delai is None:
+            zone = expedition.destination.zone_logistique
+            if zone == 'CENTRE':
+                jours_delai = 1
+            elif zone in ['EST', 'OUEST']:
+                jours_delai = 2
+            elif zone == 'SUD':
+                jours_delai = 3
+            else:
+                jours_delai = 1
         
-        # Date de départ = maintenant + délai
+        # Date de départ = maintenant + délai, retour = départ + aller-retour
         date_depart = timezone.now() + timedelta(days=jours_delai)
         date_depart = date_depart.replace(hour=9, minute=0, second=0)
+        date_retour_prevue = date_depart + timedelta(days=2 * jours_delai)
         
-        tournee = Tournee.objects.create(
-            chauffeur=chauffeur,
-            vehicule=vehicule,
-            date_depart=date_depart,
+        tournee = AffectationService.creer_tournee(
+            date_depart,
+            date_retour_prevue,
+            expedition,
             zone_cible=expedition.destination.zone_logistique,
             statut='PREVUE'
         )
         
+        if tournee is None:
+            raise ValidationError(
+                "⚠️ Aucune tournée compatible et aucun chauffeur/véhicule disponible. "
+                "L'expédition sera créée sans tournée. Veuillez l'affecter manuellement plus tard."
+            )
+        
         expedition.tournee = tournee
         expedition.save()
     
@@ -292,17 +305,11 @@ class ExpeditionService:
     def creer_tournee_express(expedition):
         """
         Crée une tournée PRIVÉE (dédiée) pour une expédition EXPRESS
+        Chauffeur et véhicule : libres sur toute la fenêtre aller-retour,
+        choisis par AffectationService (le plus petit véhicule adapté au colis)
         """
-        from .models import Tournee, Chauffeur, Vehicule
-        
-        chauffeur = Chauffeur.objects.filter(statut_disponibilite='DISPONIBLE').first()
-        vehicule = Vehicule.objects.filter(statut='DISPONIBLE').first()
-        
-        if not chauffeur or not vehicule:
-            raise ValidationError(
-                "Aucun chauffeur ou véhicule disponible pour une expédition EXPRESS. "
-                "Veuillez attendre ou passer en STANDARD."
-            )
+        from .services.affectation_service import AffectationService
+        from .services.distance_service import DistanceService
         
         # Départ immédiat si avant 14h, sinon demain matin 8h
         maintenant = timezone.now()
@@ -312,16 +319,25 @@ class ExpeditionService:
             date_depart = maintenant + timedelta(days=1)
             date_depart = date_depart.replace(hour=8, minute=0, second=0)
         
-        tournee = Tournee.objects.create(
-            chauffeur=chauffeur,
-            vehicule=vehicule,
-            date_depart=date_depart,
+        jours_route = DistanceService.jours_route(expedition.destination) or 1
+        date_retour_prevue = date_depart + timedelta(days=2 * jours_route)
+        
+        tournee = AffectationService.creer_tournee(
+            date_depart,
+            date_retour_prevue,
+            expedition,
             zone_cible=expedition.destination.zone_logistique,
             est_privee=True,
             remarques=f"Tournée privée EXPRESS vers {expedition.destination.ville}, {expedition.destination.wilaya}",
             statut='PREVUE'
         )
         
+        if tournee is None:
+            raise ValidationError(
+                "Aucun chauffeur ou véhicule disponible pour une expédition EXPRESS. "
+                "Veuillez attendre ou passer en STANDARD."
+            )
+        
         expedition.tournee = tournee
         expedition.save()
     
@@ -345,15 +361,16 @@ class ExpeditionService:
     
     
     @staticmethod
-    def envoyer_notification_destinataire(expedition):
+    def envoyer_notifications_destinataires(expeditions):
         """
-        Envoie un email/SMS au destinataire quand sa tournée démarre
+        Envoie un email/SMS aux destinataires quand leur tournée démarre
+        (après le commit du démarrage, via la boîte d'envoi : un INSERT pour toutes)
         """
-        from .notification import ExpeditionEmailService
+        from .services.boite_envoi_service import BoiteEnvoiService
         
-        # Email au destinataire
-        ExpeditionEmailService.envoyer_notification_colis_en_route(expedition)
+        BoiteEnvoiService.publier_lot('expedition_en_route', [{'expedition_id': exp.pk} for exp in expeditions])
 
+@MetriquesService.instrumenter
 class VehiculeService:
     """
     Service pour gérer les maintenances automatiques des véhicules
@@ -421,59 +438,17 @@ class VehiculeService:
     @staticmethod
     def gerer_maintenance_veille_soir():
         """
-        ⏰ Exécuté à 17h30 (J-1) par le scheduler
+        ⏰ Exécuté à 17h30 par le scheduler
         
-        Vérifie les véhicules dont la maintenance est DEMAIN et crée les notifications
-        
-        2 CAS :
-        1. Véhicule EN TOURNÉE → Notification "Véhicule occupé, modifier DPR ?"
-        2. Véhicule DISPONIBLE → Notification "Confirmer maintenance demain ?"
+        Planifie les révisions des MAINTENANCE_HORIZON_JOURS prochains jours
+        (requêtes en nombre fixe, voir services/maintenance_service.py) :
+        1. Véhicule réservé pour une tournée le jour de la révision → Notification
+           "Véhicule occupé, modifier DPR ?" avec les créneaux proposés
+        2. Véhicule libre → jour de révision réservé au calendrier, et si la
+           révision est DEMAIN → Notification "Confirmer maintenance demain ?"
         """
-        from datetime import date, timedelta
-        from .models import Vehicule, Notification
-        
-        demain = date.today() + timedelta(days=1)
-        
-        # Trouver tous les véhicules avec DPR = demain
-        vehicules_maintenance_demain = Vehicule.objects.filter(
-            date_prochaine_revision=demain
-        )
-        
-        stats = {
-            'notifications_vehicule_en_tournee': 0,
-            'notifications_confirmation': 0,
-        }
-        
-        for vehicule in vehicules_maintenance_demain:
-            
-            # Check si le véhicule est en tournée
-            if not VehiculeService.verifier_vehicule_libre(vehicule):
-                # ⚠️ CAS 1 : VÉHICULE EN TOURNÉE
-                Notification.objects.create(
-                    type_notification='MAINTENANCE_AVANT',
-                    titre=f"Véhicule en tournée - {vehicule.numero_immatriculation}",
-                    message=f"Le véhicule {vehicule.numero_immatriculation} est actuellement en tournée "
-                            f"mais a une maintenance prévue demain ({vehicule.date_prochaine_revision.strftime('%d/%m/%Y')}). "
-                            f"Voulez-vous modifier la date de prochaine révision ?",
-                    vehicule=vehicule,
-                    statut='NON_LUE'
-                )
-                stats['notifications_vehicule_en_tournee'] += 1
-                
-            else:
-                # ✅ CAS 2 : VÉHICULE DISPONIBLE
-                Notification.objects.create(
-                    type_notification='MAINTENANCE_AVANT',
-                    titre=f"Confirmation maintenance - {vehicule.numero_immatriculation}",
-                    message=f"Le véhicule {vehicule.numero_immatriculation} ({vehicule.marque} {vehicule.modele}) "
-                            f"a une maintenance prévue demain ({vehicule.date_prochaine_revision.strftime('%d/%m/%Y')}). "
-                            f"Confirmez-vous que le véhicule ira en maintenance demain ?",
-                    vehicule=vehicule,
-                    statut='NON_LUE'
-                )
-                stats['notifications_confirmation'] += 1
-        
-        return stats
+        from .services.maintenance_service import PlanificationMaintenanceService
+        return PlanificationMaintenanceService.planifier()
     
     @staticmethod
     def gerer_retour_maintenance_matin():
@@ -485,43 +460,10 @@ class VehiculeService:
         IMPORTANT : Ne crée PAS de notification si une existe déjà (NON_LUE ou LUE)
         pour éviter le spam quotidien
         """
-        from datetime import date
-        from .models import Vehicule, Notification
-        
-        # Tous les véhicules EN_MAINTENANCE dont la DPR est PASSÉE
-        vehicules_en_maintenance = Vehicule.objects.filter(
-            statut='EN_MAINTENANCE',
-            date_prochaine_revision__lt=date.today()
-        )
-        
-        stats = {
-            'notifications_retour': 0,
-        }
-        
-        for vehicule in vehicules_en_maintenance:
-            
-            # Vérifier si une notification existe déjà pour ce véhicule
-            notif_existante = Notification.objects.filter(
-                vehicule=vehicule,
-                type_notification='MAINTENANCE_APRES',
-                statut__in=['NON_LUE', 'LUE']
-            ).exists()
-            
-            # Ne créer notification que si pas déjà une en cours
-            if not notif_existante:
-                Notification.objects.create(
-                    type_notification='MAINTENANCE_APRES',
-                    titre=f"Retour de maintenance - {vehicule.numero_immatriculation}",
-                    message=f"Le véhicule {vehicule.numero_immatriculation} ({vehicule.marque} {vehicule.modele}) "
-                            f"est en maintenance depuis le {vehicule.date_prochaine_revision.strftime('%d/%m/%Y')}. "
-                            f"Est-il revenu de maintenance ?",
-                    vehicule=vehicule,
-                    statut='NON_LUE'
-                )
-                stats['notifications_retour'] += 1
-        
-        return stats
+        from .services.maintenance_service import PlanificationMaintenanceService
+        return PlanificationMaintenanceService.notifier_retours()
 
+@MetriquesService.instrumenter
 class TrackingService:
     """
     Service pour gérer le suivi (tracking) des expéditions
@@ -540,6 +482,7 @@ class TrackingService:
             commentaire=commentaire
         )
 
+@MetriquesService.instrumenter
 class FacturationService:
     """
     Service gérant toutes les opérations liées à la facturation :
@@ -553,20 +496,26 @@ class FacturationService:
     @staticmethod
     def calculer_montants_facture(facture):
         """
-        Recalcule les montants HT, TVA et TTC d'une facture
-        en fonction des expéditions qu'elle contient
+        Recalcule COMPLÈTEMENT les cumuls d'une facture depuis la base
+        (montants, nombre d'expéditions, montant payé)
+        
+        ⚠️ Réservé à la réparation (commande verifier_factures --corriger) :
+        en fonctionnement normal les cumuls sont maintenus par delta
+        (ajouter_expedition, retirer_expedition, Paiement.save)
         
         Formules :
         - Montant HT = Somme des montants des expéditions
         - Montant TVA = Montant HT × 19%
         - Montant TTC = Montant HT + Montant TVA
         """
-        from django.db.models import Sum
+        from django.db.models import Count, Sum
         
         # Montant HT = somme des montants de toutes les expéditions
-        montant_ht = facture.expeditions.aggregate(
-            total=Sum('montant_total')
-        )['total'] or Decimal('0.00')
+        expeditions = facture.expeditions.aggregate(
+            total=Sum('montant_total'),
+            nb=Count('id')
+        )
+        montant_ht = expeditions['total'] or Decimal('0.00')
         
         # TVA = Montant HT × taux de TVA
         montant_tva = montant_ht * (facture.taux_tva / 100)
@@ -578,24 +527,83 @@ class FacturationService:
         facture.montant_ht = montant_ht
         facture.montant_tva = montant_tva
         facture.montant_ttc = montant_ttc
-        facture.save()
+        facture.nb_expeditions = expeditions['nb']
+        facture.montant_paye_cumule = facture.paiements.filter(statut='VALIDE').aggregate(
+            total=Sum('montant_paye')
+        )['total'] or Decimal('0.00')
+        facture.save(update_fields=facture.CHAMPS_CUMULES)
         
         return facture
     
     @staticmethod
-    def calculer_montant_restant(facture):
+    @transaction.atomic
+    def appliquer_delta_facture(facture, montant_ht=0, nb_expeditions=0, montant_paye=0):
         """
-        Calcule le montant restant à payer
+        Met à jour les cumuls d'une facture par delta, en une seule requête :
+        UPDATE facture SET montant_ht = montant_ht + x, ... WHERE id = ...
         
-        Formule : Montant TTC - Somme des paiements valides
+        Les attributs de l'instance `facture` sont ensuite rafraîchis
         """
-        from django.db.models import Sum
+        from django.db.models import F
+        from .models import Facture
         
-        total_paye = facture.paiements.filter(statut='VALIDE').aggregate(
-            total=Sum('montant_paye')
-        )['total'] or Decimal('0.00')
+        montant_ht = Decimal(str(montant_ht))
+        montant_tva = montant_ht * (facture.taux_tva / 100)
+        
+        Facture.objects.filter(pk=facture.pk).update(
+            montant_ht=F('montant_ht') + montant_ht,
+            montant_tva=F('montant_tva') + montant_tva,
+            montant_ttc=F('montant_ttc') + montant_ht + montant_tva,
+            nb_expeditions=F('nb_expeditions') + nb_expeditions,
+            montant_paye_cumule=F('montant_paye_cumule') + Decimal(str(montant_paye)),
+        )
+        facture.refresh_from_db(fields=Facture.CHAMPS_CUMULES)
         
-        return facture.montant_ttc - total_paye
+        return facture
+    
+    @staticmethod
+    @transaction.atomic
+    def ajouter_expedition(facture, expedition):
+        """Ajoute une expédition à une facture et met à jour les cumuls par delta"""
+        facture.expeditions.add(expedition)
+        return FacturationService.appliquer_delta_facture(
+            facture, montant_ht=expedition.montant_total, nb_expeditions=1
+        )
+    
+    @staticmethod
+    @transaction.atomic
+    def retirer_expedition(facture, expedition):
+        """Retire une expédition d'une facture et met à jour les cumuls par delta"""
+        facture.expeditions.remove(expedition)
+        return FacturationService.appliquer_delta_facture(
+            facture, montant_ht=-expedition.montant_total, nb_expeditions=-1
+        )
+    
+    @staticmethod
+    @transaction.atomic
+    def annuler_paiements_facture(facture):
+        """
+        Passe les paiements VALIDE d'une facture annulée à ANNULE, sans passer
+        par Paiement.save : le montant payé reste au client (crédit), c'est
+        l'appelant qui retire la facture du solde. Le cumul payé est remis à 0.
+        
+        Returns:
+            Decimal: total des paiements annulés
+        """
+        paiements = facture.paiements.select_for_update().filter(statut='VALIDE')
+        total_paye = paiements.aggregate(total=Sum('montant_paye'))['total'] or Decimal('0.00')
+        paiements.update(statut='ANNULE')
+        FacturationService.appliquer_delta_facture(facture, montant_paye=-total_paye)
+        return total_paye
+    
+    @staticmethod
+    def calculer_montant_restant(facture):
+        """
+        Calcule le montant restant à payer
+        
+        Formule : Montant TTC - Montant payé cumulé (aucune requête)
+        """
+        return facture.montant_ttc - facture.montant_paye_cumule
     
     @staticmethod
     def mettre_a_jour_statut_facture(facture):
@@ -613,6 +621,7 @@ class FacturationService:
         if facture.statut == 'ANNULEE':
             return
         
+        ancien_statut = facture.statut
         montant_restant = FacturationService.calculer_montant_restant(facture)
         
         # Vérifier si payée complètement
@@ -633,7 +642,8 @@ class FacturationService:
             else:
                 facture.statut = 'IMPAYEE'
         
-        facture.save()
+        if facture.statut != ancien_statut:
+            facture.save(update_fields=['statut'])
     
     @staticmethod
     def gerer_facture_expedition(expedition, created_by=None):
@@ -667,19 +677,19 @@ class FacturationService:
         ).first()
         
         if facture_du_jour:
-            # AJOUTER À la facture existante
-            facture_du_jour.expeditions.add(expedition)
-            
-            # Recalculer les montants
-            FacturationService.calculer_montants_facture(facture_du_jour)
+            # AJOUTER À la facture existante (cumuls mis à jour par delta)
+            FacturationService.ajouter_expedition(facture_du_jour, expedition)
             
             # Calculer le montant TTC de cette expédition
             montant_exp_tva = expedition.montant_total * (facture_du_jour.taux_tva / 100)
             montant_exp_ttc = expedition.montant_total + montant_exp_tva
             
             # Mettre à jour le solde du client (augmenter la dette)
-            client.solde += montant_exp_ttc
-            client.save()
+            SoldeService.appliquer(
+                client, montant_exp_ttc, 'FACTURATION',
+                reference=facture_du_jour.numero_facture,
+                description=f"Expédition {expedition.get_numero_expedition()}"
+            )
             
             
             # Mettre à jour le statut de la facture
@@ -697,15 +707,15 @@ class FacturationService:
                 taux_tva=Decimal('19.00')
             )
             
-            # Ajouter l'expédition
-            facture.expeditions.add(expedition)
-            
-            # Calculer les montants
-            FacturationService.calculer_montants_facture(facture)
+            # Ajouter l'expédition (calcule les montants par delta)
+            FacturationService.ajouter_expedition(facture, expedition)
             
             # Mettre à jour le solde du client (augmenter la dette)
-            client.solde += facture.montant_ttc
-            client.save()
+            SoldeService.appliquer(
+                client, facture.montant_ttc, 'FACTURATION',
+                reference=facture.numero_facture,
+                description=f"Expédition {expedition.get_numero_expedition()}"
+            )
             
             return facture
     '''
@@ -768,9 +778,8 @@ class FacturationService:
         - Montant <= Montant restant
         
         ACTIONS :
-        - Créer objet Paiement
-        - Diminuer solde client
-        - Mettre à jour statut facture
+        - Créer objet Paiement (Paiement.save diminue le solde client
+          et met à jour le statut de la facture)
         """
         from .models import Paiement
         
@@ -805,16 +814,10 @@ class FacturationService:
             statut='VALIDE'
         )
         
-        # Mettre à jour le solde du client (diminuer la dette)
-        facture.client.solde -= montant
-        facture.client.save()
-        
-        # Mettre à jour le statut de la facture
-        FacturationService.mettre_a_jour_statut_facture(facture)
-        
         return paiement
     
     @staticmethod
+    @transaction.atomic
     def annuler_facture_simple(facture):
         """
         Annule une facture contenant UNE SEULE expédition
@@ -828,8 +831,6 @@ class FacturationService:
         - Marquer l'expédition comme annulée
         - Marquer la facture comme annulée
         """
-        from django.db.models import Sum
-        
         if facture.statut == 'ANNULEE':
             raise ValidationError("Cette facture est déjà annulée")
         
@@ -847,24 +848,23 @@ class FacturationService:
         # Récupérer l'expédition
         expedition = facture.expeditions.first()
         
-        # Calculer le total payé
-        total_paye = facture.paiements.filter(statut='VALIDE').aggregate(
-            total=Sum('montant_paye')
-        )['total'] or Decimal('0.00')
-        
-        # Annuler tous les paiements
-        for paiement in facture.paiements.filter(statut='VALIDE'):
-            paiement.statut = 'ANNULE'
-            paiement.save()
+        # Annuler tous les paiements (le solde n'est corrigé qu'ici, ci-dessous)
+        total_paye = FacturationService.annuler_paiements_facture(facture)
         
         # Rembourser au client le total payé (crédit)
-        facture.client.solde -= total_paye
+        SoldeService.appliquer(
+            facture.client, -total_paye, 'ANNULATION_FACTURE',
+            reference=facture.numero_facture,
+            description="Remboursement des paiements (crédit)"
+        )
         
         # Enlever le montant non payé du solde
         montant_impaye = facture.montant_ttc - total_paye
-        facture.client.solde -= montant_impaye
-        
-        facture.client.save()
+        SoldeService.appliquer(
+            facture.client, -montant_impaye, 'ANNULATION_FACTURE',
+            reference=facture.numero_facture,
+            description="Annulation du montant impayé"
+        )
         
         # Marquer l'expédition comme annulée
         expedition.statut = 'ANNULEE'
@@ -877,6 +877,7 @@ class FacturationService:
         facture.statut = 'ANNULEE'
         facture.save()
 
+@MetriquesService.instrumenter
 class NotificationService:
     """
     Service pour gérer les notifications et leurs traitements
@@ -900,7 +901,8 @@ class NotificationService:
         from .models import Notification, Client
         from django.utils import timezone
         
-        notification = Notification.objects.get(id=notification_id)
+        # SELECT ... FOR UPDATE : deux agents qui cliquent en même temps → un seul traitement
+        notification = Notification.objects.select_for_update().get(id=notification_id)
         
         if notification.statut == 'TRAITEE':
             return {'success': False, 'message': 'Notification déjà traitée'}
@@ -915,8 +917,10 @@ class NotificationService:
                 montant_remboursement = abs(client.solde)
                 
                 # Remettre le solde à 0 après remboursement
-                client.solde = Decimal('0.00')
-                client.save()
+                SoldeService.ajuster(
+                    client, Decimal('0.00'), 'REMBOURSEMENT',
+                    description="Remboursement du crédit client"
+                )
                 
                 # Marquer la notification comme traitée
                 notification.statut = 'TRAITEE'
@@ -1012,7 +1016,7 @@ class NotificationService:
         elif notification.type_notification == 'REMBOURSEMENT_REQUIS':
             
             if action == 'OK':
-                client = notification.client
+                client = Client.objects.select_for_update().filter(id=notification.client_id).first()
                 incident = notification.incident
                 if not client:
                     return {'success': False, 'message': '❌ Client introuvable'}
@@ -1022,8 +1026,11 @@ class NotificationService:
                 montant_rembourse_physiquement = abs(client.solde) if client.solde < 0 else Decimal('0.00')
         
                 # ✅ REMETTRE LE SOLDE À 0 (seulement maintenant !)
-                client.solde = Decimal('0.00')
-                client.save()
+                SoldeService.ajuster(
+                    client, Decimal('0.00'), 'REMBOURSEMENT',
+                    reference=incident.numero_incident,
+                    description="Remboursement physique suite à incident"
+                )
         
                 # Marquer le remboursement comme effectué
                 incident.remboursement_effectue = True
@@ -1139,6 +1146,7 @@ class NotificationService:
         
         return {'success': True}
     
+@MetriquesService.instrumenter
 class IncidentService:
    
     TAUX_REMBOURSEMENT = {
@@ -1205,12 +1213,14 @@ class IncidentService:
             
             # ✅ GESTION INTELLIGENTE DU REMBOURSEMENT
             client = expedition.client
-            solde_avant = client.solde
-            solde_apres = solde_avant - montant_rembourse
             
             # Appliquer le nouveau solde
-            client.solde = solde_apres
-            client.save()
+            solde_apres = SoldeService.appliquer(
+                client, -montant_rembourse, 'REMBOURSEMENT_INCIDENT',
+                reference=incident.numero_incident,
+                description=f"Remboursement {taux}% ({incident.get_type_incident_display()})"
+            )
+            solde_avant = solde_apres + montant_rembourse
             
             # ✅ CRÉER NOTIFICATION SELON LE CAS
             if solde_apres < 0:
@@ -1489,6 +1499,7 @@ class IncidentService:
         
         return stats
     
+@MetriquesService.instrumenter
 class ReclamationService:
     """
     Service gérant toutes les opérations liées aux réclamations :
@@ -1525,8 +1536,9 @@ class ReclamationService:
         )
 
         
-        from .notification import AlerteEmailService
-        AlerteEmailService.envoyer_notification_nouvelle_reclamation(reclamation)
+        # Email au support après le commit (boîte d'envoi)
+        from .services.boite_envoi_service import BoiteEnvoiService
+        BoiteEnvoiService.publier('reclamation_creee', reclamation_id=reclamation.pk)
     
     @staticmethod
     def assigner_agent(reclamation, agent_nom):
@@ -1555,6 +1567,7 @@ class ReclamationService:
 
     
     @staticmethod
+    @transaction.atomic
     def repondre_reclamation(reclamation, reponse, solution, auteur):
         """
         Enregistre une réponse à la réclamation
@@ -1578,8 +1591,9 @@ class ReclamationService:
             nouveau_statut='EN_ATTENTE_CLIENT'
         )
         
-        from .notification import AlerteEmailService
-        AlerteEmailService.envoyer_reponse_reclamation_client(reclamation)
+        # Email au client après le commit (boîte d'envoi)
+        from .services.boite_envoi_service import BoiteEnvoiService
+        BoiteEnvoiService.publier('reclamation_repondue', reclamation_id=reclamation.pk)
     
     @staticmethod
     def resoudre_reclamation(reclamation, auteur, accorder_compensation=False, montant_compensation=0):
@@ -1613,8 +1627,11 @@ class ReclamationService:
         
         # Si compensation accordée, créditer le client
         if accorder_compensation and montant_compensation > 0:
-            reclamation.client.solde -= Decimal(str(montant_compensation))
-            reclamation.client.save()
+            SoldeService.appliquer(
+                reclamation.client, -Decimal(str(montant_compensation)), 'COMPENSATION_RECLAMATION',
+                reference=reclamation.numero_reclamation,
+                description=f"Compensation réclamation ({reclamation.get_nature_display()})"
+            )
 
         # ✅ NOTIFIER L'AGENT RESPONSABLE PRINCIPAL
         AgentUtilisateur = get_user_model()
@@ -1762,12 +1779,32 @@ class ReclamationService:
         return stats
     
     @staticmethod
-    def top_clients_reclamants(limite=10):
+    def top_clients_reclamants(limite=10, exact=False):
         """
         Retourne les clients ayant le plus de réclamations
+        
+        Par défaut : sketch Top-K en O(K) (voir services/topk_service.py)
+        exact=True : GROUP BY complet (audit)
         """
         from django.db.models import Count
-        from .models import Reclamation
+        from .models import Reclamation, Client
+        
+        if not exact:
+            from .services.topk_service import TopKService
+            
+            classement = TopKService.top('reclamations_clients', limite)
+            clients = Client.objects.in_bulk([cle for cle, _, _ in classement])
+            
+            return [
+                {
+                    'client__prenom': clients[client_id].prenom,
+                    'client__nom': clients[client_id].nom,
+                    'client__id': client_id,
+                    'nb_reclamations': int(nb),
+                }
+                for client_id, nb, _ in classement
+                if client_id in clients
+            ]
         
         return Reclamation.objects.values(
             'client__prenom',
@@ -1778,13 +1815,32 @@ class ReclamationService:
         ).order_by('-nb_reclamations')[:limite]
     
     @staticmethod
-    def motifs_recurrents():
+    def motifs_recurrents(exact=False):
         """
         Analyse des motifs de réclamations les plus fréquents
+        
+        Par défaut : sketch Top-K (le nombre de natures est inférieur à la
+        capacité du sketch, les comptes sont donc exacts)
+        exact=True : GROUP BY complet (audit)
         """
         from django.db.models import Count
         from .models import Reclamation
         
+        if not exact:
+            from .services.topk_service import TopKService
+            
+            total = TopKService.total('reclamations_natures')
+            classement = TopKService.top('reclamations_natures', len(Reclamation._meta.get_field('nature').choices))
+            
+            return [
+                {
+                    'nature': nature,
+                    'count': int(nb),
+                    'pourcentage': nb * 100.0 / total if total else 0,
+                }
+                for nature, nb, _ in classement
+            ]
+        
         return Reclamation.objects.values('nature').annotate(
             count=Count('id'),
             pourcentage=Count('id') * 100.0 / Reclamation.objects.count()
@@ -1802,6 +1858,7 @@ from io import BytesIO
 from datetime import datetime
 from django.http import HttpResponse
 
+@MetriquesService.chronometrer('generer_pdf_liste')
 def generer_pdf_liste(titre_document, headers, data_rows, nom_fichier_base):
     """
     Fonction générique pour générer un PDF professionnel (LISTE/TABLEAU)
@@ -1947,6 +2004,7 @@ def generer_pdf_liste(titre_document, headers, data_rows, nom_fichier_base):
     
     return response
 
+@MetriquesService.chronometrer('generer_pdf_fiche')
 def generer_pdf_fiche(titre_document, sections, nom_fichier_base, remarques=None):
     """
     Fonction générique pour générer un PDF professionnel (FICHE DÉTAILLÉE)
@@ -1,12 +1,24 @@
+import hmac
+
+from asgiref.sync import sync_to_async
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.core.exceptions import ValidationError
-from django.db.models import Q, Count, Sum, Prefetch
+from django.db import transaction
+from django.db.models import Q, Count, Sum, Prefetch, F
 from django.urls import reverse
 from .models import Client, Chauffeur, Vehicule, TypeService, Destination, Tarification, Tournee, Expedition, TrackingExpedition, Facture, Paiement, Incident, HistoriqueIncident, Reclamation, HistoriqueReclamation, Notification, AgentUtilisateur
-from .forms import ClientForm, ChauffeurForm, VehiculeForm, TypeServiceForm, DestinationForm, TarificationForm, TourneeForm, ExpeditionForm, FactureForm, PaiementForm, IncidentForm, IncidentModificationForm, ReclamationForm, ReclamationModificationForm, ReclamationReponseForm, ReclamationResolutionForm, LoginForm, ChangerMotDePasseForm
+from .forms import ClientForm, ClientCreationForm, CorrectionSoldeForm, ChauffeurForm, VehiculeForm, TypeServiceForm, DestinationForm, TarificationForm, TourneeForm, FinTourneeForm, ExpeditionForm, FactureForm, PaiementForm, IncidentForm, IncidentModificationForm, ReclamationForm, ReclamationModificationForm, ReclamationReponseForm, ReclamationResolutionForm, LoginForm, ChangerMotDePasseForm
 from .utils import generer_pdf_fiche, generer_pdf_liste, IncidentService, ReclamationService, ExpeditionService
+from .routers import base_analytique
+from .services.archive_service import ArchiveService
+from .services.solde_service import SoldeService
+from .services.suivi_public_service import SuiviPublicService
 from django.utils import timezone
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
@@ -48,7 +60,8 @@ def liste_clients(request):
 
 @login_required
 def exporter_clients_pdf(request):
-    clients = Client.objects.all()
+    db = base_analytique()
+    clients = Client.objects.using(db).all()
     headers = ['Id', 'Nom', 'Prénom', 'Téléphone', 'Solde']
     data = [[f"CL-{c.id:03d}", c.nom, c.prenom, c.telephone, c.solde] for c in clients]
     return generer_pdf_liste("Liste Clients", headers, data, "clients")
@@ -61,16 +74,17 @@ def detail_client(request, client_id):
     client = get_object_or_404(Client, id=client_id)
     
     # Récupérer toutes les expéditions du client
-    expeditions = client.expedition_set.all().order_by('-date_creation')
-    
-    # Statistiques du client
-    stats_client = {
-        'total_expeditions': expeditions.count(),
-        'expeditions_livrees': expeditions.filter(statut='LIVRE').count(),
-        'expeditions_en_cours': expeditions.filter(statut='EN_TRANSIT').count(),
-        'expeditions_en_attente': expeditions.filter(statut='EN_ATTENTE').count(),
-        'total_depense': expeditions.aggregate(Sum('montant_total'))['montant_total__sum'] or 0,
-    }
+    expeditions = client.expedition_set.select_related('destination', 'tournee').order_by('-date_creation')
+    
+    # Statistiques du client (une seule requête)
+    stats_client = client.expedition_set.aggregate(
+        total_expeditions=Count('id'),
+        expeditions_livrees=Count('id', filter=Q(statut='LIVRE')),
+        expeditions_en_cours=Count('id', filter=Q(statut='EN_TRANSIT')),
+        expeditions_en_attente=Count('id', filter=Q(statut='EN_ATTENTE')),
+        total_depense=Sum('montant_total'),
+    )
+    stats_client['total_depense'] = stats_client['total_depense'] or 0
     
     # Récupérer les factures du client
     factures = client.factures.all().order_by('-date_creation')[:5]  # Les 5 dernières
@@ -84,11 +98,12 @@ def detail_client(request, client_id):
 
 @login_required
 def exporter_client_detail_pdf(request, client_id):
-    client = get_object_or_404(Client, id=client_id)
+    db = base_analytique()
+    client = get_object_or_404(Client.objects.using(db), id=client_id)
     
     # Récupérer expéditions et factures
-    expeditions = client.expedition_set.all()
-    factures = Facture.objects.filter(client=client).order_by('-date_creation')[:5]
+    expeditions = client.expedition_set.select_related('destination')
+    factures = Facture.objects.using(db).filter(client=client).order_by('-date_creation')[:5]
     
     # ========== UNE SEULE SECTION AVEC TOUS LES CHAMPS ==========
     sections = [
@@ -105,13 +120,7 @@ def exporter_client_detail_pdf(request, client_id):
                 ['Ville', client.ville or 'Non renseignée'],
                 ['Wilaya', client.wilaya or 'Non renseignée'],
                 ['Solde', f"{client.solde:,.2f} DA"],
-                ['Créé par', 
-                 f"{client.cree_par.first_name} {client.cree_par.last_name} (@{client.cree_par.username})" 
-                 if client.cree_par else 'Non renseigné'],
                 ['Date d\'inscription', client.date_inscription.strftime('%d/%m/%Y %H:%M')],
-                ['Modifié par', 
-                 f"{client.modifie_par.first_name} {client.modifie_par.last_name} (@{client.modifie_par.username})" 
-                 if client.modifie_par else 'Jamais modifié'],
                 ['Dernière modification', client.date_modification.strftime('%d/%m/%Y %H:%M')],
                 ['Remarques', client.remarques or 'Aucune remarque'],
             ]
@@ -168,7 +177,7 @@ def creer_client(request):
     Formulaire de création d'un nouveau client
     """
     if request.method == 'POST':
-        form = ClientForm(request.POST)
+        form = ClientCreationForm(request.POST)
         if form.is_valid():
             client = form.save(commit=False)
             client.cree_par = request.user  # ✅ AJOUTE L'AGENT QUI CRÉE
@@ -179,7 +188,7 @@ def creer_client(request):
             # Les erreurs sont automatiquement passées au template via form.errors
             messages.error(request, 'Erreur de validation. Veuillez vérifier les champs.')
     else:
-        form = ClientForm()
+        form = ClientCreationForm()
     
     return render(request, 'clients/creer.html', {'form': form})
 
@@ -192,19 +201,31 @@ def modifier_client(request, client_id):
     
     if request.method == 'POST':
         form = ClientForm(request.POST, instance=client)
-        if form.is_valid():
-            client = form.save(commit=False)
-            client.modifie_par = request.user
-            client = form.save()
+        correction = CorrectionSoldeForm(request.POST)
+        if form.is_valid() and correction.is_valid():
+            with transaction.atomic():
+                client = form.save(commit=False)
+                client.modifie_par = request.user
+                client = form.save()
+                
+                # Le solde ne fait pas partie du formulaire : correction explicite par le grand livre
+                montant = correction.cleaned_data['correction_solde']
+                if montant:
+                    SoldeService.corriger(
+                        client, montant,
+                        description=correction.cleaned_data['motif_correction'] or f"Correction manuelle par {request.user.username}"
+                    )
             messages.success(request, f'Client {client.prenom} {client.nom} modifié par {request.user.username}!')
             return redirect('detail_client', client_id=client.id)
         else:
             messages.error(request, 'Erreur de validation. Veuillez vérifier les champs.')
     else:
         form = ClientForm(instance=client)
+        correction = CorrectionSoldeForm()
     
     return render(request, 'clients/modifier.html', {
         'form': form,
+        'correction': correction,
         'client': client,
     })
 
@@ -289,7 +310,8 @@ def exporter_chauffeurs_pdf(request):
     """
     Export PDF de la liste complète des chauffeurs
     """
-    chauffeurs = Chauffeur.objects.all().order_by('nom', 'prenom')
+    db = base_analytique()
+    chauffeurs = Chauffeur.objects.using(db).all().order_by('nom', 'prenom')
     
     headers = ['ID', 'Nom', 'Prénom', 'Téléphone', 'Permis', 'Statut']
     
@@ -361,7 +383,8 @@ def exporter_chauffeur_detail_pdf(request, chauffeur_id):
     """
     Export PDF de la fiche détaillée d'un chauffeur
     """
-    chauffeur = get_object_or_404(Chauffeur, id=chauffeur_id)
+    db = base_analytique()
+    chauffeur = get_object_or_404(Chauffeur.objects.using(db), id=chauffeur_id)
     
     # Récupérer les tournées du chauffeur
     tournees = chauffeur.tournee_set.all()
@@ -546,7 +569,8 @@ def exporter_vehicules_pdf(request):
     """
     Export PDF de la liste complète des véhicules
     """
-    vehicules = Vehicule.objects.all().order_by('numero_immatriculation')
+    db = base_analytique()
+    vehicules = Vehicule.objects.using(db).all().order_by('numero_immatriculation')
     
     headers = ['Immatriculation', 'Marque', 'Modèle', 'Type', 'Capacité (kg)', 'Statut']
     
@@ -618,7 +642,8 @@ def exporter_vehicule_detail_pdf(request, vehicule_id):
     """
     Export PDF de la fiche détaillée d'un véhicule
     """
-    vehicule = get_object_or_404(Vehicule, id=vehicule_id)
+    db = base_analytique()
+    vehicule = get_object_or_404(Vehicule.objects.using(db), id=vehicule_id)
     
     # Récupérer les tournées du véhicule
     tournees = vehicule.tournee_set.all()
@@ -759,7 +784,8 @@ def exporter_typeservices_pdf(request):
     """
     Export PDF de la liste complète des types de service
     """
-    typeservices = TypeService.objects.all().order_by('type_service')
+    db = base_analytique()
+    typeservices = TypeService.objects.using(db).all().order_by('type_service')
     
     headers = ['Type de Service', 'Description', 'Expéditions', 'Tarifications']
     
@@ -801,7 +827,8 @@ def exporter_typeservice_detail_pdf(request, typeservice_id):
     """
     Export PDF de la fiche détaillée d'un type de service
     """
-    typeservice = get_object_or_404(TypeService, id=typeservice_id)
+    db = base_analytique()
+    typeservice = get_object_or_404(TypeService.objects.using(db), id=typeservice_id)
     
     # Récupérer les expéditions et tarifications
     expeditions = typeservice.expedition_set.all()
@@ -967,7 +994,8 @@ def exporter_destinations_pdf(request):
     """
     Export PDF de la liste complète des destinations
     """
-    destinations = Destination.objects.all().order_by('wilaya', 'ville')
+    db = base_analytique()
+    destinations = Destination.objects.using(db).all().order_by('wilaya', 'ville')
     
     headers = ['Ville', 'Wilaya', 'Zone', 'Distance (km)', 'Tarif Base (DA)', 'Délai (j)']
     
@@ -1011,7 +1039,8 @@ def exporter_destination_detail_pdf(request, destination_id):
     """
     Export PDF de la fiche détaillée d'une destination
     """
-    destination = get_object_or_404(Destination, id=destination_id)
+    db = base_analytique()
+    destination = get_object_or_404(Destination.objects.using(db), id=destination_id)
     
     # Stats
     nb_tarifications = destination.tarification_set.count()
@@ -1186,7 +1215,8 @@ def exporter_tarifications_pdf(request):
     """
     Export PDF de la liste complète des tarifications
     """
-    tarifications = Tarification.objects.all().select_related('destination', 'type_service').order_by('destination__wilaya')
+    db = base_analytique()
+    tarifications = Tarification.objects.using(db).all().select_related('destination', 'type_service').order_by('destination__wilaya')
     
     headers = ['Destination', 'Type Service', 'Tarif Poids (DA/kg)', 'Tarif Volume (DA/m³)', 'Délai (j)']
     
@@ -1229,7 +1259,8 @@ def exporter_tarification_detail_pdf(request, tarification_id):
     """
     Export PDF de la fiche détaillée d'une tarification
     """
-    tarification = get_object_or_404(Tarification, id=tarification_id)
+    db = base_analytique()
+    tarification = get_object_or_404(Tarification.objects.using(db), id=tarification_id)
     
     # Stats
     nb_expeditions = tarification.destination.expedition_set.filter(
@@ -1337,6 +1368,57 @@ def supprimer_tarification(request, tarification_id):
         'nb_expeditions': nb_expeditions,
     })
 
+@login_required
+def disponibilites_ressources(request):
+    """
+    Calendrier des chauffeurs et véhicules :
+    - Ressources libres sur une fenêtre [début, fin) (une requête par type)
+    - Grille d'occupation jour par jour (7 jours à partir d'aujourd'hui par défaut)
+    """
+    from django.utils.dateparse import parse_datetime
+    from .services.calendrier_service import CalendrierService
+    
+    debut_saisi = request.GET.get('debut', '')
+    fin_saisie = request.GET.get('fin', '')
+    
+    try:
+        nb_jours = min(max(int(request.GET.get('jours', 7)), 1), 31)
+    except ValueError:
+        nb_jours = 7
+    
+    chauffeurs_libres = vehicules_libres = None
+    statut = 200
+    
+    if debut_saisi and fin_saisie:
+        try:
+            debut = parse_datetime(debut_saisi)
+            fin = parse_datetime(fin_saisie)
+        except ValueError:
+            # Format correct mais date impossible (ex: 2024-13-40T00:00)
+            debut = fin = None
+        
+        if not debut or not fin or fin <= debut:
+            messages.error(request, "❌ Fenêtre invalide : la fin doit être après le début")
+            statut = 400
+        else:
+            if timezone.is_naive(debut):
+                debut = timezone.make_aware(debut)
+            if timezone.is_naive(fin):
+                fin = timezone.make_aware(fin)
+            chauffeurs_libres = CalendrierService.chauffeurs_libres(debut, fin)
+            vehicules_libres = CalendrierService.vehicules_libres(debut, fin)
+    
+    context = {
+        'debut': debut_saisi,
+        'fin': fin_saisie,
+        'nb_jours': nb_jours,
+        'chauffeurs_libres': chauffeurs_libres,
+        'vehicules_libres': vehicules_libres,
+        'planning': CalendrierService.planning(timezone.localdate(), nb_jours),
+    }
+    
+    return render(request, 'tournees/disponibilites.html', context, status=statut)
+
 @login_required
 def liste_tournees(request):
     """
@@ -1402,7 +1484,8 @@ def exporter_tournees_pdf(request):
     """
     Exporte la liste de toutes les tournées en PDF
     """
-    tournees = Tournee.objects.all().select_related('chauffeur', 'vehicule').order_by('-date_depart')
+    db = base_analytique()
+    tournees = Tournee.objects.using(db).all().select_related('chauffeur', 'vehicule').order_by('-date_depart')
     
     headers = ['ID', 'Chauffeur', 'Véhicule', 'Date départ', 'Zone', 'Statut']
     
@@ -1460,9 +1543,10 @@ def detail_tournee(request, tournee_id):
         id=tournee_id
     )
     
+    # Ordre de livraison optimisé d'abord (expéditions non optimisées à la fin)
     expeditions = tournee.expeditions.all().select_related(
         'client', 'destination', 'type_service'
-    ).order_by('date_creation')
+    ).order_by(F('ordre_livraison').asc(nulls_last=True), 'date_creation')
     
     stats_expeditions = {
         'total': expeditions.count(),
@@ -1482,8 +1566,9 @@ def exporter_tournee_detail_pdf(request, tournee_id):
     """
     Exporte les détails d'une tournée en PDF
     """
+    db = base_analytique()
     tournee = get_object_or_404(
-        Tournee.objects.select_related('chauffeur', 'vehicule'),
+        Tournee.objects.using(db).select_related('chauffeur', 'vehicule'),
         id=tournee_id
     )
     
@@ -1680,6 +1765,14 @@ def terminer_tournee(request, tournee_id):
             tournee.kilometrage_arrivee = kilometrage_arrivee
             tournee.date_retour_reelle = timezone.now()
             
+            # Litres relevés (facultatif) : sinon estimation par la consommation moyenne
+            releves = FinTourneeForm({'carburant_reel': request.POST.get('carburant_reel', '').strip().replace(',', '.')})
+            if not releves.is_valid() or releves.cleaned_data['carburant_reel'] == 0:
+                messages.error(request, "❌ Les litres relevés doivent être un nombre positif (9999,99 L au plus)")
+                return render(request, 'tournees/terminer.html', {'tournee': tournee})
+            if releves.cleaned_data['carburant_reel'] is not None:
+                tournee.carburant_reel = releves.cleaned_data['carburant_reel']
+            
             # Calculer kilométrage et consommation
             TourneeService.calculer_kilometrage_et_consommation(tournee)
             
@@ -1713,10 +1806,15 @@ def terminer_tournee(request, tournee_id):
                 date_traitement=timezone.now()
             )
             
+            message_km = ""
+            if tournee.kilometrage_estime:
+                ecart = tournee.kilometrage_parcouru - tournee.kilometrage_estime
+                message_km = f" (circuit optimisé : {tournee.kilometrage_estime} km, écart {ecart:+d} km)"
+            
             messages.success(
                 request, 
                 f"✅ Tournée {tournee.get_numero_tournee()} finalisée ! "
-                f"Kilométrage parcouru : {tournee.kilometrage_parcouru} km, "
+                f"Kilométrage parcouru : {tournee.kilometrage_parcouru} km{message_km}, "
                 f"Consommation : {tournee.consommation_carburant:.2f} L"
             )
             
@@ -1794,7 +1892,8 @@ def liste_expeditions(request):
 @login_required
 def exporter_expeditions_pdf(request):
     """Export PDF liste expéditions"""
-    expeditions = Expedition.objects.all().select_related(
+    db = base_analytique()
+    expeditions = Expedition.objects.using(db).all().select_related(
         'client', 'destination', 'type_service'
     ).order_by('-date_creation')
     
@@ -1825,22 +1924,33 @@ def detail_expedition(request, expedition_id):
         id=expedition_id
     )
     
-    # ✅ Récupérer TOUT l'historique de tracking pour affichage en table
-    trackings = expedition.suivis.all().order_by('-date_heure')
+    # ✅ Historique de tracking récent (tables courantes)
+    trackings = list(expedition.suivis.all().order_by('-date_heure'))
+    
+    # Historique archivé : résumé seulement, contenu chargé à la demande (?archive=1)
+    archive = ArchiveService.resume('EXPEDITION', expedition.id)
+    afficher_archive = archive is not None and request.GET.get('archive') == '1'
+    if afficher_archive:
+        trackings += ArchiveService.historique('EXPEDITION', expedition.id)
     
     return render(request, 'expeditions/detail.html', {
         'expedition': expedition,
         'trackings': trackings,
+        'archive': archive,
+        'afficher_archive': afficher_archive,
+        'jeton_suivi': SuiviPublicService.jeton(expedition.id),
     })
 
 @login_required
 def exporter_expedition_detail_pdf(request, expedition_id):
     """Export PDF détail expédition avec tracking"""
+    db = base_analytique()
     expedition = get_object_or_404(
-        Expedition.objects.select_related('client', 'destination', 'type_service', 'tournee'),
+        Expedition.objects.using(db).select_related('client', 'destination', 'type_service', 'tournee'),
         id=expedition_id
     )
-    trackings = expedition.suivis.all().order_by('-date_heure')
+    trackings = list(expedition.suivis.all().order_by('-date_heure'))
+    trackings += ArchiveService.historique('EXPEDITION', expedition.id, using=db)
     
     # Section principale
     sections = [
@@ -1880,7 +1990,7 @@ def exporter_expedition_detail_pdf(request, expedition_id):
     ]
     
     # Historique tracking
-    if trackings.exists():
+    if trackings:
         tracking_data = [['Date/Heure', 'Statut', 'Commentaire']]
         for t in trackings:
             tracking_data.append([
@@ -1890,7 +2000,7 @@ def exporter_expedition_detail_pdf(request, expedition_id):
             ])
         
         sections.append({
-            'titre': f'Historique de suivi ({trackings.count()} étapes)',
+            'titre': f'Historique de suivi ({len(trackings)} étapes)',
             'data': tracking_data
         })
     
@@ -2063,6 +2173,228 @@ def detail_tracking(request, expedition_id):
     """
     return redirect('detail_expedition', expedition_id=expedition_id)
 
+@csrf_exempt
+@require_POST
+def ingerer_evenements(request):
+    """
+    Réception d'un lot d'événements de l'application chauffeur (NDJSON)
+    Voir services/ingestion_service.py pour le format
+
+    Authentification : en-tête "Authorization: Bearer <INGESTION_JETON>"
+    (ou session d'un agent connecté si aucun jeton n'est configuré)
+
+    Réponses :
+    - 200 : {"recus", "inseres", "doublons", "jalons", "erreurs"}
+    - 401 : jeton absent ou invalide
+    - 413 : lot trop gros (à découper)
+    - 503 : ingestion saturée → réessayer après Retry-After secondes
+    """
+    from .services.ingestion_service import IngestionService, LotTropGros, SaturationIngestion
+
+    jeton = getattr(settings, 'INGESTION_JETON', '')
+    if jeton:
+        fourni = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(fourni.encode(), jeton.encode()):
+            return JsonResponse({'erreur': "Jeton d'ingestion invalide"}, status=401)
+    elif not request.user.is_authenticated:
+        return JsonResponse({'erreur': 'Authentification requise'}, status=401)
+
+    try:
+        resultat = IngestionService.ingerer(request)
+    except LotTropGros as e:
+        return JsonResponse({'erreur': str(e)}, status=413)
+    except SaturationIngestion as e:
+        reponse = JsonResponse({'erreur': str(e)}, status=503)
+        reponse['Retry-After'] = str(getattr(settings, 'INGESTION_RETRY_AFTER_SECONDES', 2))
+        return reponse
+
+    return JsonResponse(resultat)
+
+def _consulter_suivi_public(request, numero, jeton):
+    """
+    Contrôles communs aux deux vues publiques
+
+    Returns:
+        (etat, erreur, statut_http, retry_after)
+    """
+    autorise, retry_after = SuiviPublicService.autoriser(request.META.get('REMOTE_ADDR', ''))
+    if not autorise:
+        return None, "Trop de demandes, réessayez dans une minute.", 429, retry_after
+
+    expedition_id = SuiviPublicService.verifier(numero, jeton)
+    etat = SuiviPublicService.etat(expedition_id) if expedition_id else None
+    if etat is None:
+        return None, "Numéro d'expédition ou code de suivi incorrect.", 404, None
+
+    return etat, None, 200, None
+
+def suivi_public(request):
+    """
+    Page publique (sans connexion) : suivi d'un colis par numéro + code de suivi
+    """
+    numero = request.GET.get('numero', '').strip()
+    jeton = request.GET.get('jeton', '').strip()
+    contexte = {'numero': numero, 'jeton': jeton}
+    statut_http = 200
+
+    if numero or jeton:
+        etat, erreur, statut_http, retry_after = _consulter_suivi_public(request, numero, jeton)
+        contexte.update({'etat': etat, 'erreur': erreur})
+
+    reponse = render(request, 'suivi/public.html', contexte, status=statut_http)
+    if statut_http == 429:
+        reponse['Retry-After'] = str(retry_after)
+    return reponse
+
+def api_suivi_public(request, numero):
+    """
+    Même contenu en JSON : GET /api/suivi/EXP-000123/?jeton=XXXX
+    """
+    etat, erreur, statut_http, retry_after = _consulter_suivi_public(request, numero, request.GET.get('jeton', ''))
+
+    reponse = JsonResponse(etat if etat else {'erreur': erreur}, status=statut_http)
+    if statut_http == 429:
+        reponse['Retry-After'] = str(retry_after)
+    return reponse
+
+async def flux_direct(request):
+    """
+    Flux Server-Sent Events du tableau de bord (tournées, notifications, suivis, positions)
+    Voir services/diffusion_service.py
+
+    Vue ASYNCHRONE : chaque navigateur connecté n'occupe qu'une coroutine, pas
+    un thread. Servie par tp1/asgi.py (uvicorn) ; sous WSGI (runserver), un flux
+    infini bloquerait un thread par agent → 204, le navigateur n'insiste pas.
+
+    Réponses :
+    - 200 : text/event-stream (jusqu'à déconnexion)
+    - 204 : serveur WSGI, pas de flux
+    - 403 : agent non connecté
+    - 503 : trop de navigateurs connectés à ce processus (DIFFUSION_ABONNES_MAX)
+    """
+    from django.core.handlers.asgi import ASGIRequest
+    from .services.diffusion_service import DiffusionService
+
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    # login_required ne gère pas les vues asynchrones (Django 4.2) ; la session se lit en synchrone
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return HttpResponse(status=403)
+
+    if DiffusionService.nb_abonnes() >= getattr(settings, 'DIFFUSION_ABONNES_MAX', 500):
+        reponse = HttpResponse(status=503)
+        reponse['Retry-After'] = '30'
+        return reponse
+
+    dernier_id = request.headers.get('Last-Event-ID', '')
+    reponse = StreamingHttpResponse(
+        DiffusionService.flux(int(dernier_id) if dernier_id.isdigit() else None),
+        content_type='text/event-stream',
+    )
+    reponse['Cache-Control'] = 'no-cache'
+    reponse['X-Accel-Buffering'] = 'no'   # nginx : ne pas mettre le flux en tampon
+    return reponse
+
+@login_required
+def efficacite_flotte(request):
+    """
+    Rapport d'efficacité de la flotte : km, carburant, chargement par véhicule
+    et tournées anormales (voir services/flotte_service.py)
+    
+    Rapport en cache, recalculé après chaque tournée terminée
+    """
+    from .services.flotte_service import FlotteService
+    
+    periodes = [30, 90, 365]
+    jours = request.GET.get('jours', '90')
+    jours = int(jours) if jours.isdigit() and int(jours) in periodes else 90
+    
+    return render(request, 'vehicules/efficacite.html', {
+        'rapport': FlotteService.rapport(jours),
+        'periodes': periodes,
+    })
+
+@login_required
+def diagnostic_requetes(request):
+    """
+    Vues hors budget de requêtes SQL ou avec N+1 depuis le démarrage du processus
+    (voir services/requetes_service.py) — responsables uniquement
+    """
+    from .services.requetes_service import RequetesService
+    
+    if not request.user.is_responsable:
+        return JsonResponse({'erreur': 'Réservé aux responsables'}, status=403)
+    
+    return JsonResponse({'contrevenants': RequetesService.contrevenants()})
+
+@login_required
+def liste_profils(request):
+    """Profils des requêtes lentes et des tâches planifiées (réservé au responsable)"""
+    from .services.profilage_service import ProfilageService
+
+    if not request.user.is_responsable:
+        messages.error(request, "❌ Accès refusé : réservé à l'agent responsable")
+        return redirect('home')
+
+    return render(request, 'diagnostic/profils.html', {
+        'profils': ProfilageService.fichiers(),
+        'actif': ProfilageService.actif(),
+        'seuil_ms': getattr(settings, 'PROFILAGE_SEUIL_MS', 1000),
+        'fichiers_max': getattr(settings, 'PROFILAGE_FICHIERS_MAX', 200),
+    })
+
+@login_required
+def detail_profil(request, nom):
+    """Frames les plus échantillonnées d'un profil (code de l'application, ou tout avec ?tout=1)"""
+    from .services.profilage_service import ProfilageService
+
+    if not request.user.is_responsable:
+        messages.error(request, "❌ Accès refusé : réservé à l'agent responsable")
+        return redirect('home')
+    if ProfilageService.chemin(nom) is None:
+        raise Http404("Profil introuvable")
+
+    tout = request.GET.get('tout') == '1'
+    return render(request, 'diagnostic/profil.html', {
+        'nom': nom,
+        'tout': tout,
+        'resultat': ProfilageService.frames_chaudes(nom, limite=50, prefixe=None if tout else 'app1'),
+    })
+
+@login_required
+def telecharger_profil(request, nom):
+    """Fichier brut d'un profil (speedscope / flamegraph.pl)"""
+    from .services.profilage_service import ProfilageService
+
+    if not request.user.is_responsable:
+        messages.error(request, "❌ Accès refusé : réservé à l'agent responsable")
+        return redirect('home')
+
+    chemin = ProfilageService.chemin(nom)
+    if chemin is None:
+        raise Http404("Profil introuvable")
+    return FileResponse(open(chemin, 'rb'), as_attachment=True, filename=nom)
+
+def metriques(request):
+    """
+    Métriques du processus au format texte Prometheus (voir services/metriques_service.py)
+
+    Authentification : en-tête "Authorization: Bearer <METRIQUES_JETON>"
+    (ou session d'un agent connecté si aucun jeton n'est configuré)
+    """
+    from .services.metriques_service import MetriquesService
+
+    jeton = getattr(settings, 'METRIQUES_JETON', '')
+    if jeton:
+        fourni = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(fourni.encode(), jeton.encode()):
+            return HttpResponse("Jeton invalide\n", status=401, content_type='text/plain')
+    elif not request.user.is_authenticated:
+        return HttpResponse("Authentification requise\n", status=401, content_type='text/plain')
+
+    return HttpResponse(MetriquesService.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @login_required
 def liste_factures(request):
     """
@@ -2124,7 +2456,8 @@ def exporter_factures_pdf(request):
     Génère un PDF avec la liste de toutes les factures
     Format : Tableau avec colonnes [N° Facture, Client, Montant, Statut, Échéance]
     """
-    factures = Facture.objects.all().select_related('client').order_by('-date_creation')
+    db = base_analytique()
+    factures = Facture.objects.using(db).all().select_related('client').order_by('-date_creation')
     
     # En-têtes du tableau
     headers = ['N° Facture', 'Client', 'Montant TTC', 'Statut', 'Échéance']
@@ -2199,7 +2532,8 @@ def exporter_facture_detail_pdf(request, facture_id):
     - Section 2 : Expéditions facturées (si existent)
     - Section 3 : Paiements effectués (si existent)
     """
-    facture = get_object_or_404(Facture.objects.select_related('client'), id=facture_id)
+    db = base_analytique()
+    facture = get_object_or_404(Facture.objects.using(db).select_related('client'), id=facture_id)
     paiements = facture.paiements.all().order_by('-date_paiement')
     expeditions = facture.expeditions.all().select_related('destination', 'type_service')
     
@@ -2373,7 +2707,8 @@ def exporter_paiements_pdf(request):
     Génère un PDF avec la liste de tous les paiements
     Format : Tableau avec colonnes [Date, Facture, Client, Montant, Mode]
     """
-    paiements = Paiement.objects.all().select_related(
+    db = base_analytique()
+    paiements = Paiement.objects.using(db).all().select_related(
         'facture', 'facture__client'
     ).order_by('-date_paiement')
     
@@ -2415,8 +2750,9 @@ def exporter_paiement_detail_pdf(request, paiement_id):
     - Section 1 : Informations du paiement
     - Section 2 : Informations de la facture associée
     """
+    db = base_analytique()
     paiement = get_object_or_404(
-        Paiement.objects.select_related('facture', 'facture__client'),
+        Paiement.objects.using(db).select_related('facture', 'facture__client'),
         id=paiement_id
     )
     
@@ -2603,12 +2939,18 @@ def detail_incident(request, incident_id):
         id=incident_id
     )
     
-    # Historique
-    historique = incident.historique.all().order_by('-date_action')
+    # Historique (archivé : chargé à la demande avec ?archive=1)
+    historique = list(incident.historique.all().order_by('-date_action'))
+    archive = ArchiveService.resume('INCIDENT', incident.id)
+    afficher_archive = archive is not None and request.GET.get('archive') == '1'
+    if afficher_archive:
+        historique += ArchiveService.historique('INCIDENT', incident.id)
     
     return render(request, 'incidents/detail.html', {
         'incident': incident,
         'historique': historique,
+        'archive': archive,
+        'afficher_archive': afficher_archive,
     })
 @login_required
 def creer_incident(request):
@@ -3030,7 +3372,8 @@ def exporter_incidents_pdf(request):
     """
     Génère un PDF avec la liste de tous les incidents
     """
-    incidents = Incident.objects.all().select_related(
+    db = base_analytique()
+    incidents = Incident.objects.using(db).all().select_related(
         'expedition', 'tournee'
     ).order_by('-date_heure_incident')
     
@@ -3055,7 +3398,8 @@ def exporter_incident_detail_pdf(request, incident_id):
     """
     Génère un PDF détaillé d'un incident
     """
-    incident = Incident.objects.select_related(
+    db = base_analytique()
+    incident = Incident.objects.using(db).select_related(
         'expedition', 'tournee'
     ).get(id=incident_id)
     
@@ -3220,12 +3564,18 @@ def detail_reclamation(request, reclamation_id):
         id=reclamation_id
     )
     
-    # Historique
-    historique = reclamation.historique.all().order_by('-date_action')
+    # Historique (archivé : chargé à la demande avec ?archive=1)
+    historique = list(reclamation.historique.all().order_by('-date_action'))
+    archive = ArchiveService.resume('RECLAMATION', reclamation.id)
+    afficher_archive = archive is not None and request.GET.get('archive') == '1'
+    if afficher_archive:
+        historique += ArchiveService.historique('RECLAMATION', reclamation.id)
     
     return render(request, 'reclamations/detail.html', {
         'reclamation': reclamation,
         'historique': historique,
+        'archive': archive,
+        'afficher_archive': afficher_archive,
     })
 
 @login_required
@@ -3590,7 +3940,8 @@ def exporter_reclamations_pdf(request):
     """
     Génère un PDF avec la liste de toutes les réclamations
     """
-    reclamations = Reclamation.objects.all().select_related(
+    db = base_analytique()
+    reclamations = Reclamation.objects.using(db).all().select_related(
         'client'
     ).order_by('-date_creation')
     
@@ -3615,7 +3966,8 @@ def exporter_reclamation_detail_pdf(request, reclamation_id):
     """
     Génère un PDF détaillé d'une réclamation
     """
-    reclamation = Reclamation.objects.select_related(
+    db = base_analytique()
+    reclamation = Reclamation.objects.using(db).select_related(
         'client', 'facture'
     ).prefetch_related('expeditions').get(id=reclamation_id)
     
@@ -3766,6 +4118,12 @@ def home(request):
         ('TERMINEE', 'Terminée'),
     ]
     
+    # ========== RÉPLICA ANALYTIQUE (indicateur de retard) ==========
+    etat_replica = None
+    if request.user.is_responsable:
+        from .services.replica_service import ReplicaService
+        etat_replica = ReplicaService.etat()
+    
     context = {
         'favoris': favoris,
         'notifications': notifications,
@@ -3774,6 +4132,7 @@ def home(request):
         'statuts_tournee': statuts_tournee,
         "reclamations_non_terminees": reclamations_non_terminees,
         "incidents_non_termines": incidents_non_termines,
+        'etat_replica': etat_replica,
     }
     
     return render(request, 'home.html', context)
@@ -5,12 +5,64 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+Nécessaire pour le flux en direct du tableau de bord (/flux/, vue asynchrone) :
+    uvicorn tp1.asgi:application --host 0.0.0.0 --port 8000
+Le broker du flux est en mémoire : un worker = un broker (un seul worker, ou
+un broker partagé type Redis si on en lance plusieurs).
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tp1.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Worker de la boîte d'envoi, copie de la réplica et instantanés : processus serveur uniquement (pas les commandes manage.py)
+from app1.scheduler import demarrer_scheduler_serveur  # noqa: E402
+from app1.services.boite_envoi_service import BoiteEnvoiService  # noqa: E402
+
+BoiteEnvoiService.demarrer_serveur()
+demarrer_scheduler_serveur()
+
+# Chemins servis en flux continu (voir app1/urls.py)
+CHEMINS_FLUX = ('/flux/',)
+
+
+async def application(scope, receive, send):
+    """
+    Django 4.2 ne surveille pas la déconnexion du client pendant une réponse
+    en flux : un onglet fermé garderait son abonnement indéfiniment. Pour les
+    CHEMINS_FLUX, on écoute "http.disconnect" et on annule la requête.
+    """
+    if scope['type'] != 'http' or scope['path'] not in CHEMINS_FLUX:
+        return await django_application(scope, receive, send)
+
+    corps_lu = asyncio.Event()
+    deconnexion = asyncio.Event()
+
+    async def recevoir():
+        message = await receive()
+        if not message.get('more_body'):
+            corps_lu.set()
+        return message
+
+    async def surveiller(requete):
+        await corps_lu.wait()
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        deconnexion.set()
+        requete.cancel()
+
+    requete = asyncio.ensure_future(django_application(scope, recevoir, send))
+    surveillance = asyncio.ensure_future(surveiller(requete))
+    try:
+        await requete
+    except asyncio.CancelledError:
+        if not deconnexion.is_set():
+            raise
+    finally:
+        surveillance.cancel()
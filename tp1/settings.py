@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -73,13 +74,17 @@ EMAILS_SUPPORT = [
 ]
 
 MIDDLEWARE = [
+    'app1.middleware.MetriquesMiddleware',
+    'app1.middleware.ProfilageMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'app1.middleware.BudgetRequetesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'app1.middleware.EpinglagePrimaireMiddleware',
 ]
 
 ROOT_URLCONF = 'tp1.urls'
@@ -106,12 +111,59 @@ WSGI_APPLICATION = 'tp1.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Moteur choisi par l'environnement : BASE_MOTEUR=sqlite (défaut) ou postgresql
+#   BASE_MOTEUR=postgresql POSTGRES_DB=tp1 POSTGRES_USER=tp1 POSTGRES_PASSWORD=... python manage.py runserver
+#   BASE_MOTEUR=postgresql python manage.py test   (même suite de tests, base test_<POSTGRES_DB>)
+BASE_MOTEUR = os.environ.get('BASE_MOTEUR', 'sqlite')
+
+if BASE_MOTEUR == 'postgresql':
+    DATABASES = {
+        # PostgreSQL (psycopg) : connexions persistantes, vérifiées avant réutilisation
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'tp1'),
+            'USER': os.environ.get('POSTGRES_USER', 'tp1'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('POSTGRES_CONN_MAX_AGE', 60)),  # Secondes ; 0 = une connexion par requête
+            'CONN_HEALTH_CHECKS': True,                                       # Connexion persistante testée avant chaque requête
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('POSTGRES_CONNECT_TIMEOUT', 5)),
+                'application_name': 'tp1',
+                # Garde-fou : aucune requête ne bloque un worker plus de N ms (0 = sans limite)
+                'options': f"-c statement_timeout={int(os.environ.get('POSTGRES_STATEMENT_TIMEOUT_MS', 0))}",
+            },
+        },
     }
-}
+else:
+    DATABASES = {
+        # Moteur SQLite de Django + PRAGMAs (WAL en production), BEGIN IMMEDIATE, porte d'écriture (app1/backends/sqlite/base.py)
+        'default': {
+            'ENGINE': 'app1.backends.sqlite',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # Base de test dans un fichier : les tests de concurrence ouvrent une connexion par thread
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        },
+        # Réplica en lecture seule pour les statistiques et exports (copie de db.sqlite3)
+        'analytics': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db_analytics.sqlite3',
+            'TEST': {
+                'MIRROR': 'default',
+            },
+        },
+    }
+
+DATABASE_ROUTERS = ['app1.routers.AnalyticsRouter']
+
+# Réplica analytique : copie toutes les REPLICA_INTERVALLE_MINUTES par le processus serveur (tp1/wsgi.py, tp1/asgi.py),
+# ignorée si plus vieille que REPLICA_RETARD_MAX secondes (copie binaire : SQLite uniquement)
+REPLICA_ANALYTIQUE_ACTIVE = 'analytics' in DATABASES
+REPLICA_INTERVALLE_MINUTES = 5
+REPLICA_RETARD_MAX = 900
 
 
 # Password validation
@@ -155,3 +207,127 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 PHONENUMBER_DEFAULT_REGION = 'DZ'
+
+# Nombre de compteurs par sketch Top-K (classements approximatifs)
+# Erreur maximale d'un classement = total / TOPK_CAPACITE
+TOPK_CAPACITE = 500
+
+# Numérotation des documents : nombre de numéros réservés d'un coup par processus
+# 1 = numérotation sans trou (recommandé pour les factures)
+SEQUENCE_BLOC = 1
+
+# Matrice des distances entre destinations (services/distance_service.py)
+MATRICE_DISTANCES_DIR = BASE_DIR / 'matrices'
+DEPOT_COORDONNEES = (36.754, 3.059)  # Dépôt principal (Alger)
+FACTEUR_ROUTE = 1.3  # Distance routière ≈ vol d'oiseau × facteur
+VITESSE_MOYENNE_KMH = 60
+HEURES_CONDUITE_PAR_JOUR = 8
+
+# Optimisation de l'ordre de livraison : temps de recherche maximum par tournée
+OPTIMISATION_BUDGET_SECONDES = 0.5
+
+# Calendrier des ressources : durée réservée pour une tournée sans date de retour prévue
+DUREE_TOURNEE_DEFAUT_HEURES = 24
+
+# Choix chauffeur / véhicule d'une nouvelle tournée (services/affectation_service.py)
+AFFECTATION_CHARGE_STANDARD_KG = 500      # Charge visée pour une tournée partagée
+AFFECTATION_MARGE_REVISION_JOURS = 7      # Véhicule pénalisé si sa révision suit la tournée de près
+AFFECTATION_FENETRE_JOURS = 30            # Période de calcul de la charge des chauffeurs
+AFFECTATION_HEURES_PAR_TOURNEE = 1        # Temps fixe (chargement, livraisons) par tournée
+
+# Planification des maintenances (services/maintenance_service.py)
+MAINTENANCE_HORIZON_JOURS = 7             # Révisions examinées chaque soir
+MAINTENANCE_RECHERCHE_JOURS = 14          # Fenêtre de recherche des créneaux de report
+
+# Ingestion des événements de l'application chauffeur (services/ingestion_service.py)
+INGESTION_JETON = os.environ.get('INGESTION_JETON', '')  # Vide = session agent requise
+INGESTION_LOT_MAX = 5000                  # Lignes NDJSON maximum par requête (413 au-delà)
+INGESTION_TAILLE_PAQUET = 500             # Taille des INSERT groupés
+INGESTION_CONCURRENCE_MAX = 4             # Lots écrits en même temps par processus
+INGESTION_ATTENTE_MAX_SECONDES = 0.5      # Attente d'une place avant de répondre 503
+INGESTION_RETRY_AFTER_SECONDES = 2        # En-tête Retry-After des réponses 503
+
+# Archivage de l'historique des dossiers clôturés (services/archive_service.py)
+ARCHIVE_HISTORIQUE_MOIS = 12              # Ancienneté avant compression dans ArchiveHistorique
+
+# Cache Django (suivi public des colis). LocMemCache = un cache par processus :
+# avec plusieurs workers, préférer Redis / Memcached pour une invalidation partagée
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'transportpro',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    }
+}
+
+# Suivi public des colis (services/suivi_public_service.py)
+SUIVI_PUBLIC_CACHE_SECONDES = 30          # Durée maximale d'un état en cache
+SUIVI_PUBLIC_LIMITE_PAR_MINUTE = int(os.environ.get('SUIVI_PUBLIC_LIMITE_PAR_MINUTE', 60))  # Par IP, 0 = sans limite
+
+# Flux en direct du tableau de bord (services/diffusion_service.py, GET /flux/ sous ASGI)
+DIFFUSION_ABONNES_MAX = 500               # Navigateurs connectés par processus (503 au-delà)
+DIFFUSION_FILE_MAX = 100                  # Messages en attente par navigateur avant déconnexion
+DIFFUSION_HISTORIQUE = 500                # Derniers événements rejoués à la reconnexion
+DIFFUSION_BATTEMENT_SECONDES = 15         # Commentaire SSE périodique (proxys, détection des coupures)
+
+# Efficacité de la flotte (services/flotte_service.py)
+FLOTTE_FENETRE = 20                       # Tournées dans les moyennes glissantes d'un véhicule
+FLOTTE_MIN_POINTS = 5                     # Points de comparaison minimum avant de signaler une anomalie
+FLOTTE_SEUIL_Z = 3.0                      # |z-score| au-delà duquel une tournée est signalée
+FLOTTE_ECART_CIRCUIT_MIN = 0.2            # Et au moins +20 % de km par rapport au circuit optimisé
+FLOTTE_RAPPORT_CACHE_SECONDES = 600       # Durée d'un rapport en cache (invalidé à chaque tournée terminée)
+
+# Budgets de requêtes SQL par vue (app1/middleware.py, budgets dans app1/urls.py)
+REQUETES_BUDGET_ACTIF = True              # Mesure + en-tête Server-Timing sur chaque réponse
+REQUETES_BUDGET_STRICT = os.environ.get('REQUETES_BUDGET_STRICT') == '1'  # Exception si dépassement (CI)
+REQUETES_BUDGET_DEFAUT = None             # Budget des vues non déclarées (None = pas de limite)
+REQUETES_SEUIL_REPETITION = 5             # Même requête N fois dans une vue → N+1 signalé
+
+# Métriques Prometheus (services/metriques_service.py, GET /metrics)
+METRIQUES_ACTIVES = True                  # Chronométrage des services et des requêtes HTTP
+METRIQUES_JETON = os.environ.get('METRIQUES_JETON', '')  # "Authorization: Bearer" du collecteur ; vide = session agent
+
+# Profilage par échantillonnage (services/profilage_service.py, page /diagnostic/profils/)
+PROFILAGE_ACTIF = os.environ.get('PROFILAGE_ACTIF') == '1'  # Opt-in : requêtes lentes + chaque tâche planifiée
+PROFILAGE_SEUIL_MS = 1000                 # Profil d'une requête écrit au-delà de cette durée
+PROFILAGE_INTERVALLE_MS = 10              # Période d'échantillonnage des piles
+PROFILAGE_REPERTOIRE = BASE_DIR / 'profils'
+PROFILAGE_FICHIERS_MAX = 200              # Profils de requêtes gardés (les plus anciens supprimés)
+PROFILAGE_FICHIERS_MAX_TACHES = 50        # Profils de tâches planifiées gardés (quota séparé)
+PROFILAGE_FORMAT = 'speedscope'           # 'speedscope' (.speedscope.json) ou 'collapsed' (.folded, flamegraph.pl)
+
+# Instantanés de db.sqlite3 (services/instantane_service.py, commandes *_instantane)
+INSTANTANES_ACTIFS = os.environ.get('INSTANTANES_ACTIFS') == '1'  # Opt-in : instantané + rétention par le processus serveur
+INSTANTANES_INTERVALLE_MINUTES = 60
+INSTANTANES_REPERTOIRE = BASE_DIR / 'instantanes'
+INSTANTANES_PAGES_PAR_ETAPE = 256         # Pages copiées par étape de l'API backup
+INSTANTANES_PAUSE_SECONDES = 0.01         # Pause entre deux étapes (les écritures passent)
+INSTANTANES_TAILLE_BLOC = 1 << 20         # Octets par bloc dédupliqué (multiple de la taille de page)
+INSTANTANES_GARDER_DERNIERS = 24          # Rétention : les N plus récents...
+INSTANTANES_GARDER_JOURS = 7              # ... + le dernier de chaque jour sur N jours
+INSTANTANES_GARDER_SEMAINES = 8           # ... + le dernier de chaque semaine sur N semaines
+
+# Profil SQLite de production (app1/backends/sqlite/base.py), PRAGMAs appliqués à chaque connexion
+# WAL est écrit DANS le fichier (persistant) : à activer sur la base de production
+# (SQLITE_JOURNAL_MODE=WAL), jamais sur le db.sqlite3 de démonstration versionné
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'DELETE').upper()
+SQLITE_PRAGMAS = {
+    'journal_mode': SQLITE_JOURNAL_MODE,  # WAL : lecteurs et écrivain ne se bloquent plus
+    'synchronous': 'NORMAL' if SQLITE_JOURNAL_MODE == 'WAL' else 'FULL',  # NORMAL n'est sûr qu'en WAL
+    'busy_timeout': 20000,                # Millisecondes d'attente du verrou avant "database is locked"
+    'cache_size': -65536,                 # Cache de pages par connexion (négatif = Kio, ici 64 Mo)
+    'mmap_size': 268435456,               # Lectures par mmap (256 Mo)
+    'temp_store': 'MEMORY',               # Tris et index temporaires en mémoire
+}
+SQLITE_TRANSACTIONS_IMMEDIATES = True     # transaction.atomic() → BEGIN IMMEDIATE (verrou d'écriture pris au début)
+SQLITE_PORTE_ECRITURE = True              # Une transaction d'écriture à la fois par processus (file d'attente Python)
+SQLITE_PORTE_ATTENTE_SECONDES = 20        # Attente maximale de la porte avant "database is locked"
+
+# Boîte d'envoi : effets de bord après commit (services/boite_envoi_service.py, commande traiter_boite_envoi)
+BOITE_ENVOI_ACTIVE = True                 # Worker dans le processus serveur (WSGI/ASGI/runserver), réveillé après chaque commit qui publie
+BOITE_ENVOI_INTERVALLE_SECONDES = 30      # Passage de secours : reprises, événements publiés par d'autres processus
+BOITE_ENVOI_TAILLE_LOT = 100              # Événements réservés par lot
+BOITE_ENVOI_BAIL_SECONDES = 300           # Un lot non acquitté (worker arrêté) redevient disponible après ce délai
+BOITE_ENVOI_TENTATIVES_MAX = 8            # Puis ECHEC (traiter_boite_envoi --rejouer-echecs)
+BOITE_ENVOI_DELAI_SECONDES = 30           # Reprises après 30 s, 1 min, 2 min, 4 min...
+BOITE_ENVOI_CONSERVATION_JOURS = 7        # Événements traités purgés chaque nuit au-delà
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tp1.settings')
 
 application = get_wsgi_application()
+
+# Worker de la boîte d'envoi, copie de la réplica et instantanés : processus serveur uniquement (pas les commandes manage.py)
+from app1.scheduler import demarrer_scheduler_serveur  # noqa: E402
+from app1.services.boite_envoi_service import BoiteEnvoiService  # noqa: E402
+
+BoiteEnvoiService.demarrer_serveur()
+demarrer_scheduler_serveur()